@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+"""
+run_benchmarks.py
+
+Purpose:    Time the main data-processing stages of Quanformer on synthetic
+            inputs of several sizes, and keep a history of results in a JSON
+            file so that slowdowns between versions can be caught without
+            real QM runs. Stages benchmarked:
+            - filter:   filter_confs on a QM-optimized SDF file
+            - harvest:  get_psi_results of opt, spe, and hess campaigns
+            - parse:    process_psi_out alone on the opt output files, stored
+                        uncompressed and compressed with gz and xz; disk use
+                        of the output files is recorded with the time
+            - tags:     proc_tags.get_sd_list over all molecules
+            - match:    match_minima of two files of the same molecules
+            - stitch:   stitch_spe of two single point energy files
+            - uniq:     tools/save_uniq_mols over an SDF stream in which every
+                        molecule appears twice, by title, canonical SMILES,
+                        or InChIKey, with seen molecules kept in memory
+                        (uniq_title etc.) or in SQLite (uniq_title_disk etc.)
+
+            With --records, the uniq benchmarks also run on a stream of that
+            many records, generated while it is read through a named pipe
+            so that it is never written to disk.
+
+Usage:      python run_benchmarks.py --scales small medium
+            python run_benchmarks.py --scales small --only harvest parse --fail
+            python run_benchmarks.py --scales small --records 1000000
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import socket
+import platform
+import tempfile
+import subprocess
+import collections
+import contextlib
+
+import synthetic
+
+# the pipeline modules import each other by name, as when run as scripts
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(_here), 'quanformer'))
+sys.path.insert(1, os.path.join(os.path.dirname(_here), 'tools'))
+
+# (number of molecules, conformers per molecule, atoms per molecule)
+SCALES = collections.OrderedDict([
+    ('small', (10, 5, 20)),
+    ('medium', (50, 10, 30)),
+    ('large', (200, 20, 40)),
+])
+
+HISTORY = os.path.join(_here, 'history.json')
+THRY = "%s/%s" % (synthetic.METHOD, synthetic.BASIS)
+
+### ------------------- Functions -------------------
+
+
+@contextlib.contextmanager
+def working_dir(path):
+    """
+    Temporarily change directory since the pipeline writes to the cwd.
+    """
+    curr = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(curr)
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Hide the per-molecule printing of the pipeline during timing.
+    """
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def bench_filter(workdir, nmols, nconfs, natoms):
+    import filter_confs
+    infile = os.path.join(workdir, 'filt-210.sdf')
+    synthetic.synthetic_sdf(infile, nmols, nconfs, natoms, 'opt')
+    tag = "QM Psi4 Final Opt. Energy (Har) %s" % THRY
+    with working_dir(workdir):
+        start = time.perf_counter()
+        filter_confs.filter_confs(infile, tag, 'filt-220.sdf')
+        return time.perf_counter() - start, nmols * nconfs
+
+
+def bench_harvest(workdir, nmols, nconfs, natoms, calctype):
+    import get_psi_results
+    campdir = os.path.join(workdir, 'harvest_' + calctype)
+    sdf = synthetic.synthetic_campaign(campdir, nmols, nconfs, natoms,
+                                       calctype)
+    with working_dir(campdir):
+        start = time.perf_counter()
+        get_psi_results.get_psi_results(sdf, 'bench-210.sdf', calctype)
+        return time.perf_counter() - start, nmols * nconfs
+
+
+def campaign_bytes(campdir):
+    """
+    Get total size of the files in the conformer directories of a campaign.
+    """
+    return sum(os.path.getsize(f)
+               for f in glob.glob(os.path.join(campdir, '*', '*', '*')))
+
+
+def bench_parse(workdir, nmols, nconfs, natoms, fmt=None):
+    import get_psi_results
+    import output_io
+    campdir = os.path.join(workdir, 'harvest_opt')
+    if not os.path.isdir(campdir):
+        synthetic.synthetic_campaign(campdir, nmols, nconfs, natoms, 'opt')
+    if fmt is not None:
+        compdir = os.path.join(workdir, 'parse_' + fmt)
+        shutil.copytree(campdir, compdir)
+        output_io.compact(compdir, fmt)
+        campdir = compdir
+    outputs = [os.path.join(d, 'output.dat') for d in
+               sorted(glob.glob(os.path.join(campdir, '*', '*', '')))]
+    start = time.perf_counter()
+    for outf in outputs:
+        get_psi_results.process_psi_out(outf, {}, 'opt')
+    return time.perf_counter() - start, len(outputs), campaign_bytes(campdir)
+
+
+def bench_tags(workdir, nmols, nconfs, natoms):
+    import openeye.oechem as oechem
+    import proc_tags
+    infile = os.path.join(workdir, 'tags-210.sdf')
+    synthetic.synthetic_sdf(infile, nmols, nconfs, natoms, 'opt')
+    method, basis = THRY.split('/')
+    ifs = oechem.oemolistream()
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    ifs.open(infile)
+    start = time.perf_counter()
+    for mol in ifs.GetOEMols():
+        for datum in ['QM opt energy', 'opt runtime', 'opt step',
+                      'original index']:
+            proc_tags.get_sd_list(mol, datum, 'Psi4', method, basis)
+    ifs.close()
+    return time.perf_counter() - start, nmols * nconfs
+
+
+def bench_match(workdir, nmols, nconfs, natoms):
+    import match_minima
+    ref = os.path.join(workdir, 'match1-222.sdf')
+    query = os.path.join(workdir, 'match2-222.sdf')
+    synthetic.synthetic_sdf(ref, nmols, nconfs, natoms, 'opt', seed=0)
+    synthetic.synthetic_sdf(query, nmols, nconfs, natoms, 'opt', seed=1)
+    with working_dir(workdir):
+        start = time.perf_counter()
+        match_minima.match_minima([ref, query], [THRY, THRY],
+                                  'QM opt energy')
+        return time.perf_counter() - start, nmols * nconfs
+
+
+def bench_stitch(workdir, nmols, nconfs, natoms):
+    import stitch_spe
+    method, basis = THRY.split('/')
+    wholedict = collections.OrderedDict()
+    for i in range(2):
+        fname = os.path.join(workdir, 'spe%d-210.sdf' % (i + 1))
+        synthetic.synthetic_sdf(fname, nmols, nconfs, natoms, 'spe', seed=i)
+        wholedict[i] = {'ftitle': 'spe%d' % (i + 1), 'fname': fname,
+                        'calctype': 'spe', 'method': method,
+                        'basisset': basis}
+    with working_dir(workdir):
+        start = time.perf_counter()
+        stitch_spe.stitch_spe(wholedict, 'relene.dat')
+        return time.perf_counter() - start, nmols * nconfs
+
+
+def uniq_input(fname, nmols, natoms):
+    """
+    Provide the SDF stream of synthetic.uniq_stream as fname. Where named
+    pipes are available, the stream is written by a separate process while
+    it is read, and the writer process is returned. Otherwise the file is
+    written first and None is returned.
+    """
+    if not hasattr(os, 'mkfifo'):
+        with open(fname, 'w') as f:
+            synthetic.uniq_stream(f, nmols, natoms)
+        return None
+    os.mkfifo(fname)
+    return subprocess.Popen([sys.executable, synthetic.__file__, 'uniq',
+                             '-o', fname, '--mols', str(nmols),
+                             '--atoms', str(natoms)])
+
+
+def bench_uniq(workdir, nmols, nconfs, natoms, key='title', ondisk=False):
+    import save_uniq_mols
+    # nmols * nconfs different molecules, each appearing twice
+    infile = os.path.join(workdir, 'uniq-in.sdf')
+    writer = uniq_input(infile, nmols * nconfs, natoms)
+    outfile = os.path.join(workdir, 'uniq-out.sdf')
+    dbfile = os.path.join(workdir, 'uniq-seen.db') if ondisk else None
+    try:
+        start = time.perf_counter()
+        save_uniq_mols.save_uniq_mols(infile, outfile, key, dbfile, report=0)
+        seconds = time.perf_counter() - start
+    finally:
+        # writer is blocked forever if the pipe was not read to the end
+        if writer is not None:
+            if writer.poll() is None:
+                writer.kill()
+            writer.wait()
+        os.remove(infile)
+    if dbfile is not None:
+        os.remove(dbfile)
+    return seconds, 2 * nmols * nconfs
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('filter', bench_filter),
+    ('harvest_opt', lambda *a: bench_harvest(*(a + ('opt', )))),
+    ('harvest_spe', lambda *a: bench_harvest(*(a + ('spe', )))),
+    ('harvest_hess', lambda *a: bench_harvest(*(a + ('hess', )))),
+    ('parse', bench_parse),
+    ('parse_gz', lambda *a: bench_parse(*(a + ('gz', )))),
+    ('parse_xz', lambda *a: bench_parse(*(a + ('xz', )))),
+    ('tags', bench_tags),
+    ('match', bench_match),
+    ('stitch', bench_stitch),
+    ('uniq_title', bench_uniq),
+    ('uniq_title_disk', lambda *a: bench_uniq(*(a + ('title', True)))),
+    ('uniq_smiles', lambda *a: bench_uniq(*(a + ('smiles', )))),
+    ('uniq_smiles_disk', lambda *a: bench_uniq(*(a + ('smiles', True)))),
+    ('uniq_inchikey', lambda *a: bench_uniq(*(a + ('inchikey', )))),
+    ('uniq_inchikey_disk', lambda *a: bench_uniq(*(a + ('inchikey', True)))),
+])
+
+# atoms per molecule of the --records stream
+RECORD_ATOMS = 20
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=_here,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, only=None, keep=False, records=None):
+    """
+    Run the benchmarks at the given scales.
+
+    Parameters
+    ----------
+    scales : list of scale names, keys of SCALES
+    only : list of benchmark names to run. None runs all.
+    keep : Boolean, keep the synthetic files instead of deleting them
+    records : int, also run the uniq benchmarks on a stream of this many
+        SDF records, as scale 'records[N]'. None to skip.
+
+    Returns
+    -------
+    results : dictionary of results[scale][benchmark] =
+        {'seconds': float, 'items': int, 'ms_per_item': float}, plus
+        'bytes' of files on disk for the parse benchmarks
+
+    """
+    results = collections.OrderedDict()
+    runs = [(scale, SCALES[scale]) for scale in scales]
+    if records:
+        # half of the records are different molecules, one conformer each
+        runs.append(('records%d' % records, (records // 2, 1, RECORD_ATOMS)))
+    for scale, (nmols, nconfs, natoms) in runs:
+        workdir = tempfile.mkdtemp(prefix='quanformer_bench_%s_' % scale)
+        results[scale] = collections.OrderedDict()
+        for name, func in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            if scale not in SCALES and not name.startswith('uniq'):
+                continue
+            with quiet():
+                res = func(workdir, nmols, nconfs, natoms)
+            seconds, items = res[:2]
+            results[scale][name] = {
+                'seconds': seconds,
+                'items': items,
+                'ms_per_item': 1000. * seconds / items
+            }
+            line = "%-8s %-14s %9.3f s  %8.3f ms/item" % (
+                scale, name, seconds, 1000. * seconds / items)
+            if len(res) > 2:
+                results[scale][name]['bytes'] = res[2]
+                line += "  %9.2f MB on disk" % (res[2] / 1024.**2)
+            print(line)
+        if keep:
+            print("Synthetic files kept in %s" % workdir)
+        else:
+            shutil.rmtree(workdir)
+    return results
+
+
+def load_history(history=HISTORY):
+    if not os.path.exists(history):
+        return []
+    with open(history) as f:
+        return json.load(f)
+
+
+def compare(results, runs, threshold=0.2):
+    """
+    Compare results against the most recent earlier run of each
+    benchmark at the same scale.
+
+    Returns
+    -------
+    regressions : list of (scale, name, previous seconds, current seconds)
+        for benchmarks slower than before by more than the threshold fraction
+
+    """
+    regressions = []
+    for scale, benches in results.items():
+        for name, res in benches.items():
+            previous = [r['results'][scale][name] for r in runs
+                        if name in r['results'].get(scale, {})]
+            if not previous:
+                continue
+            before = previous[-1]['seconds']
+            if res['seconds'] > before * (1. + threshold):
+                regressions.append((scale, name, before, res['seconds']))
+    return regressions
+
+
+def record(results, history=HISTORY):
+    """
+    Append results of this run to the JSON history file.
+    """
+    runs = load_history(history)
+    runs.append({
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'host': socket.gethostname(),
+        'python': platform.python_version(),
+        'results': results
+    })
+    with open(history, 'w') as f:
+        json.dump(runs, f, indent=1)
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--scales", nargs='+', default=['small'],
+        choices=list(SCALES), help="Sizes of synthetic inputs to run.")
+    parser.add_argument("--only", nargs='+', default=None,
+        choices=list(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--history", default=HISTORY,
+        help="JSON file of results of previous runs.")
+    parser.add_argument("--norecord", action="store_true", default=False,
+        help="Do not add the results of this run to the history file.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+        help="Fractional slowdown vs. the previous run reported as a "
+             "regression. Default 0.2")
+    parser.add_argument("--fail", action="store_true", default=False,
+        help="Exit with nonzero status if any regression is found.")
+    parser.add_argument("--keep", action="store_true", default=False,
+        help="Keep the synthetic input files.")
+    parser.add_argument("--records", type=int, default=None,
+        help="Also run the uniq benchmarks on a streamed SDF of this many "
+             "records, e.g., 1000000. Off by default since it takes long.")
+
+    args = parser.parse_args()
+    results = run(args.scales, args.only, args.keep, args.records)
+    regressions = compare(results, load_history(args.history), args.threshold)
+    for scale, name, before, after in regressions:
+        print("REGRESSION: %s %s %.3f s --> %.3f s" % (scale, name, before,
+                                                      after))
+    if not args.norecord:
+        record(results, args.history)
+    if args.fail and regressions:
+        sys.exit(1)
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+"""
+synthetic.py
+
+Purpose:    Generate synthetic inputs for benchmarking Quanformer without
+            running any conformer generation or QM calculations:
+            - multi-conformer SDF files of a chosen size (mols x confs x atoms)
+              with the SD tags that the pipeline would have written
+            - fake Psi4 output.dat and timer.dat files of opt, spe (with
+              MP2/SCS-MP2 energies), and Hessian calculations, laid out in the
+              mainDir/molName/confNum directories of the pipeline
+            - SDF streams of different molecules that each appear twice, for
+              removing duplicates by title, SMILES, or InChIKey
+
+            Files only contain what Quanformer reads, padded with filler
+            lines so that file sizes resemble those of real calculations.
+
+Usage:      python synthetic.py sdf -o set1-200.sdf --mols 100 --confs 20 --atoms 30
+            python synthetic.py campaign -o bench_dir --mols 10 --confs 5 --calctype opt
+            python synthetic.py uniq -o uniq-in.sdf --mols 500000 --atoms 20
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import sys
+import random
+
+METHOD = 'mp2'
+BASIS = 'def2-SV(P)'
+
+### ------------------- Functions -------------------
+
+
+def chain_coords(natoms, rng, noise=0.3):
+    """
+    Get coordinates of a zigzag carbon chain with random displacements.
+    Returns list of (x, y, z) tuples.
+    """
+    coords = []
+    for i in range(natoms):
+        coords.append((1.26 * i + rng.gauss(0, noise),
+                       0.89 * (i % 2) + rng.gauss(0, noise),
+                       rng.gauss(0, noise)))
+    return coords
+
+
+def conformer_set(nconfs, natoms, rng, dup_every=4):
+    """
+    Get coordinates and relative energies (Hartree) of conformers of one
+    molecule. Every dup_every-th conformer is a near-duplicate of the one
+    before it, so that filtering has something to remove.
+
+    Returns
+    -------
+    confs : list of (coords, energy) tuples
+
+    """
+    confs = []
+    for j in range(nconfs):
+        if dup_every and j % dup_every == dup_every - 1 and confs:
+            prev, prev_e = confs[-1]
+            coords = [(x + rng.gauss(0, 0.01), y + rng.gauss(0, 0.01),
+                       z + rng.gauss(0, 0.01)) for x, y, z in prev]
+            confs.append((coords, prev_e + rng.uniform(0, 1.e-4)))
+        else:
+            confs.append((chain_coords(natoms, rng), rng.uniform(0, 0.01)))
+    return confs
+
+
+def sd_tags(kind, j, energy, natoms, rng, method=METHOD, basis=BASIS):
+    """
+    Get the SD tags of one conformer as the pipeline would have set them.
+
+    Parameters
+    ----------
+    kind : string, 'mm' for tags after MM optimization (-200 files),
+        'opt' for tags after QM optimization (-210/-220 files), or 'spe'
+        for tags after QM single point energy calculations
+    j : int, 0-based conformer index
+    energy : float, relative energy in Hartree
+    natoms : int, number of atoms used to set a base energy
+
+    Returns
+    -------
+    list of (tag, value) tuples
+
+    """
+    base = -38.0 * natoms
+    thry = "%s/%s" % (method, basis)
+    tags = [("Original omega conformer number", str(j + 1)),
+            ("MM Szybki SD Energy", "%.6f" % (energy * 627.5095))]
+    if kind == 'opt':
+        tags += [
+            ("QM Psi4 Opt. Runtime (sec) %s" % thry,
+             "%.2f" % rng.uniform(50, 500)),
+            ("QM Psi4 Opt. Steps %s" % thry, str(rng.randint(3, 20))),
+            ("QM Psi4 Initial Opt. Energy (Har) %s" % thry,
+             "%.12f" % (base + energy + 0.01)),
+            ("QM Psi4 Final Opt. Energy (Har) %s" % thry,
+             "%.12f" % (base + energy)),
+            ("QM Psi4 Final Opt. Energy (Har) SCS-%s" % thry,
+             "%.12f" % (base + 1.1 * energy)),
+        ]
+    elif kind == 'spe':
+        tags += [
+            ("QM Psi4 Single Pt. Runtime (sec) %s" % thry,
+             "%.2f" % rng.uniform(10, 100)),
+            ("QM Psi4 Single Pt. Energy (Har) %s" % thry,
+             "%.12f" % (base + energy)),
+            ("QM Psi4 Single Pt. Energy (Har) SCS-%s" % thry,
+             "%.12f" % (base + 1.1 * energy)),
+        ]
+    return tags
+
+
+def sdf_record(title, coords, tags, elements=None):
+    """
+    Format one conformer as a V2000 SDF record. Atoms are carbons unless
+    a list of element symbols is given.
+    """
+    natoms = len(coords)
+    if elements is None:
+        elements = ['C'] * natoms
+    lines = [title, "  synthetic3D", ""]
+    lines.append("%3d%3d  0  0  0  0  0  0  0  0999 V2000" % (natoms,
+                                                               natoms - 1))
+    for (x, y, z), elem in zip(coords, elements):
+        lines.append("%10.4f%10.4f%10.4f %-3s 0  0  0  0  0  0  0  0  0  0"
+                     "  0  0" % (x, y, z, elem))
+    for i in range(1, natoms):
+        lines.append("%3d%3d  1  0  0  0  0" % (i, i + 1))
+    lines.append("M  END")
+    for tag, value in tags:
+        lines += ["> <%s>" % tag, value, ""]
+    lines.append("$$$$")
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_sdf(fname, nmols, nconfs, natoms, kind='mm', seed=0,
+                  method=METHOD, basis=BASIS):
+    """
+    Write a multi-molecule, multi-conformer SDF file.
+
+    Parameters
+    ----------
+    fname : string, name of output SDF file
+    nmols : int, number of molecules
+    nconfs : int, number of conformers per molecule
+    natoms : int, number of atoms per molecule
+    kind : string, which SD tags to write; see sd_tags
+    seed : int, random seed so that files are reproducible
+
+    Returns
+    -------
+    titles : list of molecule titles
+
+    """
+    rng = random.Random(seed)
+    titles = []
+    with open(fname, 'w') as f:
+        for m in range(nmols):
+            title = "mol%05d" % (m + 1)
+            titles.append(title)
+            for j, (coords, ene) in enumerate(
+                    conformer_set(nconfs, natoms, rng)):
+                f.write(sdf_record(title, coords,
+                                   sd_tags(kind, j, ene, natoms, rng, method,
+                                           basis)))
+    return titles
+
+
+def chain_elements(m, natoms):
+    """
+    Get element symbols of a chain molecule numbered m. The base-3 digits of
+    m pick C, N, or O for the inner atoms, and the ends are F and C so that
+    a reversed chain is not the same molecule. Different m up to
+    3**(natoms - 2) thus give different canonical SMILES and InChIKeys.
+    """
+    elements = ['F']
+    for i in range(natoms - 2):
+        elements.append('CNO' [m % 3])
+        m //= 3
+    return elements + ['C']
+
+
+def uniq_stream(f, nmols, natoms, seed=0):
+    """
+    Write an SDF stream of 2 * nmols single-conformer records for removing
+    duplicates: nmols different molecules, then all of them again in the
+    same order. Records are written one at a time, so f can be a pipe.
+
+    Parameters
+    ----------
+    f : file object opened for writing text
+    nmols : int, number of different molecules
+    natoms : int, number of atoms per molecule
+
+    """
+    rng = random.Random(seed)
+    # coordinates do not matter for duplicates, so reuse a few of them, and
+    # split records of sdf_record around the title and element symbols to
+    # keep the writer ahead of the reader
+    pool = []
+    for i in range(64):
+        marker = ['@'] * natoms
+        pool.append(sdf_record('', chain_coords(natoms, rng), [],
+                               marker).split('@  '))
+    for k in range(2 * nmols):
+        m = k % nmols
+        parts = pool[m % len(pool)]
+        elements = chain_elements(m, natoms)
+        f.write("mol%07d" % (m + 1) + parts[0] + ''.join(
+            "%-3s" % e + p for e, p in zip(elements, parts[1:])))
+
+
+def geometry_block(coords):
+    return "".join("\t    C  %14.10f %14.10f %14.10f\n" % c for c in coords)
+
+
+def scf_filler(nlines):
+    """
+    Lines of SCF iterations, as padding to make realistic file sizes.
+    """
+    return "".join("   @DF-RHF iter %3d:  -230.51750272690771   -1.23456e-05"
+                   "   1.23456e-06 DIIS\n" % (i + 1) for i in range(nlines))
+
+
+def psi4_output(calctype, coords, energy, nsteps=8, method=METHOD,
+                basis=BASIS, filler=100):
+    """
+    Get the text of a fake Psi4 output file.
+
+    Parameters
+    ----------
+    calctype : string, one of 'opt', 'spe', 'hess'
+    coords : list of (x, y, z) tuples of final geometry
+    energy : float, final total energy in Hartree
+    nsteps : int, number of optimization steps (opt only)
+    filler : int, lines of SCF iterations per gradient or energy
+
+    """
+    natoms = len(coords)
+    head = ["", "  Psi4 synthetic output for benchmarking", "",
+            "molecule {", geometry_block(coords).rstrip('\n'),
+            "  units angstrom", "}", "", "set basis %s" % basis,
+            "set freeze_core True"]
+    if calctype == 'opt':
+        head.append("optimize('%s')" % method)
+    elif calctype == 'spe':
+        head.append("energy('%s')" % method)
+    else:
+        head.append("H, wfn = hessian('%s', return_wfn=True)" % method)
+        head.append("wfn.hessian().print_out()")
+    text = "\n".join(head) + "\n"
+
+    ncalcs = nsteps if calctype == 'opt' else 1
+    for i in range(ncalcs):
+        step_e = energy + 0.001 * (ncalcs - 1 - i)
+        text += scf_filler(filler)
+        text += "    Total Energy =                      %.16f\n" % step_e
+        text += "\t SCS Total Energy          =    %.16f [Eh]\n" % (
+            step_e - 1.7)
+
+    if calctype == 'opt':
+        text += "\n  **** Optimization is complete! (in %d steps) ****\n\n" % \
+                nsteps
+        text += "  ==> Optimization Summary <==\n\n"
+        text += "  Measures of convergence in internal coordinates in au.\n"
+        text += "  " + "-" * 60 + " ~\n"
+        text += "   Step         Total Energy             Delta E  ~\n"
+        text += "  " + "-" * 60 + " ~\n"
+        for i in range(nsteps):
+            step_e = energy + 0.001 * (nsteps - 1 - i)
+            text += "  %5d  %18.12f  %18.12f  ~\n" % (i + 1, step_e, 0.)
+        text += "  " + "-" * 60 + " ~\n\n"
+        text += "\tFinal energy is %20.13f\n" % energy
+        text += "\tFinal (previous) structure:\n"
+        text += "\tCartesian Geometry (in Angstrom)\n"
+        text += geometry_block(coords)
+        text += "\tSaving final (previous) structure.\n\n"
+    elif calctype == 'hess':
+        text += hessian_block(3 * natoms)
+        text += "\n\n\n\n"
+    text += "*** Psi4 exiting successfully. Buy a developer a beer!\n"
+    return text
+
+
+def hessian_block(dim, ncols=5):
+    """
+    Format a symmetric dim x dim matrix as Psi4 prints the Hessian, in
+    chunks of ncols columns.
+    """
+    mat = [[1. / (1 + abs(i - j)) for j in range(dim)] for i in range(dim)]
+    text = "  ## Hessian (Symmetry 0) ##\n"
+    text += "  Irrep: 1 Size: %d x %d\n" % (dim, dim)
+    for start in range(0, dim, ncols):
+        cols = range(start, min(start + ncols, dim))
+        text += "\n" + "".join("%20d" % (c + 1) for c in cols) + "\n\n"
+        for i in range(dim):
+            text += "%5d" % (i + 1) + "".join(
+                "%21.14f" % mat[i][c] for c in cols) + "\n"
+    return text
+
+
+def timer_output(walltime):
+    return ("\nHost: synthetic\n\nTimers On : Mon May  1 19:06:07 2017\n"
+            "Timers Off: Mon May  1 19:20:14 2017\n\n"
+            "Wall Time:    %10.2f seconds\n\n" % walltime)
+
+
+def synthetic_campaign(outdir, nmols, nconfs, natoms, calctype='opt',
+                       seed=0, filler=100, prefix='bench'):
+    """
+    Write a [prefix]-200.sdf file and, for each of its conformers, a fake
+    Psi4 output.dat and timer.dat in outdir/molName/confNum/.
+
+    Parameters
+    ----------
+    outdir : string, main directory of the campaign
+    nmols, nconfs, natoms : int, size of the campaign
+    calctype : string, one of 'opt', 'spe', 'hess'
+    seed : int, random seed
+    filler : int, lines of SCF iterations per energy in output files
+    prefix : string, base name of SDF file
+
+    Returns
+    -------
+    sdf : string, full name of the SDF file of input structures
+
+    """
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    sdf = os.path.join(outdir, "%s-200.sdf" % prefix)
+    titles = synthetic_sdf(sdf, nmols, nconfs, natoms, 'mm', seed)
+    rng = random.Random(seed + 1)
+    for title in titles:
+        for j, (coords, ene) in enumerate(
+                conformer_set(nconfs, natoms, rng)):
+            confdir = os.path.join(outdir, title, str(j + 1))
+            if not os.path.isdir(confdir):
+                os.makedirs(confdir)
+            with open(os.path.join(confdir, 'output.dat'), 'w') as f:
+                f.write(psi4_output(calctype, coords, -38.0 * natoms + ene,
+                                    rng.randint(3, 20), filler=filler))
+            with open(os.path.join(confdir, 'timer.dat'), 'w') as f:
+                f.write(timer_output(rng.uniform(10, 1000)))
+    return sdf
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='kind')
+
+    sp = subparsers.add_parser('sdf', help="Write a synthetic SDF file.")
+    sp.add_argument("-o", "--outfile", required=True)
+    sp.add_argument("--tags", default="mm", choices=["mm", "opt", "spe"],
+        help="Which SD tags to write on each conformer.")
+
+    up = subparsers.add_parser('uniq',
+        help="Write an SDF stream in which every molecule appears twice.")
+    up.add_argument("-o", "--outfile", required=True,
+        help="Output file, which may be a named pipe, or - for stdout.")
+    up.add_argument("--mols", type=int, default=10)
+    up.add_argument("--atoms", type=int, default=20)
+    up.add_argument("--seed", type=int, default=0)
+
+    cp = subparsers.add_parser('campaign',
+        help="Write an SDF file plus fake Psi4 outputs of each conformer.")
+    cp.add_argument("-o", "--outdir", required=True)
+    cp.add_argument("--calctype", default="opt",
+        choices=["opt", "spe", "hess"])
+    cp.add_argument("--filler", type=int, default=100,
+        help="Lines of SCF iterations per energy in each output file.")
+
+    for p in (sp, cp):
+        p.add_argument("--mols", type=int, default=10)
+        p.add_argument("--confs", type=int, default=5)
+        p.add_argument("--atoms", type=int, default=20)
+        p.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.kind == 'sdf':
+        synthetic_sdf(args.outfile, args.mols, args.confs, args.atoms,
+                      args.tags, args.seed)
+    elif args.kind == 'uniq':
+        if args.outfile == '-':
+            uniq_stream(sys.stdout, args.mols, args.atoms, args.seed)
+        else:
+            with open(args.outfile, 'w') as f:
+                uniq_stream(f, args.mols, args.atoms, args.seed)
+    elif args.kind == 'campaign':
+        synthetic_campaign(args.outdir, args.mols, args.confs, args.atoms,
+                           args.calctype, args.seed, args.filler)
+    else:
+        parser.print_help()
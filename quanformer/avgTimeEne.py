@@ -9,53 +9,13 @@ import openeye.oechem as oechem
 import numpy as np
 import argparse
 import proc_tags as pt
+import time_stats
 
 ### ------------------- Functions -------------------
 
 
 
 
-def timeAvg(sdfRef, method, basis, steps=False):
-    """
-
-    For an SDF file with all confs of all mols, get the average runtime
-       of all conformers for each molecule
-
-    Parameters
-    ----------
-    sdfRef | str  | path+name of SDF file with times for all confs of all mols
-    steps  | Bool | average number of steps instead of runtime seconds
-
-    """
-
-    # Open reference file.
-    print("Opening SDF file %s" % sdfRef)
-    ifsRef = oechem.oemolistream()
-    ifsRef.SetConfTest( oechem.OEAbsoluteConfTest() )
-    if not ifsRef.open(sdfRef):
-        oechem.OEThrow.Fatal("Unable to open %s for reading" % sdfRef)
-    molsRef = ifsRef.GetOEMols()
-
-    timeF = open(os.path.join(os.path.dirname(sdfRef),"timeAvgs.txt"), 'a')
-    timeF.write("\nAnalyzing file: %s \n" % (sdfRef))
-    if not steps: timeF.write("\nAverage runtime (sec) over all confs for each molecule\n")
-    else: timeF.write("\nAverage number of steps over all confs for each molecule\n")
-
-    # Grab all the times.
-    for rmol in molsRef:
-        if not steps:
-            tmol = np.array(map(float, pt.get_sd_list(rmol, "runtime", method, basis)))
-        else:
-            tmol = np.array(map(float, pt.get_sd_list(rmol, "step", method, basis)))
-
-        # exclude conformers for which job did not finish (nan)
-        nanIndices = np.argwhere(np.isnan(tmol))
-        for i in reversed(nanIndices): # loop in reverse to delete correctly
-            tmol = np.delete(tmol, i)
-        timeF.write( "%s\t%d confs\t\t%.3f\n" % (rmol.GetTitle(), tmol.size, np.mean(tmol)) )
-    timeF.close()
-
-
 def calcRelEne(sdfRef, method, basis, eFromOpt=False,outfn='relene.dat'):
     """
 
@@ -118,8 +78,10 @@ def calcRelEne(sdfRef, method, basis, eFromOpt=False,outfn='relene.dat'):
 
 def main(**kwargs):
     if opt['time']:
-        timeAvg(opt['filename'], opt['method'], opt['basisset'], steps=True)
-        timeAvg(opt['filename'], opt['method'], opt['basisset'], steps=False)
+        # steps and runtimes are gathered from a single read of the file
+        time_stats.time_stats([opt['filename']],
+            ["%s/%s" % (opt['method'], opt['basisset'])],
+            outdir=os.path.dirname(os.path.abspath(opt['filename'])))
     if opt['relene']:
         calcRelEne(opt['filename'], opt['method'], opt['basisset'], opt['efromopt'])
 
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+"""
+campaign_status.py
+
+Purpose:    Count how many conformer calculations of a campaign are done,
+            failed, running, or not started, without find/grep loops over the
+            job tree. Molecule directories of maindir/molName/confNumber/ are
+            scanned in parallel threads with os.scandir, and each conformer is
+            classified from which of its input, output, and timer files exist
+            and from the end of its output file:
+            - done:        output ends with the Psi4 completion message, or
+                           output is compressed (see output_io.py), or the
+                           result is in the QM cache (cache.key file)
+            - failed:      output ends with a Psi4 error message, or output
+                           has not changed for longer than --stale hours
+            - running:     output exists without either message
+            - not started: no output yet
+            Molecules packed by job_archive.py are classified from the
+            members of their archive.
+
+            Classifications are cached in maindir/.campaign_status.json.
+            On the next run, done and failed conformers whose directory did
+            not change are not read again, and other conformers are only read
+            again if their output file changed.
+
+            The estimated time left uses the mean wall time of done
+            conformers from their timer files, assuming running jobs are half
+            done and the number of jobs running at once stays the same.
+
+Usage:      python campaign_status.py -d maindir
+            python campaign_status.py -d maindir --summary --list failed
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import json
+import time
+import collections
+import concurrent.futures
+
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+try:
+    import quanformer.pipeline_state as pipeline_state
+except ModuleNotFoundError:
+    import pipeline_state
+try:
+    import quanformer.qm_cache as qm_cache
+except ModuleNotFoundError:
+    import qm_cache
+
+CACHE_FILE = '.campaign_status.json'
+STATUSES = ['done', 'failed', 'running', 'not_started']
+
+### ------------------- Functions -------------------
+
+
+def wall_time(timef):
+    """
+    Get the average wall time in seconds of a Psi4 timer file, which may be
+    compressed or in an archive, or None if it cannot be read.
+    """
+    try:
+        with output_io.open_output(timef) as f:
+            times = [float(line.split()[2]) for line in f
+                     if "Wall Time:" in line]
+    except (OSError, ValueError, IndexError):
+        return None
+    return sum(times) / len(times) if times else None
+
+
+def tail_status(tail):
+    """
+    Classify a conformer from the end of its output file.
+    """
+    if output_io.PSI4_DONE in tail:
+        return 'done'
+    if any(err in tail for err in output_io.PSI4_ERRORS):
+        return 'failed'
+    return 'running'
+
+
+def classify_conf(confdir, dir_mtime, cached=None, psiout='output.dat',
+                  timeout='timer.dat'):
+    """
+    Classify one conformer directory.
+
+    Parameters
+    ----------
+    confdir : string, full path of the conformer directory
+    dir_mtime : int, modification time of the directory in ns
+    cached : list of a record of an earlier run, or None
+    psiout : string, name of the Psi4 output files
+    timeout : string, name of the Psi4 timer files
+
+    Returns
+    -------
+    record : list of [status, dir_mtime, output (mtime, size) or None,
+        wall time in seconds or None, output mtime in s or None]
+
+    """
+    if cached is not None and cached[0] in ('done', 'failed') and \
+            cached[1] == dir_mtime:
+        return cached
+
+    with os.scandir(confdir) as it:
+        entries = dict((e.name, e) for e in it)
+
+    if psiout not in entries:
+        done = qm_cache.KEY_FILE in entries or any(
+            psiout + ext in entries for ext in output_io.COMPRESSED)
+        status = 'done' if done else 'not_started'
+        walltime = None
+        if done:
+            walltime = wall_time(os.path.join(confdir, timeout))
+        return [status, dir_mtime, None, walltime, None]
+
+    st = entries[psiout].stat()
+    key = [st.st_mtime_ns, st.st_size]
+    if cached is not None and cached[2] == key:
+        status = cached[0]
+    else:
+        status = tail_status(output_io.read_tail(entries[psiout].path))
+    walltime = None
+    if status == 'done':
+        walltime = wall_time(os.path.join(confdir, timeout))
+    return [status, dir_mtime, key, walltime, st.st_mtime]
+
+
+def scan_molecule(moldir, cached=None, psiout='output.dat',
+                  timeout='timer.dat'):
+    """
+    Classify all conformers of one molecule directory.
+
+    Returns
+    -------
+    confs : dictionary of confs[confNumber] = record of classify_conf
+
+    """
+    cached = cached or {}
+    confs = {}
+    try:
+        it = os.scandir(moldir)
+    except (FileNotFoundError, NotADirectoryError):
+        return confs
+    with it:
+        for entry in it:
+            if not entry.name.isdigit() or not entry.is_dir():
+                continue
+            confs[entry.name] = classify_conf(
+                entry.path, entry.stat().st_mtime_ns,
+                cached.get(entry.name), psiout, timeout)
+    return confs
+
+
+def scan_archive(archive, psiout='output.dat', timeout='timer.dat'):
+    """
+    Classify all conformers of a molecule packed by job_archive.py.
+    Conformers with an output file are done unless it ends with an error.
+    """
+    names = output_io.open_archive(archive)[1]
+    confs = {}
+    for name in names:
+        parts = name.split('/')
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        if parts[2] in [psiout + ext for ext in [''] + list(
+                output_io.COMPRESSED)]:
+            path = archive + '/' + name
+            confs[parts[1]] = [tail_status(output_io.read_tail(path)), None,
+                               None, wall_time(os.path.join(
+                                   archive, parts[0], parts[1], timeout)),
+                               None]
+        elif parts[1] not in confs:
+            confs[parts[1]] = ['not_started', None, None, None, None]
+    output_io.close_archive(archive)
+    return confs
+
+
+def load_cache(maindir, psiout):
+    fname = os.path.join(maindir, CACHE_FILE)
+    if not os.path.exists(fname):
+        return {}
+    try:
+        with open(fname) as f:
+            cache = json.load(f)
+    except ValueError:
+        return {}
+    if cache.get('psiout') != psiout:
+        return {}
+    return cache.get('mols', {})
+
+
+def scan(maindir, psiout='output.dat', timeout='timer.dat', nthreads=16,
+         use_cache=True):
+    """
+    Classify every conformer of a campaign, reusing and updating the cache
+    of classifications.
+
+    Parameters
+    ----------
+    maindir : string, main directory of the calculations
+    psiout : string, name of the Psi4 output files
+    timeout : string, name of the Psi4 timer files
+    nthreads : int, number of molecule directories scanned at once
+    use_cache : Boolean, read and write the cache file
+
+    Returns
+    -------
+    mols : ordered dictionary of mols[molName] = {'key': archive stamp or
+        None, 'confs': {confNumber: record of classify_conf}}
+
+    """
+    maindir = os.path.abspath(maindir)
+    cached = load_cache(maindir, psiout) if use_cache else {}
+
+    moldirs = []
+    archives = []
+    with os.scandir(maindir) as it:
+        for entry in it:
+            ext = os.path.splitext(entry.name)[1]
+            if entry.is_dir():
+                moldirs.append((entry.name, entry.path))
+            elif ext in output_io.ARCHIVES and entry.is_file():
+                st = entry.stat()
+                archives.append((entry.name[:-len(ext)], entry.path,
+                                 [st.st_mtime_ns, st.st_size]))
+
+    def scan_one(moldir):
+        molname, path = moldir
+        old = cached.get(molname, {})
+        return molname, {'key': None, 'confs': scan_molecule(
+            path, old.get('confs'), psiout, timeout)}
+
+    mols = {}
+    with concurrent.futures.ThreadPoolExecutor(nthreads) as pool:
+        for molname, result in pool.map(scan_one, moldirs):
+            if result['confs']:
+                mols[molname] = result
+
+    # archives share open handles of output_io so are read in this thread
+    for molname, path, stamp in archives:
+        old = cached.get(molname, {})
+        if old.get('key') == stamp:
+            mols[molname] = old
+        else:
+            mols[molname] = {'key': stamp,
+                             'confs': scan_archive(path, psiout, timeout)}
+    mols = collections.OrderedDict(sorted(mols.items()))
+
+    if use_cache:
+        pipeline_state.atomic_write(
+            os.path.join(maindir, CACHE_FILE),
+            json.dumps({'psiout': psiout, 'mols': mols}).encode())
+    return mols
+
+
+def conf_status(record, stale=None, now=None):
+    """
+    Get the status of a conformer record, counting running outputs that
+    have not changed for more than stale hours as failed.
+    """
+    now = time.time() if now is None else now
+    if record[0] == 'running' and stale is not None and \
+            record[4] is not None and now - record[4] > stale * 3600:
+        return 'failed'
+    return record[0]
+
+
+def count_statuses(mols, stale=None, now=None):
+    """
+    Count conformers of each status, by molecule and in total.
+
+    Parameters
+    ----------
+    mols : dictionary from scan()
+    stale : float, hours after which a running output that has not changed
+        counts as failed; None keeps them running
+    now : float, current time in seconds since the epoch
+
+    Returns
+    -------
+    counts : ordered dictionary of counts[molName][status] = int
+    totals : dictionary of totals[status] = int
+    walltimes : list of wall times in seconds of done conformers
+
+    """
+    now = time.time() if now is None else now
+    counts = collections.OrderedDict()
+    totals = dict((s, 0) for s in STATUSES)
+    walltimes = []
+    for molname, mol in mols.items():
+        counts[molname] = dict((s, 0) for s in STATUSES)
+        for conf, record in mol['confs'].items():
+            status = conf_status(record, stale, now)
+            counts[molname][status] += 1
+            totals[status] += 1
+            if status == 'done' and record[3] is not None:
+                walltimes.append(record[3])
+    return counts, totals, walltimes
+
+
+def eta_hours(totals, walltimes):
+    """
+    Estimate hours left for running and not started calculations, or None
+    if no calculation is done yet.
+    """
+    if not walltimes:
+        return None
+    mean = sum(walltimes) / len(walltimes)
+    left = totals['not_started'] * mean + totals['running'] * mean / 2.
+    return left / max(totals['running'], 1) / 3600.
+
+
+def status_report(maindir, psiout='output.dat', timeout='timer.dat',
+                  stale=None, summary=False, nthreads=16, use_cache=True,
+                  listing=None):
+    """
+    Print the number of conformers of each status for each molecule and
+    for the whole campaign, with an estimate of the time left. If listing
+    is one of STATUSES, also print the directories of those conformers.
+
+    Returns
+    -------
+    totals : dictionary of totals[status] = number of conformers
+    eta : float, estimated hours left, or None
+
+    """
+    start = time.time()
+    mols = scan(maindir, psiout, timeout, nthreads, use_cache)
+    counts, totals, walltimes = count_statuses(mols, stale)
+    header = "%-30s %6s %6s %6s %8s %12s" % ('molecule', 'confs', 'done',
+                                             'failed', 'running',
+                                             'not started')
+    print(header)
+    if not summary:
+        for molname, c in counts.items():
+            print("%-30s %6d %6d %6d %8d %12d" %
+                  (molname, sum(c.values()), c['done'], c['failed'],
+                   c['running'], c['not_started']))
+    nconfs = sum(totals.values())
+    print("%-30s %6d %6d %6d %8d %12d" %
+          ('TOTAL (%d molecules)' % len(counts), nconfs, totals['done'],
+           totals['failed'], totals['running'], totals['not_started']))
+
+    eta = eta_hours(totals, walltimes)
+    if nconfs:
+        print("\n%.1f%% of conformers done" % (100. * totals['done'] / nconfs))
+    if eta is None:
+        print("Time left: unknown until a calculation is done")
+    else:
+        print("Time left: about %.1f hours (mean wall time %.0f s, %d "
+              "running)" % (eta, sum(walltimes) / len(walltimes),
+                            totals['running']))
+    print("Scanned %s in %.2f s" % (maindir, time.time() - start))
+
+    if listing is not None:
+        print("\nConformers %s:" % listing.replace('_', ' '))
+        now = time.time()
+        for molname, mol in mols.items():
+            for conf in sorted(mol['confs'], key=int):
+                if conf_status(mol['confs'][conf], stale, now) == listing:
+                    print(os.path.join(maindir, molname, conf))
+    return totals, eta
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-d", "--maindir", required=True,
+        help="Main directory with molName/confNumber subdirectories.")
+    parser.add_argument("-o", "--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+    parser.add_argument("-t", "--timeout", default="timer.dat",
+        help="Name of the Psi4 timer files. Default is timer.dat")
+    parser.add_argument("--stale", type=float, default=None,
+        help="Hours after which a running output that has not changed "
+             "counts as failed, e.g., of a job killed by the queue.")
+    parser.add_argument("--summary", action="store_true", default=False,
+        help="Print campaign totals only, without a row per molecule.")
+    parser.add_argument("--list", default=None, choices=STATUSES,
+        help="Also print the directories of conformers of this status.")
+    parser.add_argument("--nthreads", type=int, default=16,
+        help="Number of molecule directories scanned at once. Default 16.")
+    parser.add_argument("--nocache", action="store_true", default=False,
+        help="Classify all conformers again without reading or writing "
+             "the cache file.")
+
+    args = parser.parse_args()
+    status_report(args.maindir, args.psiout, args.timeout, args.stale,
+                  args.summary, args.nthreads, not args.nocache, args.list)
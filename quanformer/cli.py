@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""
+cli.py
+
+Purpose:    Single entry point to Quanformer with one subcommand per stage.
+            Only the modules needed by the requested subcommand are imported,
+            and only after its arguments are parsed, so that --help and
+            light subcommands do not wait on OEChem, matplotlib, or scipy.
+
+Usage:      python cli.py setup -f set1.smi -m 'mp2' -b 'def2-SV(P)'
+            python cli.py results -f set1-200.sdf
+            python cli.py shard -f set1-200.sdf -n 8
+            python cli.py merge -m set1_shards/set1-200.shards.json -s 220
+            python cli.py timestats -f set1-210.sdf -t 'mp2/def2-SV(P)'
+            python cli.py modsem -i set1-hess.sdf -p set1-hess.pickle
+            python cli.py status -d set1 --summary
+            python cli.py triage -d set1 --restart
+            python cli.py match -i match.in --verbose --eplot
+            python cli.py matchplot -i plot.in -t set1 --eheatplot
+            python cli.py stitch -i stitch.in --reffile set1-220.sdf
+            python cli.py plottimes -i times.in
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import sys
+import argparse
+
+# the pipeline modules import each other by name, as when run as scripts
+_here = os.path.dirname(os.path.abspath(__file__))
+if _here not in sys.path:
+    sys.path.insert(0, _here)
+
+### ------------------- Functions -------------------
+
+
+def run_executor(args):
+    """
+    Run setup or results through executor.py.
+    """
+    import executor
+    opt = vars(args)
+    opt['setup'] = args.command == 'setup'
+    opt['results'] = args.command == 'results'
+    if not os.path.exists(opt['filename']):
+        sys.exit("Input file %s does not exist. Try again." % opt['filename'])
+    if opt['calctype'] not in {'opt', 'spe', 'hess'}:
+        sys.exit("Specify a valid calculation type.")
+    if opt['shards'] is not None:
+        if not opt['filename'].endswith('.sdf'):
+            sys.exit("Shards can only be used with SDF input.")
+        try:
+            executor.run_shards(**opt)
+        except ValueError as e:
+            sys.exit("ERROR: %s" % e)
+    else:
+        executor.main(**opt)
+
+
+def run_shard(args):
+    import shard_sdf
+    shard_sdf.shard_sdf(args.filename, args.nshards, args.outdir, args.weight)
+
+
+def run_merge(args):
+    import shard_sdf
+    try:
+        shard_sdf.merge_shards(args.manifest, args.suffix, args.outfile,
+                               not args.nostrict)
+    except ValueError as e:
+        sys.exit("ERROR: %s" % e)
+
+
+def run_timestats(args):
+    import time_stats
+    if len(args.filenames) != len(args.theory):
+        sys.exit("Specify one level of theory per input file.")
+    time_stats.time_stats(args.filenames, args.theory, args.package,
+                          args.calctype)
+
+
+def run_modsem(args):
+    import modsem
+    modsem.modsem(args.infile, args.pfile, args.outfile, args.scaling)
+
+
+def run_status(args):
+    import campaign_status
+    campaign_status.status_report(args.maindir, args.psiout, args.timeout,
+                                  args.stale, args.summary, args.nthreads,
+                                  not args.nocache, args.list)
+
+
+def run_triage(args):
+    import triage
+    triage.triage(args.maindir, args.psiout, args.timeout, args.stale,
+                  args.restart, args.classes)
+
+
+def run_match(args):
+    import match_minima
+    opt = vars(args)
+    del opt['command'], opt['func']
+    match_minima.main(**opt)
+
+
+def run_matchplot(args):
+    import match_plot
+    if args.onescatter:
+        match_plot.single_scatter(args)
+    else:
+        match_plot.match_plot(args)
+
+
+def run_stitch(args):
+    import stitch_spe
+    stitch_spe.main(args.infile, args.reffile, args.plotbars, args.profile)
+
+
+def run_plottimes(args):
+    import plotTimes
+    plotTimes.main(args.infile)
+
+
+def build_parser():
+    """
+    Build the argument parser of all subcommands. No pipeline modules are
+    imported here, only the options shared with executor.py.
+    """
+    import pipeline_args
+    parser = argparse.ArgumentParser(
+        prog='quanformer',
+        description="Quanformer pipeline for QM calculations of conformers.")
+    subparsers = parser.add_subparsers(dest='command')
+
+    for name, desc in [('setup', "Generate conformers and Psi4 inputs."),
+                       ('results', "Process Psi4 outputs and filter.")]:
+        sp = subparsers.add_parser(name, help=desc)
+        pipeline_args.add_pipeline_args(sp)
+        sp.set_defaults(func=run_executor)
+
+    sp = subparsers.add_parser('shard', help="Split SDF file into shards.")
+    sp.add_argument("-f", "--filename", required=True,
+        help="Pipeline SDF file to split, e.g., set1-200.sdf")
+    sp.add_argument("-n", "--nshards", type=int, required=True,
+        help="Number of shards.")
+    sp.add_argument("-o", "--outdir", default=None,
+        help="Directory of shards. Default is [prefix]_shards.")
+    sp.add_argument("-w", "--weight", default="confs",
+        choices=["confs", "cost", "hash"],
+        help="Balance shards by number of conformers or predicted QM cost, "
+             "or place molecules by a stable hash of their titles.")
+    sp.set_defaults(func=run_shard)
+
+    sp = subparsers.add_parser('merge', help="Merge shards of one suffix.")
+    sp.add_argument("-m", "--manifest", required=True,
+        help="JSON manifest written by the shard stage.")
+    sp.add_argument("-s", "--suffix", required=True,
+        help="Pipeline suffix of the shard files to merge, e.g., 220")
+    sp.add_argument("-o", "--outfile", default=None,
+        help="Merged SDF file. Default is [prefix]-[suffix].sdf")
+    sp.add_argument("--nostrict", action="store_true", default=False,
+        help="Merge even if some shards fail the integrity checks.")
+    sp.set_defaults(func=run_merge)
+
+    sp = subparsers.add_parser('timestats',
+        help="Runtime and opt step statistics of SDF files.")
+    sp.add_argument("-f", "--filenames", nargs='+', required=True,
+        help="SDF file(s) to be processed.")
+    sp.add_argument("-t", "--theory", nargs='+', required=True,
+        help="Level(s) of theory in 'method/basis' format, one per file.")
+    sp.add_argument("-c", "--calctype", default="opt",
+        help="One of 'opt', 'spe', or 'hess'. Default is 'opt'.")
+    sp.add_argument("-p", "--package", default="Psi4",
+        help="QM software package, 'Psi4' or 'Turbomole'.")
+    sp.set_defaults(func=run_timestats)
+
+    sp = subparsers.add_parser('modsem',
+        help="Modified Seminario force constants from Hessians.")
+    sp.add_argument("-i", "--infile", required=True,
+        help="Input SDF file with all conformers of Hessian data")
+    sp.add_argument("-p", "--pfile", required=True,
+        help="Associated pickle file with dictionary of extracted Hessian matrices")
+    sp.add_argument("-o", "--outfile", default="modsem.dat",
+        help="Output table of bond and angle parameters")
+    sp.add_argument("-s", "--scaling", type=float, default=1.,
+        help="Vibrational scaling factor of the QM level of theory")
+    sp.set_defaults(func=run_modsem)
+
+    sp = subparsers.add_parser('status',
+        help="Count done/failed/running/not started calculations.")
+    sp.add_argument("-d", "--maindir", required=True,
+        help="Main directory with molName/confNumber subdirectories.")
+    sp.add_argument("-o", "--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+    sp.add_argument("-t", "--timeout", default="timer.dat",
+        help="Name of the Psi4 timer files. Default is timer.dat")
+    sp.add_argument("--stale", type=float, default=None,
+        help="Hours after which an unchanged running output counts as failed.")
+    sp.add_argument("--summary", action="store_true", default=False,
+        help="Print campaign totals only.")
+    sp.add_argument("--list", default=None,
+        choices=['done', 'failed', 'running', 'not_started'],
+        help="Also print the directories of conformers of this status.")
+    sp.add_argument("--nthreads", type=int, default=16,
+        help="Number of molecule directories scanned at once.")
+    sp.add_argument("--nocache", action="store_true", default=False,
+        help="Classify all conformers again, ignoring the cache file.")
+    sp.set_defaults(func=run_status)
+
+    sp = subparsers.add_parser('triage',
+        help="Classify failed calculations and write restart inputs.")
+    sp.add_argument("-d", "--maindir", required=True,
+        help="Main directory with molName/confNumber subdirectories.")
+    sp.add_argument("-o", "--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+    sp.add_argument("-t", "--timeout", default="timer.dat",
+        help="Name of the Psi4 timer files. Default is timer.dat")
+    sp.add_argument("--stale", type=float, default=None,
+        help="Hours after which an unchanged output without completion or "
+             "error message counts as failed.")
+    sp.add_argument("--restart", action="store_true", default=False,
+        help="Keep files of failed calculations as [name].failN and write "
+             "restart inputs.")
+    sp.add_argument("--classes", nargs='+', default=None,
+        choices=['naming', 'scratch', 'memory', 'scf', 'opt_maxiter',
+                 'incomplete'],
+        help="Failure classes to restart. Default is all of them.")
+    sp.set_defaults(func=run_triage)
+
+    sp = subparsers.add_parser('match',
+        help="Match conformer minima of files of different QM methods.")
+    sp.add_argument("-i", "--input", required=True,
+        help="Text file with one 'method/basis, SDF file' line per file; "
+             "the first file is the reference.")
+    sp.add_argument("--readpickle", action="store_true", default=False,
+        help="Read matches from match.pickle of an earlier run.")
+    sp.add_argument("--verbose", action="store_true", default=False,
+        help="Write relative energies of each molecule to relene_*.dat files.")
+    sp.add_argument("--eplot", action="store_true", default=False,
+        help="Line plots of relative energies for each molecule.")
+    sp.add_argument("--tplot", action="store_true", default=False,
+        help="Bar plots of conformer-averaged opt times for each molecule.")
+    sp.add_argument("--batch", action="store_true", default=False,
+        help="Render plots in parallel with the Agg backend.")
+    sp.add_argument("--nprocs", type=int, default=None,
+        help="Number of processes for --batch plotting.")
+    sp.add_argument("--fmt", default="png",
+        help="Output format of --batch plots, e.g., png, pdf, svg.")
+    sp.add_argument("--dpi", type=int, default=100,
+        help="Resolution of --batch plots in raster formats.")
+    sp.add_argument("--profile", default=None,
+        help="Write profiles of hot sections into this directory.")
+    sp.set_defaults(func=run_match)
+
+    sp = subparsers.add_parser('matchplot',
+        help="Heat and scatter plots of match results.")
+    sp.add_argument("-i", "--infile", required=True,
+        help="Text file with one 'method/basis, relene .dat file' line per "
+             "file, or one .dat file with --onescatter.")
+    sp.add_argument("-t", "--title", default="",
+        help="Name/identifier of molecule")
+    sp.add_argument("--eheatplot", action="store_true", default=False,
+        help="Heat plot of RMS errors of energies by methods.")
+    sp.add_argument("--theatplot", action="store_true", default=False,
+        help="Heat plot of relative opt times by methods.")
+    sp.add_argument("--etscatter", action="store_true", default=False,
+        help="Scatter plots of log ratio of opt times vs. RMS error.")
+    sp.add_argument("--onescatter", action="store_true", default=False,
+        help="Single scatter plot from one .dat file as the input file.")
+    sp.add_argument("--batch", action="store_true", default=False,
+        help="Render plots in parallel with the Agg backend.")
+    sp.add_argument("--nprocs", type=int, default=None,
+        help="Number of processes for --batch plotting.")
+    sp.add_argument("--fmt", default="png",
+        help="Output format of --batch plots, e.g., png, pdf, svg.")
+    sp.add_argument("--dpi", type=int, default=100,
+        help="Resolution of --batch plots in raster formats.")
+    sp.set_defaults(func=run_matchplot)
+
+    sp = subparsers.add_parser('stitch',
+        help="Compare single point energies of files of different methods.")
+    sp.add_argument("-i", "--infile", required=True,
+        help="Text file with one 'title, SDF file, calctype, method, basis' "
+             "line per file.")
+    sp.add_argument("--reffile", default=None,
+        help="SDF file of the input file to compute RMSDs of energies against.")
+    sp.add_argument("--plotbars", action="store_true", default=False,
+        help="Bar plots of each file against the reference file.")
+    sp.add_argument("--profile", default=None,
+        help="Write profiles of hot sections into this directory.")
+    sp.set_defaults(func=run_stitch)
+
+    sp = subparsers.add_parser('plottimes',
+        help="Bar plot of runtimes averaged over conformers of each molecule.")
+    sp.add_argument("-i", "--infile", required=True,
+        help="Text file with one 'method/basis, SDF file, tag' line per file.")
+    sp.set_defaults(func=run_plottimes)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,9 +12,32 @@ import os, sys
 import openeye.oechem as oechem
 import shutil
 import json
-
-
-def make_psi_input(mol, label, method, basisset, calctype='opt', mem=None):
+import collections
+
+try:
+    import quanformer.instrument as instrument
+except ModuleNotFoundError:
+    import instrument
+try:
+    import quanformer.pipeline_state as pipeline_state
+except ModuleNotFoundError:
+    import pipeline_state
+try:
+    import quanformer.qm_cache as qm_cache
+except ModuleNotFoundError:
+    import qm_cache
+try:
+    import quanformer.cost_model as cost_model
+except ModuleNotFoundError:
+    import cost_model
+try:
+    import quanformer.warm_start as warm_start
+except ModuleNotFoundError:
+    import warm_start
+
+
+def make_psi_input(mol, label, method, basisset, calctype='opt', mem=None,
+                   save_wfn=False, guess_file=None):
     """
     Get coordinates from input mol, and generate/format input text for
     Psi4 calculation.
@@ -38,6 +61,12 @@ def make_psi_input(mol, label, method, basisset, calctype='opt', mem=None):
         How much memory each Psi4 job should take. If not specified, the
         default in Psi4 is 500 Mb. Examples: "2000 MB" "1.5 GB"
         http://www.psicode.org/psi4manual/master/psithoninput.html
+    save_wfn : Boolean
+        If True, write final orbitals to wfn.npy for warm starts of a
+        later stage
+    guess_file : string
+        If given, read this orbital file (from save_wfn of an earlier stage)
+        as the SCF guess instead of SAD
 
     Returns
     -------
@@ -92,7 +121,10 @@ def make_psi_input(mol, label, method, basisset, calctype='opt', mem=None):
     # http://www.psicode.org/psi4manual/master/scf.html#recommendations
     # http://www.psicode.org/psi4manual/master/dft.html#recommendations
     inputstring += '\n\nset scf_type df'
-    inputstring += '\nset guess sad'
+    if guess_file is not None:
+        inputstring += '\nset guess read'
+    else:
+        inputstring += '\nset guess sad'
 
     # explicitly specify MP2 RI-auxiliary basis for [Ahlrichs] basis set
     # http://www.psicode.org/psi4manual/master/basissets_byfamily.html
@@ -106,15 +138,28 @@ def make_psi_input(mol, label, method, basisset, calctype='opt', mem=None):
 
     inputstring += ('\n\nset basis %s' % (basisset))
     inputstring += ('\nset freeze_core True')
+    # read orbitals of an earlier calculation as guess
+    kwargs = ''
+    if guess_file is not None:
+        kwargs = ', restart_file=\'%s\'' % (guess_file)
     # specify command for type of calculation
-    if calctype == 'opt':
-        inputstring += ('\noptimize(\'%s\')\n\n' % (method))
+    if calctype == 'opt' and save_wfn:
+        inputstring += ('\nE, wfn = optimize(\'%s\'%s, return_wfn=True)'
+                        '\nwfn.to_file(\'wfn\')\n\n' % (method, kwargs))
+    elif calctype == 'opt':
+        inputstring += ('\noptimize(\'%s\'%s)\n\n' % (method, kwargs))
+    elif calctype == 'spe' and save_wfn:
+        inputstring += ('\nE, wfn = energy(\'%s\'%s, return_wfn=True)'
+                        '\nwfn.to_file(\'wfn\')\n\n' % (method, kwargs))
     elif calctype == 'spe':
-        inputstring += ('\nenergy(\'%s\')\n\n' % (method))
+        inputstring += ('\nenergy(\'%s\'%s)\n\n' % (method, kwargs))
     elif calctype == 'hess':
         inputstring += (
-            '\nH, wfn = hessian(\'%s\', return_wfn=True)\nwfn.hessian().print_out()\n\n'
-            % (method))
+            '\nH, wfn = hessian(\'%s\'%s, return_wfn=True)\nwfn.hessian().print_out()\n'
+            % (method, kwargs))
+        if save_wfn:
+            inputstring += ('wfn.to_file(\'wfn\')\n')
+        inputstring += '\n'
 
     return inputstring
 
@@ -233,12 +278,44 @@ def make_psi_json(mol, label, method, basisset, calctype='opt', mem=None):
     return inputdict
 
 
+def warm_orbitals(conf, title, confnum, warm_start_dir):
+    """
+    Find the orbitals of the earlier stage to warm start one conformer.
+
+    Parameters
+    ----------
+    conf : OEChem conformer, with 'Original omega conformer number' SD tag
+        giving its directory number in the earlier stage
+    title : string, molecule title
+    confnum : int, conformer number of the new calculation
+    warm_start_dir : string, main directory of the earlier stage, or None
+
+    Returns
+    -------
+    wfn : string, full name of the earlier stage's orbital file, or None
+
+    """
+    if warm_start_dir is None:
+        return None
+    num = warm_start.stage1_conf_number(conf)
+    wfn = os.path.join(warm_start_dir, title, str(num), warm_start.WFN_FILE)
+    if num is not None and os.path.isfile(wfn):
+        return wfn
+    print("No orbitals to warm start {} conformer {}".format(title, confnum))
+    return None
+
+
+@instrument.timed('confs_to_psi')
 def confs_to_psi(insdf,
                  method,
                  basis,
                  calctype='opt',
                  memory=None,
-                 via_json=False):
+                 via_json=False,
+                 history=None,
+                 cores=1,
+                 save_wfn=False,
+                 warm_start_dir=None):
     """
     Read in molecule(s) (and conformers, if present) in insdf file. Create
     Psi4 input calculations for each structure.
@@ -269,9 +346,34 @@ def confs_to_psi(insdf,
         If False, use normal text files for Psi4 input and output.
         - Psi4 input would be in "input.dat"
         - Psi4 output would be in "output.dat"
+    history : string
+        Name of runtime history database from cost_model.py. If given, print
+        the estimated CPU-hours of the new inputs per molecule and in total.
+    cores : int
+        Number of cores per Psi4 job, to convert estimated wall time to CPU time
+    save_wfn : Boolean
+        If True, jobs write final orbitals to wfn.npy for warm starts of a
+        later stage
+    warm_start_dir : string
+        Main directory of an earlier stage run with save_wfn. Orbitals of each
+        conformer's earlier job are copied as its SCF guess. See warm_start.py
     """
     wdir = os.getcwd()
 
+    # skip inputs of calculations already in the shared QM result store
+    cache = qm_cache.from_env()
+
+    # predict cost of the new inputs from past runtimes
+    estimator = None
+    estimates = collections.OrderedDict()
+    if history is not None:
+        estimator = cost_model.Estimator(history, method, basis, calctype,
+                                         cores)
+        if estimator.model is None:
+            print("Not enough runtime history in %s to estimate cost." %
+                  history)
+            estimator = None
+
     ### Read in .sdf file and distinguish each molecule's conformers
     ifs = oechem.oemolistream()
     ifs.SetConfTest(oechem.OEAbsoluteConfTest())
@@ -282,8 +384,10 @@ def confs_to_psi(insdf,
     ### For each molecule: for each conf, generate input
     for mol in ifs.GetOEMols():
         print(mol.GetTitle(), mol.NumConfs())
+        instrument.count('mols')
         if not mol.GetTitle():
             sys.exit("ERROR: OEMol must have title assigned! Exiting.")
+        nwritten = 0
         for i, conf in enumerate(mol.GetConfs()):
             # change into subdirectory ./mol/conf/
             subdir = os.path.join(wdir, "%s/%s" % (mol.GetTitle(), i + 1))
@@ -294,24 +398,49 @@ def confs_to_psi(insdf,
                     os.path.join(subdir, 'input.dat')))
                 continue
             label = mol.GetTitle() + '_' + str(i + 1)
+            instrument.count('inputs')
+            # write whole input then rename so no partial input is left
             if via_json:
-                ofile = open(os.path.join(subdir, 'input.py'), 'w')
-                ofile.write("# molecule {}\n\nimport numpy as np\nimport psi4"
-                            "\nimport json\n\njson_data = ".format(label))
-                json.dump(
+                text = "# molecule {}\n\nimport numpy as np\nimport psi4" \
+                       "\nimport json\n\njson_data = ".format(label)
+                text += json.dumps(
                     make_psi_json(conf, label, method, basis, calctype,
                                   memory),
-                    ofile,
                     indent=4,
                     separators=(',', ': '))
-                ofile.write(
-                    "\njson_ret = psi4.json_wrapper.run_json(json_data)\n\n")
-                ofile.write("with open(\"output.json\", \"w\") as ofile:\n\t"
-                            "json.dump(json_ret, ofile, indent=2)\n\n")
+                text += "\njson_ret = psi4.json_wrapper.run_json(json_data)\n\n"
+                text += "with open(\"output.json\", \"w\") as ofile:\n\t" \
+                        "json.dump(json_ret, ofile, indent=2)\n\n"
+                pipeline_state.atomic_write(
+                    os.path.join(subdir, 'input.py'), text, 'w')
             else:
-                ofile = open(os.path.join(subdir, 'input.dat'), 'w')
-                ofile.write(
-                    make_psi_input(conf, label, method, basis, calctype,
-                                   memory))
-            ofile.close()
+                wfn = warm_orbitals(conf, mol.GetTitle(), i + 1,
+                                    warm_start_dir)
+                guess_file = warm_start.GUESS_FILE if wfn else None
+                inputstring = make_psi_input(conf, label, method, basis,
+                                             calctype, memory, save_wfn,
+                                             guess_file)
+                keyfile = os.path.join(subdir, qm_cache.KEY_FILE)
+                if cache is not None:
+                    key = cache.key(inputstring)
+                    if cache.has(key):
+                        instrument.count('cache_hits')
+                        pipeline_state.atomic_write(keyfile, key + '\n', 'w')
+                        continue
+                if os.path.exists(keyfile):
+                    os.remove(keyfile)
+                # orbitals are only needed if the calculation is run
+                if wfn is not None:
+                    shutil.copyfile(wfn, os.path.join(subdir, guess_file))
+                pipeline_state.atomic_write(
+                    os.path.join(subdir, 'input.dat'), inputstring, 'w')
+            nwritten += 1
+        if estimator is not None and nwritten > 0:
+            estimates[mol.GetTitle()] = (nwritten,
+                                         estimator.mol_hours(mol, nwritten))
     ifs.close()
+    if estimator is not None:
+        estimator.report(estimates)
+    if cache is not None:
+        print(cache.report())
+        cache.close()
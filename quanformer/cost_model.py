@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+"""
+cost_model.py
+
+Purpose:    Predict the cost of QM calculations from past runtimes.
+            - ingest: read runtimes of harvested SDF files (from the
+              'QM Psi4 ... Runtime (sec) method/basis' tags) into a compact
+              SQLite history, with descriptors of each molecule:
+              heavy atoms, electrons, basis functions, and rotatable bonds
+            - fit: for each (method, basis, calctype), fit a log-linear model
+              log(runtime) = b0 + b1*log(nbf) + b2*log(heavy) + b3*log(elec)
+                             + b4*rotors
+              Levels of theory with too little history fall back to a model of
+              all basis sets of that method and calctype, then of that calctype.
+            - estimate: predict CPU-hours per molecule and for a whole campaign
+              before submitting jobs; see also confs_to_psi(history=...)
+            - report: accuracy of each model on held-out molecules from
+              k-fold cross validation, grouped by molecule
+
+Usage:      python cost_model.py ingest -d history.sqlite -f set1-210.sdf set2-221.sdf
+            python cost_model.py report -d history.sqlite
+            python cost_model.py estimate -d history.sqlite -f set3-200.sdf \\
+                -m 'mp2' -b 'def2-SV(P)' -t opt --cores 4
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import re
+import math
+import zlib
+import sqlite3
+import collections
+
+import numpy as np
+
+FEATURES = ['log_nbf', 'log_heavy', 'log_electrons', 'rotors']
+
+# minimum number of runs to fit a model
+MIN_RUNS = 2 * (len(FEATURES) + 1)
+
+# runtime tags written by proc_tags.set_sd_tags
+RUNTIME_TAG = re.compile(
+    r'^QM (\S+) (Opt\.|Single Pt\.|Hessian) Runtime \(sec\) (.+)/(.+)$')
+CALCTYPES = {'Opt.': 'opt', 'Single Pt.': 'spe', 'Hessian': 'hess'}
+
+# number of (spherical unless noted) basis functions of H, first-row, and
+# second-row atoms for common basis sets
+BASIS_FUNCTIONS = {
+    'def2-sv(p)': (2, 14, 18),
+    'def2-svp': (5, 14, 18),
+    'def2-svpd': (9, 19, 24),
+    'def2-tzvp': (6, 31, 37),
+    'def2-tzvpp': (14, 31, 37),
+    'def2-tzvpd': (11, 37, 44),
+    'def2-qzvp': (30, 57, 70),
+    'def2-qzvpd': (35, 64, 77),
+    '6-31g': (2, 9, 13),
+    '6-31g*': (2, 15, 19),  # cartesian d
+    '6-31g(d)': (2, 15, 19),
+    '6-31g**': (5, 15, 19),
+    '6-31g(d,p)': (5, 15, 19),
+    '6-31+g(d)': (2, 19, 23),
+    '6-31+g(d,p)': (5, 19, 23),
+    '6-311g(d,p)': (6, 18, 22),
+    '6-311+g(d,p)': (6, 22, 26),
+    'cc-pvdz': (5, 14, 18),
+    'cc-pvtz': (14, 30, 34),
+    'cc-pvqz': (30, 55, 59),
+    'aug-cc-pvdz': (9, 23, 27),
+    'aug-cc-pvtz': (23, 46, 50),
+}
+
+### ------------------- Functions -------------------
+
+
+def basis_functions(atomic_nums, basis):
+    """
+    Get the number of basis functions of a molecule. Unknown basis sets are
+    estimated from the zeta level in their name.
+
+    Parameters
+    ----------
+    atomic_nums : list of atomic numbers of all atoms (including hydrogens)
+    basis : string, name of the basis set
+
+    Returns
+    -------
+    int number of basis functions
+
+    """
+    key = basis.lower()
+    if key in BASIS_FUNCTIONS:
+        per_row = BASIS_FUNCTIONS[key]
+    else:
+        zeta = 4 if 'qz' in key else 3 if 'tz' in key else 2
+        per_row = {2: (5, 14, 18), 3: (14, 30, 34), 4: (30, 55, 59)}[zeta]
+    nbf = 0
+    for z in atomic_nums:
+        if z <= 2:
+            nbf += per_row[0]
+        elif z <= 10:
+            nbf += per_row[1]
+        elif z <= 18:
+            nbf += per_row[2]
+        else:
+            # heavier elements are rare in the pipeline; rough estimate
+            nbf += per_row[2] + 10
+    return nbf
+
+
+def descriptors(atomic_nums, charge, rotors, basis):
+    """
+    Get the descriptors of one molecule for a given basis set.
+
+    Returns
+    -------
+    dictionary of 'heavy', 'electrons', 'nbf', and 'rotors'
+
+    """
+    return {
+        'heavy': sum(1 for z in atomic_nums if z > 1),
+        'electrons': sum(atomic_nums) - charge,
+        'nbf': basis_functions(atomic_nums, basis),
+        'rotors': rotors
+    }
+
+
+def mol_descriptors(mol, basis):
+    """
+    Get the descriptors of an OEChem molecule for a given basis set.
+    """
+    import openeye.oechem as oechem
+    atomic_nums = [a.GetAtomicNum() for a in mol.GetAtoms()]
+    # implicit hydrogens count too
+    atomic_nums += [1] * sum(a.GetImplicitHCount() for a in mol.GetAtoms())
+    return descriptors(atomic_nums, oechem.OENetCharge(mol),
+                       oechem.OECount(mol, oechem.OEIsRotor()), basis)
+
+
+def feature_row(desc):
+    return [
+        1.,
+        math.log(max(desc['nbf'], 1)),
+        math.log(max(desc['heavy'], 1)),
+        math.log(max(desc['electrons'], 1)),
+        float(desc['rotors'])
+    ]
+
+
+def open_history(dbfile):
+    """
+    Open (and create if needed) a runtime history database.
+    """
+    db = sqlite3.connect(dbfile, timeout=60)
+    db.execute("CREATE TABLE IF NOT EXISTS runs (title TEXT, method TEXT, "
+               "basis TEXT, calctype TEXT, runtime REAL, heavy INTEGER, "
+               "electrons INTEGER, nbf INTEGER, rotors INTEGER, steps REAL, "
+               "source TEXT, PRIMARY KEY (title, method, basis, calctype, "
+               "runtime)) WITHOUT ROWID")
+    return db
+
+
+def add_records(db, records):
+    """
+    Add runtime records to the history. A run seen before (same molecule,
+    level of theory, calctype, and runtime), e.g., from both -210 and -220
+    files, is only kept once.
+
+    Parameters
+    ----------
+    db : sqlite3 connection from open_history
+    records : iterable of dictionaries with keys of title, method, basis,
+        calctype, runtime, heavy, electrons, nbf, rotors, steps, source
+
+    Returns
+    -------
+    int number of new records
+
+    """
+    before = db.total_changes
+    db.executemany(
+        "INSERT OR IGNORE INTO runs VALUES (:title, :method, :basis, "
+        ":calctype, :runtime, :heavy, :electrons, :nbf, :rotors, :steps, "
+        ":source)", records)
+    db.commit()
+    return db.total_changes - before
+
+
+def sdf_records(sdffile):
+    """
+    Get runtime records of all conformers of a harvested SDF file, for every
+    level of theory with a runtime tag. Jobs that did not finish are skipped.
+    """
+    import openeye.oechem as oechem
+
+    ifs = oechem.oemolistream()
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    if not ifs.open(sdffile):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % sdffile)
+    source = os.path.basename(sdffile)
+    for mol in ifs.GetOEMols():
+        descs = {}
+        for conf in mol.GetConfs():
+            pairs = [(x.GetTag(), x.GetValue())
+                     for x in oechem.OEGetSDDataPairs(conf)]
+            notes = set(t for t, v in pairs
+                        if 'did not finish' in v.lower())
+            for tag, value in pairs:
+                match = RUNTIME_TAG.match(tag)
+                if not match:
+                    continue
+                pkg, ctype, method, basis = match.groups()
+                if "Note on {} {}/{}".format(ctype, method, basis) in notes:
+                    continue
+                try:
+                    runtime = float(value)
+                except ValueError:
+                    continue
+                if not runtime > 0:
+                    continue
+                steps = float('nan')
+                steptag = "QM {} {} Steps {}/{}".format(pkg, ctype, method,
+                                                        basis)
+                for t, v in pairs:
+                    if t == steptag:
+                        steps = float(v)
+                if basis not in descs:
+                    descs[basis] = mol_descriptors(mol, basis)
+                record = {'title': mol.GetTitle(), 'method': method,
+                          'basis': basis, 'calctype': CALCTYPES[ctype],
+                          'runtime': runtime, 'steps': steps,
+                          'source': source}
+                record.update(descs[basis])
+                yield record
+    ifs.close()
+
+
+def ingest(dbfile, sdffiles):
+    """
+    Add runtimes of harvested SDF files to the history database.
+    """
+    db = open_history(dbfile)
+    for sdffile in sdffiles:
+        nnew = add_records(db, sdf_records(sdffile))
+        print("%s: %d new runtime records" % (sdffile, nnew))
+    db.close()
+
+
+def load_runs(db, method=None, basis=None, calctype=None):
+    """
+    Get runs of the history matching the given level of theory and calctype.
+    Matching of method and basis is case-insensitive; None matches any.
+
+    Returns
+    -------
+    list of dictionaries, one per run
+
+    """
+    query = "SELECT * FROM runs WHERE 1"
+    args = []
+    for name, value in [('method', method), ('basis', basis),
+                        ('calctype', calctype)]:
+        if value is not None:
+            query += " AND lower(%s) = lower(?)" % name
+            args.append(value)
+    cur = db.execute(query, args)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur]
+
+
+def fit(runs, ridge=1e-3):
+    """
+    Fit a log-linear model of runtime.
+
+    Parameters
+    ----------
+    runs : list of run dictionaries with descriptors and 'runtime' in seconds
+    ridge : float, small ridge penalty on coefficients (not the intercept)
+        so that the fit is stable when descriptors are collinear
+
+    Returns
+    -------
+    model : dictionary with 'coef' (list), 'n' (number of runs), and 'sigma'
+        (rms residual of log runtime), or None if too few runs
+
+    """
+    if len(runs) < MIN_RUNS:
+        return None
+    X = np.array([feature_row(r) for r in runs])
+    y = np.log(np.array([r['runtime'] for r in runs]))
+    penalty = ridge * len(runs) * np.eye(X.shape[1])
+    penalty[0, 0] = 0.
+    coef = np.linalg.solve(X.T.dot(X) + penalty, X.T.dot(y))
+    resid = y - X.dot(coef)
+    return {'coef': coef.tolist(), 'n': len(runs),
+            'sigma': float(np.sqrt(np.mean(resid**2)))}
+
+
+def predict(model, desc):
+    """
+    Predict the runtime in seconds of one calculation from its descriptors.
+    """
+    return math.exp(float(np.dot(model['coef'], feature_row(desc))))
+
+
+def get_model(db, method, basis, calctype):
+    """
+    Fit the most specific model with enough history for a level of theory.
+
+    Returns
+    -------
+    model : dictionary from fit, with 'scope' describing the runs used,
+        or None if there are not enough runs for any fallback
+
+    """
+    for scope, m, b in [('%s/%s' % (method, basis), method, basis),
+                        ('%s/any basis' % method, method, None),
+                        ('any theory', None, None)]:
+        model = fit(load_runs(db, m, b, calctype))
+        if model is not None:
+            model['scope'] = "%s %s" % (scope, calctype)
+            return model
+    return None
+
+
+def cpu_hours(seconds, cores=1):
+    return seconds * cores / 3600.
+
+
+def estimate(dbfile, insdf, method, basis, calctype='opt', cores=1):
+    """
+    Estimate the QM cost of all conformers in an SDF file before submission.
+
+    Parameters
+    ----------
+    dbfile : string, name of the runtime history database
+    insdf : string, name of the SDF file to be set up, e.g., set1-200.sdf
+    method : string, QM method
+    basis : string, QM basis set
+    calctype : string, one of 'opt', 'spe', 'hess'
+    cores : int, number of cores of each job to convert wall time to CPU time
+
+    Returns
+    -------
+    estimates : ordered dictionary of estimates[title] = (number of
+        conformers, CPU-hours), or None if there is no model
+
+    """
+    import openeye.oechem as oechem
+
+    estimator = Estimator(dbfile, method, basis, calctype, cores)
+    if estimator.model is None:
+        return None
+    ifs = oechem.oemolistream()
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    if not ifs.open(insdf):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % insdf)
+    estimates = collections.OrderedDict()
+    for mol in ifs.GetOEMols():
+        estimates[mol.GetTitle()] = (mol.NumConfs(),
+                                     estimator.mol_hours(mol, mol.NumConfs()))
+    ifs.close()
+    estimator.report(estimates)
+    return estimates
+
+
+class Estimator(object):
+    """
+    Predict CPU-hours of molecules for one level of theory and calctype.
+    """
+
+    def __init__(self, dbfile, method, basis, calctype='opt', cores=1):
+        db = open_history(dbfile)
+        self.model = get_model(db, method, basis, calctype)
+        db.close()
+        self.basis = basis
+        self.cores = cores
+        self.label = "%s/%s %s" % (method, basis, calctype)
+
+    def mol_hours(self, mol, nconfs):
+        """
+        Predict CPU-hours of nconfs conformers of an OEChem molecule.
+        """
+        seconds = predict(self.model, mol_descriptors(mol, self.basis))
+        return nconfs * cpu_hours(seconds, self.cores)
+
+    def report(self, estimates):
+        """
+        Print CPU-hours per molecule and in total.
+        """
+        print("\nEstimated cost of %s using model of %s (%d runs, "
+              "typical error x%.1f):" %
+              (self.label, self.model['scope'], self.model['n'],
+               math.exp(self.model['sigma'])))
+        total = 0.
+        for title, (nconfs, hours) in estimates.items():
+            print("  %-20s %4d confs %10.2f CPU-hours" % (title, nconfs, hours))
+            total += hours
+        print("  %-20s %4d confs %10.2f CPU-hours\n" %
+              ('TOTAL', sum(n for n, h in estimates.values()), total))
+
+
+def crossval(runs, nfolds=5):
+    """
+    Held-out accuracy of a model. Runs are split into folds by molecule so
+    that conformers of one molecule are never both fit and tested.
+
+    Returns
+    -------
+    dictionary of 'n' (runs tested), 'mae_log' (mean absolute error of log
+        runtime), 'median_ape' (median absolute percent error), 'r2_log',
+        and 'total_ratio' (sum of predicted over sum of actual runtimes),
+        or None if there are too few runs or molecules
+
+    """
+    folds = [zlib.crc32(r['title'].encode()) % nfolds for r in runs]
+    actual = []
+    predicted = []
+    for k in range(nfolds):
+        train = [r for r, f in zip(runs, folds) if f != k]
+        test = [r for r, f in zip(runs, folds) if f == k]
+        model = fit(train)
+        if model is None or not test:
+            continue
+        actual.extend(r['runtime'] for r in test)
+        predicted.extend(predict(model, r) for r in test)
+    if len(actual) < 2:
+        return None
+    actual = np.array(actual)
+    predicted = np.array(predicted)
+    la, lp = np.log(actual), np.log(predicted)
+    ss_tot = np.sum((la - la.mean())**2)
+    return {
+        'n': len(actual),
+        'mae_log': float(np.mean(np.abs(la - lp))),
+        'median_ape': float(np.median(np.abs(predicted - actual) / actual)) * 100,
+        'r2_log': float(1 - np.sum((la - lp)**2) / ss_tot) if ss_tot > 0 else
+                  float('nan'),
+        'total_ratio': float(predicted.sum() / actual.sum())
+    }
+
+
+def accuracy_report(dbfile, nfolds=5):
+    """
+    Print held-out accuracy of the model of each level of theory and
+    calctype in the history.
+
+    Returns
+    -------
+    results : dictionary of results[(method, basis, calctype)] = crossval
+        dictionary, or None if too few runs
+
+    """
+    db = open_history(dbfile)
+    groups = db.execute("SELECT method, basis, calctype, COUNT(*) FROM runs "
+                        "GROUP BY method, basis, calctype").fetchall()
+    results = collections.OrderedDict()
+    print("%-32s %6s %8s %11s %7s %8s" %
+          ('theory calctype', 'runs', 'MAE(ln)', 'median APE', 'R2(ln)',
+           'sum p/a'))
+    for method, basis, calctype, n in groups:
+        res = crossval(load_runs(db, method, basis, calctype), nfolds)
+        results[(method, basis, calctype)] = res
+        label = "%s/%s %s" % (method, basis, calctype)
+        if res is None:
+            print("%-32s %6d  too few runs for held-out test" % (label, n))
+        else:
+            print("%-32s %6d %8.3f %10.1f%% %7.3f %8.2f" %
+                  (label, n, res['mae_log'], res['median_ape'], res['r2_log'],
+                   res['total_ratio']))
+    db.close()
+    return results
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    sp = subparsers.add_parser('ingest', help="Add runtimes of SDF files.")
+    sp.add_argument("-d", "--database", required=True,
+        help="SQLite runtime history, created if needed.")
+    sp.add_argument("-f", "--filenames", nargs='+', required=True,
+        help="Harvested SDF files with QM runtime tags, e.g., *-210.sdf")
+
+    rp = subparsers.add_parser('report', help="Held-out model accuracy.")
+    rp.add_argument("-d", "--database", required=True,
+        help="SQLite runtime history.")
+    rp.add_argument("-k", "--nfolds", type=int, default=5,
+        help="Number of cross validation folds. Default is 5.")
+
+    ep = subparsers.add_parser('estimate', help="CPU-hours of an SDF file.")
+    ep.add_argument("-d", "--database", required=True,
+        help="SQLite runtime history.")
+    ep.add_argument("-f", "--filename", required=True,
+        help="SDF file of conformers to be calculated.")
+    ep.add_argument("-m", "--method", required=True,
+        help="Name of QM method. Put this in 'quotes'.")
+    ep.add_argument("-b", "--basisset", required=True,
+        help="Name of QM basis set. Put this in 'quotes'.")
+    ep.add_argument("-t", "--calctype", default="opt",
+        help="Specify 'opt', 'spe', or 'hess'. Default is 'opt'.")
+    ep.add_argument("--cores", type=int, default=1,
+        help="Number of cores per QM job. Default is 1.")
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        ingest(args.database, args.filenames)
+    elif args.command == 'report':
+        accuracy_report(args.database, args.nfolds)
+    elif args.command == 'estimate':
+        if estimate(args.database, args.filename, args.method, args.basisset,
+                    args.calctype, args.cores) is None:
+            print("Not enough runtime history to estimate %s/%s %s." %
+                  (args.method, args.basisset, args.calctype))
+    else:
+        parser.print_help()
@@ -11,11 +11,15 @@ By:         Victoria T. Lim
 
 import os, sys
 import argparse
+import multiprocessing
 
-import initialize_confs
-import filter_confs
-import confs_to_psi
-import get_psi_results
+import shard_sdf
+import pipeline_args
+import instrument
+import profiling
+import qm_cache
+import output_io
+import job_archive
 
 
 def name_manager(infile):
@@ -36,96 +40,221 @@ def name_manager(infile):
     return curr_dir, checked_infile, prefix, ext, no_path_infile
 
 
+def results_suffixes(no_path_infile, opt):
+    """
+    Get the suffixes of the results file and filtered file that --results
+    will write for this input file. Second suffix is None if not filtering.
+    """
+    if opt['suffix'] is None:
+        if '-200.sdf' in no_path_infile:
+            return '210', '220'
+        elif '-220.sdf' in no_path_infile:
+            return '221', '222'
+        return None, None
+    if opt['calctype'] == 'opt':
+        return opt['suffix'][0], opt['suffix'][1]
+    return opt['suffix'][0], None
+
+
+def run_shard(kwargs):
+    """
+    Run setup or results for one shard. Psi4 inputs and outputs are placed
+    relative to the working directory, so work from the shard's directory.
+    """
+    curr_dir = os.getcwd()
+    os.chdir(os.path.dirname(kwargs['filename']))
+    try:
+        main(**kwargs)
+    finally:
+        os.chdir(curr_dir)
+    return kwargs['filename']
+
+
+def run_shards(**kwargs):
+    """
+    Run setup or results on each shard of a manifest from shard_sdf.py,
+    in parallel over nprocs processes. The shard files used are those with
+    the same pipeline suffix as the given filename. After results, the
+    shard outputs are merged in original molecule order next to filename.
+    Raises ValueError if the shard outputs fail the checks of merge_shards.
+    """
+    opt = kwargs
+    if opt.get('instrument'):
+        instrument.enable(opt['instrument'])
+    if opt.get('profile'):
+        profiling.enable(opt['profile'])
+    manifest, mdir = shard_sdf.load_manifest(opt['shards'])
+    prefix, suffix = shard_sdf.split_name(opt['filename'])
+
+    jobs = []
+    for shard in manifest['shards']:
+        shard_opt = dict(opt)
+        shard_opt['shards'] = None
+        shard_opt['filename'] = shard_sdf.shard_file(mdir, shard, suffix)
+        if not os.path.exists(shard_opt['filename']):
+            sys.exit("ERROR: shard file %s does not exist." %
+                     shard_opt['filename'])
+        jobs.append(shard_opt)
+
+    nprocs = opt['nprocs'] if opt['nprocs'] else len(jobs)
+    if nprocs == 1:
+        done = [run_shard(j) for j in jobs]
+    else:
+        pool = multiprocessing.Pool(min(nprocs, len(jobs)))
+        done = pool.map(run_shard, jobs, chunksize=1)
+        pool.close()
+        pool.join()
+    print("\nFinished %s on %d shards." %
+          ('setup' if opt['setup'] else 'results', len(done)))
+
+    if opt['results']:
+        curr_dir = os.path.dirname(os.path.abspath(opt['filename']))
+        for out_suffix in results_suffixes(os.path.basename(opt['filename']),
+                                           opt):
+            if out_suffix is None:
+                continue
+            shard_sdf.merge_shards(
+                opt['shards'], out_suffix,
+                os.path.join(curr_dir, "{}-{}.sdf".format(prefix, out_suffix)))
+
+
 def main(**kwargs):
+    opt = kwargs
+
+    # pipeline stages need OEChem which is slow to import, so import here
+    # instead of at the top for a fast --help or dispatch of shards
+    import initialize_confs
+    import filter_confs
+    import confs_to_psi
+    import get_psi_results
 
     curr_dir, checked_infile, prefix, ext, no_path_infile = name_manager(
         opt['filename'])
 
-    if opt['setup']:
-
-        # default of pipeline uses '200' suffix for MM opt/filtering output
-        if opt['suffix'] is None:
-            suffix = '200'
-        else:
-            suffix = opt['suffix'][0]
-
-        # if input is SMILES, do MM opt then filter
-        if ext == '.smi':
-            print("\nGenerating and filtering conformers for %s" %
-                  opt['filename'])
-            initialize_confs.initialize_confs(checked_infile)
-            pre_filt = os.path.join(curr_dir, prefix + '.sdf')
-            # prefix is base filename with same dir as input file
-            post_filt = os.path.join(curr_dir, "{}-{}.sdf".format(
-                prefix, suffix))
-            filter_confs.filter_confs(pre_filt, "MM Szybki SD Energy",
-                                      post_filt)
-        # if input is SDF, don't generate confs/filter, generate QM inputs
-        else:
-            post_filt = checked_infile
-
-        # generate Psi4 inputs
-        print("\nCreating Psi4 input files for %s..." % prefix)
-        confs_to_psi.confs_to_psi(post_filt, opt['method'], opt['basisset'],
-                                  opt['calctype'], opt['mem'])
-
-    else:  # ========== AFTER QM =========== #
-
-        # default of pipeline goes '200' --> '210'/'220' --> '221/'222'
-        if opt['suffix'] is None:
-            if '-200.sdf' in no_path_infile:
-                out_results = os.path.join(curr_dir, prefix + '-210.sdf')
-                out_filter = os.path.join(curr_dir, prefix + '-220.sdf')
-            elif '-220.sdf' in no_path_infile:
-                out_results = os.path.join(curr_dir, prefix + '-221.sdf')
-                out_filter = os.path.join(curr_dir, prefix + '-222.sdf')
+    # record time and memory of this stage if --instrument is given
+    if opt.get('instrument'):
+        instrument.enable(opt['instrument'])
+    # profile the hot sections of this stage if --profile is given
+    if opt.get('profile'):
+        profiling.enable(opt['profile'])
+    # share QM results across campaigns if --cache is given
+    if opt.get('cache'):
+        qm_cache.enable(opt['cache'])
+        if opt.get('cache_max'):
+            qm_cache.QMCache(opt['cache'], opt['cache_max']).close()
+    stage = 'executor.setup' if opt['setup'] else 'executor.results'
+    with instrument.stage(stage, input=checked_infile,
+                          calctype=opt['calctype']):
+        if opt['setup']:
+
+            # default of pipeline uses '200' suffix for MM opt/filtering output
+            if opt['suffix'] is None:
+                suffix = '200'
             else:
-                sys.exit(
-                    "ERROR: Input file does not have usual 200-series "
-                    "suffixes (see README for details).\nPlease specify "
-                    "one suffix if calling setup or if extracting Hessian "
-                    "data, or specify two suffixes if extracting/filtering "
-                    "optimization results.\nSee usage in argparse.")
-        else:
-            out_results = os.path.join(
-                curr_dir, "{}-{}.sdf".format(prefix, opt['suffix'][0]))
-            if opt['calctype'] == 'opt':
-                out_filter = os.path.join(
-                    curr_dir, "{}-{}.sdf".format(prefix, opt['suffix'][1]))
-
-        # get psi4 results
-        print("Getting Psi4 results for %s ..." % (checked_infile))
-        method, basisset = get_psi_results.get_psi_results(
-            checked_infile, out_results, calctype=opt['calctype'])
-
-        # only filter structures after opts; spe/hess should not change geoms
-        if opt['calctype'] == 'opt':
-
-            # if get_psi_results exits early (output file already exists),
-            # look for method from command line call for filtering
-            if None in [method, basisset]:
-                if None in [opt['method'], opt['basisset']]:
-                    print(
-                        "\nERROR: no results obtained and no conformers "
-                        "filtered. If you want to filter an already-existing "
-                        "output file, specify method and basis set in command "
-                        "line call with -m [method] -b [basis]\n")
-                    return
+                suffix = opt['suffix'][0]
+
+            # if input is SMILES, do MM opt then filter
+            if ext == '.smi':
+                print("\nGenerating and filtering conformers for %s" %
+                      opt['filename'])
+                initialize_confs.initialize_confs(checked_infile)
+                pre_filt = os.path.join(curr_dir, prefix + '.sdf')
+                # prefix is base filename with same dir as input file
+                post_filt = os.path.join(curr_dir, "{}-{}.sdf".format(
+                    prefix, suffix))
+                filter_confs.filter_confs(pre_filt, "MM Szybki SD Energy",
+                                          post_filt, opt.get('maxconfs'),
+                                          opt.get('budget'),
+                                          opt.get('cluster_rmsd', 0.5))
+            # if input is SDF, don't generate confs/filter, generate QM inputs
+            else:
+                post_filt = checked_infile
+
+            # generate Psi4 inputs
+            print("\nCreating Psi4 input files for %s..." % prefix)
+            confs_to_psi.confs_to_psi(post_filt, opt['method'], opt['basisset'],
+                                      opt['calctype'], opt['mem'],
+                                      history=opt.get('history'),
+                                      cores=opt.get('cores') or 1,
+                                      save_wfn=opt.get('save_wfn', False),
+                                      warm_start_dir=opt.get('warm_start'))
+
+        else:  # ========== AFTER QM =========== #
+
+            # default of pipeline goes '200' --> '210'/'220' --> '221/'222'
+            if opt['suffix'] is None:
+                if '-200.sdf' in no_path_infile:
+                    out_results = os.path.join(curr_dir, prefix + '-210.sdf')
+                    out_filter = os.path.join(curr_dir, prefix + '-220.sdf')
+                elif '-220.sdf' in no_path_infile:
+                    out_results = os.path.join(curr_dir, prefix + '-221.sdf')
+                    out_filter = os.path.join(curr_dir, prefix + '-222.sdf')
                 else:
-                    method = opt['method']
-                    basisset = opt['basisset']
+                    sys.exit(
+                        "ERROR: Input file does not have usual 200-series "
+                        "suffixes (see README for details).\nPlease specify "
+                        "one suffix if calling setup or if extracting Hessian "
+                        "data, or specify two suffixes if extracting/filtering "
+                        "optimization results.\nSee usage in argparse.")
+            else:
+                out_results = os.path.join(
+                    curr_dir, "{}-{}.sdf".format(prefix, opt['suffix'][0]))
+                if opt['calctype'] == 'opt':
+                    out_filter = os.path.join(
+                        curr_dir, "{}-{}.sdf".format(prefix, opt['suffix'][1]))
+
+            # get psi4 results, as jobs finish if watching
+            print("Getting Psi4 results for %s ..." % (checked_infile))
+            if opt.get('watch'):
+                import watch_results
+                method, basisset = watch_results.watch_results(
+                    checked_infile, out_results, calctype=opt['calctype'],
+                    interval=opt.get('watch_interval') or 60.,
+                    shard_size=opt.get('shard_size') or 50,
+                    flush=opt.get('flush') or 600.,
+                    stale=opt.get('stale'))
+            else:
+                method, basisset = get_psi_results.get_psi_results(
+                    checked_infile, out_results, calctype=opt['calctype'])
 
-            tag = "QM Psi4 Final Opt. Energy (Har) %s/%s" % (method, basisset)
-            print("Filtering Psi4 results for %s ..." % (out_results))
-            filter_confs.filter_confs(out_results, tag, out_filter)
+            # compress outputs of finished calculations after harvesting
+            if opt.get('compact'):
+                output_io.compact(os.path.dirname(checked_infile),
+                                  opt['compact'])
+
+            # pack job directories of finished molecules into archives
+            if opt.get('archive'):
+                job_archive.pack(os.path.dirname(checked_infile),
+                                 opt['archive'])
+
+            # only filter structures after opts; spe/hess should not change geoms
+            if opt['calctype'] == 'opt':
+
+                # if get_psi_results exits early (output file already exists),
+                # look for method from command line call for filtering
+                if None in [method, basisset]:
+                    if None in [opt['method'], opt['basisset']]:
+                        print(
+                            "\nERROR: no results obtained and no conformers "
+                            "filtered. If you want to filter an already-existing "
+                            "output file, specify method and basis set in command "
+                            "line call with -m [method] -b [basis]\n")
+                        return
+                    else:
+                        method = opt['method']
+                        basisset = opt['basisset']
+
+                tag = "QM Psi4 Final Opt. Energy (Har) %s/%s" % (method, basisset)
+                print("Filtering Psi4 results for %s ..." % (out_results))
+                filter_confs.filter_confs(out_results, tag, out_filter)
+
+    # write profiles now since shards run in pool workers skip atexit
+    profiling.write_reports()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("-f", "--filename", required=True,
-        help="SDF file (with FULL path) to be set up or processed.")
-
     # setup calculations or process results for specified calctype
     parser.add_argument("--setup", action="store_true", default=False,
         help="If True (default=False), generate and filter conformers (if "
@@ -133,27 +262,9 @@ if __name__ == "__main__":
     parser.add_argument("--results", action="store_true", default=False,
         help="If True (default=False), process Psi4 output files and filter "
              "conformers.")
-    parser.add_argument("-t", "--calctype", default="opt",
-        help="Specify either 'opt' for geometry optimizations, 'spe' for "
-             "single point energy calculations, or 'hess' for Hessian "
-             "calculations. Default is 'opt'.")
-
-    # qm job detail
-    parser.add_argument("-m", "--method",
-        help="Name of QM method. Put this in 'quotes'.")
-    parser.add_argument("-b", "--basisset",
-        help="Name of QM basis set. Put this in 'quotes'.")
-    parser.add_argument("--mem", default="5.0 Gb",
-        help="Memory specification for each Psi4 calculation.")
-
-    # custom suffixes for pipeline outputs
-    parser.add_argument("--suffix", nargs='+',
-        help="For custom naming of results and filtered files throughout "
-             "pipeline. If called with --setup option, include ONE suffix "
-             "for output of filtered conformers. If suffix is called with "
-             "--results option, include TWO suffixes for (1) output of QM "
-             "calculations and (2) the filtered file of (1)."
-             "Examples: --suffix 'filt'; --suffix 'qm' 'qmfilt' ")
+
+    # options shared with the setup and results subcommands of cli.py
+    pipeline_args.add_pipeline_args(parser)
 
     args = parser.parse_args()
     opt = vars(args)
@@ -172,4 +283,12 @@ if __name__ == "__main__":
     if opt['calctype'] not in {'opt', 'spe', 'hess'}:
         raise parser.error("Specify a valid calculation type.")
 
-    main(**opt)
+    if opt['shards'] is not None:
+        if not opt['filename'].endswith('.sdf'):
+            raise parser.error("Shards can only be used with SDF input.")
+        try:
+            run_shards(**opt)
+        except ValueError as e:
+            sys.exit("ERROR: %s" % e)
+    else:
+        main(**opt)
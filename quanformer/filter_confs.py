@@ -10,14 +10,120 @@
 
 ## Import and call filter_confs.filter_confs(rmsdfile, tag, rmsdout)
 
+## For molecules with very many conformers, a clustering mode instead keeps
+## the lowest energy conformer of each RMSD cluster, up to a number of
+## conformers per molecule and/or a total number of conformers for the file:
+## filter_confs.filter_confs(rmsdfile, tag, rmsdout, maxconfs=20, budget=500)
+
 import re
+import math
 import os, sys, glob
+import collections
+import numpy as np
 import openeye.oechem as oechem
 
+try:
+    import quanformer.instrument as instrument
+except ModuleNotFoundError:
+    import instrument
+try:
+    import quanformer.profiling as profiling
+except ModuleNotFoundError:
+    import profiling
+try:
+    import quanformer.pipeline_state as pipeline_state
+except ModuleNotFoundError:
+    import pipeline_state
+
 ### ------------------- Functions -------------------
 
 
-def identify_minima(mol, tag, ThresholdE, ThresholdRMSD):
+def end_atom(atom, partner):
+    """
+    Pick the neighbor of atom (other than partner) to define a torsion about
+    the atom--partner bond. The neighbor must be a heavy atom whose symmetry
+    class is unique among the other neighbors, so that the torsion does not
+    depend on which of several equivalent atoms is picked.
+
+    Returns
+    -------
+    OEAtomBase, or None if there is no such neighbor
+
+    """
+    nbrs = [n for n in atom.GetAtoms() if n.GetIdx() != partner.GetIdx()]
+    classes = [n.GetSymmetryClass() for n in nbrs]
+    unique = [n for n, c in zip(nbrs, classes)
+              if classes.count(c) == 1 and n.GetAtomicNum() > 1]
+    if not unique:
+        return None
+    return sorted(unique, key=lambda n: (-n.GetAtomicNum(), n.GetIdx()))[0]
+
+
+def rotatable_torsions(mol, max_angle=165.):
+    """
+    Get heavy-atom torsions about rotatable bonds of a molecule that can be
+    compared between conformers without considering symmetry. Rotors with
+    symmetric ends (e.g., methyl, tert-butyl) are left out, as are rotors
+    equivalent by symmetry to another rotor. Torsions with a near-linear
+    angle a-b-c or b-c-d (e.g., next to a nitrile or alkyne) are also left
+    out, since their dihedral is ill-defined and can differ a lot between
+    conformers that are the same.
+
+    Parameters
+    ----------
+    mol : OEChem molecule
+    max_angle : float, largest angle (degrees) a-b-c or b-c-d of a torsion
+        that is kept, measured on the active conformer
+
+    Returns
+    -------
+    torsions : list of (a, b, c, d) tuples of OEAtomBase
+
+    """
+    oechem.OEPerceiveSymmetry(mol)
+    cutoff = math.radians(max_angle)
+    torsions = []
+    for bond in mol.GetBonds(oechem.OEIsRotor()):
+        b, c = bond.GetBgn(), bond.GetEnd()
+        a, d = end_atom(b, c), end_atom(c, b)
+        if a is None or d is None:
+            continue
+        if oechem.OEGetAngle(mol, a, b, c) > cutoff or \
+                oechem.OEGetAngle(mol, b, c, d) > cutoff:
+            continue
+        torsions.append((a, b, c, d))
+
+    # leave out rotors equivalent to another since symmetry could swap them
+    def signature(t):
+        sig = tuple(atom.GetSymmetryClass() for atom in t)
+        return min(sig, sig[::-1])
+
+    sigs = [signature(t) for t in torsions]
+    return [t for t, s in zip(torsions, sigs) if sigs.count(s) == 1]
+
+
+def torsion_fingerprint(conf, torsions):
+    """
+    Get the torsion angles (radians) of one conformer.
+    """
+    return [oechem.OEGetTorsion(conf, a, b, c, d) for a, b, c, d in torsions]
+
+
+def torsions_differ(fp1, fp2, threshold):
+    """
+    Check if any torsion of two fingerprints differs by more than threshold
+    (radians), accounting for the periodicity of angles.
+    """
+    for t1, t2 in zip(fp1, fp2):
+        diff = abs(t1 - t2) % (2 * math.pi)
+        if min(diff, 2 * math.pi - diff) > threshold:
+            return True
+    return False
+
+
+@profiling.profiled('identify_minima')
+def identify_minima(mol, tag, ThresholdE, ThresholdRMSD, ThresholdTor=90.,
+                    stats=None):
     """
     For a molecule's set of conformers computed with some level of theory,
         whittle down unique conformers based on energy and RMSD.
@@ -30,6 +136,11 @@ def identify_minima(mol, tag, ThresholdE, ThresholdRMSD):
         Units are hartrees (default output units of Psi4)
     ThresholdR    float value for RMSD, below which 2 confs are "same"
         Units are in Angstrom (Psi4 default)
+    ThresholdTor  float value in degrees. Two confs of similar energy are
+        "diff" without RMSD calculation if any heavy-atom rotatable torsion
+        differs by more than this. None to always calculate RMSD.
+    stats         dictionary to which numbers of RMSD calculations done
+        ('rmsd') and avoided by torsions ('rmsd_avoided') are added
 
     Returns
     -------
@@ -45,6 +156,10 @@ def identify_minima(mol, tag, ThresholdE, ThresholdRMSD):
     # declare variables for conformers to delete
     confsToDel = set()
     delCount = 0
+    if stats is None:
+        stats = {}
+    stats.setdefault('rmsd', 0)
+    stats.setdefault('rmsd_avoided', 0)
 
     # check if SD tag exists for the case of single conformer
     if mol.NumConfs() == 1:
@@ -55,6 +170,15 @@ def identify_minima(mol, tag, ThresholdE, ThresholdRMSD):
             else:
                 return False
 
+    # torsion fingerprint of each conformer, computed once per molecule
+    fps = {}
+    if ThresholdTor is not None:
+        torsions = rotatable_torsions(mol)
+        if torsions:
+            fps = dict((conf.GetIdx(), torsion_fingerprint(conf, torsions))
+                       for conf in mol.GetConfs())
+        thresTor = math.radians(ThresholdTor)
+
     # Loop over conformers twice (NxN diagonal comparison of RMSDs)
     for confRef in mol.GetConfs():
         print(" ~ Reference: %s conformer %d" % (mol.GetTitle(),
@@ -101,7 +225,15 @@ def identify_minima(mol, tag, ThresholdE, ThresholdRMSD):
             # if energies are diff enough --> confs are diff --> keep & skip ahead
             if absERel > ThresholdE:
                 continue
+            # if rotamers clearly differ --> confs are diff --> skip RMSD
+            if fps and torsions_differ(fps[confRef.GetIdx()],
+                                       fps[confTest.GetIdx()], thresTor):
+                stats['rmsd_avoided'] += 1
+                instrument.count('rmsd_avoided')
+                continue
             # if energies are similar, see if they are diff by RMSD
+            stats['rmsd'] += 1
+            instrument.count('rmsd')
             rmsd = oechem.OERMSD(confRef, confTest, automorph, heavyOnly,
                                  overlay)
             # if measured_RMSD < threshold_RMSD --> confs are same --> delete
@@ -124,10 +256,208 @@ def identify_minima(mol, tag, ThresholdE, ThresholdRMSD):
     return True
 
 
+def conf_energy(conf, tag):
+    """
+    Get the energy of a conformer from the SD tag that contains tag (any
+    capitalization), or None if there is no such tag. MM energies are
+    converted from kcal/mol to Hartrees.
+    """
+    for x in oechem.OEGetSDDataPairs(conf):
+        if tag.lower() in x.GetTag().lower():
+            energy = float(x.GetValue())
+            if 'mm' in x.GetTag().lower():
+                energy = energy / 627.5095
+            return energy
+    return None
+
+
+def condensed_index(n, i, j):
+    """
+    Get the position of pair (i, j), i < j, in a condensed distance array
+    of n items, which stores the upper triangle row by row.
+    """
+    return n * i - i * (i + 1) // 2 + j - i - 1
+
+
+def condensed_row(dists, n, i):
+    """
+    Get all distances of item i from a condensed distance array. The
+    distance of i to itself is zero.
+    """
+    row = np.zeros(n, dtype=dists.dtype)
+    if i > 0:
+        j = np.arange(i)
+        row[:i] = dists[n * j - j * (j + 1) // 2 + i - j - 1]
+    if i < n - 1:
+        start = condensed_index(n, i, i + 1)
+        row[i + 1:] = dists[start:start + n - i - 1]
+    return row
+
+
+def rmsd_condensed(mol, confs, automorph=True, heavyOnly=False, overlay=True):
+    """
+    Calculate RMSD of all pairs of the given conformers of a molecule.
+
+    Parameters
+    ----------
+    mol : OEChem molecule with all of its conformers
+    confs : list of n conformers of mol to compare
+
+    Returns
+    -------
+    dists : numpy float32 array of length n*(n-1)/2 of RMSDs in condensed
+        form; see condensed_index
+
+    """
+    n = len(confs)
+    dists = np.zeros(n * (n - 1) // 2, dtype=np.float32)
+    # one call compares a reference to every conformer of mol
+    rmsds = oechem.OEDoubleArray(mol.GetMaxConfIdx())
+    cols = np.array([c.GetIdx() for c in confs])
+    for i, confRef in enumerate(confs[:-1]):
+        oechem.OERMSD(confRef, mol, rmsds, automorph, heavyOnly, overlay)
+        row = np.array(list(rmsds), dtype=np.float32)
+        start = condensed_index(n, i, i + 1)
+        dists[start:start + n - i - 1] = row[cols[i + 1:]]
+    return dists
+
+
+def butina(dists, n, cutoff, energies):
+    """
+    Butina clustering of n items from condensed distances. The item with
+    most neighbors within cutoff (ties to the lower energy) is a cluster
+    centroid with all its unassigned neighbors, repeated until all items
+    are assigned.
+
+    Parameters
+    ----------
+    dists : condensed distance array; see condensed_index
+    n : int, number of items
+    cutoff : float, distance below which items are neighbors
+    energies : list of energies of items
+
+    Returns
+    -------
+    clusters : list of numpy arrays of member indices of each cluster
+
+    """
+    counts = np.array([np.count_nonzero(condensed_row(dists, n, i) < cutoff)
+                       for i in range(n)])
+    order = sorted(range(n), key=lambda i: (-counts[i], energies[i]))
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    for i in order:
+        if assigned[i]:
+            continue
+        members = np.nonzero((condensed_row(dists, n, i) < cutoff) &
+                             ~assigned)[0]
+        assigned[members] = True
+        clusters.append(members)
+    return clusters
+
+
+def cluster_minima(mol, tag, cutoff, maxconfs=None):
+    """
+    Cluster conformers of a molecule by RMSD and get the lowest energy
+    conformer of each cluster. Conformers without energy are left out.
+
+    Parameters
+    ----------
+    mol : OEChem molecule with all of its conformers
+    tag : string name of the SD tag with energies
+    cutoff : float, RMSD (Angstrom) below which conformers are neighbors
+    maxconfs : int, keep at most this many representatives. None for all.
+
+    Returns
+    -------
+    reps : list of (energy, conformer index) of representatives in order of
+        increasing energy
+
+    """
+    confs = []
+    energies = []
+    for conf in mol.GetConfs():
+        energy = conf_energy(conf, tag)
+        if energy is not None:
+            confs.append(conf)
+            energies.append(energy)
+    if not confs:
+        return []
+    n = len(confs)
+    dists = rmsd_condensed(mol, confs)
+    instrument.count('rmsd', n * (n - 1) // 2)
+    reps = []
+    for members in butina(dists, n, cutoff, energies):
+        best = min(members, key=lambda k: energies[k])
+        reps.append((energies[best], confs[best].GetIdx()))
+    reps.sort()
+    print("%s: %d conformers in %d clusters" % (mol.GetTitle(), n, len(reps)))
+    return reps[:maxconfs] if maxconfs else reps
+
+
+def allocate_budget(ranked, budget):
+    """
+    Choose representatives of all molecules within a total budget. Each
+    molecule's lowest energy representative is chosen first, then each
+    molecule's second, and so on; within one round, representatives of lower
+    energy relative to their molecule's minimum are chosen first.
+
+    Parameters
+    ----------
+    ranked : dictionary of ranked[title] = list of (energy, conformer index)
+        in order of increasing energy, e.g., from cluster_minima
+    budget : int, total number of conformers to keep. None keeps all.
+
+    Returns
+    -------
+    selected : dictionary of selected[title] = set of conformer indices
+
+    """
+    selected = dict((title, set()) for title in ranked)
+    if budget is None:
+        for title, reps in ranked.items():
+            selected[title] = set(idx for e, idx in reps)
+        return selected
+    candidates = []
+    for title, reps in ranked.items():
+        for rank, (energy, idx) in enumerate(reps):
+            candidates.append((rank, energy - reps[0][0], title, idx))
+    candidates.sort(key=lambda c: c[:2])
+    for rank, rel, title, idx in candidates[:budget]:
+        selected[title].add(idx)
+    if budget < len(ranked):
+        print("WARNING: budget of %d conformers is less than the %d molecules; "
+              "some molecules have no conformers kept." % (budget, len(ranked)))
+    return selected
+
+
+def select_clusters(rmsdfile, tag, cutoff, maxconfs=None, budget=None):
+    """
+    Cluster conformers of each molecule of a file and choose representatives
+    within the per-molecule and total limits.
+
+    Returns
+    -------
+    selected : dictionary of selected[title] = set of conformer indices
+
+    """
+    ifs = oechem.oemolistream()
+    if not ifs.open(rmsdfile):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % rmsdfile)
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    ranked = collections.OrderedDict()
+    for mol in ifs.GetOEMols():
+        ranked[mol.GetTitle()] = cluster_minima(mol, tag, cutoff, maxconfs)
+    ifs.close()
+    return allocate_budget(ranked, budget)
+
+
 ### ------------------- Script -------------------
 
 
-def filter_confs(rmsdfile, tag, rmsdout):
+@instrument.timed('filter_confs')
+def filter_confs(rmsdfile, tag, rmsdout, maxconfs=None, budget=None,
+                 cluster_rmsd=0.5):
     """
     Read in OEMols (and each of their conformers) in 'rmsdfile'.
     For each molecule:
@@ -146,11 +476,21 @@ def filter_confs(rmsdfile, tag, rmsdout):
         - "QM Psi4 Final Single Pt. Energy (Har) mp2/def-sv(p)"
     rmsdout : str
         Name of the output file with filtered conformers
+    maxconfs : int
+        If given, use clustering mode and keep at most this many conformers
+        per molecule
+    budget : int
+        If given, use clustering mode and keep at most this many conformers
+        in total for all molecules of the file
+    cluster_rmsd : float
+        RMSD cutoff (Angstrom) of Butina clustering in clustering mode
 
     """
     # Parameters for distinguishing cutoff of conformer similarity
     thresE = 5.E-4  # declare confs diff & skip RMSD comparison above this threshold
     thresRMSD = 0.2  # above this threshold (Angstrom), confs are "diff" minima
+    thresTor = 90.  # above this torsion difference (degrees), confs are "diff"
+    stats = {'rmsd': 0, 'rmsd_avoided': 0}
 
     wdir, fname = os.path.split(rmsdfile)
     numConfsF = open(os.path.join(os.getcwd(), "numConfs.txt"), 'a')
@@ -163,24 +503,47 @@ def filter_confs(rmsdfile, tag, rmsdout):
     rmsd_ifs.SetConfTest(oechem.OEAbsoluteConfTest())
     rmsd_molecules = rmsd_ifs.GetOEMols()
 
-    # Open outstream file.
-    rmsd_ofs = oechem.oemolostream()
-    if os.path.exists(rmsdout):
+    # Output is only put in place when complete; resume any interrupted run.
+    ckpt = pipeline_state.Checkpoint(rmsdout, 'filter_confs', rmsdfile)
+    if ckpt.complete():
         print("%s output file already exists in %s. Skip filtering.\n" %
               (rmsdout, os.getcwd()))
         return
-    if not rmsd_ofs.open(rmsdout):
-        oechem.OEThrow.Fatal("Unable to open %s for writing" % rmsdout)
+
+    # In clustering mode, choose conformers of all molecules before writing.
+    selected = None
+    if maxconfs is not None or budget is not None:
+        selected = select_clusters(rmsdfile, tag, cluster_rmsd, maxconfs,
+                                   budget)
+    done = ckpt.start()
 
     # Identify minima and write output file.
     for mol in rmsd_molecules:
-        if identify_minima(mol, tag, thresE, thresRMSD):
+        if mol.GetTitle() in done:
+            continue
+        instrument.count('mols')
+        instrument.count('confs_in', mol.NumConfs())
+        if selected is not None:
+            keep = selected.get(mol.GetTitle(), set())
+            for conf in mol.GetConfs():
+                if conf.GetIdx() not in keep:
+                    mol.DeleteConf(conf)
+            kept = len(keep) > 0
+        else:
+            kept = identify_minima(mol, tag, thresE, thresRMSD, thresTor,
+                                   stats)
+        if kept:
+            instrument.count('confs_out', mol.NumConfs())
             numConfsF.write("%s\t%s\n" % (mol.GetTitle(), mol.NumConfs()))
-            oechem.OEWriteConstMolecule(rmsd_ofs, mol)
+            ckpt.add(mol.GetTitle(), oechem.OEWriteMolToBytes('.sdf', mol))
         else:
             numConfsF.write("%s\t0\n" % (mol.GetTitle()))
+            ckpt.add(mol.GetTitle())
     rmsd_ifs.close()
     numConfsF.close()
-    rmsd_ofs.close()
+    ckpt.finish()
 
+    if selected is None:
+        print("Torsion prescreen avoided %d of %d RMSD calculations." %
+              (stats['rmsd_avoided'], stats['rmsd'] + stats['rmsd_avoided']))
     print("Done filtering %s to %s.\n" % (fname, rmsdout))
@@ -21,6 +21,10 @@ try:
     import quanformer.proc_tags as pt
 except ModuleNotFoundError:
     import proc_tags as pt # VTL temporary bc travis fails to import
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
 
 ### ------------------- Functions -------------------
 
@@ -42,10 +46,10 @@ def get_time(jobdir):
     """
     jstart = os.path.join(jobdir,"job.start")
     jlast = os.path.join(jobdir,"job.last")
-    if not (os.path.exists(jstart) and os.path.exists(jlast)):
+    if None in [output_io.find_output(jstart), output_io.find_output(jlast)]:
         print("job.start or job.last file missing. Appending -1.")
         return -1.
-    fp = open(jstart)
+    fp = output_io.open_output(jstart)
     for i, line in enumerate(fp):
         if i == 1:
             init = line.strip()
@@ -53,7 +57,7 @@ def get_time(jobdir):
             break
     fp.close()
 
-    fp = open(jlast)
+    fp = output_io.open_output(jlast)
     for i, line in enumerate(fp):
         if i == 2:
             final = line.strip()
@@ -79,6 +83,7 @@ def process_turb_out(Props, calctype, cosmo):
     Relevant Turbomole output files:
      * GEO_OPT_CONVERGED or GEO_OPT_FAILED
      * job.last
+    The energy and job files may be stored compressed (see output_io.py).
 
     Parameters
     ----------
@@ -98,7 +103,7 @@ def process_turb_out(Props, calctype, cosmo):
         return Props
 
     try:
-        f = open("energy","r")
+        f = output_io.open_output("energy")
     except IOError:
         print("No 'energy' file found in directory of %s" % os.getcwd() )
         return Props
@@ -121,7 +126,7 @@ def process_turb_out(Props, calctype, cosmo):
 
     # check if there's an outlying charge corrected value in job.last for COSMO
     try:
-        f = open("job.last","r")
+        f = output_io.open_output("job.last")
     except IOError:
         print("No 'job.last' file found in directory of %s" % os.getcwd() )
         return Props
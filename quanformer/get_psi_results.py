@@ -24,6 +24,30 @@ try:
     import quanformer.proc_tags as pt
 except ModuleNotFoundError:
     import proc_tags as pt  # VTL temporary bc travis fails to import
+try:
+    import quanformer.instrument as instrument
+except ModuleNotFoundError:
+    import instrument
+try:
+    import quanformer.profiling as profiling
+except ModuleNotFoundError:
+    import profiling
+try:
+    import quanformer.pipeline_state as pipeline_state
+except ModuleNotFoundError:
+    import pipeline_state
+try:
+    import quanformer.qm_cache as qm_cache
+except ModuleNotFoundError:
+    import qm_cache
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+try:
+    import quanformer.triage as triage
+except ModuleNotFoundError:
+    import triage
 
 ### ------------------- Functions -------------------
 
@@ -110,6 +134,7 @@ def get_psi_time(filename):
     Parameters
     ----------
     filename: string name of the timefile. E.g. "timer.dat"
+        The file may also be stored compressed as timer.dat.gz or .xz
 
     Returns
     -------
@@ -119,12 +144,12 @@ def get_psi_time(filename):
     """
 
     # check whether file exists
-    if not os.path.isfile(filename):
+    if output_io.find_output(filename) is None:
         print("*** ERROR: timer file not found: {} ***".format(filename))
         return ("Timer output file not found")
 
     # read file and extract time
-    with open(filename) as fname:
+    with output_io.open_output(filename) as fname:
         times = []
         for line in fname:
             if "Wall Time:" in line:
@@ -164,6 +189,7 @@ def get_scs_mp2(lines):
     return ene
 
 
+@profiling.profiled('process_psi_out')
 def process_psi_out(filename, properties, calctype='opt'):
     """
     Go through output file and get level of theory (method and basis set),
@@ -174,6 +200,7 @@ def process_psi_out(filename, properties, calctype='opt'):
     Parameters
     ----------
     filename: string name of the output file. E.g. "output.dat"
+        The file may also be stored compressed as output.dat.gz or .xz
     properties: dictionary where all the data will go. Can be empty or not.
     calctype: string; one of 'opt','spe','hess' for geometry optimization,
         single point energy calculation, or Hessian calculation
@@ -188,13 +215,13 @@ def process_psi_out(filename, properties, calctype='opt'):
     """
 
     # check whether output file exists
-    if not os.path.isfile(filename):
+    if output_io.find_output(filename) is None:
         print("*** ERROR: Output file not found: {} ***".format(filename))
         properties['missing'] = True
         return properties
 
     # open and read file
-    f = open(filename, "r")
+    f = output_io.open_output(filename)
     lines = f.readlines()
     it = iter(lines)
 
@@ -309,9 +336,114 @@ def process_psi_out(filename, properties, calctype='opt'):
     return properties
 
 
+def harvest_mol(mol, hdir, origsdf, calctype='opt', psiout="output.dat",
+                timeout="timer.dat", cache=None):
+    """
+    Process the output files of all conformers of one molecule.
+    Conformers with missing or incomplete output are skipped.
+
+    Parameters
+    ----------
+    mol : OpenEye OEMol with all conformers of the QM calculations
+    hdir : string, main directory of the calculations
+    origsdf : string, name of the SDF file of the mol
+    calctype : string; one of 'opt','spe','hess'
+    psiout : string, name of the Psi4 output files
+    timeout : string, name of the Psi4 timer files
+    cache : QMCache, store of QM results to read and add results, or None
+
+    Returns
+    -------
+    molbytes : bytes of SDF records of the processed conformers
+    props : dictionary of results of the last conformer, empty if the
+        molecule has no conformers
+    hessians : dictionary of hessians[confIndex] = np array for 'hess'
+        calculations, else empty
+
+    """
+    molbytes = []
+    hessians = {}
+    props = {}
+    for j, conf in enumerate(mol.GetConfs()):
+
+        props = initiate_dict()
+
+        # set file locations
+        timef = os.path.join(hdir,
+                             "%s/%s/%s" % (mol.GetTitle(), j + 1, timeout))
+        outf = os.path.join(hdir,
+                            "%s/%s/%s" % (mol.GetTitle(), j + 1, psiout))
+
+        # calculations found in the store by confs_to_psi have a key file
+        keyf = os.path.join(os.path.dirname(outf), qm_cache.KEY_FILE)
+        cached = False
+        if cache is not None and output_io.find_output(outf) is None \
+                and output_io.find_output(keyf) is not None:
+            with output_io.open_output(keyf) as f:
+                stored_out, stored_time = cache.get(f.read().strip())
+            if stored_out is None:
+                print("Result of {} was evicted from the QM cache. Run "
+                      "setup again to write its input.".format(keyf))
+            else:
+                outf, timef = stored_out, stored_time
+                cached = True
+
+        # process output and get dictionary results
+        props = get_conf_data(props, calctype, timef, outf)
+
+        # if output was missing or are missing calculation details
+        # move on to next conformer
+        if props['missing'] or (calctype == 'opt' and not all(
+                key in props
+                for key in ['numSteps', 'finalEnergy', 'coords'])):
+            failure = None
+            if output_io.find_output(outf) is not None:
+                failure = triage.classify_output(outf)
+            if failure is not None:
+                print("ERROR reading {}\nPsi4 job failed: {}. Run triage.py "
+                      "to write a restart input.\n".format(outf, failure))
+            else:
+                print(
+                    "ERROR reading {}\nEither Psi4 job was incomplete OR wrong calctype specified\n"
+                    .format(outf))
+            continue
+
+        # add new finished calculation to the store
+        inf = os.path.join(os.path.dirname(outf), 'input.dat')
+        if calctype == 'hess':
+            # Hessian is an array, or a message string if it was not read
+            finished = hasattr(props.get('hessian'), 'shape')
+        else:
+            finished = 'finalEnergy' in props
+        if cache is not None and not cached and finished and \
+                output_io.find_output(inf) is not None:
+            with output_io.open_output(inf) as f:
+                cache.put(cache.key(f.read()),
+                          output_io.find_output(outf),
+                          output_io.find_output(timef) or timef,
+                          "%s_%d" % (mol.GetTitle(), j + 1))
+
+        # add data to oemol
+        conf = set_conf_data(conf, props, calctype)
+        instrument.count('confs')
+
+        # if hessian, append to dict bc does not go to SD tag
+        if calctype == 'hess':
+            hessians[j + 1] = props['hessian']
+
+        # check mol title
+        conf = check_title(conf, origsdf)
+
+        # write output of this conformer
+        molbytes.append(oechem.OEWriteMolToBytes('.sdf', conf))
+
+    return b''.join(molbytes), props, hessians
+
+
 ### ------------------- Script -------------------
 
 
+@instrument.timed('get_psi_results')
 def get_psi_results(origsdf,
                     finsdf,
                     calctype='opt',
@@ -357,70 +489,59 @@ def get_psi_results(origsdf,
         sys.exit("Unable to open %s for reading" % origsdf)
     molecules = ifs.GetOEMols()
 
-    # open outstream file
+    # output is only put in place when complete; resume if interrupted
     writeout = os.path.join(wdir, finsdf)
-    write_ofs = oechem.oemolostream()
-    if os.path.exists(writeout):
+    ckpt = pipeline_state.Checkpoint(writeout, 'get_psi_results', origsdf)
+    if ckpt.complete():
         print("File already exists: %s. Skip getting results.\n" % (finsdf))
         return (None, None)
-    if not write_ofs.open(writeout):
-        oechem.OEThrow.Fatal("Unable to open %s for writing" % writeout)
+    done = ckpt.start()
+
+    # shared store of QM results, if any, to read and add results
+    cache = qm_cache.from_env()
 
     # Hessian dictionary, where hdict['molTitle']['confIndex'] has np array
     if calctype == 'hess':
         hdict = {}
 
     # for each conformer, process output file and write new data to SDF file
+    props = {}
     for mol in molecules:
         print("===== %s =====" % (mol.GetTitle()))
-        if calctype == 'hess':
-            hdict[mol.GetTitle()] = {}
-
-        for j, conf in enumerate(mol.GetConfs()):
-
-            props = initiate_dict()
-
-            # set file locations
-            timef = os.path.join(hdir,
-                                 "%s/%s/%s" % (mol.GetTitle(), j + 1, timeout))
-            outf = os.path.join(hdir,
-                                "%s/%s/%s" % (mol.GetTitle(), j + 1, psiout))
-
-            # process output and get dictionary results
-            props = get_conf_data(props, calctype, timef, outf)
-
-            # if output was missing or are missing calculation details
-            # move on to next conformer
-            if props['missing'] or (calctype == 'opt' and not all(
-                    key in props
-                    for key in ['numSteps', 'finalEnergy', 'coords'])):
-                print(
-                    "ERROR reading {}\nEither Psi4 job was incomplete OR wrong calctype specified\n"
-                    .format(outf))
-                continue
-
-            # add data to oemol
-            conf = set_conf_data(conf, props, calctype)
-
-            # if hessian, append to dict bc does not go to SD tag
+        if mol.GetTitle() in done:
+            # results of molecules from an interrupted run are in .part file
+            saved = done[mol.GetTitle()]
+            props.update(saved['theory'])
             if calctype == 'hess':
-                hdict[mol.GetTitle()][j + 1] = props['hessian']
-
-            # check mol title
-            conf = check_title(conf, origsdf)
+                hdict[mol.GetTitle()] = saved['hessian']
+            continue
+        instrument.count('mols')
+        molbytes, conf_props, hessians = harvest_mol(mol, hdir, origsdf,
+                                                     calctype, psiout,
+                                                     timeout, cache)
+        props = conf_props or props
+        if calctype == 'hess':
+            hdict[mol.GetTitle()] = hessians
 
-            # write output file
-            oechem.OEWriteConstMolecule(write_ofs, conf)
+        # checkpoint after each molecule
+        ckpt.add(mol.GetTitle(), molbytes, {
+            'theory': dict((k, props[k]) for k in ['method', 'basis']
+                           if k in props),
+            'hessian': hdict[mol.GetTitle()] if calctype == 'hess' else None
+        })
 
     # if hessian, write hdict out to separate file
     if calctype == 'hess':
         hfile = os.path.join(wdir,
                              os.path.splitext(finsdf)[0] + '.hess.pickle')
-        pickle.dump(hdict, open(hfile, 'wb'))
+        pipeline_state.atomic_write(hfile, pickle.dumps(hdict))
 
     # close file streams
     ifs.close()
-    write_ofs.close()
+    ckpt.finish()
+    if cache is not None:
+        print(cache.report())
+        cache.close()
     try:
         return props['method'], props['basis']
     except KeyError:
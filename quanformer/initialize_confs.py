@@ -21,6 +21,15 @@ import openeye.oechem as oechem
 import openeye.oeomega as oeomega
 import openeye.oeszybki as oeszybki
 
+try:
+    import quanformer.instrument as instrument
+except ModuleNotFoundError:
+    import instrument
+try:
+    import quanformer.pipeline_state as pipeline_state
+except ModuleNotFoundError:
+    import pipeline_state
+
 ### ------------------- Functions -------------------
 
 
@@ -150,6 +159,7 @@ def quick_opt(mol):
 ### ------------------- Script -------------------
 
 
+@instrument.timed('initialize_confs')
 def initialize_confs(smiles, resolve_clash=True, do_opt=True):
     """
     From a file containing smiles strings, generate omega conformers,
@@ -180,15 +190,14 @@ def initialize_confs(smiles, resolve_clash=True, do_opt=True):
     if not ifs.open(smiles):
         oechem.OEThrow.Warning("Unable to open %s for reading" % smiles)
 
-    ### Open output file to write molecules.
-    ofs = oechem.oemolostream()
-    if os.path.exists(sdfout):
+    ### Output file is only put in place when complete; resume if interrupted.
+    ckpt = pipeline_state.Checkpoint(sdfout, 'initialize_confs', smiles)
+    if ckpt.complete():
         print(
             "Output .sdf file already exists. Exiting initialize_confs.\n{}\n".format(
                 os.path.abspath(sdfout)))
         return
-    if not ofs.open(sdfout):
-        oechem.OEThrow.Fatal("Unable to open %s for writing" % sdfout)
+    done = ckpt.start()
 
     ### Output files detailing number of resolved clashes
     ###   and original number of conformers before MM opt.
@@ -197,12 +206,17 @@ def initialize_confs(smiles, resolve_clash=True, do_opt=True):
 
     ### For each molecule: label atoms, generate confs, resolve clashes, optimize.
     for smimol in ifs.GetOEMols():
+        if smimol.GetTitle() in done:
+            continue
         oechem.OETriposAtomNames(smimol)
         oechem.OEAddExplicitHydrogens(smimol)
         mol = generate_confs(smimol)
         if mol is None:
+            ckpt.add(smimol.GetTitle())
             continue
         conffile.write("%s\t%s\n" % (mol.GetTitle(), mol.NumConfs()))
+        instrument.count('mols')
+        instrument.count('confs', mol.NumConfs())
 
         for i, conf in enumerate(mol.GetConfs()):
             print(mol.GetTitle(), i + 1)
@@ -220,12 +234,12 @@ conformer %d:' % (mol.GetTitle(), i + 1))
                     print('Quick optimization failed for molecule %s \
 conformer %d:' % (mol.GetTitle(), i + 1))
                     continue
-        oechem.OEWriteConstMolecule(ofs, mol)
+        ckpt.add(smimol.GetTitle(), oechem.OEWriteMolToBytes('.sdf', mol))
 
     ### Close files.
     ifs.close()
-    ofs.close()
     conffile.close()
+    ckpt.finish()
 
 
 if __name__ == "__main__":
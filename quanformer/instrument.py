@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+instrument.py
+
+Purpose:    Record wall time, CPU time, peak memory, and item counts of each
+            stage of the pipeline, written as one JSON object per line.
+            Instrumentation is off unless switched on with enable() (e.g.,
+            by executor.py --instrument report.jsonl) or by setting the
+            QUANFORMER_INSTRUMENT environment variable to the report file.
+            When off, stages cost one function call and no file access.
+
+Usage:      - import instrument
+            - instrument.enable('stages.jsonl')
+            - with instrument.stage('filter_confs', infile=fname):
+                  ...
+                  instrument.count('confs', mol.NumConfs())
+            - or decorate a function with @instrument.timed('filter_confs')
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+ENV_VAR = 'QUANFORMER_INSTRUMENT'
+
+# stages that are currently running in this process, innermost last
+_active = []
+
+### ------------------- Functions -------------------
+
+
+def enable(report):
+    """
+    Switch on instrumentation and append records to the given report file.
+    The setting is passed on to child processes through the environment.
+    """
+    os.environ[ENV_VAR] = os.path.abspath(report)
+
+
+def disable():
+    os.environ.pop(ENV_VAR, None)
+
+
+def report_file():
+    """
+    Get the name of the report file, or None if instrumentation is off.
+    """
+    return os.environ.get(ENV_VAR) or None
+
+
+def peak_rss_mb():
+    """
+    Get the peak resident set size of this process so far in MB, or None
+    if it cannot be determined.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, mac reports bytes
+    if sys.platform == 'darwin':
+        return peak / 1024.**2
+    return peak / 1024.
+
+
+def count(key, n=1):
+    """
+    Add n items of the given kind (e.g., 'mols', 'confs') to the innermost
+    running stage. Does nothing if no stage is running.
+    """
+    if _active:
+        items = _active[-1].items
+        items[key] = items.get(key, 0) + n
+
+
+class stage(object):
+    """
+    Context manager that records one stage. Extra keyword arguments are
+    written into the record, e.g., the input file name.
+    """
+
+    def __init__(self, name, **info):
+        self.name = name
+        self.info = info
+        self.items = {}
+        self.report = None
+
+    def __enter__(self):
+        self.report = report_file()
+        if self.report is None:
+            return self
+        self.start = time.time()
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        self.rss0 = peak_rss_mb()
+        _active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.report is None:
+            return False
+        _active.remove(self)
+        rss = peak_rss_mb()
+        record = {
+            'stage': self.name,
+            'start': self.start,
+            'wall_sec': time.perf_counter() - self.wall0,
+            'cpu_sec': time.process_time() - self.cpu0,
+            'peak_rss_mb': rss,
+            'peak_rss_increase_mb':
+                None if rss is None else rss - self.rss0,
+            'items': self.items,
+            'ok': exc_type is None,
+            'pid': os.getpid(),
+            'parent': _active[-1].name if _active else None
+        }
+        record.update(self.info)
+        # one write per record so lines of parallel processes do not mix
+        with open(self.report, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+        return False
+
+
+def timed(name):
+    """
+    Decorator to record each call of a function as a stage. If the first
+    argument is a string, e.g., the input file name, it is recorded too.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if report_file() is None:
+                return func(*args, **kwargs)
+            info = {}
+            if args and isinstance(args[0], str):
+                info['input'] = args[0]
+            with stage(name, **info):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def read_report(report):
+    """
+    Read a JSON lines report into a list of dictionaries.
+    """
+    with open(report) as f:
+        return [json.loads(line) for line in f if line.strip()]
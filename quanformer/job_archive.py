@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+job_archive.py
+
+Purpose:    Pack the conformer job directories of each molecule into a single
+            archive after the jobs finish, to cut the number of files of a
+            campaign, e.g., on Lustre or NFS file systems where every file
+            lookup is slow. The directory maindir/molName/ with its
+            confNumber/ subdirectories becomes maindir/molName.tar (or .zip)
+            with members molName/confNumber/[file], so that extracting the
+            archive in maindir gives back the same layout.
+
+            Harvesting reads output files from the archives directly without
+            extracting them (see output_io.py), so get_psi_results works the
+            same on packed and unpacked molecules. Unpack the molecules to
+            rerun or to set up warm starts from their calculations.
+
+            Archives are not compressed themselves. Compress outputs first
+            with output_io.py compact, which keeps each file separately
+            readable in the archive.
+
+Usage:      python job_archive.py pack -d maindir -f tar
+            python job_archive.py unpack -d maindir
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import glob
+import shutil
+import tarfile
+import zipfile
+
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+
+### ------------------- Functions -------------------
+
+
+def mol_dirs(maindir):
+    """
+    Get the names of molecule directories of a campaign, i.e., those with
+    at least one numbered conformer subdirectory.
+    """
+    mols = []
+    for moldir in sorted(glob.glob(os.path.join(maindir, '*', ''))):
+        moldir = os.path.dirname(moldir)
+        if any(d.isdigit() for d in os.listdir(moldir)):
+            mols.append(os.path.basename(moldir))
+    return mols
+
+
+def mol_finished(moldir, psiout='output.dat'):
+    """
+    Check if every conformer of a molecule directory has a finished output
+    file. Outputs compressed by output_io.compact are finished.
+    """
+    confs = [d for d in os.listdir(moldir) if d.isdigit()]
+    for conf in confs:
+        outf = output_io.find_output(os.path.join(moldir, conf, psiout))
+        if outf is None:
+            return False
+        if outf.endswith(psiout) and not output_io.is_finished(outf):
+            return False
+    return len(confs) > 0
+
+
+def pack_molecule(maindir, molname, fmt='tar', remove=True):
+    """
+    Pack one molecule directory into maindir/molName.tar or .zip.
+
+    Parameters
+    ----------
+    maindir : string, main directory of the calculations
+    molname : string, name of the molecule directory
+    fmt : string, 'tar' or 'zip'
+    remove : Boolean, delete the molecule directory after packing
+
+    Returns
+    -------
+    archive : string, name of the archive
+    nfiles : int, number of files packed
+
+    """
+    moldir = os.path.join(maindir, molname)
+    archive = moldir + '.' + fmt
+    part = archive + '.part'
+    files = []
+    for root, dirs, fnames in os.walk(moldir):
+        dirs.sort()
+        for fname in sorted(fnames):
+            full = os.path.join(root, fname)
+            files.append((full, os.path.relpath(full, maindir)))
+
+    if fmt == 'zip':
+        # outputs are compressed beforehand if at all
+        with zipfile.ZipFile(part, 'w', zipfile.ZIP_STORED) as zf:
+            for full, arcname in files:
+                zf.write(full, arcname)
+    elif fmt == 'tar':
+        with tarfile.open(part, 'w') as tf:
+            for full, arcname in files:
+                tf.add(full, arcname)
+    else:
+        raise ValueError("Unknown archive format: %s" % fmt)
+    os.replace(part, archive)
+
+    if remove:
+        shutil.rmtree(moldir)
+    return archive, len(files)
+
+
+def pack(maindir, fmt='tar', psiout='output.dat', force=False, remove=True):
+    """
+    Pack each molecule directory of a campaign whose calculations have all
+    finished.
+
+    Parameters
+    ----------
+    maindir : string, main directory of the calculations
+    fmt : string, 'tar' or 'zip'
+    psiout : string, name of the Psi4 output files
+    force : Boolean, also pack molecules with unfinished calculations
+    remove : Boolean, delete molecule directories after packing
+
+    Returns
+    -------
+    counts : dictionary of number of 'mols' and 'files' packed, and of
+        'skipped' molecules with unfinished calculations
+
+    """
+    counts = {'mols': 0, 'files': 0, 'skipped': 0}
+    for molname in mol_dirs(maindir):
+        moldir = os.path.join(maindir, molname)
+        if os.path.exists(moldir + '.tar') or os.path.exists(moldir + '.zip'):
+            print("Archive of %s already exists. Skipping." % molname)
+            counts['skipped'] += 1
+            continue
+        if not force and not mol_finished(moldir, psiout):
+            counts['skipped'] += 1
+            continue
+        archive, nfiles = pack_molecule(maindir, molname, fmt, remove)
+        counts['mols'] += 1
+        counts['files'] += nfiles
+    print("Packed %d files of %d molecules of %s; skipped %d molecules" %
+          (counts['files'], counts['mols'], maindir, counts['skipped']))
+    return counts
+
+
+def unpack_molecule(archive, remove=True):
+    """
+    Extract a molecule archive in its own directory, giving back the
+    molName/confNumber/ layout.
+
+    Returns
+    -------
+    int number of files extracted
+
+    """
+    maindir = os.path.dirname(os.path.abspath(archive))
+    output_io.close_archive(archive)
+    if archive.endswith('.zip'):
+        with zipfile.ZipFile(archive) as zf:
+            names = [n for n in zf.namelist() if not n.endswith('/')]
+            check_members(names, maindir)
+            zf.extractall(maindir, names)
+    else:
+        with tarfile.open(archive) as tf:
+            members = [m for m in tf.getmembers() if m.isfile()]
+            names = [m.name for m in members]
+            check_members(names, maindir)
+            tf.extractall(maindir, members)
+    if remove:
+        os.remove(archive)
+    return len(names)
+
+
+def check_members(names, maindir):
+    """
+    Refuse to extract archive members outside of the main directory.
+    """
+    for name in names:
+        dest = os.path.abspath(os.path.join(maindir, name))
+        if os.path.commonpath([dest, maindir]) != maindir:
+            raise ValueError("Archive member outside of %s: %s" %
+                             (maindir, name))
+
+
+def unpack(maindir, molnames=None, remove=True):
+    """
+    Extract molecule archives of a campaign.
+
+    Parameters
+    ----------
+    maindir : string, main directory of the calculations
+    molnames : list of molecule names to unpack. None unpacks all.
+    remove : Boolean, delete archives after extracting
+
+    Returns
+    -------
+    int number of molecules unpacked
+
+    """
+    count = 0
+    for ext in output_io.ARCHIVES:
+        for archive in sorted(glob.glob(os.path.join(maindir, '*' + ext))):
+            molname = os.path.basename(archive)[:-len(ext)]
+            if molnames is not None and molname not in molnames:
+                continue
+            unpack_molecule(archive, remove)
+            count += 1
+    print("Unpacked %d molecules of %s" % (count, maindir))
+    return count
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    pp = subparsers.add_parser('pack',
+        help="Pack molecules whose calculations have all finished.")
+    pp.add_argument("-d", "--maindir", required=True,
+        help="Main directory with molName/confNumber subdirectories.")
+    pp.add_argument("-f", "--format", default="tar", choices=['tar', 'zip'],
+        help="Archive format. Default is tar.")
+    pp.add_argument("-o", "--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+    pp.add_argument("--force", action="store_true", default=False,
+        help="Also pack molecules with unfinished calculations.")
+
+    up = subparsers.add_parser('unpack', help="Extract molecule archives.")
+    up.add_argument("-d", "--maindir", required=True,
+        help="Main directory with molName.tar or molName.zip archives.")
+    up.add_argument("-m", "--mols", nargs='+', default=None,
+        help="Names of molecules to unpack. Default is all.")
+
+    args = parser.parse_args()
+    if args.command == 'pack':
+        pack(args.maindir, args.format, args.psiout, args.force)
+    elif args.command == 'unpack':
+        unpack(args.maindir, args.mols)
+    else:
+        parser.print_help()
@@ -7,18 +7,16 @@ By:     Victoria T. Lim
 
 import os
 import sys
-import openeye.oechem as oechem
 import numpy as np
 from numpy import nan
 import pickle
 import itertools
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-import proc_tags as pt  # for get_sd_list
+import profiling
 
 ### ------------------- Functions -------------------
 
 
+@profiling.profiled('compare_two_mols')
 def compare_two_mols(rmol, qmol):
     """
     For two identical molecules, with varying conformers,
@@ -38,6 +36,8 @@ def compare_two_mols(rmol, qmol):
 
     """
 
+    import openeye.oechem as oechem
+
     automorph = True  # take into acct symmetry related transformations
     heavyOnly = False  # do consider hydrogen atoms for automorphisms
     overlay = True  # find the lowest possible RMSD
@@ -76,6 +76,8 @@ def plot_mol_minima(molName, minimaE, xticklabels, selected=None, stag=False):
 
     # minimaE for ONE molecule
     '''
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
 
     refNumConfs = len(minimaE[0])
     refFile = xticklabels[0]
@@ -157,6 +159,8 @@ def plot_mol_minima(molName, minimaE, xticklabels, selected=None, stag=False):
 
 
 def plot_avg_times(molName, avgTimes, sdTimes, xticklabels):
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
     plttitle = "Conformer-Averaged Wall Times\nfor %s" % (molName)
     plttitle += "\nGeometry Optimization in Psi4"
     ylabel = "time (s)"
@@ -199,6 +203,9 @@ def match_minima(sdfList, thryList, *tags):
         Second-level keys are from tags variable.
 
     """
+    # OEChem is slow to import, so import here instead of at the top
+    import openeye.oechem as oechem
+    import proc_tags as pt  # for get_sd_list
 
     def load_file(fname):
         ifs = oechem.oemolistream()
@@ -503,39 +510,17 @@ def extract_matches(moldict, *tags):
     return moldict
 
 
-### ------------------- Parser -------------------
-
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument("-i", "--input",
-        help="Required argument on name of text file with information on\
-              file(s) and levels of theory to process.\
-              See README file or examples for more details. TODO")
-
-    parser.add_argument("--readpickle", action="store_true", default=False,
-        help="If specified, read in data from pickle files from each \
-              directory. Input file can be same as for heat plot inputs, \
-              and pickle files will be read from same directory as \
-              specified output files.")
-
-    parser.add_argument("--verbose", action="store_true", default=False,
-        help="If specified, write out relative energies in kcal/mol for \
-              all conformers of all mols for all files. If in doubt, \
-              do specify this option.")
-
-    parser.add_argument("--eplot",action="store_true", default=False,
-        help="Generate line plots for every molecule with relative energies.")
-
-    parser.add_argument("--tplot", action="store_true", default=False,
-        help="Generate bar plots of conformer-averaged time per each \
-              optimization. One plot generated per molecule.")
-
-    args = parser.parse_args()
-    opt = vars(args)
+def main(**kwargs):
+    """
+    Match minima of the files of the input file, then write relative
+    energies and make the plots requested by the keyword arguments, which
+    are the options of the parser below.
+    """
+    opt = kwargs
+    if opt.get('profile'):
+        profiling.enable(opt['profile'])
     if not os.path.exists(opt['input']):
-        raise parser.error("Input file %s does not exist." % opt['filename'])
+        sys.exit("Input file %s does not exist." % opt['input'])
     sys.stdout.flush()
 
     # Read input file and store each file's information in two lists.
@@ -552,16 +537,8 @@ if __name__ == "__main__":
             sdfList.append(dataline[1])
 
     # Check that each file exists before starting -_-
-    while True:
-        list1 = []
-        for f in sdfList:
-            list1.append(os.path.isfile(f))
-
-        if all(list1):
-            # All elements are True. Therefore all the files exist. Run %run commands
-            break
-        else:
-            raise parser.error("One or more input files are missing!!")
+    if not all(os.path.isfile(f) for f in sdfList):
+        sys.exit("One or more input files are missing!!")
 
     # run the workhorse, unless reading in from pickle file
     if not opt['readpickle']:
@@ -595,6 +572,10 @@ if __name__ == "__main__":
                 write_rel_ene(mn, [nan] * len(thryList), elists[i], zeroes[i],
                               thryList)
 
+    if opt['batch']:
+        import render_plots
+        plotjobs = []
+
     if opt['tplot']:
         timesByMol = []
         for m in moldict:
@@ -629,7 +610,12 @@ if __name__ == "__main__":
                 element for i, element in enumerate(thryList)
                 if i not in to_exclude
             ]
-            plot_avg_times(name, fileTimes_i, stdevs_i, thryList_i)
+            if opt['batch']:
+                plotjobs.append(render_plots.job('times', name,
+                    avgTimes=fileTimes_i, sdTimes=stdevs_i,
+                    xticklabels=thryList_i))
+            else:
+                plot_avg_times(name, fileTimes_i, stdevs_i, thryList_i)
 
         if opt['verbose']:  # append time to relative energies file
             for i, name in enumerate(molNames):
@@ -652,5 +638,63 @@ if __name__ == "__main__":
     if opt['eplot']:
         for i, m in enumerate(moldict):
 #            if m != 'AlkEthOH_c1178': continue
-            plot_mol_minima(m, trimE[i], thryList)
+            if opt['batch']:
+                plotjobs.append(render_plots.job('minima', m,
+                    minimaE=trimE[i], xticklabels=thryList))
+            else:
+                plot_mol_minima(m, trimE[i], thryList)
 #            plot_mol_minima(m, trimE[i], thryList, selected=[0]) # zero based index
+
+    if opt['batch']:
+        render_plots.render_batch(plotjobs, opt['nprocs'], opt['fmt'],
+                                  opt['dpi'])
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-i", "--input",
+        help="Required argument on name of text file with information on\
+              file(s) and levels of theory to process.\
+              See README file or examples for more details. TODO")
+
+    parser.add_argument("--readpickle", action="store_true", default=False,
+        help="If specified, read in data from pickle files from each \
+              directory. Input file can be same as for heat plot inputs, \
+              and pickle files will be read from same directory as \
+              specified output files.")
+
+    parser.add_argument("--verbose", action="store_true", default=False,
+        help="If specified, write out relative energies in kcal/mol for \
+              all conformers of all mols for all files. If in doubt, \
+              do specify this option.")
+
+    parser.add_argument("--eplot",action="store_true", default=False,
+        help="Generate line plots for every molecule with relative energies.")
+
+    parser.add_argument("--tplot", action="store_true", default=False,
+        help="Generate bar plots of conformer-averaged time per each \
+              optimization. One plot generated per molecule.")
+
+    parser.add_argument("--batch", action="store_true", default=False,
+        help="Render plots of all molecules in parallel with the \
+              object-oriented Agg backend instead of one by one in pyplot.")
+
+    parser.add_argument("--nprocs", type=int, default=None,
+        help="Number of processes for --batch plotting. Default uses all CPUs.")
+
+    parser.add_argument("--fmt", default="png",
+        help="Output format of --batch plots, e.g., png, pdf, svg.")
+
+    parser.add_argument("--dpi", type=int, default=100,
+        help="Resolution of --batch plots in raster formats.")
+
+    parser.add_argument("--profile", default=None,
+        help="Directory in which to write cProfile summaries and collapsed \
+              stacks of hot sections such as compare_two_mols.")
+
+    args = parser.parse_args()
+    main(**vars(args))
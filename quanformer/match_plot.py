@@ -16,8 +16,6 @@ import os
 import sys
 import numpy as np
 import itertools
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 
 
 def shift_array(rmsArray):
@@ -43,6 +41,9 @@ def plot_heat_rmse(molName,
                    colors='PRGn_r'):
     """
     """
+    # matplotlib is slow to import, so import here instead of at the top
+    import matplotlib.pyplot as plt
+
     plttitle = "%s\n%s" % (ptitle, molName)
     figname = "%s_%s.png" % (fprefix, molName)
     x = list(range(len(rmsArray)))
@@ -72,6 +73,9 @@ def plot_rmse_time(molName, eneArray, timeArray, ticklabels,
                    fprefix='scatter'):
     """
     """
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
+
     plttitle = "RMS error vs. log ratio of wall time\n%s" % molName
     figname = "%s_%s.png" % (fprefix, molName)
     colors = mpl.cm.rainbow(np.linspace(0, 1, len(eneArray)))
@@ -107,6 +111,15 @@ def plot_rmse_time(molName, eneArray, timeArray, ticklabels,
 
 def match_plot(args):
 
+    # collect plots to render together in batch mode
+    batch = getattr(args, 'batch', False)
+    plotjobs = []
+    if batch:
+        try:
+            import quanformer.render_plots as render_plots
+        except ModuleNotFoundError:
+            import render_plots
+
     # Read input file and store each file's information in two lists.
     dat_list = []
     thry_list = []
@@ -138,7 +151,11 @@ def match_plot(args):
         # adjust data when dat files have more columns than # of method files were input, identify which index first
         #[l.pop(-1) for l in rmsArray]
 
-        plot_heat_rmse(args.title, rmsArray, thry_list)
+        if batch:
+            plotjobs.append(render_plots.job('heat', args.title,
+                rmsArray=rmsArray, ticklabels=thry_list))
+        else:
+            plot_heat_rmse(args.title, rmsArray, thry_list)
 
     # HEAT PLOT OF TIMES
     if args.theatplot:
@@ -159,13 +176,19 @@ def match_plot(args):
         #[l.pop(-1) for l in rmsArray]
 
         # plot log ratio of wall times
-        plot_heat_rmse(
-            args.title,
-            np.log10(rmsArray),
-            thry_list,
-            ptitle='log ratio of wall times',
-            fprefix='times',
-            colors='seismic')
+        if batch:
+            plotjobs.append(render_plots.job('heat', args.title,
+                rmsArray=np.log10(rmsArray), ticklabels=thry_list,
+                ptitle='log ratio of wall times', fprefix='times',
+                colors='seismic'))
+        else:
+            plot_heat_rmse(
+                args.title,
+                np.log10(rmsArray),
+                thry_list,
+                ptitle='log ratio of wall times',
+                fprefix='times',
+                colors='seismic')
         # plot direct ratio of wall times
         #plot_heat_rmse(args.title,rmsArray,thry_list, ptitle='ratio of wall times',fprefix='times')
 
@@ -196,6 +219,11 @@ def match_plot(args):
 
         for i in range(len(dat_list)):
             #            if i<13: continue
+            if batch:
+                plotjobs.append(render_plots.job('scatter', args.title,
+                    eneArray=eArray[i], timeArray=np.log10(tArray[i]),
+                    ticklabels=thry_list, fprefix='scatter' + str(i + 1)))
+                continue
             plot_rmse_time(
                 args.title,
                 eArray[i],
@@ -203,6 +231,9 @@ def match_plot(args):
                 thry_list,
                 fprefix='scatter' + str(i + 1))
 
+    if batch:
+        render_plots.render_batch(plotjobs, args.nprocs, args.fmt, args.dpi)
+
 
 def single_scatter(args):
     # SINGLE SCATTER PLOT
@@ -288,6 +319,19 @@ if __name__ == "__main__":
               "This flag allows user to specify one .dat file AS THE INPUT file of "
               "this match_plot.py script to generate a time vs rmse scatter plot."))
 
+    parser.add_argument("--batch", action="store_true", default=False,
+        help=("Render all plots in parallel with the object-oriented Agg "
+              "backend instead of one by one in pyplot."))
+
+    parser.add_argument("--nprocs", type=int, default=None,
+        help="Number of processes for --batch plotting. Default uses all CPUs.")
+
+    parser.add_argument("--fmt", default="png",
+        help="Output format of --batch plots, e.g., png, pdf, svg.")
+
+    parser.add_argument("--dpi", type=int, default=100,
+        help="Resolution of --batch plots in raster formats.")
+
     args = parser.parse_args()
     if args.onescatter:
         single_scatter(args)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+"""
+modsem.py
+
+Purpose:    Built-in, vectorized implementation of the modified Seminario
+            method for obtaining bond and angle force constants from
+            Hessian matrices of Psi4 calculations organized by Quanformer.
+            The 3x3 interatomic sub-blocks of the Hessian are diagonalized
+            for all bonds and angles of a conformer in batched NumPy calls,
+            and the bond/angle topology is set up once per molecule and
+            reused for all of its conformers.
+
+Reference:  Seminario, 10.1002/(SICI)1097-461X(1996)60:7<1271::AID-QUA8>3.0.CO;2-W
+            Allen et al., 10.1021/acs.jctc.7b00785
+            https://github.com/aa840/ModSeminario_Py
+
+Usage:      python modsem.py -i file.sdf -p file.hess.pickle -o modsem.dat
+
+By:         Victoria T. Lim
+
+Notes:
+ - Force constants are reported in the same (OPLS/AMBER) form as the
+   ModSeminario_Py code, i.e., E = k(x-x0)^2, so k is half of the
+   harmonic force constant.
+ - Units: bond lengths in Angstrom, bond force constants in
+   kcal/mol/Angstrom^2, angles in degrees, angle force constants in
+   kcal/mol/radian^2.
+
+"""
+
+import sys
+import numpy as np
+import pickle
+
+### ------------------- Functions -------------------
+
+
+def hbb_to_kaa(hessian):
+    """
+    Unit conversions on input Hessian matrix from (Hartrees/Bohr/Bohr)
+    (kcal/mol/Angstrom/Angstrom).
+
+    """
+    hessian = (hessian * 627.509474) / (0.529177**2)
+    return hessian
+
+
+class Topology(object):
+    """
+    Bond and angle definitions of one molecule, along with the index arrays
+    needed by the modified Seminario angle scaling factors. This depends
+    only on the connectivity, so it is built once per molecule and reused
+    for every conformer.
+
+    Attributes
+    ----------
+    natoms : int, number of atoms
+    bonds : (nbonds, 2) int array of atom indices
+    angles : (nangles, 3) int array of atom indices, central atom in middle
+    arms : (2*nangles, 2) int array. Each angle A-B-C has two arms, (A, C)
+        and (C, A), where the first atom is the one whose bond to the central
+        atom is being projected.
+    pair_i, pair_j : int arrays of arm indices that share the same outer
+        atom and the same central atom, i.e., the same bond
+
+    """
+
+    def __init__(self, natoms, bonds, angles):
+        self.natoms = natoms
+        self.bonds = np.asarray(bonds, dtype=int).reshape(-1, 2)
+        self.angles = np.asarray(angles, dtype=int).reshape(-1, 3)
+
+        first = np.concatenate((self.angles[:, 0], self.angles[:, 2]))
+        other = np.concatenate((self.angles[:, 2], self.angles[:, 0]))
+        center = np.concatenate((self.angles[:, 1], self.angles[:, 1]))
+        self.arms = np.column_stack((first, other))
+        self.arm_center = center
+
+        # arms on the same bond contribute to each other's scaling factor
+        keys = first * natoms + center
+        order = np.argsort(keys, kind='mergesort')
+        pair_i = []
+        pair_j = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            if end == len(order) or keys[order[end]] != keys[order[start]]:
+                group = order[start:end]
+                for gi in group:
+                    for gj in group:
+                        if gi != gj:
+                            pair_i.append(gi)
+                            pair_j.append(gj)
+                start = end
+        self.pair_i = np.array(pair_i, dtype=int)
+        self.pair_j = np.array(pair_j, dtype=int)
+
+    @classmethod
+    def from_mol(cls, mol):
+        """
+        Get bonds and angles from the connectivity of an OEChem molecule.
+        """
+        bonds = [[b.GetBgnIdx(), b.GetEndIdx()] for b in mol.GetBonds()]
+        angles = []
+        for atom in mol.GetAtoms():
+            nbors = [n.GetIdx() for n in atom.GetAtoms()]
+            # all combinations of two neighbors are the outer angle atoms
+            for a in range(len(nbors)):
+                for c in range(a + 1, len(nbors)):
+                    angles.append([nbors[a], atom.GetIdx(), nbors[c]])
+        return cls(mol.NumAtoms(), bonds, angles)
+
+
+def block_eigen(hessian, rows, cols):
+    """
+    Eigenvalues and eigenvectors of many 3x3 interatomic Hessian sub-blocks
+    in a single batched call.
+
+    Parameters
+    ----------
+    hessian : (3N, 3N) array
+    rows, cols : int arrays of atom indices for each sub-block
+
+    Returns
+    -------
+    eigvals : (n, 3) complex array
+    eigvecs : (n, 3, 3) complex array; eigvecs[k, :, i] is the ith
+        eigenvector of the kth sub-block
+
+    """
+    natoms = hessian.shape[0] // 3
+    blocks = hessian.reshape(natoms, 3, natoms, 3).transpose(0, 2, 1, 3)
+    return np.linalg.eig(blocks[rows, cols])
+
+
+def _unit(vecs):
+    return vecs / np.linalg.norm(vecs, axis=-1)[..., np.newaxis]
+
+
+def _projection(eigvals, eigvecs, unit_vecs):
+    """
+    Sum over the three eigenpairs of each sub-block of the eigenvalue times
+    the absolute projection of its eigenvector onto a unit vector.
+    """
+    dots = np.abs(np.einsum('nj,nji->ni', unit_vecs, eigvecs))
+    return np.sum(eigvals * dots, axis=1)
+
+
+def _perpendicular(u_ab, u_cb):
+    """
+    Unit normals of the planes defined by pairs of bond vectors. For
+    (near-)linear angles, any vector perpendicular to u_ab is used.
+    """
+    normal = np.cross(u_cb, u_ab)
+    norms = np.linalg.norm(normal, axis=1)
+    linear = norms < 1.e-6
+    if np.any(linear):
+        trial = np.tile([1., 0., 0.], (np.sum(linear), 1))
+        parallel = np.abs(u_ab[linear][:, 0]) > 0.9
+        trial[parallel] = [0., 1., 0.]
+        normal[linear] = np.cross(u_ab[linear], trial)
+        norms = np.linalg.norm(normal, axis=1)
+    return normal / norms[:, np.newaxis]
+
+
+def bond_params(coords, hessian, topology):
+    """
+    Equilibrium lengths and force constants for all bonds of a conformer.
+
+    Parameters
+    ----------
+    coords : (N, 3) array of coordinates in Angstrom
+    hessian : (3N, 3N) array in kcal/mol/Angstrom^2
+    topology : Topology of the molecule
+
+    Returns
+    -------
+    lengths : (nbonds,) array of bond lengths in Angstrom
+    k_bonds : (nbonds,) array of force constants in kcal/mol/Angstrom^2
+
+    """
+    a = topology.bonds[:, 0]
+    b = topology.bonds[:, 1]
+    diff = coords[b] - coords[a]
+    lengths = np.linalg.norm(diff, axis=1)
+    u_ab = diff / lengths[:, np.newaxis]
+
+    vals_ab, vecs_ab = block_eigen(hessian, a, b)
+    vals_ba, vecs_ba = block_eigen(hessian, b, a)
+    k_ab = _projection(vals_ab, vecs_ab, u_ab)
+    k_ba = _projection(vals_ba, vecs_ba, -u_ab)
+
+    # average both directions; negate and halve for OPLS form
+    k_bonds = -0.5 * np.real(0.5 * (k_ab + k_ba))
+    return lengths, k_bonds
+
+
+def angle_params(coords, hessian, topology):
+    """
+    Equilibrium angles and force constants for all angles of a conformer,
+    including the scaling factors of the modified Seminario method which
+    account for other angles sharing the same bond.
+
+    Parameters
+    ----------
+    coords : (N, 3) array of coordinates in Angstrom
+    hessian : (3N, 3N) array in kcal/mol/Angstrom^2
+    topology : Topology of the molecule
+
+    Returns
+    -------
+    theta0 : (nangles,) array of angles in degrees
+    k_angles : (nangles,) array of force constants in kcal/mol/rad^2
+
+    """
+    nangles = len(topology.angles)
+    if nangles == 0:
+        return np.zeros(0), np.zeros(0)
+
+    # vectors from the outer atom of each arm to the central atom
+    first = topology.arms[:, 0]
+    other = topology.arms[:, 1]
+    center = topology.arm_center
+    d_first = coords[center] - coords[first]
+    d_other = coords[center] - coords[other]
+    arm_len = np.linalg.norm(d_first, axis=1)
+    u_first = d_first / arm_len[:, np.newaxis]
+    u_other = _unit(d_other)
+
+    # in-plane unit vectors perpendicular to each arm's bond
+    u_n = _perpendicular(u_first, u_other)
+    u_p = _unit(np.cross(u_n, u_first))
+
+    # modified Seminario scaling factor: 1 + mean |u_p . u_p'|^2 over the
+    # other angles that share this arm's bond
+    contrib = np.abs(np.sum(u_p[topology.pair_i] * u_p[topology.pair_j],
+                            axis=1))**2
+    totals = np.bincount(topology.pair_i, weights=contrib,
+                         minlength=len(first))
+    counts = np.bincount(topology.pair_i, minlength=len(first))
+    scaling = np.ones(len(first))
+    has_nbors = counts > 0
+    scaling[has_nbors] += totals[has_nbors] / counts[has_nbors]
+
+    # projections of the (outer, central) sub-blocks onto u_p
+    vals, vecs = block_eigen(hessian, first, center)
+    sums = np.real(_projection(vals, vecs, u_p)) / scaling
+
+    # combine the two arms (A-B and C-B) of each angle like springs in series
+    sum_a, sum_c = sums[:nangles], sums[nangles:]
+    len_a, len_c = arm_len[:nangles], arm_len[nangles:]
+    with np.errstate(divide='ignore'):
+        k_theta = 1. / (1. / (len_a**2 * sum_a) + 1. / (len_c**2 * sum_c))
+    k_angles = np.abs(-k_theta * 0.5)
+
+    cos_theta = np.sum(u_first[:nangles] * u_other[:nangles], axis=1)
+    theta0 = np.degrees(np.arccos(np.clip(cos_theta, -1., 1.)))
+    return theta0, k_angles
+
+
+def modsem_conformer(coords, hessian, topology, vib_scaling=1.):
+    """
+    Apply the modified Seminario method to one conformer.
+
+    Parameters
+    ----------
+    coords : (N, 3) array of coordinates in Angstrom
+    hessian : (3N, 3N) array in Hartree/Bohr^2, as extracted by
+        get_psi_results
+    topology : Topology of the molecule
+    vib_scaling : float, vibrational scaling factor of the level of theory.
+        Force constants are scaled by its square.
+
+    Returns
+    -------
+    dictionary with keys 'bond_lengths', 'k_bonds', 'angles', 'k_angles'
+
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    hessian = hbb_to_kaa(np.asarray(hessian, dtype=float))
+    if hessian.shape != (3 * len(coords), 3 * len(coords)):
+        raise ValueError("Hessian shape {} does not match {} atoms".format(
+            hessian.shape, len(coords)))
+
+    lengths, k_bonds = bond_params(coords, hessian, topology)
+    theta0, k_angles = angle_params(coords, hessian, topology)
+    return {
+        'bond_lengths': lengths,
+        'k_bonds': k_bonds * vib_scaling**2,
+        'angles': theta0,
+        'k_angles': k_angles * vib_scaling**2
+    }
+
+
+def write_modsem_rows(fileobj, title, confnum, topology, results):
+    """
+    Write the bond and angle parameters of one conformer as rows of the
+    output table. Atom indices are zero-based as in OEChem.
+    """
+    for (a, b), r0, k in zip(topology.bonds, results['bond_lengths'],
+                             results['k_bonds']):
+        fileobj.write("%s\t%d\tbond\t%d-%d\t%.6f\t%.6f\n" % (title, confnum,
+                                                             a, b, r0, k))
+    for (a, b, c), t0, k in zip(topology.angles, results['angles'],
+                                results['k_angles']):
+        fileobj.write("%s\t%d\tangle\t%d-%d-%d\t%.6f\t%.6f\n" %
+                      (title, confnum, a, b, c, t0, k))
+
+
+### ------------------- Script -------------------
+
+
+def modsem(infile, pfile, outfile='modsem.dat', vib_scaling=1.):
+    """
+    Compute modified Seminario force constants for all conformers of all
+    molecules in infile, using the Hessians stored in the pickle file from
+    get_psi_results, and write all results to a single table.
+
+    Parameters
+    ----------
+    infile : string
+        SDF file from setting up the Hessian calculations
+    pfile : string
+        Pickle file with dictionary of Hessians, where
+        hdict['molTitle'][confNumber] is a (3N, 3N) array in Hartree/Bohr^2
+    outfile : string
+        Name of the output table. Columns are molecule title, conformer
+        number, parameter type, atom indices, equilibrium value, and
+        force constant.
+    vib_scaling : float
+        Vibrational scaling factor of the level of theory
+
+    Returns
+    -------
+    count : int, number of conformers processed
+
+    """
+    import openeye.oechem as oechem
+
+    # read in sdf file and distinguish each molecule's conformers
+    ifs = oechem.oemolistream()
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    if not ifs.open(infile):
+        sys.exit("Unable to open %s for reading" % infile)
+
+    # open quanformer-generated pickle file with dictionary of hessians
+    hdict = pickle.load(open(pfile, 'rb'))
+
+    count = 0
+    ofile = open(outfile, 'w')
+    ofile.write("# title\tconf\ttype\tatoms\tvalue\tk\n")
+    for mol in ifs.GetOEMols():
+        title = mol.GetTitle()
+        print("===== %s =====" % title)
+        if title not in hdict:
+            print("No Hessians found for %s in %s" % (title, pfile))
+            continue
+
+        # connectivity is the same for all conformers
+        topology = Topology.from_mol(mol)
+
+        for j, conf in enumerate(mol.GetConfs()):
+            if j + 1 not in hdict[title]:
+                print("No Hessian found for %s conformer %d" % (title, j + 1))
+                continue
+            coords = np.array(list(conf.GetCoords().values()))
+            results = modsem_conformer(coords, hdict[title][j + 1], topology,
+                                       vib_scaling)
+            write_modsem_rows(ofile, title, j + 1, topology, results)
+            count += 1
+    ofile.close()
+    ifs.close()
+
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-i", "--infile", required=True,
+        help="Input SDF file with all conformers of Hessian data")
+    parser.add_argument("-p", "--pfile", required=True,
+        help="Associated pickle file with dictionary of extracted Hessian matrices")
+    parser.add_argument("-o", "--outfile", default="modsem.dat",
+        help="Output table of bond and angle parameters")
+    parser.add_argument("-s", "--scaling", type=float, default=1.,
+        help="Vibrational scaling factor of the QM level of theory")
+
+    args = parser.parse_args()
+    modsem(args.infile, args.pfile, args.outfile, args.scaling)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+"""
+output_io.py
+
+Purpose:    Compressed storage of finished QM output files. After results are
+            harvested, compact() compresses the Psi4 output and timer files of
+            each finished calculation in place, e.g., output.dat becomes
+            output.dat.gz. Files are compressed with gzip or xz (lzma) of the
+            Python standard library: gzip is faster to read and write, and xz
+            makes smaller files.
+
+            Readers of output files (get_psi_results, getTurbResults,
+            warm_start, and the QM cache) open them with open_output(), which
+            takes the uncompressed name and reads whichever of name, name.gz,
+            or name.xz is present, decompressing while reading.
+
+            A calculation is only compressed if its output file has the Psi4
+            completion message, so running or failed jobs are left as they
+            are. Compressed files are written to [name].part first and the
+            uncompressed file is removed only after that is complete.
+
+            Output files of molecules packed by job_archive.py are read from
+            the archive maindir/molName.tar (or .zip) without extracting it.
+            Such files are named [archive]/[member], e.g.,
+            maindir/molName.tar/molName/1/output.dat.gz, by find_output().
+
+Usage:      python output_io.py compact -d maindir -f gz
+            python output_io.py expand -d maindir
+
+By:         Victoria T. Lim
+
+"""
+
+import io
+import os
+import glob
+import gzip
+import lzma
+import shutil
+import tarfile
+import zipfile
+import collections
+
+# compressed file extensions and the module to open each
+COMPRESSED = collections.OrderedDict([('.gz', gzip), ('.xz', lzma)])
+
+# extensions of per-molecule archives of job_archive.py
+ARCHIVES = ['.tar', '.zip']
+
+# open archives by name, with (mtime, size) of file and member names;
+# a molecule's outputs are read one after another so few are kept open
+_archives = collections.OrderedDict()
+MAX_OPEN_ARCHIVES = 8
+
+# last lines of a Psi4 output file that finished without error
+PSI4_DONE = "Psi4 exiting successfully"
+
+# messages near the end of Psi4 output files that stopped on an error
+PSI4_ERRORS = ["Psi4 encountered an error",
+               "An error has occurred python-side",
+               "Fatal Error"]
+
+### ------------------- Functions -------------------
+
+
+def open_archive(archive):
+    """
+    Get an open tar or zip archive and the set of its member names. Archives
+    are kept open for later calls until replaced by a changed file.
+    """
+    st = os.stat(archive)
+    stamp = (st.st_mtime, st.st_size)
+    if archive in _archives:
+        if _archives[archive][0] == stamp:
+            _archives.move_to_end(archive)
+            return _archives[archive][1:]
+        close_archive(archive)
+    if archive.endswith('.zip'):
+        handle = zipfile.ZipFile(archive)
+        names = set(handle.namelist())
+    else:
+        handle = tarfile.open(archive)
+        names = set(m.name for m in handle.getmembers() if m.isfile())
+    _archives[archive] = (stamp, handle, names)
+    while len(_archives) > MAX_OPEN_ARCHIVES:
+        close_archive(next(iter(_archives)))
+    return handle, names
+
+
+def close_archive(archive=None):
+    """
+    Close one open archive, or all of them if archive is None.
+    """
+    for name in [archive] if archive else list(_archives):
+        if name in _archives:
+            _archives.pop(name)[1].close()
+
+
+def split_member(filename):
+    """
+    Split the name of a file in an archive, as given by find_output, into
+    the archive name and member name. Returns (None, None) otherwise.
+    """
+    for ext in ARCHIVES:
+        idx = filename.find(ext + '/')
+        if idx >= 0:
+            cut = idx + len(ext)
+            return filename[:cut], filename[cut + 1:]
+    return None, None
+
+
+def find_member(filename):
+    """
+    Find a file of maindir/molName/confNumber/ in a molecule archive
+    maindir/molName.tar or .zip. Returns the name [archive]/[member] or None.
+    """
+    confdir = os.path.dirname(os.path.abspath(filename))
+    moldir = os.path.dirname(confdir)
+    for ext in ARCHIVES:
+        archive = moldir + ext
+        if not os.path.isfile(archive):
+            continue
+        member = os.path.relpath(filename, os.path.dirname(moldir))
+        member = member.replace(os.sep, '/')
+        names = open_archive(archive)[1]
+        for cext in [''] + list(COMPRESSED):
+            if member + cext in names:
+                return archive + '/' + member + cext
+    return None
+
+
+def find_output(filename):
+    """
+    Get the name of an output file as stored, whether uncompressed or
+    compressed, on disk or in a molecule archive. Returns None if no version
+    of the file exists.
+    """
+    if os.path.isfile(filename):
+        return filename
+    for ext in COMPRESSED:
+        if os.path.isfile(filename + ext):
+            return filename + ext
+    if split_member(filename)[0] is not None:
+        archive, member = split_member(filename)
+        if not os.path.isfile(archive):
+            return None
+        names = open_archive(archive)[1]
+        for cext in [''] + list(COMPRESSED):
+            if member + cext in names:
+                return filename + cext
+        return None
+    return find_member(filename)
+
+
+def open_output(filename, mode='rt'):
+    """
+    Open an output file for reading, decompressing it if stored compressed.
+
+    Parameters
+    ----------
+    filename : string, name of the file without any compression extension,
+        or the full name of the stored file
+    mode : string, 'rt' for text or 'rb' for bytes
+
+    Returns
+    -------
+    file object
+
+    """
+    stored = find_output(filename)
+    if stored is None:
+        raise FileNotFoundError("No such file: %s" % filename)
+    ext = os.path.splitext(stored)[1]
+    archive, member = split_member(stored)
+    if archive is None:
+        if ext in COMPRESSED:
+            return COMPRESSED[ext].open(stored, mode)
+        return open(stored, mode)
+
+    # read member of archive as a stream
+    handle = open_archive(archive)[0]
+    if isinstance(handle, zipfile.ZipFile):
+        f = handle.open(member)
+    else:
+        f = handle.extractfile(member)
+    if ext in COMPRESSED:
+        return COMPRESSED[ext].open(f, mode)
+    if 'b' in mode:
+        return f
+    return io.TextIOWrapper(f)
+
+
+def read_tail(filename, nbytes=2048):
+    """
+    Get the last nbytes of an output file as text. Uncompressed files are
+    read from the end without reading the rest of the file; compressed files
+    and archive members are read through.
+    """
+    stored = find_output(filename)
+    if stored is None:
+        raise FileNotFoundError("No such file: %s" % filename)
+    if stored == filename and split_member(stored)[0] is None and \
+            os.path.splitext(stored)[1] not in COMPRESSED:
+        with open(stored, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - nbytes))
+            tail = f.read()
+    else:
+        tail = b''
+        with open_output(stored, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                tail = (tail + block)[-nbytes:]
+    return tail.decode('utf-8', 'replace')
+
+
+def is_finished(filename, marker=PSI4_DONE, nbytes=2048):
+    """
+    Check if an output file has the completion marker in its last nbytes.
+    """
+    return marker in read_tail(filename, nbytes)
+
+
+def compress_file(filename, fmt='gz', level=6):
+    """
+    Compress one file in place, keeping its modification time.
+
+    Parameters
+    ----------
+    filename : string, name of the uncompressed file
+    fmt : string, 'gz' or 'xz'
+    level : int, compression level from 0 (fastest) to 9 (smallest)
+
+    Returns
+    -------
+    before : int, bytes of the uncompressed file
+    after : int, bytes of the compressed file
+
+    """
+    ext = '.' + fmt.lstrip('.')
+    if ext not in COMPRESSED:
+        raise ValueError("Unknown compression format: %s" % fmt)
+    outname = filename + ext
+    part = outname + '.part'
+    if ext == '.gz':
+        fout = gzip.open(part, 'wb', compresslevel=level)
+    else:
+        fout = lzma.open(part, 'wb', preset=level)
+    with open(filename, 'rb') as fin, fout:
+        shutil.copyfileobj(fin, fout, 1 << 20)
+    shutil.copystat(filename, part)
+    os.replace(part, outname)
+    before = os.path.getsize(filename)
+    os.remove(filename)
+    return before, os.path.getsize(outname)
+
+
+def decompress_file(filename):
+    """
+    Decompress one compressed file in place, keeping its modification time.
+    Returns the name of the uncompressed file.
+    """
+    outname, ext = os.path.splitext(filename)
+    part = outname + '.part'
+    with COMPRESSED[ext].open(filename, 'rb') as fin, open(part, 'wb') as fout:
+        shutil.copyfileobj(fin, fout, 1 << 20)
+    shutil.copystat(filename, part)
+    os.replace(part, outname)
+    os.remove(filename)
+    return outname
+
+
+def compact(maindir, fmt='gz', psiout='output.dat', timeout='timer.dat',
+            level=6):
+    """
+    Compress the output and timer files of finished calculations of a
+    campaign laid out as maindir/molName/confNumber/psiout.
+
+    Parameters
+    ----------
+    maindir : string, main directory of the calculations
+    fmt : string, 'gz' or 'xz'
+    psiout : string, name of the Psi4 output files
+    timeout : string, name of the Psi4 timer files
+    level : int, compression level from 0 (fastest) to 9 (smallest)
+
+    Returns
+    -------
+    counts : dictionary with number of 'files' compressed, 'skipped'
+        unfinished calculations, and total bytes 'before' and 'after'
+
+    """
+    counts = {'files': 0, 'skipped': 0, 'before': 0, 'after': 0}
+    for outf in sorted(glob.glob(os.path.join(maindir, '*', '*', psiout))):
+        if not is_finished(outf):
+            counts['skipped'] += 1
+            continue
+        timef = os.path.join(os.path.dirname(outf), timeout)
+        for fname in [outf, timef]:
+            if not os.path.isfile(fname):
+                continue
+            before, after = compress_file(fname, fmt, level)
+            counts['files'] += 1
+            counts['before'] += before
+            counts['after'] += after
+    print("Compressed %d files of %s from %.1f MB to %.1f MB; skipped %d "
+          "unfinished calculations" %
+          (counts['files'], maindir, counts['before'] / 1024.**2,
+           counts['after'] / 1024.**2, counts['skipped']))
+    return counts
+
+
+def expand(maindir, psiout='output.dat', timeout='timer.dat'):
+    """
+    Decompress the output and timer files of a campaign, e.g., to rerun or
+    inspect them with other programs. Returns the number of files.
+    """
+    count = 0
+    for name in [psiout, timeout]:
+        for ext in COMPRESSED:
+            for fname in sorted(
+                    glob.glob(os.path.join(maindir, '*', '*', name + ext))):
+                decompress_file(fname)
+                count += 1
+    print("Decompressed %d files of %s" % (count, maindir))
+    return count
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    cp = subparsers.add_parser('compact',
+        help="Compress outputs of finished calculations.")
+    ep = subparsers.add_parser('expand', help="Decompress all outputs.")
+    for sp in [cp, ep]:
+        sp.add_argument("-d", "--maindir", required=True,
+            help="Main directory with molName/confNumber subdirectories.")
+        sp.add_argument("-o", "--psiout", default="output.dat",
+            help="Name of the Psi4 output files. Default is output.dat")
+        sp.add_argument("-t", "--timeout", default="timer.dat",
+            help="Name of the Psi4 timer files. Default is timer.dat")
+    cp.add_argument("-f", "--format", default="gz", choices=['gz', 'xz'],
+        help="Compression format. gz is faster to read, xz is smaller. "
+             "Default is gz.")
+    cp.add_argument("-l", "--level", type=int, default=6,
+        help="Compression level from 0 (fastest) to 9 (smallest). "
+             "Default is 6.")
+
+    args = parser.parse_args()
+    if args.command == 'compact':
+        compact(args.maindir, args.format, args.psiout, args.timeout,
+                args.level)
+    elif args.command == 'expand':
+        expand(args.maindir, args.psiout, args.timeout)
+    else:
+        parser.print_help()
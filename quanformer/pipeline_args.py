@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+pipeline_args.py
+
+Purpose:    Define the command line options of the setup and results stages
+            of the pipeline in one place, for the parsers of executor.py and
+            of the setup and results subcommands of cli.py. This module only
+            imports argparse, so that building a parser stays fast.
+
+Usage:      - import pipeline_args
+            - parser = argparse.ArgumentParser()
+            - pipeline_args.add_pipeline_args(parser)
+
+By:         Victoria T. Lim
+
+"""
+
+### ------------------- Functions -------------------
+
+
+def add_pipeline_args(parser):
+    """
+    Add the options of the setup and results stages to an argparse parser.
+    Choosing between setup and results (e.g., --setup or a subcommand) is
+    left to the caller.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser or subparser
+
+    Returns
+    -------
+    parser with the options added
+
+    """
+    parser.add_argument("-f", "--filename", required=True,
+        help="SDF file (with FULL path) to be set up or processed.")
+    parser.add_argument("-t", "--calctype", default="opt",
+        help="Specify either 'opt' for geometry optimizations, 'spe' for "
+             "single point energy calculations, or 'hess' for Hessian "
+             "calculations. Default is 'opt'.")
+
+    # qm job detail
+    parser.add_argument("-m", "--method",
+        help="Name of QM method. Put this in 'quotes'.")
+    parser.add_argument("-b", "--basisset",
+        help="Name of QM basis set. Put this in 'quotes'.")
+    parser.add_argument("--mem", default="5.0 Gb",
+        help="Memory specification for each Psi4 calculation.")
+
+    # cost estimate from past runtimes
+    parser.add_argument("--history", default=None,
+        help="With --setup, print estimated CPU-hours of the new Psi4 inputs "
+             "per molecule and in total, from this runtime history database "
+             "of cost_model.py.")
+    parser.add_argument("--cores", type=int, default=1,
+        help="Number of cores per Psi4 job for --history estimates.")
+
+    # warm starts of second-stage calculations
+    parser.add_argument("--save-wfn", action="store_true", default=False,
+        help="With --setup, have Psi4 jobs write final orbitals to wfn.npy "
+             "so that a later stage can be warm started.")
+    parser.add_argument("--warm-start", default=None,
+        help="With --setup of a second stage (e.g., from -220.sdf), main "
+             "directory of the first stage run with --save-wfn. Its orbitals "
+             "are read as the SCF guess of each conformer.")
+
+    # clustering mode for MM filtering to cap the number of QM calculations
+    parser.add_argument("--maxconfs", type=int, default=None,
+        help="With --setup from SMILES, cluster MM conformers by RMSD and "
+             "keep at most this many lowest energy cluster representatives "
+             "per molecule for QM.")
+    parser.add_argument("--budget", type=int, default=None,
+        help="With --setup from SMILES, cluster MM conformers by RMSD and "
+             "keep at most this many conformers in total for QM.")
+    parser.add_argument("--cluster-rmsd", type=float, default=0.5,
+        help="RMSD cutoff in Angstrom for clustering with --maxconfs or "
+             "--budget. Default is 0.5")
+
+    # custom suffixes for pipeline outputs
+    parser.add_argument("--suffix", nargs='+',
+        help="For custom naming of results and filtered files throughout "
+             "pipeline. If called with --setup option, include ONE suffix "
+             "for output of filtered conformers. If suffix is called with "
+             "--results option, include TWO suffixes for (1) output of QM "
+             "calculations and (2) the filtered file of (1)."
+             "Examples: --suffix 'filt'; --suffix 'qm' 'qmfilt' ")
+
+    # run on shards from shard_sdf.py
+    parser.add_argument("--shards", default=None,
+        help="JSON manifest from shard_sdf.py. Setup or results is run on "
+             "each shard file that has the same suffix as --filename, then "
+             "results of all shards are merged in original order.")
+    parser.add_argument("--nprocs", type=int, default=None,
+        help="Number of shards to run at once with --shards. Default runs "
+             "all shards at once.")
+
+    # instrumentation
+    parser.add_argument("--instrument", default=None,
+        help="Append wall time, CPU time, peak memory, and item counts of "
+             "each stage to this JSON lines file. Can also be switched on "
+             "with the QUANFORMER_INSTRUMENT environment variable.")
+    parser.add_argument("--profile", default=None,
+        help="Directory in which to write cProfile summaries and collapsed "
+             "stacks of hot sections such as process_psi_out and "
+             "identify_minima. Can also be switched on with the "
+             "QUANFORMER_PROFILE environment variable.")
+
+    # shared store of QM results
+    parser.add_argument("--cache", default=None,
+        help="Directory of a QM result store shared across campaigns. Setup "
+             "skips inputs of calculations in the store, and results reads "
+             "them from and adds new ones to the store. Can also be switched "
+             "on with the QUANFORMER_QM_CACHE environment variable.")
+    parser.add_argument("--cache-max", default=None,
+        help="Size limit of the QM result store, e.g., '500M' or '20G'. "
+             "Least recently used results are evicted above it.")
+
+    # harvest results while calculations run
+    parser.add_argument("--watch", action="store_true", default=False,
+        help="With --results, keep polling the calculations and harvest "
+             "each molecule once all its conformers finish, writing shards "
+             "of results as they are done. Filtering runs at the end.")
+    parser.add_argument("--watch-interval", type=float, default=60.,
+        help="Seconds between polls with --watch. Default is 60.")
+    parser.add_argument("--shard-size", type=int, default=50,
+        help="Number of molecules per results shard with --watch. "
+             "Default is 50.")
+    parser.add_argument("--flush", type=float, default=600.,
+        help="Seconds after which a partly full results shard is written "
+             "with --watch. Default is 600.")
+    parser.add_argument("--stale", type=float, default=None,
+        help="With --watch, seconds after which an unchanged output without "
+             "completion message, or an input without output, counts as "
+             "failed. Without it, a job killed without a Psi4 completion or "
+             "error message (e.g., by the queue) keeps its molecule "
+             "unfinished and the watch never ends.")
+
+    # compressed storage of finished outputs
+    parser.add_argument("--compact", default=None, choices=['gz', 'xz'],
+        help="With --results, compress output and timer files of finished "
+             "Psi4 calculations after harvesting them. Compressed outputs "
+             "are read transparently by later runs of --results.")
+    parser.add_argument("--archive", default=None, choices=['tar', 'zip'],
+        help="With --results, pack the job directories of each molecule "
+             "whose calculations all finished into one archive, after "
+             "--compact if given. Later runs of --results read the archives "
+             "directly; use job_archive.py unpack to rerun jobs.")
+
+    return parser
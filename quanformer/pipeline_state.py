@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+pipeline_state.py
+
+Purpose:    Make pipeline stages resumable. Output files of a stage are only
+            put in place when the stage finishes, so an existing output file
+            always means a complete stage. While the stage runs:
+            - results are appended one molecule at a time to [output].part
+            - each finished molecule is logged in [output].ckpt with the size
+              of the .part file after it, plus any data of that molecule that
+              does not go into the output file (e.g., Hessians)
+            - pipeline_state.json in the working directory records the status
+              of each output file ('running' or 'done') and its source file
+            If a run is interrupted, the next run of the same stage on the same
+            source file truncates [output].part after the last logged molecule,
+            skips the logged molecules, and continues with the next one. If the
+            source file changed since the checkpoint started, the stage starts
+            over.
+
+Usage:      - import pipeline_state
+            - ckpt = pipeline_state.Checkpoint('set1-210.sdf', 'get_psi_results',
+                                               'set1-200.sdf')
+            - if ckpt.complete(): skip the stage
+            - done = ckpt.start()
+            - for each molecule not in done: ckpt.add(title, sdf_bytes)
+            - ckpt.finish()
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+
+STATE_FILE = 'pipeline_state.json'
+
+### ------------------- Functions -------------------
+
+
+def sha256sum(fname):
+    """
+    Get the sha256 hex digest of a file, reading in blocks.
+    """
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def atomic_write(fname, data, mode='wb'):
+    """
+    Write data to fname.part then rename it to fname, so that fname is
+    either absent or complete.
+    """
+    part = fname + '.part'
+    with open(part, mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(part, fname)
+
+
+def load_state(wdir=None):
+    """
+    Read the state manifest of a working directory, or an empty one if
+    there is none yet.
+    """
+    fname = os.path.join(wdir or os.getcwd(), STATE_FILE)
+    if not os.path.exists(fname):
+        return {'outputs': {}}
+    with open(fname) as f:
+        return json.load(f)
+
+
+def update_state(output, **info):
+    """
+    Update the manifest record of one output file in the directory of that
+    output file. The manifest itself is replaced atomically.
+    """
+    wdir = os.path.dirname(os.path.abspath(output))
+    state = load_state(wdir)
+    record = state['outputs'].setdefault(os.path.basename(output), {})
+    record.update(info)
+    atomic_write(os.path.join(wdir, STATE_FILE),
+                 json.dumps(state, indent=2).encode(), 'wb')
+
+
+def read_log(logfile):
+    """
+    Read a checkpoint log. A record cut off by an interruption ends the log.
+
+    Returns
+    -------
+    header : dictionary of source file information, or None if no log
+    records : list of (title, offset, extra) tuples in order written
+
+    """
+    if not os.path.exists(logfile):
+        return None, []
+    header = None
+    records = []
+    with open(logfile, 'rb') as f:
+        while True:
+            try:
+                item = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError, ValueError,
+                    AttributeError, ImportError, IndexError):
+                break
+            if header is None:
+                header = item
+            else:
+                records.append(item)
+    return header, records
+
+
+class Checkpoint(object):
+    """
+    Per-molecule checkpoint of one output file of a pipeline stage.
+    """
+
+    def __init__(self, output, stage, source):
+        """
+        Parameters
+        ----------
+        output : string, name of the output file of the stage
+        stage : string, name of the stage, e.g., 'filter_confs'
+        source : string, name of the input file of the stage. A checkpoint
+            is only resumed if this file is unchanged.
+        """
+        self.output = os.path.abspath(output)
+        self.part = self.output + '.part'
+        self.log = self.output + '.ckpt'
+        self.stage = stage
+        self.source = os.path.abspath(source)
+        self.count = 0
+        self.f = None
+        self.logf = None
+
+    def complete(self):
+        """
+        Check if the output file is complete. Output files are only created
+        by finish(), or by older versions of the pipeline which wrote them
+        in place, so any existing output file counts as complete.
+        """
+        return os.path.exists(self.output)
+
+    def start(self):
+        """
+        Start or resume the stage.
+
+        Returns
+        -------
+        done : dictionary of done[title] = extra data of each molecule
+            completed by an earlier run. Empty if starting over.
+
+        """
+        header, records = read_log(self.log)
+        source_sum = sha256sum(self.source)
+        if header is not None and header.get('sha256') != source_sum:
+            print("Source file %s changed since last checkpoint of %s. "
+                  "Starting over." % (self.source, self.output))
+            header, records = None, []
+        if not os.path.exists(self.part) or (
+                records and os.path.getsize(self.part) < records[-1][1]):
+            records = []
+
+        done = {}
+        offset = 0
+        if records:
+            offset = records[-1][1]
+            done = dict((title, extra) for title, off, extra in records)
+            print("Resuming %s after %d completed molecule(s)." %
+                  (os.path.basename(self.output), len(done)))
+
+        # drop any partly written molecule after the last checkpoint
+        self.f = open(self.part, 'ab')
+        self.f.truncate(offset)
+        self.f.seek(offset)
+
+        # rewrite log without any cut off record at its end
+        self.logf = open(self.log, 'wb')
+        pickle.dump({'stage': self.stage, 'source': self.source,
+                     'sha256': source_sum}, self.logf)
+        for rec in records:
+            pickle.dump(rec, self.logf)
+        self.logf.flush()
+
+        update_state(self.output, stage=self.stage, source=self.source,
+                     status='running', started=time.strftime('%c'),
+                     resumed=len(done))
+        return done
+
+    def add(self, title, data=b'', extra=None):
+        """
+        Append one completed molecule to the output, and log it.
+
+        Parameters
+        ----------
+        title : string, molecule title
+        data : bytes of the molecule's output, e.g., SDF records
+        extra : any picklable data of this molecule to return from start()
+            if the stage is resumed
+
+        """
+        self.f.write(data)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        pickle.dump((title, self.f.tell(), extra), self.logf)
+        self.logf.flush()
+        self.count += 1
+
+    def finish(self):
+        """
+        Move the complete output into place and mark the stage done.
+        """
+        self.f.close()
+        self.logf.close()
+        os.replace(self.part, self.output)
+        os.remove(self.log)
+        update_state(self.output, status='done', finished=time.strftime('%c'),
+                     sha256=sha256sum(self.output))
+
+    def close(self):
+        """
+        Close files without finishing, e.g., on an early exit. The checkpoint
+        is kept for the next run.
+        """
+        for f in [self.f, self.logf]:
+            if f is not None and not f.closed:
+                f.close()
@@ -1,13 +1,10 @@
 #!/usr/bin/env python
 
 import os
-import openeye.oechem as oechem
+import sys
 import numpy as np
-import proc_tags as pt
+import time_stats
 import collections
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-from scipy import stats # for mode
 
 ### ------------------- Functions -------------------
 
@@ -18,79 +15,59 @@ def timeAvg(titles, sdfRef, method, basis, tag):
     """
 
     For an SDF file with all confs of all mols, get the average runtime
-       of all conformers for each molecule
+       (or number of optimization steps) of all conformers for each molecule.
+       The file is read once, and statistics are accumulated in a single pass
+       with time_stats.RunningStats.
 
     Parameters
     ----------
     titles: dictionary (empty or not). keys = molTitles.
         values = [[qm1_avg, qm1_std], [qm2_avg, qm2_std] ... ]
     sdfRef | str  | path+name of SDF file with times for all confs of all mols
+    method | str  | QM method of the SD tags
+    basis  | str  | QM basis set of the SD tags
+    tag    | str  | one of 'opt runtime', 'spe runtime', 'opt step'
 
-    TODO
+    Returns
+    -------
+    titles: dictionary updated with values from this file
 
     """
-
-    # Open reference file.
-    print("Opening SDF file %s" % sdfRef)
-    ifsRef = oechem.oemolistream()
-    ifsRef.SetConfTest( oechem.OEAbsoluteConfTest() )
-    if not ifsRef.open(sdfRef):
-        oechem.OEThrow.Fatal("Unable to open %s for reading" % sdfRef)
-    molsRef = ifsRef.GetOEMols()
+    calctype = tag.split()[0]
+    key = 'steps' if 'step' in tag else 'runtime'
+    molstats, _ = time_stats.sdf_time_stats(sdfRef, method, basis, 'Psi4',
+                                            calctype)
 
     timeF = open("timeAvgs.txt", 'a')
     timeF.write("\nFile: {}\n".format(sdfRef))
     timeF.write("Average [{}/{}] [{}s] over all confs for each molecule\n".format(method, basis, tag))
 
-    # Grab all the times.
-#    titles = {}
-#    timelist = []
-#    stdlist = []
-    for rmol in molsRef:
-        tmol = np.fromiter(pt.get_sd_list(rmol, tag, 'Psi4',method, basis), dtype=np.float64)
-
-        # exclude conformers for which job did not finish (nan)
-        nanIndices = np.argwhere(np.isnan(tmol))
-        for i in reversed(nanIndices): # loop in reverse to delete correctly
-            tmol = np.delete(tmol, i)
-        meantime = np.mean(tmol)
-        stdtime = np.std(tmol)
-        timeF.write("%s\t%d confs\t\t%.3f +- %.3f\n" % (rmol.GetTitle(), tmol.size, meantime, stdtime ))
-
-        name = rmol.GetTitle()
+    for name, mstats in molstats.items():
+        rstats = mstats[key]
+        meantime = rstats.mean
+        stdtime = rstats.sd
+        timeF.write("%s\t%d confs\t\t%.3f +- %.3f\n" % (name, rstats.n, meantime, stdtime ))
+
         if name not in titles: titles[name] = []
         titles[name].append([meantime, stdtime])
-#        titles.append(rmol.GetTitle())
-#        timelist.append(meantime)
-#        stdlist.append(stdtime)
     timeF.close()
-#    return titles, timelist, stdlist
     return titles
 
 
 
-### ----------------------------------------------
-
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument("-i", "--input",
-        help="Required argument on name of text file with information on\
-              file(s) and levels of theory to process.\
-              See README file or examples for more details. TODO")
-
-    args = parser.parse_args()
-    opt = vars(args)
-
-    if not os.path.exists(opt['input']):
-        raise parser.error("Input file %s does not exist." % opt['filename'])
+def main(infile):
+    """
+    Average the runtimes of the files of the input file for each molecule,
+    and plot them as bars.
+    """
+    if not os.path.exists(infile):
+        sys.exit("Input file %s does not exist." % infile)
 
     # Read input file and store each file's information in an ordered dictionary.
     # http://stackoverflow.com/questions/25924244/creating-2d-dictionary-in-python
     linecount = 0
     wholedict = collections.OrderedDict()
-    with open(opt['input']) as f:
+    with open(infile) as f:
         for line in f:
             if line.startswith('#'):
                 continue
@@ -122,7 +99,7 @@ if __name__ == "__main__":
 
     # delete mols with missing data. asarray must have uniform length sublists.
     lens = [len(x) for x in timeplot]
-    m = stats.mode(lens)[0][0] # ModeResult(mode=array([2]), count=array([40]))
+    m = collections.Counter(lens).most_common(1)[0][0] # most common length
     tracker = [] # indices of which sublists to remove
     for i, t in enumerate(timeplot):
         if len(t) != m:
@@ -134,6 +111,10 @@ if __name__ == "__main__":
     stdplot = np.asarray(stdplot).T
 
     ### PLOTTING
+    # plotting modules are slow to import so wait until needed
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
+
     # horizonal range
 #    x = np.arange(len(timeplot[0]))
     x = np.arange(len(titles)-len(tracker))
@@ -160,3 +141,18 @@ if __name__ == "__main__":
 #    plt.bar(x, timeplot[0], color=colors,align='center',ecolor='k')
     plt.savefig('rename_me.png',bbox_inches='tight')
     plt.show()
+
+
+### ----------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-i", "--input",
+        help="Required argument on name of text file with information on\
+              file(s) and levels of theory to process.\
+              See README file or examples for more details. TODO")
+
+    args = parser.parse_args()
+    main(args.input)
@@ -15,7 +15,13 @@ By: Victoria T. Lim
 import openeye.oechem as oechem
 import sys
 
+try:
+    import quanformer.profiling as profiling
+except ModuleNotFoundError:
+    import profiling
 
+
+@profiling.profiled('get_sd_list')
 def get_sd_list(mol, datum, Package='Psi4', Method=None, Basisset=None):
     """
     Get list of specified SD tag for all confs in mol.
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+profiling.py
+
+Purpose:    Opt-in cProfile of the hot sections of the pipeline, e.g.,
+            process_psi_out, identify_minima, compare_two_mols, get_sd_list.
+            Profiling is off unless switched on with enable() (e.g., by
+            executor.py --profile profdir) or by setting the QUANFORMER_PROFILE
+            environment variable to an output directory. When off, each
+            profiled call costs one environment lookup.
+
+            All calls of one section in a process are added into one profile.
+            A section called from within another profiled section is counted
+            as part of the outer one. For each section and process, these
+            files are written to the output directory:
+            - [section].[pid].prof       pstats file, e.g., for snakeviz
+            - [section].[pid].txt        summary sorted by cumulative and own time
+            - [section].[pid].collapsed  collapsed stacks for flamegraph.pl or
+                                         speedscope, in microseconds. Stacks
+                                         are rebuilt from the caller/callee
+                                         times of cProfile so they are
+                                         approximate for shared callees.
+
+Usage:      - import profiling
+            - profiling.enable('profdir')
+            - decorate a function with @profiling.profiled('process_psi_out')
+            - profiling.write_reports() at the end, else files are written
+              when the process exits
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import io
+import atexit
+import pstats
+import cProfile
+import functools
+
+ENV_VAR = 'QUANFORMER_PROFILE'
+
+# accumulated profiles of this process, by section name
+_profiles = {}
+
+# name of the profiled section currently running in this process
+_running = []
+
+### ------------------- Functions -------------------
+
+
+def enable(outdir):
+    """
+    Switch on profiling and write reports into the given directory.
+    The setting is passed on to child processes through the environment.
+    """
+    outdir = os.path.abspath(outdir)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    os.environ[ENV_VAR] = outdir
+
+
+def disable():
+    os.environ.pop(ENV_VAR, None)
+
+
+def profile_dir():
+    """
+    Get the output directory of profiles, or None if profiling is off.
+    """
+    return os.environ.get(ENV_VAR) or None
+
+
+def profiled(name):
+    """
+    Decorator to add each call of a function to the profile of the named
+    section.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _running or profile_dir() is None:
+                return func(*args, **kwargs)
+            prof = _profiles.setdefault(name, cProfile.Profile())
+            _running.append(name)
+            prof.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                prof.disable()
+                _running.pop()
+        return wrapper
+
+    return decorator
+
+
+def frame_name(func):
+    """
+    Get a readable frame name from a pstats function key of
+    (file, line number, function name).
+    """
+    fname, line, funcname = func
+    if fname == '~':
+        name = funcname
+    else:
+        name = "%s (%s:%d)" % (funcname, os.path.basename(fname), line)
+    # semicolons separate frames in collapsed stacks
+    return name.replace(';', ':')
+
+
+def collapsed_stacks(stats, min_usec=1):
+    """
+    Rebuild call stacks from pstats caller/callee data.
+
+    Each function's cumulative time is split among its callees by the time
+    spent in each call edge, and its own time is assigned to the current
+    stack. Recursive calls are cut at the first repeat.
+
+    Parameters
+    ----------
+    stats : pstats.Stats object
+    min_usec : int, stacks with less time than this are left out
+
+    Returns
+    -------
+    stacks : dictionary of stacks['a;b;c'] = microseconds of own time in c
+
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+    roots = [f for f, v in raw.items()
+             if not v[4] and not f[2].startswith("<method 'disable'")]
+
+    stacks = {}
+
+    def expand(func, path, frac):
+        cc, nc, tt, ct, callers = raw[func]
+        path = path + [func]
+        usec = int(round(tt * frac * 1e6))
+        if usec >= min_usec:
+            key = ';'.join(frame_name(f) for f in path)
+            stacks[key] = stacks.get(key, 0) + usec
+        for callee, edge_ct in callees.get(func, {}).items():
+            if callee in path or callee not in raw:
+                continue
+            total = raw[callee][3]
+            if total <= 0 or edge_ct * frac * 1e6 < min_usec:
+                continue
+            expand(callee, path, min(1., edge_ct * frac / total))
+
+    for root in roots:
+        expand(root, [], 1.)
+    return stacks
+
+
+def summary(stats, name, nlines=40):
+    """
+    Get a text summary of a profile sorted by cumulative time and by
+    own time of each function.
+    """
+    out = io.StringIO()
+    out.write("Profile of %s (pid %d): %d calls in %.3f s\n" %
+              (name, os.getpid(), stats.total_calls, stats.total_tt))
+    for key, title in [('cumulative', 'cumulative time'),
+                       ('tottime', 'own time')]:
+        out.write("\n===== Sorted by %s =====\n" % title)
+        stats.stream = out
+        stats.sort_stats(key).print_stats(nlines)
+    return out.getvalue()
+
+
+def write_reports(outdir=None):
+    """
+    Write the profiles of this process so far. Files of the same section
+    and process are overwritten with the updated profile.
+
+    Returns
+    -------
+    files : list of the names of files written
+
+    """
+    outdir = outdir or profile_dir()
+    if outdir is None or not _profiles:
+        return []
+    files = []
+    for name, prof in _profiles.items():
+        base = os.path.join(outdir, "%s.%d" % (name, os.getpid()))
+        stats = pstats.Stats(prof, stream=io.StringIO())
+        stats.dump_stats(base + '.prof')
+        with open(base + '.txt', 'w') as f:
+            f.write(summary(stats, name))
+        with open(base + '.collapsed', 'w') as f:
+            for stack, usec in sorted(collapsed_stacks(stats).items()):
+                f.write("%s %d\n" % (stack, usec))
+        files.extend([base + ext for ext in ['.prof', '.txt', '.collapsed']])
+    return files
+
+
+def reset():
+    """
+    Discard the profiles collected so far in this process.
+    """
+    _profiles.clear()
+
+
+atexit.register(write_reports)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+qm_cache.py
+
+Purpose:    Content-addressed store of finished Psi4 calculations that can be
+            shared across campaigns, so that a calculation on the same input
+            is not run twice. The key of a calculation is the sha256 of its
+            Psi4 input text from confs_to_psi.make_psi_input with:
+            - the memory line and molecule label removed
+            - coordinates rounded to a tolerance (default 0.001 Angstrom)
+            so that the key covers the geometry (in the given atom order and
+            frame), net charge and multiplicity, method, basis set, calctype,
+            and all options of the input.
+
+            Results are stored as copies of output.dat and timer.dat under
+            [store]/objects/[key[:2]]/[key]/, with an SQLite index of size,
+            last use, and hits. When the store grows over its size limit, the
+            least recently used results are evicted. Hits and misses are
+            counted for each process and in total for the store. Results
+            may be stored compressed (see output_io.py), either as added from
+            compacted campaigns or by compacting the store.
+
+            The store is used when the QUANFORMER_QM_CACHE environment
+            variable names its directory (e.g., set by executor.py --cache):
+            - confs_to_psi writes cache.key instead of input.dat for hits
+            - get_psi_results reads results of cache.key directories from the
+              store, and adds new finished results to the store
+
+Usage:      python qm_cache.py stats -c /path/to/store
+            python qm_cache.py evict -c /path/to/store --max-size 20G
+            python qm_cache.py compact -c /path/to/store -f xz
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import re
+import time
+import shutil
+import sqlite3
+import hashlib
+
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+
+ENV_VAR = 'QUANFORMER_QM_CACHE'
+KEY_FILE = 'cache.key'
+DEFAULT_MAX_BYTES = 10 * 1024**3
+
+# coordinate line of a Psi4 input: element symbol then x y z
+COORD_LINE = re.compile(r'^\s*([A-Za-z]{1,3})\s+(\S+)\s+(\S+)\s+(\S+)\s*$')
+
+### ------------------- Functions -------------------
+
+
+def parse_size(size):
+    """
+    Convert a size such as '500M' or '20G' or 1000 to number of bytes.
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = size.strip().upper().rstrip('B')
+    scale = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    if size and size[-1] in scale:
+        return int(float(size[:-1]) * scale[size[-1]])
+    return int(float(size))
+
+
+def canonical_input(inputstring, tol=1e-3):
+    """
+    Canonicalize the text of a Psi4 input file for hashing.
+
+    Parameters
+    ----------
+    inputstring : string, contents of Psi4 input file
+    tol : float, coordinates are rounded to this tolerance in Angstrom
+
+    Returns
+    -------
+    string of canonical input
+
+    """
+    lines = []
+    in_mol = False
+    for line in inputstring.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('memory '):
+            continue
+        if stripped.startswith('molecule ') and stripped.endswith('{'):
+            in_mol = True
+            lines.append('molecule {')
+            continue
+        if in_mol:
+            if stripped == '}':
+                in_mol = False
+            match = COORD_LINE.match(line)
+            if match:
+                try:
+                    xyz = [int(round(float(x) / tol)) for x in match.groups()[1:]]
+                except ValueError:
+                    pass
+                else:
+                    lines.append("%s %d %d %d" % (match.group(1), xyz[0],
+                                                  xyz[1], xyz[2]))
+                    continue
+        if stripped:
+            lines.append(' '.join(stripped.split()))
+    return "tol %g\n" % tol + '\n'.join(lines)
+
+
+def input_key(inputstring, tol=1e-3):
+    """
+    Get the cache key of the text of a Psi4 input file.
+    """
+    text = canonical_input(inputstring, tol)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+class QMCache(object):
+    """
+    Content-addressed store of Psi4 results in one directory.
+    """
+
+    def __init__(self, root, max_bytes=None, tol=1e-3):
+        """
+        Parameters
+        ----------
+        root : string, directory of the store, created if needed
+        max_bytes : int or string like '20G', size limit of the store. If None,
+            the limit saved in the store is used, else DEFAULT_MAX_BYTES.
+        tol : float, tolerance in Angstrom to round coordinates for keys
+
+        """
+        self.root = os.path.abspath(root)
+        self.tol = tol
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        self.evicted = 0
+        # hits and misses not yet added to the totals of the store
+        self._unsaved = {'hits': 0, 'misses': 0}
+        if not os.path.isdir(os.path.join(self.root, 'objects')):
+            os.makedirs(os.path.join(self.root, 'objects'))
+        self.db = sqlite3.connect(os.path.join(self.root, 'index.sqlite'),
+                                  timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY "
+                        "KEY, size INTEGER, created REAL, used REAL, hits "
+                        "INTEGER, label TEXT) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY "
+                        "KEY, value REAL) WITHOUT ROWID")
+        for name in ['hits', 'misses', 'evicted']:
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES (?, 0)", (name, ))
+        if max_bytes is not None:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('max_bytes', ?)",
+                            (parse_size(max_bytes), ))
+        self.db.commit()
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE name = 'max_bytes'").fetchone()
+        self.max_bytes = int(row[0]) if row else DEFAULT_MAX_BYTES
+
+    def key(self, inputstring):
+        return input_key(inputstring, self.tol)
+
+    def path(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def _count(self, name, n=1):
+        self.db.execute("UPDATE meta SET value = value + ? WHERE name = ?",
+                        (n, name))
+
+    def _save_counts(self):
+        """
+        Add hits and misses not yet saved to the totals of the store. The
+        caller commits.
+        """
+        for name, n in self._unsaved.items():
+            if n:
+                self._count(name, n)
+        self._unsaved = {'hits': 0, 'misses': 0}
+
+    def has(self, key):
+        """
+        Check if the store has a result for the key, and count a hit or miss.
+        Counts are saved to the store with the next write or on close, so
+        lookups do not write to the database.
+        """
+        found = self.db.execute("SELECT 1 FROM results WHERE key = ?",
+                                (key, )).fetchone() is not None
+        found = found and os.path.isdir(self.path(key))
+        name = 'hits' if found else 'misses'
+        setattr(self, name, getattr(self, name) + 1)
+        self._unsaved[name] += 1
+        return found
+
+    def get(self, key):
+        """
+        Get the stored output files of a key and mark them as recently used.
+
+        Returns
+        -------
+        psiout : string, full path of stored Psi4 output file
+        timeout : string, full path of stored Psi4 timer file
+        Both are None if the key is not in the store. Files may be stored
+        compressed, so read them with output_io.open_output.
+
+        """
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return None, None
+        self.db.execute("UPDATE results SET used = ?, hits = hits + 1 WHERE "
+                        "key = ?", (time.time(), key))
+        self._save_counts()
+        self.db.commit()
+        return os.path.join(path, 'output.dat'), os.path.join(path, 'timer.dat')
+
+    def put(self, key, psiout, timeout, label=''):
+        """
+        Add copies of the output files of one finished calculation.
+
+        Parameters
+        ----------
+        key : string, key of the calculation's input
+        psiout : string, name of the Psi4 output file, which may be
+            compressed or in a molecule archive
+        timeout : string, name of the Psi4 timer file; skipped if missing
+        label : string, e.g., molecule and conformer, for reference only
+
+        """
+        path = self.path(key)
+        if os.path.isdir(path):
+            return
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.tmp%d" % (path, os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+        for src, name in [(psiout, 'output.dat'), (timeout, 'timer.dat')]:
+            if output_io.find_output(src) is None:
+                continue
+            ext = os.path.splitext(src)[1]
+            if ext not in output_io.COMPRESSED:
+                ext = ''
+            # files may be members of a molecule archive
+            with output_io.open_output(src, 'rb') as fin, \
+                    open(os.path.join(tmp, name + ext), 'wb') as fout:
+                shutil.copyfileobj(fin, fout)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # same result added by another process in the meantime
+            shutil.rmtree(tmp)
+            return
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, 0, ?)",
+                        (key, dir_size(path), now, now, label))
+        self._save_counts()
+        self.db.commit()
+        self.added += 1
+        self.evict()
+
+    def total_bytes(self):
+        return self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        Remove least recently used results until the store is within its
+        size limit.
+
+        Returns
+        -------
+        int number of results removed
+
+        """
+        max_bytes = self.max_bytes if max_bytes is None else parse_size(max_bytes)
+        total = self.total_bytes()
+        if total <= max_bytes:
+            return 0
+        removed = 0
+        for key, size in self.db.execute(
+                "SELECT key, size FROM results ORDER BY used").fetchall():
+            if total <= max_bytes:
+                break
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            self.db.execute("DELETE FROM results WHERE key = ?", (key, ))
+            total -= size
+            removed += 1
+        self._count('evicted', removed)
+        self.db.commit()
+        self.evicted += removed
+        return removed
+
+    def compact(self, fmt='gz', level=6):
+        """
+        Compress uncompressed results in the store and update their sizes.
+
+        Returns
+        -------
+        int number of results compressed
+
+        """
+        count = 0
+        for key, in self.db.execute("SELECT key FROM results").fetchall():
+            path = self.path(key)
+            found = False
+            for name in ['output.dat', 'timer.dat']:
+                if os.path.isfile(os.path.join(path, name)):
+                    output_io.compress_file(os.path.join(path, name), fmt,
+                                            level)
+                    found = True
+            if found:
+                self.db.execute("UPDATE results SET size = ? WHERE key = ?",
+                                (dir_size(path), key))
+                count += 1
+        self.db.commit()
+        return count
+
+    def stats(self):
+        """
+        Get counts of this process and totals of the store.
+        """
+        meta = dict(self.db.execute("SELECT name, value FROM meta").fetchall())
+        nresults = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'added': self.added,
+            'evicted': self.evicted,
+            'total_hits': int(meta['hits']) + self._unsaved['hits'],
+            'total_misses': int(meta['misses']) + self._unsaved['misses'],
+            'total_evicted': int(meta['evicted']),
+            'results': nresults,
+            'bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes
+        }
+
+    def report(self):
+        """
+        Get a one line summary of hits and misses of this process.
+        """
+        s = self.stats()
+        looked = s['hits'] + s['misses']
+        rate = 100. * s['hits'] / looked if looked else 0.
+        return ("QM cache %s: %d hits, %d misses (%.1f%% hit rate), %d added, "
+                "%d evicted; store has %d results in %.1f of %.1f MB" %
+                (self.root, s['hits'], s['misses'], rate, s['added'],
+                 s['evicted'], s['results'], s['bytes'] / 1024.**2,
+                 s['max_bytes'] / 1024.**2))
+
+    def close(self):
+        self._save_counts()
+        self.db.commit()
+        self.db.close()
+
+
+def enable(root):
+    """
+    Switch on the cache for pipeline stages of this and child processes.
+    """
+    os.environ[ENV_VAR] = os.path.abspath(root)
+
+
+def from_env():
+    """
+    Get the cache named by the environment variable, or None if not set.
+    """
+    root = os.environ.get(ENV_VAR)
+    if not root:
+        return None
+    return QMCache(root)
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    sp = subparsers.add_parser('stats', help="Print hit/miss totals and size.")
+    sp.add_argument("-c", "--cache", required=True,
+        help="Directory of the QM result store.")
+
+    ep = subparsers.add_parser('evict', help="Evict down to a size limit.")
+    ep.add_argument("-c", "--cache", required=True,
+        help="Directory of the QM result store.")
+    ep.add_argument("--max-size", default=None,
+        help="New size limit of the store, e.g., 500M or 20G. Default keeps "
+             "the saved limit.")
+
+    cp = subparsers.add_parser('compact', help="Compress stored results.")
+    cp.add_argument("-c", "--cache", required=True,
+        help="Directory of the QM result store.")
+    cp.add_argument("-f", "--format", default="gz", choices=['gz', 'xz'],
+        help="Compression format. Default is gz.")
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+    else:
+        store = QMCache(args.cache, getattr(args, 'max_size', None))
+        if args.command == 'evict':
+            print("Evicted %d results" % store.evict())
+        elif args.command == 'compact':
+            print("Compressed %d results" % store.compact(args.format))
+        for k, v in store.stats().items():
+            print("%-14s %s" % (k, v))
+        store.close()
@@ -18,6 +18,8 @@ Usage:      [1] Obtain modified Seminario Python code (see reference below)
                       def modified_Seminario_method(bond_list, angle_list, coords, N, hessian, atom_names, inputfilefolder, outputfilefolder, vibrational_scaling):
             [3] Comment out the two lines at the bottom: import sys, modified_Seminario_method(...)
             [4] python quan2modsem.py -i file.sdf -h file.hess.pickle
+            Alternatively, skip steps 1-3 and use the built-in implementation:
+                python quan2modsem.py -i file.sdf -p file.hess.pickle --builtin
 
 By:         Victoria T. Lim
 
@@ -43,21 +45,16 @@ import itertools
 import pickle
 import openeye.oechem as oechem
 
-sys.path.insert(
-    0,
-    '/beegfs/DATA/mobley/limvt/openforcefield/hessian/modsem/Python_Modified_Seminario_Method'
-)
-import modified_Seminario_method_vtl2
+# local testing vs. travis testing
+try:
+    from quanformer.modsem import hbb_to_kaa
+    import quanformer.modsem as modsem
+except ModuleNotFoundError:
+    from modsem import hbb_to_kaa
+    import modsem
 
-
-def hbb_to_kaa(hessian):
-    """
-    Unit conversions on input Hessian matrix from (Hartrees/Bohr/Bohr)
-    (kcal/mol/Angstrom/Angstrom).
-
-    """
-    hessian = (hessian * 627.509474) / (0.529177**2)
-    return hessian
+# location of the patched modified Seminario code (see Usage above)
+MODSEM_PATH = '/beegfs/DATA/mobley/limvt/openforcefield/hessian/modsem/Python_Modified_Seminario_Method'
 
 
 def prep_hess(mol, hessian):
@@ -100,6 +97,10 @@ def prep_hess(mol, hessian):
 
 def quan2modsem(infile, pfile):
 
+    # only needed for the external code path
+    sys.path.insert(0, MODSEM_PATH)
+    import modified_Seminario_method_vtl2
+
     hdir, fname = os.path.split(infile)
     wdir = os.getcwd()
 
@@ -152,7 +153,17 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--pfile", required=True,
         help="Associated pickle file with dictionary of extracted Hessian matrices")
 
+    parser.add_argument("--builtin", action="store_true", default=False,
+        help="Use the built-in vectorized modified Seminario code (modsem.py) "
+             "instead of the external patched script. All results are "
+             "written to a single table.")
+    parser.add_argument("-o", "--outfile", default="modsem.dat",
+        help="Output table for the --builtin option")
+
     args = parser.parse_args()
     opt = vars(args)
 
-    quan2modsem(args.infile, args.pfile)
+    if args.builtin:
+        modsem.modsem(args.infile, args.pfile, args.outfile)
+    else:
+        quan2modsem(args.infile, args.pfile)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+render_plots.py
+
+Purpose:    Batch rendering of per-molecule plots of match_minima.py and
+            match_plot.py. Plots are drawn with matplotlib's object-oriented
+            Agg interface instead of the global pyplot state, each worker
+            process reuses one figure per plot type, and molecules are
+            rendered in parallel over a process pool.
+
+Usage:      - import render_plots
+            - jobs = [render_plots.job('minima', molName, minimaE=..., xticklabels=...), ...]
+            - render_plots.render_batch(jobs, nprocs=8, fmt='png', dpi=100)
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import itertools
+import multiprocessing
+import numpy as np
+import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+MARKERS = ["x", "^", "8", "d", "o", "s", "*", "p", "v", "<", "D", "+", ">", "."
+           ] * 10
+
+### ------------------- Functions -------------------
+
+
+def draw_mol_minima(fig, molName, minimaE, xticklabels, selected=None,
+                    stag=False):
+    """
+    Draw line plot of relative energies of conformer minima of one molecule.
+    Same plot as match_minima.plot_mol_minima.
+
+    Parameters
+    ----------
+    fig : matplotlib Figure, cleared and of size (20, 10)
+    molName : string, name of molecule
+    minimaE : 2D list of relative energies, [file][conformer]
+    xticklabels : list of levels of theory for the legend
+    selected : list of 0-based indexes of files to plot. None to plot all.
+    stag : Boolean, True to stagger each file's line for ease of viewing
+
+    Returns
+    -------
+    figname : string, base name (no extension) of the figure
+
+    """
+    refNumConfs = len(minimaE[0])
+    refFile = xticklabels[0]
+    numFiles = len(minimaE)
+
+    ### Flatten this 2D list into a 1D to find min and max for plot
+    flatten = [item for sublist in minimaE for item in sublist]
+    floor = min(flatten)
+    ceiling = max(flatten)
+    if (ceiling - floor) > 4.0:
+        ystep = (ceiling - floor) / 9  # have 10 increments of y-axis
+        ystep = round(ystep * 2) / 2  # round the step to nearest 0.5
+    else:
+        ystep = (ceiling - floor)
+
+    ### Stagger each of the component files of minimaE for ease of viewing.
+    if stag:
+        minimaE = [[x + i / 2. for x in fileE]
+                   for i, fileE in enumerate(minimaE)]
+        ceiling = ceiling + numFiles
+
+    plttitle = "Relative Energies of %s Minima" % (molName)
+    plttitle += "\nby Reference File %s" % (refFile)
+
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'  # label x-axis by letter
+    rpt = int((refNumConfs / 26) + 1)
+    xlabs = [''.join(i)
+             for i in itertools.product(letters, repeat=rpt)][:refNumConfs]
+
+    ax = fig.add_subplot(111)
+    ax.set_title(plttitle, fontsize=16)
+    ax.set_ylabel("Relative energy (kcal/mol)", fontsize=20)
+    ax.set_xlabel("conformer minimum", fontsize=20)
+    ax.set_xticks(list(range(refNumConfs)))
+    ax.set_xticklabels(xlabs, fontsize=18)
+    ax.tick_params(axis='y', labelsize=18)
+
+    colors = mpl.cm.rainbow(np.linspace(0, 1, numFiles))
+    xi = list(range(refNumConfs))
+    for i, fileE in enumerate(minimaE):
+        if selected is not None and i not in selected:
+            continue
+        ax.plot(xi, fileE, color=colors[i], label=xticklabels[i],
+                marker=MARKERS[i], markersize=9)
+
+    ax.legend(bbox_to_anchor=(0.96, 1), loc=2, prop={'size': 18})
+    ax.set_xlim(-1, refNumConfs + 1)
+    if ystep > 0:
+        ax.set_yticks(
+            np.arange(int(round(floor)) - 2, int(round(ceiling)) + 2, ystep))
+    ax.grid()
+    return "minimaE_%s" % molName
+
+
+def draw_avg_times(fig, molName, avgTimes, sdTimes, xticklabels):
+    """
+    Draw bar plot of conformer-averaged wall times of one molecule.
+    Same plot as match_minima.plot_avg_times.
+
+    Returns
+    -------
+    figname : string, base name (no extension) of the figure
+
+    """
+    plttitle = "Conformer-Averaged Wall Times\nfor %s" % (molName)
+    plttitle += "\nGeometry Optimization in Psi4"
+    x = list(range(len(avgTimes)))
+
+    ax = fig.add_subplot(111)
+    ax.set_title(plttitle, fontsize=20)
+    ax.set_ylabel("time (s)", fontsize=18)
+    ax.set_xticks(x)
+    ax.set_xticklabels(xticklabels, fontsize=14, rotation=-30, ha='left')
+    ax.tick_params(axis='y', labelsize=14)
+
+    colors = mpl.cm.rainbow(np.linspace(0, 1, len(x)))
+    ax.bar(x, avgTimes, color=colors, align='center', yerr=sdTimes,
+           ecolor='k')
+    return "timebars_%s" % molName
+
+
+def draw_heat_rmse(fig, molName, rmsArray, ticklabels,
+                   ptitle='RMS error (kcal/mol)', fprefix='rmse',
+                   colors='PRGn_r'):
+    """
+    Draw heat plot of a square array comparing levels of theory.
+    Same plot as match_plot.plot_heat_rmse.
+
+    Returns
+    -------
+    figname : string, base name (no extension) of the figure
+
+    """
+    x = list(range(len(rmsArray)))
+
+    ax = fig.add_subplot(111)
+    ### Tranpose and plot data - imshow swaps x and y
+    im = ax.imshow(np.asarray(rmsArray).T, cmap=colors, origin='lower')
+    cbar = fig.colorbar(im, ax=ax)
+
+    ax.set_xticks(x)
+    ax.set_xticklabels(ticklabels, fontsize=12, rotation=-40, ha='left')
+    ax.set_yticks(x)
+    ax.set_yticklabels(ticklabels, fontsize=14)
+    ax.set_xlabel("reference", fontsize=14)
+    ax.set_ylabel("compared", fontsize=16)
+    cbar.ax.tick_params(labelsize=14)
+    return "%s_%s" % (fprefix, molName)
+
+
+def draw_rmse_time(fig, molName, eneArray, timeArray, ticklabels,
+                   fprefix='scatter'):
+    """
+    Draw scatter plot of RMS error vs. log ratio of wall times.
+    Same plot as match_plot.plot_rmse_time.
+
+    Returns
+    -------
+    figname : string, base name (no extension) of the figure
+
+    """
+    plttitle = "RMS error vs. log ratio of wall time\n%s" % molName
+    colors = mpl.cm.rainbow(np.linspace(0, 1, len(eneArray)))
+
+    ax = fig.add_subplot(111)
+    for i, (x, y) in enumerate(zip(eneArray, timeArray)):
+        ax.scatter(x, y, color=colors[i], marker=MARKERS[i],
+                   label=ticklabels[i])
+    ax.set_title(plttitle, fontsize=20)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc=2)
+    ax.set_xlabel("RMS error (kcal/mol)", fontsize=14)
+    ax.set_ylabel("log ratio of wall time", fontsize=14)
+    return "%s_%s" % (fprefix, molName)
+
+
+# plot type: (drawing function, figure size in inches)
+PLOTS = {
+    'minima': (draw_mol_minima, (20, 10)),
+    'times': (draw_avg_times, (6.4, 4.8)),
+    'heat': (draw_heat_rmse, (10, 5)),
+    'scatter': (draw_rmse_time, (8, 6)),
+}
+
+# figure templates of this process, reused between molecules
+_templates = {}
+
+
+def get_template(kind):
+    """
+    Get the cleared figure of this plot type for this process, creating it
+    on first use.
+    """
+    if kind not in _templates:
+        fig = Figure(figsize=PLOTS[kind][1])
+        FigureCanvasAgg(fig)
+        _templates[kind] = fig
+    fig = _templates[kind]
+    fig.clear()
+    return fig
+
+
+def job(kind, molName, **kwargs):
+    """
+    Describe one plot to be rendered by render_batch.
+
+    Parameters
+    ----------
+    kind : string, one of 'minima', 'times', 'heat', 'scatter'
+    molName : string, name of molecule
+    kwargs : other arguments of the corresponding draw_* function
+
+    """
+    if kind not in PLOTS:
+        raise ValueError("Unknown plot type '{}'. Choose from {}.".format(
+            kind, ', '.join(sorted(PLOTS))))
+    return (kind, molName, kwargs)
+
+
+def render_one(plotjob, fmt='png', dpi=100, outdir='.'):
+    """
+    Draw and save one plot. Returns the name of the saved file.
+    """
+    kind, molName, kwargs = plotjob
+    fig = get_template(kind)
+    figname = PLOTS[kind][0](fig, molName, **kwargs)
+    figname = os.path.join(outdir, "%s.%s" % (figname, fmt))
+    fig.savefig(figname, format=fmt, dpi=dpi, bbox_inches='tight')
+    return figname
+
+
+def _render_star(args):
+    return render_one(*args)
+
+
+def render_batch(jobs, nprocs=None, fmt='png', dpi=100, outdir='.'):
+    """
+    Render many plots, in parallel if nprocs is not 1.
+
+    Parameters
+    ----------
+    jobs : list of plot descriptions from job()
+    nprocs : int, number of worker processes. None to use all CPUs,
+        1 to render in this process.
+    fmt : string, output file format, e.g., 'png', 'pdf', 'svg'
+    dpi : int, resolution of raster output formats
+    outdir : string, directory for output files
+
+    Returns
+    -------
+    fignames : list of saved file names, in the order of jobs
+
+    """
+    args = [(j, fmt, dpi, outdir) for j in jobs]
+    if nprocs == 1 or len(jobs) <= 1:
+        return [_render_star(a) for a in args]
+    if nprocs is None:
+        nprocs = multiprocessing.cpu_count()
+    nprocs = min(nprocs, len(jobs))
+    chunksize = max(1, len(jobs) // (4 * nprocs))
+    pool = multiprocessing.Pool(nprocs)
+    try:
+        fignames = pool.map(_render_star, args, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
+    return fignames
@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+"""
+shard_sdf.py
+
+Purpose:    Split a pipeline SDF file into shards by molecule, and merge
+            processed shards back together in the original molecule order.
+            Shards are balanced by conformer count or by a predicted QM cost,
+            or molecules are placed by a stable hash of their titles so that
+            a molecule lands in the same shard across runs. Each shard is placed in its own directory so that setup and
+            results stages of the pipeline can run on shards independently.
+
+            SDF records are handled as text, so all SD tags and coordinates
+            are kept exactly. Consecutive records with the same title are
+            treated as conformers of one molecule, as in the rest of the
+            pipeline. Files are streamed one molecule at a time, so only
+            titles and weights of all molecules are kept in memory.
+
+Usage:      python shard_sdf.py shard -f set1-200.sdf -n 8 --weight cost
+            python shard_sdf.py merge -m set1_shards/set1-200.shards.json -s 220
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import sys
+import json
+import heapq
+import zlib
+import hashlib
+import contextlib
+
+### ------------------- Functions -------------------
+
+
+def sha256sum(fname):
+    """
+    Get the sha256 hex digest of a file, reading in blocks.
+    """
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def iter_sdf_records(fname):
+    """
+    Read the records of an SDF file as text, one at a time.
+
+    Parameters
+    ----------
+    fname : string, name of SDF file
+
+    Yields
+    ------
+    title : string, title of the record
+    offset : int, byte offset of the record in the file
+    text : byte string of the record including its terminating '$$$$' line
+
+    Raises ValueError after the last complete record if the file ends with
+    an incomplete record.
+
+    """
+    offset = 0
+    record = []
+    with open(fname, 'rb') as f:
+        for line in f:
+            record.append(line)
+            if line.startswith(b'$$$$'):
+                title = record[0].decode('utf-8', 'replace').rstrip('\r\n')
+                text = b''.join(record)
+                yield title, offset, text
+                offset += len(text)
+                record = []
+    if any(line.strip() for line in record):
+        raise ValueError("Incomplete record at end of %s" % fname)
+
+
+def iter_sdf_mols(fname):
+    """
+    Read an SDF file as text grouped into molecules, one molecule at a time.
+
+    Parameters
+    ----------
+    fname : string, name of SDF file
+
+    Yields
+    ------
+    title : string, title of the molecule
+    offset : int, byte offset of the molecule's first record in the file
+    records : list of record byte strings of the molecule's conformers
+
+    """
+    title, offset, records = None, 0, []
+    for rtitle, roffset, text in iter_sdf_records(fname):
+        if records and rtitle != title:
+            yield title, offset, records
+            records = []
+        if not records:
+            title, offset = rtitle, roffset
+        records.append(text)
+    if records:
+        yield title, offset, records
+
+
+def read_sdf_mols(fname):
+    """
+    Read an SDF file as text, grouped into molecules. This keeps the whole
+    file in memory; use iter_sdf_mols for large files.
+
+    Parameters
+    ----------
+    fname : string, name of SDF file
+
+    Returns
+    -------
+    mols : list of (title, list of record byte strings) in file order.
+        Each record is one conformer including its terminating '$$$$' line.
+
+    """
+    return [(title, records) for title, offset, records in
+            iter_sdf_mols(fname)]
+
+
+def num_atoms(record):
+    """
+    Get the number of atoms from the counts line of a V2000 SDF record.
+    Returns 0 if it cannot be read (e.g., V3000 records).
+    """
+    lines = record.split(b'\n', 4)
+    try:
+        return int(lines[3][0:3])
+    except (IndexError, ValueError):
+        return 0
+
+
+def mol_weight(records, weight='confs'):
+    """
+    Get the weight of a molecule for balancing shards.
+
+    Parameters
+    ----------
+    records : list of SDF record byte strings of one molecule's conformers
+    weight : string, 'confs' for number of conformers, or 'cost' for a
+        predicted QM cost of number of conformers times the cube of number
+        of atoms, as a rough scaling of DFT/HF calculations with system size
+
+    Returns
+    -------
+    float weight of the molecule
+
+    """
+    if weight == 'confs':
+        return float(len(records))
+    if weight == 'cost':
+        return float(sum(max(num_atoms(r), 1)**3 for r in records))
+    raise ValueError("Unknown weight '{}'. Use confs or cost.".format(weight))
+
+
+def balance(weights, nshards):
+    """
+    Assign items to shards such that the total weight of the shards is about
+    equal. Heaviest items are placed first, each into the lightest shard.
+
+    Parameters
+    ----------
+    weights : list of weights of each item
+    nshards : int, number of shards
+
+    Returns
+    -------
+    assignment : list of lists of item indices of each shard, each in
+        increasing order
+
+    """
+    heap = [(0., k) for k in range(nshards)]
+    assignment = [[] for k in range(nshards)]
+    order = sorted(range(len(weights)), key=lambda i: (-weights[i], i))
+    for i in order:
+        load, k = heapq.heappop(heap)
+        assignment[k].append(i)
+        heapq.heappush(heap, (load + weights[i], k))
+    return [sorted(a) for a in assignment]
+
+
+def hash_shard(title, nshards):
+    """
+    Get the shard number of a molecule title by a stable hash, the same
+    across runs and machines (unlike Python's salted hash()).
+    """
+    return zlib.crc32(title.encode('utf-8')) % nshards
+
+
+def copy_bytes(fin, fout, nbytes, blocksize=1 << 20):
+    """
+    Copy a number of bytes from the current position of fin to fout.
+    """
+    while nbytes > 0:
+        block = fin.read(min(nbytes, blocksize))
+        if not block:
+            break
+        fout.write(block)
+        nbytes -= len(block)
+
+
+def split_name(fname):
+    """
+    Split the base name of a pipeline file into the prefix and the suffix,
+    e.g., /path/set1-200.sdf --> ('set1', '200'). Suffix is '' if none.
+    """
+    base = os.path.splitext(os.path.basename(fname))[0]
+    prefix, _, suffix = base.partition('-')
+    return prefix, suffix
+
+
+def shard_file(manifest_dir, shard, suffix):
+    """
+    Get the name of a shard's SDF file of a given pipeline suffix.
+    """
+    fname = "{}-{}.sdf".format(shard['name'], suffix) if suffix else \
+        "{}.sdf".format(shard['name'])
+    return os.path.join(manifest_dir, shard['dir'], fname)
+
+
+def shard_sdf(insdf, nshards, outdir=None, weight='confs'):
+    """
+    Split an SDF file into balanced shards by molecule. Each shard is
+    written into its own subdirectory with the same pipeline suffix as the
+    input, e.g., set1-200.sdf --> set1_shards/set1_00/set1_00-200.sdf.
+    A JSON manifest with the shard contents and checksums is written for
+    merging later.
+
+    Parameters
+    ----------
+    insdf : string, name of SDF file to split
+    nshards : int, number of shards
+    outdir : string, directory in which to create shards. Default is
+        [prefix]_shards next to the input file.
+    weight : string, 'confs' or 'cost' to balance shards; see mol_weight.
+        'hash' to place each molecule by hash_shard of its title instead,
+        with weights of the manifest counted as in 'confs'.
+
+    Returns
+    -------
+    manifest_file : string, name of JSON manifest
+
+    """
+    insdf = os.path.abspath(insdf)
+    prefix, suffix = split_name(insdf)
+    if outdir is None:
+        outdir = os.path.join(os.path.dirname(insdf), prefix + '_shards')
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    # first pass for weights, second pass to write molecules to shards
+    titles, nconfs, weights = [], [], []
+    for title, offset, recs in iter_sdf_mols(insdf):
+        titles.append(title)
+        nconfs.append(len(recs))
+        weights.append(mol_weight(recs, 'confs' if weight == 'hash' else
+                                  weight))
+    if nshards > len(titles):
+        print("Reducing number of shards from %d to the %d molecules" %
+              (nshards, len(titles)))
+        nshards = max(len(titles), 1)
+    if weight == 'hash':
+        assignment = [[] for k in range(nshards)]
+        for i, title in enumerate(titles):
+            assignment[hash_shard(title, nshards)].append(i)
+    else:
+        assignment = balance(weights, nshards)
+
+    width = max(2, len(str(nshards - 1)))
+    shards = []
+    owner = {}
+    for k, indices in enumerate(assignment):
+        name = "{}_{}".format(prefix, str(k).zfill(width))
+        shard = {'name': name, 'dir': name}
+        if not os.path.isdir(os.path.join(outdir, name)):
+            os.makedirs(os.path.join(outdir, name))
+        shards.append(shard)
+        owner.update((i, k) for i in indices)
+    with contextlib.ExitStack() as stack:
+        files = [stack.enter_context(open(shard_file(outdir, shard, suffix),
+                                          'wb')) for shard in shards]
+        for i, (title, offset, recs) in enumerate(iter_sdf_mols(insdf)):
+            files[owner[i]].writelines(recs)
+
+    for shard, indices in zip(shards, assignment):
+        fname = shard_file(outdir, shard, suffix)
+        shard.update({
+            'file': os.path.basename(fname),
+            'sha256': sha256sum(fname),
+            'titles': [titles[i] for i in indices],
+            'nconfs': sum(nconfs[i] for i in indices),
+            'weight': sum(weights[i] for i in indices)
+        })
+        print("%s: %d molecules, %d conformers, weight %.1f" %
+              (shard['name'], len(indices), shard['nconfs'], shard['weight']))
+
+    manifest = {
+        'source': insdf,
+        'source_sha256': sha256sum(insdf),
+        'prefix': prefix,
+        'suffix': suffix,
+        'weight': weight,
+        'order': titles,
+        'shards': shards
+    }
+    manifest_file = os.path.join(outdir, "{}.shards.json".format(
+        os.path.splitext(os.path.basename(insdf))[0]))
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_file
+
+
+def load_manifest(manifest_file):
+    """
+    Read a shard manifest. Returns the manifest dictionary and the directory
+    that shard directories are relative to.
+    """
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    return manifest, os.path.dirname(os.path.abspath(manifest_file))
+
+
+def check_shard(manifest, mdir, shard, suffix):
+    """
+    Check one shard for a given pipeline suffix. The shard file must exist,
+    end with a complete record, and only contain molecules of this shard.
+    For the suffix of the original split, the checksum must also match.
+
+    Returns
+    -------
+    mols : list of (title, offset, nbytes) of each molecule of the shard
+        file, to read its records later without keeping them in memory
+    problems : list of strings describing any problems found
+
+    """
+    fname = shard_file(mdir, shard, suffix)
+    if not os.path.isfile(fname):
+        return [], ["missing file %s" % fname]
+    problems = []
+    if suffix == manifest['suffix'] and sha256sum(fname) != shard['sha256']:
+        problems.append("checksum mismatch of %s" % fname)
+    mols = []
+    try:
+        for title, offset, recs in iter_sdf_mols(fname):
+            mols.append((title, offset, sum(len(r) for r in recs)))
+    except ValueError as e:
+        return [], problems + [str(e)]
+    extra = set(t for t, offset, nbytes in mols) - set(shard['titles'])
+    if extra:
+        problems.append("%s has %d molecule(s) not in this shard, e.g., %s" %
+                        (fname, len(extra), sorted(extra)[0]))
+    return mols, problems
+
+
+def merge_shards(manifest_file, suffix, outsdf=None, strict=True):
+    """
+    Merge shard files of one pipeline suffix into one SDF file with the
+    molecules in their original order.
+
+    Parameters
+    ----------
+    manifest_file : string, name of JSON manifest from shard_sdf
+    suffix : string, pipeline suffix of shard files to merge, e.g., '220'
+    outsdf : string, name of merged SDF file. Default is [prefix]-[suffix].sdf
+        in the directory of the original input file.
+    strict : Boolean, raise an error if any shard check fails. If False,
+        problems are printed and the good shards are still merged.
+
+    Returns
+    -------
+    outsdf : string, name of merged SDF file
+
+    Raises
+    ------
+    ValueError if strict and any shard check fails, listing the problems
+
+    """
+    manifest, mdir = load_manifest(manifest_file)
+    if outsdf is None:
+        outsdf = os.path.join(
+            os.path.dirname(manifest['source']),
+            "{}-{}.sdf".format(manifest['prefix'], suffix) if suffix else
+            "{}.sdf".format(manifest['prefix']))
+
+    # locations of each molecule's records in the shard files
+    bytitle = {}
+    all_problems = []
+    for shard in manifest['shards']:
+        mols, problems = check_shard(manifest, mdir, shard, suffix)
+        all_problems.extend(problems)
+        fname = shard_file(mdir, shard, suffix)
+        for title, offset, nbytes in mols:
+            bytitle.setdefault(title, []).append((fname, offset, nbytes))
+    if all_problems:
+        if strict:
+            raise ValueError(
+                "Shard checks failed; merged file not written:\n" +
+                "\n".join(all_problems))
+        print("\n".join("Shard check: " + p for p in all_problems))
+
+    missing = 0
+    with open(outsdf, 'wb') as f, contextlib.ExitStack() as stack:
+        shard_files = {}
+        for title in manifest['order']:
+            # each title written once even if it appears more than once
+            spans = bytitle.pop(title, None)
+            if spans is None:
+                missing += 1
+                continue
+            for fname, offset, nbytes in spans:
+                if fname not in shard_files:
+                    shard_files[fname] = stack.enter_context(open(fname, 'rb'))
+                shard_files[fname].seek(offset)
+                copy_bytes(shard_files[fname], f, nbytes)
+    print("Merged %d shards into %s (%d of %d molecules absent)" %
+          (len(manifest['shards']), outsdf, missing, len(manifest['order'])))
+    return outsdf
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='stage')
+
+    sp = subparsers.add_parser('shard', help="Split SDF file into shards.")
+    sp.add_argument("-f", "--filename", required=True,
+        help="Pipeline SDF file to split, e.g., set1-200.sdf")
+    sp.add_argument("-n", "--nshards", type=int, required=True,
+        help="Number of shards.")
+    sp.add_argument("-o", "--outdir", default=None,
+        help="Directory of shards. Default is [prefix]_shards.")
+    sp.add_argument("-w", "--weight", default="confs",
+        choices=["confs", "cost", "hash"],
+        help="Balance shards by number of conformers or predicted QM cost, "
+             "or place molecules by a stable hash of their titles.")
+
+    mp = subparsers.add_parser('merge', help="Merge shards of one suffix.")
+    mp.add_argument("-m", "--manifest", required=True,
+        help="JSON manifest written by the shard stage.")
+    mp.add_argument("-s", "--suffix", required=True,
+        help="Pipeline suffix of the shard files to merge, e.g., 220")
+    mp.add_argument("-o", "--outfile", default=None,
+        help="Merged SDF file. Default is [prefix]-[suffix].sdf")
+    mp.add_argument("--nostrict", action="store_true", default=False,
+        help="Merge even if some shards fail the integrity checks.")
+
+    args = parser.parse_args()
+    if args.stage == 'shard':
+        shard_sdf(args.filename, args.nshards, args.outdir, args.weight)
+    elif args.stage == 'merge':
+        try:
+            merge_shards(args.manifest, args.suffix, args.outfile,
+                         not args.nostrict)
+        except ValueError as e:
+            sys.exit("ERROR: %s" % e)
+    else:
+        parser.print_help()
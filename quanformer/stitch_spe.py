@@ -16,14 +16,11 @@ By:         Victoria T. Lim
 ## TODO: Add line plotting functionality for specified molecules.
 
 import os
-import openeye.oechem as oechem
+import sys
 import numpy as np
 import argparse
-import proc_tags as pt
+import profiling
 import collections  # ordered dictionary
-
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import operator as o
 
 
@@ -42,6 +39,9 @@ def barplot(ax, dpoints, ptitle=""):
     ptitle: String title for plot
 
     """
+    # matplotlib is slow to import, so import here instead of at the top
+    import matplotlib.pyplot as plt
+    import matplotlib.cm as cm
 
     # Aggregate the conditions and the categories according to their
     # mean values
@@ -98,6 +98,8 @@ def arrange_and_plot(wholedict, ptitle):
         Title on plot
 
     """
+    import matplotlib.pyplot as plt
+
     # fill in dictionary for ref file for list comprehension later
     wholedict[0]['titleMols'] = np.full(len(wholedict[1]['titleMols']), np.nan)
     wholedict[0]['rmsds'] = np.full(len(wholedict[1]['rmsds']), np.nan)
@@ -127,6 +129,8 @@ def arrange_and_plot(wholedict, ptitle):
 
 
 def read_mols_tag(insdf, calctype):
+    # OEChem is slow to import, so import here instead of at the top
+    import openeye.oechem as oechem
 
     if calctype not in {'opt', 'spe'}:
         sys.exit("Specify a valid calculation type for {}.".format(insdf))
@@ -169,6 +173,8 @@ def extract_enes(dict1):
 
     """
 
+    import proc_tags as pt
+
     mols1, tag1 = read_mols_tag(dict1['fname'], dict1['calctype'])
     titleMols = []
     rmsds = []
@@ -369,6 +375,8 @@ def extract_and_rmsd(dict1, dict2):
 
     """
 
+    import proc_tags as pt
+
     mols1, tag1 = read_mols_tag(dict1['fname'], dict1['calctype'])
     mols2, tag2 = read_mols_tag(dict2['fname'], dict2['calctype'])
     titleMols = []
@@ -602,42 +610,25 @@ def stitch_spe(wholedict, outfn='relene.dat'):
     return wholedict
 
 
-### ------------------- Parser -------------------
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument("-i", "--infile", required=True,
-        help="Name of text file with information on file(s) and SD tag info on "
-             "the level of theory to process.")
-
-    parser.add_argument("--reffile", default=None,
-        help="If specified, treat the specified file as a reference file from which "
-             "to compute RMSD of energies. If not, write out avgs/stdevs for "
-             "each conformer's relative energies in kcal/mol.")
-
-    #    parser.add_argument("-l", "--lineplot",
-    #        help=("Optional, list of molecule name(s) for which line plots will be "
-    #              "generated. Each molecule's line plots shows relative energies "
-    #              "for each file.")
-
-    parser.add_argument("--plotbars", action="store_true", default=False,
-        help="If specified, generate bar plots of each comparison file wrt "
-             "reference file (first entry of input file).")
-
-    args = parser.parse_args()
-    if not os.path.exists(args.infile):
-        raise parser.error("Input file %s does not exist." % args.infile)
+def main(infile, reffile=None, plotbars=False, profile=None):
+    """
+    Compare the energies of the files of the input file, with or without a
+    reference file. See the parser below for parameters.
+    """
+    if profile:
+        profiling.enable(profile)
+    if not os.path.exists(infile):
+        sys.exit("Input file %s does not exist." % infile)
 
     # Read input file into an ordered dictionary.
     # http://stackoverflow.com/questions/25924244/creating-2d-dictionary-in-python
     linecount = 0
     wholedict = collections.OrderedDict()
-    with open(args.infile) as f:
+    with open(infile) as f:
         for line in f:
             if line.startswith('#'):
                 continue
-            if args.reffile is not None and args.reffile in line:
+            if reffile is not None and reffile in line:
                 ref_index = linecount
             dataline = [x.strip() for x in line.split(',')]
             wholedict[linecount] = {
@@ -649,12 +640,43 @@ if __name__ == "__main__":
             }
             linecount += 1
 
-    if args.reffile is not None:
+    if reffile is not None:
         wholedict = stitch_with_ref(wholedict, ref_index)
-        if args.plotbars:
+        if plotbars:
             arrange_and_plot(wholedict, "RMSDs of relative conformer energies")
     else:
         wholedict = stitch_spe(wholedict)
-        if args.plotbars:
+        if plotbars:
             print('still working on this')
         #    arrange_and_plot(wholedict, "RMSDs of relative conformer energies")
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-i", "--infile", required=True,
+        help="Name of text file with information on file(s) and SD tag info on "
+             "the level of theory to process.")
+
+    parser.add_argument("--reffile", default=None,
+        help="If specified, treat the specified file as a reference file from which "
+             "to compute RMSD of energies. If not, write out avgs/stdevs for "
+             "each conformer's relative energies in kcal/mol.")
+
+    #    parser.add_argument("-l", "--lineplot",
+    #        help=("Optional, list of molecule name(s) for which line plots will be "
+    #              "generated. Each molecule's line plots shows relative energies "
+    #              "for each file.")
+
+    parser.add_argument("--plotbars", action="store_true", default=False,
+        help="If specified, generate bar plots of each comparison file wrt "
+             "reference file (first entry of input file).")
+
+    parser.add_argument("--profile", default=None,
+        help="Directory in which to write cProfile summaries and collapsed "
+             "stacks of hot sections such as get_sd_list.")
+
+    args = parser.parse_args()
+    main(args.infile, args.reffile, args.plotbars, args.profile)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+"""
+time_stats.py
+
+Purpose:    Single-pass statistics of QM runtimes and optimization steps
+            stored in the SD tags of Quanformer SDF files.
+            Each SDF file is read exactly once, and runtime and step counts
+            of every conformer are accumulated together.
+
+Usage:      - import time_stats
+            - time_stats.time_stats(['file1-210.sdf', 'file2-210.sdf'],
+                                    ['mp2/def2-SV(P)', 'b3lyp-d3mbj/def2-TZVP'])
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import math
+import json
+import collections
+
+### ------------------- Functions -------------------
+
+
+class RunningStats(object):
+    """
+    Accumulate summary statistics of a stream of values in one pass.
+
+    The mean and standard deviation are updated with Welford's algorithm
+    from the exact values. The median and mode are computed from a tally of
+    values rounded to the resolution, so the tally has at most one entry per
+    resolution step in the range of values, e.g., a few thousand for
+    runtimes to the second. With a resolution of None, exact values are
+    tallied and memory grows with the number of distinct values.
+    NaN values (e.g., from jobs that did not finish) are not counted.
+
+    """
+
+    def __init__(self, resolution=1.):
+        """
+        Parameters
+        ----------
+        resolution : float, step to which values are rounded for the median
+            and mode, e.g., 1 for seconds or steps. None for exact values.
+
+        """
+        self.n = 0
+        self._mean = 0.
+        self._m2 = 0.
+        self.resolution = resolution
+        self.counts = collections.Counter()
+
+    def add(self, value):
+        """
+        Add one value. Return False if value is NaN and was skipped.
+        """
+        value = float(value)
+        if math.isnan(value):
+            return False
+        self.n += 1
+        delta = value - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (value - self._mean)
+        if self.resolution:
+            value = round(value / self.resolution) * self.resolution
+        self.counts[value] += 1
+        return True
+
+    def merge(self, other):
+        """
+        Combine the statistics of another RunningStats into this one.
+        Both should have the same resolution.
+        """
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other._mean - self._mean
+        self._mean += delta * other.n / n
+        self._m2 += other._m2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.counts.update(other.counts)
+        return self
+
+    @property
+    def mean(self):
+        if self.n == 0:
+            return float('nan')
+        return self._mean
+
+    @property
+    def sd(self):
+        # population standard deviation, same as numpy.std default
+        if self.n == 0:
+            return float('nan')
+        return math.sqrt(self._m2 / self.n)
+
+    @property
+    def median(self):
+        if self.n == 0:
+            return float('nan')
+        # walk through the sorted tally to find the middle value(s)
+        lo_rank = (self.n - 1) // 2
+        hi_rank = self.n // 2
+        lo = hi = None
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if lo is None and seen > lo_rank:
+                lo = value
+            if seen > hi_rank:
+                hi = value
+                break
+        return 0.5 * (lo + hi)
+
+    @property
+    def mode(self):
+        # ties are broken by taking the smallest value
+        if self.n == 0:
+            return float('nan')
+        top = max(self.counts.values())
+        return min(v for v, c in self.counts.items() if c == top)
+
+    def summary(self):
+        return {
+            'n': self.n,
+            'mean': self.mean,
+            'sd': self.sd,
+            'median': self.median,
+            'mode': self.mode
+        }
+
+
+def conf_time_data(pairs, method, basis, package='Psi4', calctype='opt'):
+    """
+    From the SD data of one conformer, get both the runtime and the number
+    of optimization steps in a single pass over the tags.
+
+    Parameters
+    ----------
+    pairs : iterable of (tag, value) string tuples of one conformer
+    method : string, e.g. 'mp2'
+    basis : string, e.g. 'def2-SV(P)'
+    package : string, 'Psi4' or 'Turbomole'
+    calctype : string, one of 'opt', 'spe', 'hess'
+
+    Returns
+    -------
+    runtime : float, wall time in seconds; nan if missing or not finished
+    steps : float, number of optimization steps; nan if missing,
+        not finished, or not an optimization
+
+    """
+    cdict = {'spe': 'Single Pt.', 'opt': 'Opt.', 'hess': 'Hessian'}
+    full_method = "{}/{}".format(method, basis)
+    time_label = "QM {} {} Runtime (sec) {}".format(
+        package, cdict[calctype], full_method).lower()
+    step_label = "QM {} {} Steps {}".format(package, cdict[calctype],
+                                            full_method).lower()
+
+    runtime = float('nan')
+    steps = float('nan')
+    for tag, value in pairs:
+        tag = tag.lower()
+        # Case: opt did not finish --> nan for both
+        if "note on" in tag and "did not finish" in value.lower():
+            return float('nan'), float('nan')
+        if time_label in tag:
+            try:
+                runtime = float(value)
+            except ValueError:
+                pass
+        elif step_label in tag:
+            try:
+                steps = float(value)
+            except ValueError:
+                pass
+    return runtime, steps
+
+
+def sdf_time_stats(sdfRef, method, basis, package='Psi4', calctype='opt'):
+    """
+    Read an SDF file once and accumulate per-molecule and per-file
+    statistics of runtimes and optimization steps.
+
+    Parameters
+    ----------
+    sdfRef : string, name of SDF file with all confs of all mols
+    method : string, QM method of the tags to read
+    basis : string, QM basis set of the tags to read
+    package : string, 'Psi4' or 'Turbomole'
+    calctype : string, one of 'opt', 'spe', 'hess'
+
+    Returns
+    -------
+    molstats : ordered dictionary, molstats[title] = {'runtime': RunningStats,
+        'steps': RunningStats}, in the order of molecules in the file
+    filestats : dictionary with 'runtime' and 'steps' RunningStats of all
+        conformers in the file
+
+    """
+    import openeye.oechem as oechem
+
+    print("Opening SDF file %s" % sdfRef)
+    ifs = oechem.oemolistream()
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    if not ifs.open(sdfRef):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % sdfRef)
+
+    molstats = collections.OrderedDict()
+    filestats = {'runtime': RunningStats(), 'steps': RunningStats()}
+    for mol in ifs.GetOEMols():
+        mstats = {'runtime': RunningStats(), 'steps': RunningStats()}
+        for conf in mol.GetConfs():
+            pairs = ((x.GetTag(), x.GetValue())
+                     for x in oechem.OEGetSDDataPairs(conf))
+            runtime, steps = conf_time_data(pairs, method, basis, package,
+                                            calctype)
+            mstats['runtime'].add(runtime)
+            mstats['steps'].add(steps)
+        filestats['runtime'].merge(mstats['runtime'])
+        filestats['steps'].merge(mstats['steps'])
+        # same title twice in one file would be one mol in the pipeline
+        if mol.GetTitle() in molstats:
+            molstats[mol.GetTitle()]['runtime'].merge(mstats['runtime'])
+            molstats[mol.GetTitle()]['steps'].merge(mstats['steps'])
+        else:
+            molstats[mol.GetTitle()] = mstats
+    ifs.close()
+
+    return molstats, filestats
+
+
+def time_stats(sdf_list,
+               thry_list,
+               package='Psi4',
+               calctype='opt',
+               outdir=None,
+               prefix='timeAvgs'):
+    """
+    Get statistics of runtimes and optimization steps for any number of
+    SDF files, reading each file once. Results are appended to a
+    human-readable text file and written to a JSON summary.
+
+    Parameters
+    ----------
+    sdf_list : list of SDF file names
+    thry_list : list of levels of theory corresponding to the files in
+        sdf_list, in the form of 'method/basis'. E.g., ['mp2/def2-SV(P)']
+    package : string, 'Psi4' or 'Turbomole'
+    calctype : string, one of 'opt', 'spe', 'hess'
+    outdir : string, directory of output files. Default is the current
+        working directory.
+    prefix : string, base name of output files. Default of 'timeAvgs' leads
+        to 'timeAvgs.txt' and 'timeAvgs.json'.
+
+    Returns
+    -------
+    summary : list of dictionaries, one per input file, with keys of 'file',
+        'theory', 'calctype', 'molecules', and 'total'. The 'molecules'
+        value is an ordered dictionary of molecule titles, each with
+        'runtime' and 'steps' summaries (n, mean, sd, median, mode).
+
+    """
+    if len(sdf_list) != len(thry_list):
+        raise ValueError("Number of files and levels of theory differ.")
+    if outdir is None:
+        outdir = os.getcwd()
+
+    summary = []
+    timeF = open(os.path.join(outdir, prefix + '.txt'), 'a')
+    for sdfRef, thry in zip(sdf_list, thry_list):
+        method = thry.split('/')[0].strip()
+        basis = thry.split('/')[1].strip()
+        molstats, filestats = sdf_time_stats(sdfRef, method, basis, package,
+                                             calctype)
+
+        timeF.write("\nFile: {}\n".format(sdfRef))
+        timeF.write("Runtime (sec) and number of steps over all confs for "
+                    "each molecule [{}/{}]\n".format(method, basis))
+        timeF.write("# title\tconfs\ttime_mean\ttime_sd\ttime_median\t"
+                    "steps_mean\tsteps_sd\tsteps_median\tsteps_mode\n")
+
+        mols = collections.OrderedDict()
+        for title, mstats in molstats.items():
+            rt = mstats['runtime'].summary()
+            st = mstats['steps'].summary()
+            timeF.write("%s\t%d\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%.1f\t%.1f\n" %
+                        (title, rt['n'], rt['mean'], rt['sd'], rt['median'],
+                         st['mean'], st['sd'], st['median'], st['mode']))
+            mols[title] = {'runtime': rt, 'steps': st}
+
+        rt = filestats['runtime'].summary()
+        st = filestats['steps'].summary()
+        timeF.write("# all\t%d\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%.1f\t%.1f\n" %
+                    (rt['n'], rt['mean'], rt['sd'], rt['median'], st['mean'],
+                     st['sd'], st['median'], st['mode']))
+
+        summary.append({
+            'file': sdfRef,
+            'theory': thry,
+            'calctype': calctype,
+            'molecules': mols,
+            'total': {
+                'runtime': rt,
+                'steps': st
+            }
+        })
+    timeF.close()
+
+    # nan is not valid JSON so write it out as null
+    def _clean(obj):
+        if isinstance(obj, float) and math.isnan(obj):
+            return None
+        if isinstance(obj, dict):
+            return collections.OrderedDict(
+                (k, _clean(v)) for k, v in obj.items())
+        if isinstance(obj, list):
+            return [_clean(v) for v in obj]
+        return obj
+
+    with open(os.path.join(outdir, prefix + '.json'), 'w') as jfile:
+        json.dump(_clean(summary), jfile, indent=2)
+
+    return summary
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Single-pass statistics of QM runtimes and "
+        "optimization steps from SD tags of one or more SDF files.")
+
+    parser.add_argument("-f", "--filenames", nargs='+', required=True,
+        help="SDF file(s) to be processed.")
+    parser.add_argument("-t", "--theory", nargs='+', required=True,
+        help="Level(s) of theory in 'method/basis' format, one per file, "
+             "e.g. 'mp2/def2-SV(P)'. Put these in 'quotes'.")
+    parser.add_argument("-c", "--calctype", default="opt",
+        help="One of 'opt', 'spe', or 'hess'. Default is 'opt'.")
+    parser.add_argument("-p", "--package", default="Psi4",
+        help="QM software package, 'Psi4' or 'Turbomole'. Default is Psi4.")
+
+    args = parser.parse_args()
+    if len(args.filenames) != len(args.theory):
+        parser.error("Specify one level of theory per input file.")
+    for f in args.filenames:
+        if not os.path.exists(f):
+            parser.error("Input file %s does not exist." % f)
+
+    time_stats(args.filenames, args.theory, args.package, args.calctype)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+"""
+triage.py
+
+Purpose:    Sort failed Psi4 calculations of a campaign by cause and write
+            restart inputs for them. Each output of maindir/molName/confNumber/
+            that does not end with the Psi4 completion message is classified
+            from its last lines:
+            - naming:      SyntaxError of the input, e.g., molecule name
+                           starting with a digit (see examples/potential_errors)
+            - scratch:     PSIO error, e.g., scratch directory missing or full
+            - memory:      memory allocation failed
+            - scf:         SCF did not converge
+            - opt_maxiter: geometry optimization did not converge in the
+                           maximum number of steps
+            - unknown:     other Psi4 error message
+            - incomplete:  no error message and the output has not changed for
+                           longer than --stale hours, e.g., job was killed at
+                           its wall time limit
+            Outputs without either message are counted as running unless
+            --stale is given.
+
+            With --restart, the input, output, and timer files of each failed
+            conformer are kept as [name].fail1 (fail2, etc., on later
+            restarts) and a new input.dat is written to the directory. The new
+            input starts from the last geometry of the failed output, so that
+            optimizations continue where they stopped, with these changes:
+            - naming:      molecule name made a valid Python name
+            - memory:      memory doubled
+            - scf:         more SCF iterations, damping, and second-order SCF
+            - opt_maxiter: more optimization steps
+            Scratch errors and incomplete jobs are restarted without changes,
+            once the scratch directory is fixed (PSI_SCRATCH or psi4 -s).
+            Unknown errors are only reported. Run the restart inputs as the
+            original ones; the steps of an optimization harvested afterwards
+            are those of the restart only.
+
+Usage:      python triage.py -d maindir
+            python triage.py -d maindir --stale 48 --restart
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import re
+import glob
+import time
+import collections
+
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+
+# messages at the end of failed Psi4 outputs for each failure class,
+# checked in this order
+FAILURES = collections.OrderedDict([
+    ('naming', ['SyntaxError']),
+    ('scratch', ['PSIO Error', 'PSIO_ERROR', 'No space left on device']),
+    ('memory', ['std::bad_alloc', 'MemoryError', 'not enough memory',
+                'Insufficient memory']),
+    ('scf', ['Could not converge SCF', 'SCFConvergenceError']),
+    ('opt_maxiter', ['Could not converge geometry optimization',
+                     'OptimizationConvergenceError']),
+])
+
+# failure classes that get restart inputs
+RESTARTABLE = ['naming', 'scratch', 'memory', 'scf', 'opt_maxiter',
+               'incomplete']
+
+# Psi4 options set in restart inputs of each failure class
+RESTART_OPTIONS = {
+    'scf': [('maxiter', '200'), ('damping_percentage', '20'),
+            ('soscf', 'true')],
+    'opt_maxiter': [('geom_maxiter', '200')],
+}
+
+# driver calls written by confs_to_psi.make_psi_input
+DRIVER = re.compile(r'^(E, wfn = |H, wfn = )?(optimize|energy|hessian)\(')
+
+### ------------------- Functions -------------------
+
+
+def classify_output(filename, stale=None, now=None, nbytes=8192):
+    """
+    Get the failure class of a Psi4 output file from its last nbytes.
+
+    Parameters
+    ----------
+    filename : string, name of the Psi4 output file
+    stale : float, hours after which an output without completion or error
+        message that has not changed counts as 'incomplete'. If None, or if
+        the output is in a molecule archive, such outputs count as running.
+    now : float, time in seconds since the epoch to compare against
+
+    Returns
+    -------
+    string failure class, or None if the calculation finished or is running
+
+    """
+    tail = output_io.read_tail(filename, nbytes)
+    if output_io.PSI4_DONE in tail:
+        return None
+    for failure, messages in FAILURES.items():
+        if any(m in tail for m in messages):
+            return failure
+    if any(m in tail for m in output_io.PSI4_ERRORS):
+        return 'unknown'
+    if stale is None:
+        return None
+    # outputs in molecule archives have no modification time of their own
+    stored = output_io.find_output(filename)
+    if stored is None or not os.path.isfile(stored):
+        return None
+    now = time.time() if now is None else now
+    if now - os.path.getmtime(stored) > stale * 3600:
+        return 'incomplete'
+    return None
+
+
+def atom_line(line):
+    """
+    Get (symbol, x, y, z) of a geometry line of a Psi4 output, e.g.,
+    "  C   -0.0481   0.8924  -3.5407" with an optional mass after the
+    coordinates, or None if the line is not an atom.
+    """
+    fields = line.split()
+    if len(fields) not in (4, 5) or not fields[0][0].isalpha():
+        return None
+    try:
+        return (fields[0], float(fields[1]), float(fields[2]),
+                float(fields[3]))
+    except ValueError:
+        return None
+
+
+def last_geometry(filename):
+    """
+    Get the last geometry printed in a Psi4 output file, either the optking
+    structure for the next step or the geometry of the last calculation,
+    whichever comes later.
+
+    Returns
+    -------
+    list of (symbol, x, y, z) tuples in Angstrom, empty if none found
+
+    """
+    geom = []
+    with output_io.open_output(filename) as f:
+        it = iter(f)
+        for line in it:
+            if "Geometry (in Angstrom)" not in line:
+                continue
+            # skip any table header up to the first atom
+            atoms = []
+            for line in it:
+                atom = atom_line(line)
+                if atom is not None:
+                    atoms.append(atom)
+                    break
+                if line.strip() and not line.strip().startswith(
+                        ('Center', '---')):
+                    break
+            for line in it:
+                atom = atom_line(line)
+                if atom is None:
+                    break
+                atoms.append(atom)
+            geom = atoms or geom
+    return geom
+
+
+def valid_name(label):
+    """
+    Make a molecule name valid for the molecule block of a Psi4 input,
+    which becomes a Python variable name.
+    """
+    label = re.sub(r'\W', '', label)
+    if not label or not label[0].isalpha():
+        label = 'mol' + label
+    return label
+
+
+def set_option(lines, name, value):
+    """
+    Set a Psi4 option in the lines of an input, replacing a previous
+    setting of the same option or adding it before the driver call.
+    """
+    setting = 'set %s %s' % (name, value)
+    pattern = re.compile(r'^set\s+%s\s' % re.escape(name), re.IGNORECASE)
+    for i, line in enumerate(lines):
+        if pattern.match(line):
+            lines[i] = setting
+            return lines
+    for i, line in enumerate(lines):
+        if DRIVER.match(line):
+            lines.insert(i, setting)
+            return lines
+    lines.append(setting)
+    return lines
+
+
+def double_memory(lines):
+    """
+    Double the memory line of a Psi4 input, e.g., "memory 5.0 Gb" to
+    "memory 10 Gb". Without a memory line, twice the Psi4 default of
+    500 MB is set.
+    """
+    for i, line in enumerate(lines):
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] == 'memory':
+            match = re.match(r'([\d.]+)\s*(\S*)', ' '.join(fields[1:]))
+            if match:
+                amount = float(match.group(1)) * 2
+                unit = match.group(2)
+                lines[i] = ('memory %g %s' % (amount, unit)).strip()
+                return lines
+    return ['memory 1000 MB'] + lines
+
+
+def restart_input(inputstring, failure, geometry=None):
+    """
+    Write the restart input of a failed calculation.
+
+    Parameters
+    ----------
+    inputstring : string, contents of the failed Psi4 input file, as written
+        by confs_to_psi.make_psi_input
+    failure : string, failure class from classify_output
+    geometry : list of (symbol, x, y, z) tuples to start from, e.g., from
+        last_geometry. Not used if None, empty, or of another number of atoms.
+
+    Returns
+    -------
+    inputstring : string, contents of the restart input file
+    changes : list of strings describing what was changed
+
+    """
+    lines = inputstring.split('\n')
+    changes = []
+
+    # molecule block: name line, charge and multiplicity, atoms, units
+    start = [i for i, line in enumerate(lines)
+             if line.startswith('molecule ')]
+    if start:
+        first = start[0] + 2
+        last = first
+        while last < len(lines) and len(lines[last].split()) == 4:
+            last += 1
+        if geometry and len(geometry) == last - first:
+            lines[first:last] = [
+                '  %s %10.4f %10.4f  %10.4f' % atom for atom in geometry]
+            changes.append('last geometry')
+        if failure == 'naming':
+            label = lines[start[0]].split()[1]
+            lines[start[0]] = 'molecule %s {' % valid_name(label)
+            changes.append('name %s' % valid_name(label))
+
+    if failure == 'memory':
+        lines = double_memory(lines)
+        changes.append([l for l in lines if l.startswith('memory')][0])
+    for name, value in RESTART_OPTIONS.get(failure, []):
+        lines = set_option(lines, name, value)
+        changes.append('%s %s' % (name, value))
+
+    return '\n'.join(lines), changes
+
+
+def restart_conf(confdir, failure, psiout='output.dat', timeout='timer.dat',
+                 infile='input.dat'):
+    """
+    Keep the files of a failed conformer calculation as [name].failN and
+    write its restart input.
+
+    Returns
+    -------
+    changes : list of strings describing what was changed in the input
+
+    """
+    outf = os.path.join(confdir, psiout)
+    inf = os.path.join(confdir, infile)
+    with open(inf) as f:
+        inputstring = f.read()
+    newinput, changes = restart_input(inputstring, failure,
+                                      last_geometry(outf))
+
+    n = 1
+    while os.path.exists('%s.fail%d' % (inf, n)):
+        n += 1
+    for name in [infile, psiout, timeout]:
+        fname = os.path.join(confdir, name)
+        if os.path.isfile(fname):
+            os.replace(fname, '%s.fail%d' % (fname, n))
+    with open(inf, 'w') as f:
+        f.write(newinput)
+    return changes
+
+
+def triage(maindir, psiout='output.dat', timeout='timer.dat', stale=None,
+           restart=False, classes=None):
+    """
+    Classify the failed calculations of a campaign laid out as
+    maindir/molName/confNumber/psiout, and optionally write restart inputs.
+    Molecules packed by job_archive.py are not checked.
+
+    Parameters
+    ----------
+    maindir : string, main directory of the calculations
+    psiout : string, name of the Psi4 output files
+    timeout : string, name of the Psi4 timer files
+    stale : float, hours after which an unchanged output without completion
+        or error message counts as 'incomplete'
+    restart : Boolean, write restart inputs of failed calculations
+    classes : list of failure classes to restart. None restarts all
+        classes in RESTARTABLE.
+
+    Returns
+    -------
+    failed : ordered dictionary of failed[failure] = list of conformer
+        directories
+
+    """
+    failed = collections.OrderedDict(
+        (c, []) for c in list(FAILURES) + ['unknown', 'incomplete'])
+    now = time.time()
+    print("%-40s %-12s %s" % ('conformer', 'failure', 'restart'))
+    for outf in sorted(glob.glob(os.path.join(maindir, '*', '*', psiout))):
+        failure = classify_output(outf, stale, now)
+        if failure is None:
+            continue
+        confdir = os.path.dirname(outf)
+        failed[failure].append(confdir)
+        action = ''
+        if restart and failure in RESTARTABLE and \
+                (classes is None or failure in classes):
+            changes = restart_conf(confdir, failure, psiout, timeout)
+            action = ', '.join(changes) or 'as before'
+        print("%-40s %-12s %s" % (os.path.relpath(confdir, maindir), failure,
+                                  action))
+
+    print("\nFailed calculations of %s:" % maindir)
+    for failure, confdirs in failed.items():
+        print("  %-12s %d" % (failure, len(confdirs)))
+    if failed['scratch']:
+        print("Set the scratch directory (PSI_SCRATCH or psi4 -s) and check "
+              "its free space before rerunning scratch failures.")
+    return failed
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-d", "--maindir", required=True,
+        help="Main directory with molName/confNumber subdirectories.")
+    parser.add_argument("-o", "--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+    parser.add_argument("-t", "--timeout", default="timer.dat",
+        help="Name of the Psi4 timer files. Default is timer.dat")
+    parser.add_argument("--stale", type=float, default=None,
+        help="Hours after which an unchanged output without completion or "
+             "error message counts as failed.")
+    parser.add_argument("--restart", action="store_true", default=False,
+        help="Keep files of failed calculations as [name].failN and write "
+             "restart inputs.")
+    parser.add_argument("--classes", nargs='+', default=None,
+        choices=RESTARTABLE,
+        help="Failure classes to restart. Default is all of them.")
+
+    args = parser.parse_args()
+    triage(args.maindir, args.psiout, args.timeout, args.stale, args.restart,
+           args.classes)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+warm_start.py
+
+Purpose:    Warm start second-stage QM calculations from the first stage.
+            In the two-stage workflow (-200 --> opt1 --> -220 --> opt2 --> -221),
+            first-stage jobs set up with confs_to_psi(save_wfn=True) write their
+            final orbitals to wfn.npy in each conformer directory. Second-stage
+            inputs from confs_to_psi(warm_start=stage1_dir) copy those orbitals
+            as the SCF guess. Second-stage optimizations start from a guess
+            Hessian as usual, since Psi4 does not write out the final Hessian
+            of the first-stage optimizer, and computing Hessians separately
+            costs more than the optimization steps they could save.
+
+            The first-stage directory of each -220 conformer is found from the
+            'Original omega conformer number' SD tag, which get_psi_results sets
+            to the conformer's directory number when harvesting stage 1.
+
+            The report compares SCF iterations and optimization steps of the
+            same conformers in two harvested campaigns, e.g., a cold and a warm
+            started run of stage 2.
+
+Usage:      python warm_start.py -c cold_stage2_dir -w warm_stage2_dir
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import re
+import glob
+import collections
+
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+
+# Psi4 output files and files written for warm starts
+WFN_FILE = 'wfn.npy'
+GUESS_FILE = 'guess.npy'
+
+# SCF iteration lines, e.g., "   @DF-RHF iter   3:  -230.5175 ...";
+# the "iter SAD:" line of the initial guess is not counted
+SCF_ITER = re.compile(r'^\s*@\S+ iter\s+\d+:')
+
+### ------------------- Functions -------------------
+
+
+def stage1_conf_number(conf):
+    """
+    Get the first-stage directory number of a conformer from its
+    'Original omega conformer number' SD tag, or None if there is no tag.
+    The last number is used if the tag lists more than one.
+    """
+    import openeye.oechem as oechem
+    taglabel = "Original omega conformer number"
+    if not oechem.OEHasSDData(conf, taglabel):
+        return None
+    return int(oechem.OEGetSDData(conf, taglabel).split(',')[-1])
+
+
+def count_output(filename):
+    """
+    Count SCF iterations and optimization steps of a Psi4 output file,
+    which may be stored compressed.
+
+    Returns
+    -------
+    scf_iters : int, number of SCF iterations over all energy calculations
+    opt_steps : int, number of optimization steps; None if not an
+        optimization or it did not converge
+    converged : Boolean, whether the calculation finished
+
+    """
+    scf_iters = 0
+    opt_steps = None
+    converged = False
+    with output_io.open_output(filename) as f:
+        for line in f:
+            if SCF_ITER.match(line):
+                scf_iters += 1
+            elif "Optimization is complete" in line:
+                opt_steps = int(line.strip().split(' ')[5])
+                converged = True
+            elif "Psi4 exiting successfully" in line:
+                converged = True
+    return scf_iters, opt_steps, converged
+
+
+def campaign_counts(maindir, psiout='output.dat'):
+    """
+    Count SCF iterations and optimization steps of every Psi4 output of
+    a campaign directory laid out as maindir/molName/confNumber/psiout.
+
+    Returns
+    -------
+    counts : ordered dictionary of counts[(molName, confNumber)] =
+        (scf_iters, opt_steps), for converged calculations only
+
+    """
+    counts = collections.OrderedDict()
+    for subdir in sorted(glob.glob(os.path.join(maindir, '*', '*', ''))):
+        outf = output_io.find_output(os.path.join(subdir, psiout))
+        if outf is None:
+            continue
+        confdir, conf = os.path.split(os.path.dirname(outf))
+        mol = os.path.basename(confdir)
+        scf_iters, opt_steps, converged = count_output(outf)
+        if converged:
+            counts[(mol, conf)] = (scf_iters, opt_steps)
+    return counts
+
+
+def warm_start_report(cold_dir, warm_dir, psiout='output.dat'):
+    """
+    Compare SCF iterations and optimization steps of conformers that
+    converged in both a cold-started and a warm-started campaign.
+
+    Returns
+    -------
+    totals : dictionary with 'confs' compared, and total 'scf_cold',
+        'scf_warm', 'steps_cold', and 'steps_warm'
+
+    """
+    cold = campaign_counts(cold_dir, psiout)
+    warm = campaign_counts(warm_dir, psiout)
+    common = [k for k in cold if k in warm]
+    totals = {'confs': len(common), 'scf_cold': 0, 'scf_warm': 0,
+              'steps_cold': 0, 'steps_warm': 0}
+    print("%-24s %5s %10s %10s %11s %11s" %
+          ('molecule', 'conf', 'SCF cold', 'SCF warm', 'steps cold',
+           'steps warm'))
+    for mol, conf in common:
+        (scf_c, steps_c), (scf_w, steps_w) = cold[(mol, conf)], warm[(mol, conf)]
+        print("%-24s %5s %10d %10d %11s %11s" %
+              (mol, conf, scf_c, scf_w, steps_c, steps_w))
+        totals['scf_cold'] += scf_c
+        totals['scf_warm'] += scf_w
+        totals['steps_cold'] += steps_c or 0
+        totals['steps_warm'] += steps_w or 0
+
+    def saved(before, after):
+        return 100. * (before - after) / before if before else 0.
+
+    print("\n%d conformers converged in both campaigns." % len(common))
+    print("SCF iterations: %d cold, %d warm (%.1f%% saved)" %
+          (totals['scf_cold'], totals['scf_warm'],
+           saved(totals['scf_cold'], totals['scf_warm'])))
+    print("Optimization steps: %d cold, %d warm (%.1f%% saved)" %
+          (totals['steps_cold'], totals['steps_warm'],
+           saved(totals['steps_cold'], totals['steps_warm'])))
+    return totals
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-c", "--cold", required=True,
+        help="Main directory of cold-started calculations.")
+    parser.add_argument("-w", "--warm", required=True,
+        help="Main directory of warm-started calculations of the same "
+             "molecules and conformers.")
+    parser.add_argument("-o", "--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+
+    args = parser.parse_args()
+    warm_start_report(args.cold, args.warm, args.psiout)
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+"""
+watch_results.py
+
+Purpose:    Harvest Psi4 results while the calculations of a campaign are
+            still running. The campaign directory (maindir/molName/confNumber/)
+            is polled with os.scandir. A conformer is resolved once its output
+            file ends with the Psi4 completion or error message, or its result
+            is in the QM cache (cache.key file); output files that did not
+            change (same mtime and size) since the last poll are not read
+            again. When all conformers of a molecule are resolved,
+            the molecule is processed once with get_psi_results.harvest_mol
+            and added to the current shard.
+
+            Shards are complete SDF files written to [finsdf].watch/ as
+            shard_0001.sdf, shard_0002.sdf, ... when they reach the shard size
+            or when their oldest molecule waited longer than the flush time,
+            so downstream filtering and analysis can start on them. The shards
+            written so far are listed in [finsdf].watch/watch.json, so a
+            restarted watcher continues with the molecules not yet written.
+            When every molecule is written, the shards are merged into finsdf
+            in the order of origsdf, as get_psi_results would write it.
+
+Usage:      python watch_results.py -i maindir/set1-200.sdf -o set1-210.sdf
+            python watch_results.py -i set1-200.sdf -o set1-210.sdf --once
+
+By:         Victoria T. Lim
+
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import collections
+import openeye.oechem as oechem
+
+try:
+    import quanformer.get_psi_results as get_psi_results
+except ModuleNotFoundError:
+    import get_psi_results
+try:
+    import quanformer.output_io as output_io
+except ModuleNotFoundError:
+    import output_io
+try:
+    import quanformer.pipeline_state as pipeline_state
+except ModuleNotFoundError:
+    import pipeline_state
+try:
+    import quanformer.qm_cache as qm_cache
+except ModuleNotFoundError:
+    import qm_cache
+
+STATE_FILE = 'watch.json'
+
+### ------------------- Functions -------------------
+
+
+class ResultsWatcher(object):
+    """
+    Incremental harvester of the Psi4 results of one SDF file.
+    """
+
+    def __init__(self,
+                 origsdf,
+                 finsdf,
+                 calctype='opt',
+                 psiout="output.dat",
+                 timeout="timer.dat",
+                 shard_size=50,
+                 flush=600.,
+                 stale=None):
+        """
+        Parameters
+        ----------
+        origsdf : string, SDF file of input structures of the calculations,
+            located in the main directory of the calculations
+        finsdf : string, name of final SDF file with all results
+        calctype : string; one of 'opt','spe','hess'
+        psiout : string, name of the Psi4 output files
+        timeout : string, name of the Psi4 timer files
+        shard_size : int, number of molecules per shard
+        flush : float, seconds after which a shard is written even if it
+            has fewer molecules than shard_size
+        stale : float, seconds after which an output file that has not
+            changed and has no completion message counts as failed, e.g., of
+            a job killed by the queue. Conformers with an input file but no
+            output file count as failed when the input file is older than
+            this, so it should be longer than jobs wait in the queue.
+            None waits for all jobs indefinitely.
+
+        """
+        self.origsdf = os.path.abspath(origsdf)
+        self.hdir = os.path.dirname(self.origsdf)
+        self.finsdf = os.path.abspath(finsdf)
+        self.calctype = calctype
+        self.psiout = psiout
+        self.timeout = timeout
+        self.shard_size = shard_size
+        self.flush_secs = flush
+        self.stale = stale
+        self.infile = 'input.dat'
+
+        # all molecules with their conformers, in order of input file
+        self.mols = collections.OrderedDict()
+        ifs = oechem.oemolistream()
+        ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+        if not ifs.open(self.origsdf):
+            sys.exit("Unable to open %s for reading" % self.origsdf)
+        for mol in ifs.GetOEMols():
+            self.mols[mol.GetTitle()] = oechem.OEMol(mol)
+        ifs.close()
+
+        # shards written by an earlier run, unless the input changed
+        self.shard_dir = os.path.splitext(self.finsdf)[0] + '.watch'
+        if not os.path.isdir(self.shard_dir):
+            os.makedirs(self.shard_dir)
+        self.state_file = os.path.join(self.shard_dir, STATE_FILE)
+        source_sum = pipeline_state.sha256sum(self.origsdf)
+        self.state = None
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+            if self.state.get('sha256') != source_sum or \
+                    self.state.get('calctype') != calctype:
+                print("Source file or calctype changed since shards of %s "
+                      "were written. Starting over." % self.finsdf)
+                self.state = None
+        if self.state is None:
+            self.state = {'source': self.origsdf, 'sha256': source_sum,
+                          'calctype': calctype, 'theory': {}, 'shards': []}
+        self.written = dict((title, shard['file'])
+                            for shard in self.state['shards']
+                            for title, start, end in shard['mols'])
+        if self.written:
+            print("Resuming %s with %d of %d molecules in %d shards." %
+                  (os.path.basename(self.finsdf), len(self.written),
+                   len(self.mols), len(self.state['shards'])))
+
+        # molecules processed but not yet written to a shard
+        self.pending = []
+        self.pending_since = None
+
+        # resolved conformers by molecule, and ((mtime, size), status) of
+        # output files seen in earlier polls
+        self.resolved = {}
+        self.seen = {}
+        self.cache = qm_cache.from_env()
+
+    def conf_status(self, confdir):
+        """
+        Classify one conformer from its output file, or from its input or
+        QM cache key file if it has no output file.
+
+        Returns
+        -------
+        'done' or 'failed' if resolved, or None if not started or running
+
+        """
+        try:
+            with os.scandir(confdir) as it:
+                entries = dict((e.name, e) for e in it)
+        except FileNotFoundError:
+            return None
+        if self.psiout not in entries:
+            # only outputs of finished calculations are compressed, and
+            # results found in the QM cache have a key file and no output
+            if qm_cache.KEY_FILE in entries or any(
+                    self.psiout + ext in entries
+                    for ext in output_io.COMPRESSED):
+                return 'done'
+            # job that never wrote output, e.g., killed on startup
+            if self.stale is not None and self.infile in entries and \
+                    time.time() - entries[self.infile].stat().st_mtime > \
+                    self.stale:
+                return 'failed'
+            return None
+
+        entry = entries[self.psiout]
+        st = entry.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        last = self.seen.get(entry.path)
+        if last is not None and last[0] == key:
+            status = last[1]
+        else:
+            status = None
+            tail = output_io.read_tail(entry.path)
+            if output_io.PSI4_DONE in tail:
+                status = 'done'
+            elif any(err in tail for err in output_io.PSI4_ERRORS):
+                status = 'failed'
+            self.seen[entry.path] = (key, status)
+        if status is None and self.stale is not None and \
+                time.time() - st.st_mtime > self.stale:
+            status = 'failed'
+        return status
+
+    def mol_resolved(self, title):
+        """
+        Check if all conformers of a molecule are resolved.
+        """
+        moldir = os.path.join(self.hdir, title)
+        if not os.path.isdir(moldir):
+            # molecules packed by job_archive.py have finished
+            return any(
+                os.path.isfile(moldir + ext) for ext in output_io.ARCHIVES)
+        resolved = self.resolved.setdefault(title, set())
+        for j in range(1, self.mols[title].NumConfs() + 1):
+            if j in resolved:
+                continue
+            if self.conf_status(os.path.join(moldir, str(j))) is None:
+                return False
+            resolved.add(j)
+        return True
+
+    def poll(self):
+        """
+        Process each molecule that became resolved since the last poll.
+
+        Returns
+        -------
+        int number of molecules processed
+
+        """
+        pending = set(title for title, data, hess in self.pending)
+        count = 0
+        for title, mol in self.mols.items():
+            if title in self.written or title in pending:
+                continue
+            if not self.mol_resolved(title):
+                continue
+            print("===== %s =====" % title)
+            molbytes, props, hessians = get_psi_results.harvest_mol(
+                mol, self.hdir, self.origsdf, self.calctype, self.psiout,
+                self.timeout, self.cache)
+            for k in ['method', 'basis']:
+                if k in props:
+                    self.state['theory'][k] = props[k]
+            if not self.pending:
+                self.pending_since = time.time()
+            self.pending.append((title, molbytes, hessians))
+            count += 1
+            if len(self.pending) >= self.shard_size:
+                self.flush()
+        if self.pending and \
+                time.time() - self.pending_since >= self.flush_secs:
+            self.flush()
+        return count
+
+    def flush(self):
+        """
+        Write the pending molecules to a new shard and record it.
+        """
+        if not self.pending:
+            return None
+        fname = "shard_%04d.sdf" % (len(self.state['shards']) + 1)
+        offsets = []
+        start = 0
+        for title, molbytes, hessians in self.pending:
+            offsets.append((title, start, start + len(molbytes)))
+            start += len(molbytes)
+        shard = os.path.join(self.shard_dir, fname)
+        pipeline_state.atomic_write(
+            shard, b''.join(molbytes for t, molbytes, h in self.pending))
+        if self.calctype == 'hess':
+            hdict = dict((title, hess) for title, m, hess in self.pending)
+            pipeline_state.atomic_write(
+                os.path.splitext(shard)[0] + '.hess.pickle',
+                pickle.dumps(hdict))
+
+        self.state['shards'].append({'file': fname, 'mols': offsets})
+        pipeline_state.atomic_write(
+            self.state_file, json.dumps(self.state, indent=1).encode())
+        for title, start, end in offsets:
+            self.written[title] = fname
+        print("Wrote %s with %d molecules (%d of %d done)" %
+              (shard, len(offsets), len(self.written), len(self.mols)))
+        self.pending = []
+        self.pending_since = None
+        return shard
+
+    def complete(self):
+        return len(self.written) == len(self.mols)
+
+    def processed(self):
+        """
+        Check if all molecules are written or pending to be written.
+        """
+        return len(self.written) + len(self.pending) == len(self.mols)
+
+    def merge(self):
+        """
+        Write all shards into finsdf in the order of the input file, and the
+        Hessians of all shards into one pickle file for 'hess'.
+
+        Returns
+        -------
+        method : string, QM method of the calculations, or None
+        basisset : string, QM basis set of the calculations, or None
+
+        """
+        where = dict((title, (shard['file'], start, end))
+                     for shard in self.state['shards']
+                     for title, start, end in shard['mols'])
+        handles = {}
+        part = self.finsdf + '.part'
+        with open(part, 'wb') as f:
+            for title in self.mols:
+                fname, start, end = where[title]
+                if fname not in handles:
+                    handles[fname] = open(
+                        os.path.join(self.shard_dir, fname), 'rb')
+                handles[fname].seek(start)
+                f.write(handles[fname].read(end - start))
+            f.flush()
+            os.fsync(f.fileno())
+        for h in handles.values():
+            h.close()
+        os.replace(part, self.finsdf)
+
+        if self.calctype == 'hess':
+            hdict = {}
+            for shard in self.state['shards']:
+                hfile = os.path.join(self.shard_dir, shard['file'])
+                with open(os.path.splitext(hfile)[0] + '.hess.pickle',
+                          'rb') as f:
+                    hdict.update(pickle.load(f))
+            hdict = dict((title, hdict[title]) for title in self.mols)
+            pipeline_state.atomic_write(
+                os.path.splitext(self.finsdf)[0] + '.hess.pickle',
+                pickle.dumps(hdict))
+
+        pipeline_state.update_state(self.finsdf, stage='watch_results',
+                                    source=self.origsdf, status='done',
+                                    finished=time.strftime('%c'),
+                                    sha256=pipeline_state.sha256sum(
+                                        self.finsdf))
+        print("Merged %d shards into %s" % (len(self.state['shards']),
+                                            self.finsdf))
+        theory = self.state['theory']
+        return theory.get('method'), theory.get('basis')
+
+    def close(self):
+        if self.cache is not None:
+            print(self.cache.report())
+            self.cache.close()
+
+
+def watch_results(origsdf,
+                  finsdf,
+                  calctype='opt',
+                  psiout="output.dat",
+                  timeout="timer.dat",
+                  interval=60.,
+                  shard_size=50,
+                  flush=600.,
+                  stale=None,
+                  once=False):
+    """
+    Poll a campaign and harvest results of molecules as they finish, until
+    all molecules are done. See ResultsWatcher for parameters.
+
+    Parameters
+    ----------
+    interval : float, seconds between polls
+    once : Boolean, poll once, write shards of all molecules done so far,
+        and return
+
+    Returns
+    -------
+    method : string, QM method of the calculations
+    basisset : string, QM basis set of the calculations
+    Both are None if returning before all molecules are done, or if the
+    final SDF file already exists.
+
+    """
+    if calctype not in {'opt', 'spe', 'hess'}:
+        sys.exit("Specify a valid calculation type.")
+    if os.path.exists(finsdf):
+        print("File already exists: %s. Skip getting results.\n" % (finsdf))
+        return (None, None)
+
+    watcher = ResultsWatcher(origsdf, finsdf, calctype, psiout, timeout,
+                             shard_size, flush, stale)
+    pipeline_state.update_state(watcher.finsdf, stage='watch_results',
+                                source=watcher.origsdf, status='watching',
+                                started=time.strftime('%c'))
+    try:
+        while True:
+            watcher.poll()
+            if watcher.processed() or once:
+                watcher.flush()
+            if watcher.complete():
+                return watcher.merge()
+            if once:
+                return (None, None)
+            print("%s: %d of %d molecules done, %d pending" %
+                  (time.strftime('%c'), len(watcher.written),
+                   len(watcher.mols), len(watcher.pending)))
+            sys.stdout.flush()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        watcher.flush()
+        print("Stopped watching. Run again to continue.")
+        return (None, None)
+    finally:
+        watcher.close()
+
+
+### ------------------- Parser -------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-i", "--infile", required=True,
+        help="SDF file of input structures of the QM calculations, in the "
+             "main directory of the calculations.")
+    parser.add_argument("-o", "--outfile", required=True,
+        help="Final SDF file of all results.")
+    parser.add_argument("-t", "--calctype", default="opt",
+        help="One of 'opt', 'spe', or 'hess'. Default is 'opt'.")
+    parser.add_argument("--psiout", default="output.dat",
+        help="Name of the Psi4 output files. Default is output.dat")
+    parser.add_argument("--timeout", default="timer.dat",
+        help="Name of the Psi4 timer files. Default is timer.dat")
+    parser.add_argument("--interval", type=float, default=60.,
+        help="Seconds between polls of the campaign. Default is 60.")
+    parser.add_argument("--shard-size", type=int, default=50,
+        help="Number of molecules per shard. Default is 50.")
+    parser.add_argument("--flush", type=float, default=600.,
+        help="Seconds after which a partly full shard is written. "
+             "Default is 600.")
+    parser.add_argument("--stale", type=float, default=None,
+        help="Seconds after which an unchanged output without completion "
+             "message, or an input without output, counts as failed. "
+             "Default waits indefinitely.")
+    parser.add_argument("--once", action="store_true", default=False,
+        help="Poll once, write shards of finished molecules, and exit.")
+
+    args = parser.parse_args()
+    watch_results(args.infile, args.outfile, args.calctype, args.psiout,
+                  args.timeout, args.interval, args.shard_size, args.flush,
+                  args.stale, args.once)
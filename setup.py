@@ -15,6 +15,11 @@ if __name__ == "__main__":
         url="https://github.com/vtlim/off_psi4",
         license='MIT',
         packages=setuptools.find_packages(),
+        entry_points={
+            'console_scripts': [
+                'quanformer = quanformer.cli:main',
+            ],
+        },
         install_requires=[
             'numpy>=1.7',
         ],
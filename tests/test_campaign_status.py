@@ -0,0 +1,108 @@
+"""
+test_campaign_status.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.campaign_status import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from campaign_status import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import shutil
+import pytest
+
+
+def make_campaign(tmpdir):
+    """
+    Copy GBI calculations (all finished) and add a molecule with one
+    failed, one running, and one not started conformer.
+    """
+    maindir = os.path.join(str(tmpdir), 'campaign')
+    shutil.copytree(os.path.join(mydir, 'data_tests', 'GBI'),
+                    os.path.join(maindir, 'GBI'))
+    for conf, text in [('1', 'x\n*** Psi4 encountered an error.\n'),
+                       ('2', 'x\n'), ('3', None)]:
+        confdir = os.path.join(maindir, 'mol2', conf)
+        os.makedirs(confdir)
+        with open(os.path.join(confdir, 'input.dat'), 'w') as f:
+            f.write('x')
+        if text is not None:
+            with open(os.path.join(confdir, 'output.dat'), 'w') as f:
+                f.write(text)
+    return maindir
+
+
+def test_scan(tmpdir):
+    maindir = make_campaign(tmpdir)
+    mols = scan(maindir)
+    counts, totals, walltimes = count_statuses(mols)
+    assert counts['GBI']['done'] == 5
+    assert counts['mol2'] == {'done': 0, 'failed': 1, 'running': 1,
+                              'not_started': 1}
+    assert len(walltimes) == 5
+    assert os.path.isfile(os.path.join(maindir, CACHE_FILE))
+
+    # running output that has not changed for long counts as failed
+    totals = count_statuses(mols, stale=1., now=time.time() + 7200)[1]
+    assert (totals['failed'], totals['running']) == (2, 0)
+
+    # finish the running conformer; others are taken from the cache
+    with open(os.path.join(maindir, 'mol2', '2', 'output.dat'), 'a') as f:
+        f.write('*** Psi4 exiting successfully. Buy a developer a beer!\n')
+    totals = count_statuses(scan(maindir))[1]
+    assert totals == {'done': 6, 'failed': 1, 'running': 0,
+                      'not_started': 1}
+
+
+def test_status_report(tmpdir, capsys):
+    maindir = make_campaign(tmpdir)
+    totals, eta = status_report(maindir, listing='failed')
+    out = capsys.readouterr()[0]
+    assert 'TOTAL (2 molecules)' in out
+    assert os.path.join(maindir, 'mol2', '1') in out
+    assert eta == pytest.approx(
+        (sum(count_statuses(scan(maindir))[2]) / 5. * 1.5) / 3600.)
+
+
+def test_scan_archive(tmpdir):
+    try:
+        import quanformer.job_archive as job_archive
+    except ModuleNotFoundError:
+        import job_archive
+    maindir = make_campaign(tmpdir)
+    job_archive.pack(maindir, 'tar')
+    assert os.path.isfile(os.path.join(maindir, 'GBI.tar'))
+    counts, totals, walltimes = count_statuses(scan(maindir))
+    assert counts['GBI']['done'] == 5
+    assert len(walltimes) == 5
+
+
+
+def test_scan_archive_compacted(tmpdir):
+    # wall times are read from compressed timer files in the archive
+    try:
+        import quanformer.job_archive as job_archive
+        import quanformer.output_io as output_io
+    except ModuleNotFoundError:
+        import job_archive
+        import output_io
+    maindir = make_campaign(tmpdir)
+    output_io.compact(maindir, 'gz')
+    job_archive.pack(maindir, 'tar')
+    confs = scan_archive(os.path.join(maindir, 'GBI.tar'))
+    assert len(confs) == 5
+    assert all(c[3] is not None for c in confs.values())
+    counts, totals, walltimes = count_statuses(scan(maindir))
+    assert counts['GBI']['done'] == 5
+    assert len(walltimes) == 5
+
+# test manually without pytest
+if 0:
+    test_scan()
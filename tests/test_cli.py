@@ -0,0 +1,109 @@
+"""
+test_cli.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.cli import *
+    import quanformer.cli as cli
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from cli import *
+    import cli
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import sys
+import subprocess
+import pytest
+
+# modules that must not be imported just to start up or show help
+HEAVY = ('openeye', 'matplotlib', 'scipy', 'numpy')
+
+# budget in microseconds for cumulative import time of the entry point,
+# generous enough for slow CI machines
+BUDGET_US = 250000
+
+
+def importtime(*args):
+    """
+    Run the entry point with python -X importtime and parse the report.
+    Returns dictionary of module name to cumulative import time in us.
+    Names keep their indentation, which shows the nesting of imports.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', cli.__file__] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    assert proc.returncode == 0
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        times[fields[2][1:].rstrip()] = int(fields[1])
+    return times
+
+
+def test_parser_no_heavy_imports():
+    before = set(sys.modules)
+    parser = build_parser()
+    args = parser.parse_args(['shard', '-f', 'set1-200.sdf', '-n', '4'])
+    assert args.func is run_shard
+    new = set(sys.modules) - before
+    assert not [m for m in new if m.split('.')[0] in HEAVY]
+
+
+def test_pipeline_args_shared():
+    # setup and results subcommands have the same options as executor.py
+    import argparse
+    import pipeline_args
+    parser = argparse.ArgumentParser()
+    pipeline_args.add_pipeline_args(parser)
+    expected = vars(parser.parse_args(['-f', 'set1-200.sdf']))
+    for command in ['setup', 'results']:
+        args = vars(build_parser().parse_args([command, '-f', 'set1-200.sdf']))
+        assert {k: args[k] for k in expected} == expected
+
+
+def test_watch_args():
+    args = build_parser().parse_args(
+        ['results', '-f', 'set1-200.sdf', '--watch', '--stale', '7200',
+         '--shard-size', '10', '--flush', '300'])
+    assert (args.stale, args.shard_size, args.flush) == (7200., 10, 300.)
+
+
+@pytest.mark.parametrize("command", [[], ['setup'], ['results'], ['merge'],
+                                     ['match'], ['matchplot'], ['stitch'],
+                                     ['plottimes']])
+def test_help_importtime(command):
+    times = importtime(*(command + ['--help']))
+    heavy = [m for m in times if m.strip().split('.')[0] in HEAVY]
+    assert heavy == []
+    # top-level modules are not indented in the importtime report
+    total = sum(t for m, t in times.items() if not m.startswith(' '))
+    assert total < BUDGET_US
+
+
+@pytest.mark.parametrize("module", ['match_minima', 'match_plot',
+                                    'stitch_spe', 'plotTimes'])
+def test_analysis_module_imports(module):
+    # analysis scripts import OEChem and matplotlib only where used
+    code = ("import sys; sys.path.insert(0, %r); import %s; "
+            "print(' '.join(sys.modules))" %
+            (os.path.dirname(cli.__file__), module))
+    proc = subprocess.run([sys.executable, '-c', code],
+                          stdout=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0
+    loaded = proc.stdout.split()
+    assert not [m for m in loaded if m.split('.')[0] in
+                ('openeye', 'matplotlib')]
+
+
+# test manually without pytest
+if 0:
+    test_help_importtime(['results'])
@@ -56,6 +56,18 @@ def test_make_dfmp2_svpp():
     return
 
 
+def test_make_warm_start():
+    mol = read_mol(os.path.join(mydir, 'data_tests', 'methane_c2p.sdf'))
+    test_string = make_psi_input(mol, mol.GetTitle(), 'mp2', 'def2-sv(p)',
+                                 save_wfn=True, guess_file='guess.npy')
+    assert "set guess read" in test_string
+    assert "set guess sad" not in test_string
+    assert "optking" not in test_string
+    assert "E, wfn = optimize('mp2', restart_file='guess.npy', " \
+           "return_wfn=True)" in test_string
+    assert "wfn.to_file('wfn')" in test_string
+
+
 def test_confs_to_psi():
     confs_to_psi(
         os.path.join(mydir, 'data_tests', 'methane_c2p.sdf'), 'mp2',
@@ -79,6 +91,40 @@ def test_confs_to_psi_json():
     return
 
 
+def test_confs_to_psi_warm_cached(tmpdir, monkeypatch):
+    # stage-1 orbitals of methane conformer 1
+    mol = read_mol(os.path.join(mydir, 'data_tests', 'methane_c2p.sdf'))
+    oechem.OESetSDData(mol, 'Original omega conformer number', '1')
+    insdf = os.path.join(str(tmpdir), 'methane-220.sdf')
+    ofs = oechem.oemolostream(insdf)
+    oechem.OEWriteConstMolecule(ofs, mol)
+    ofs.close()
+    stage1 = os.path.join(str(tmpdir), 'stage1')
+    os.makedirs(os.path.join(stage1, 'methane', '1'))
+    with open(os.path.join(stage1, 'methane', '1', 'wfn.npy'), 'wb') as f:
+        f.write(b'orbitals')
+
+    # guess is copied when the calculation is to be run
+    monkeypatch.chdir(str(tmpdir))
+    confs_to_psi(insdf, 'mp2', 'def2-sv(p)', warm_start_dir=stage1)
+    confdir = os.path.join(str(tmpdir), 'methane', '1')
+    assert os.path.isfile(os.path.join(confdir, 'guess.npy'))
+
+    # but not when its result is in the QM cache
+    store = os.path.join(str(tmpdir), 'store')
+    cache = qm_cache.QMCache(store)
+    with open(os.path.join(confdir, 'input.dat')) as f:
+        key = cache.key(f.read())
+    with open(os.path.join(confdir, 'output.dat'), 'w') as f:
+        f.write("*** Psi4 exiting successfully. Buy a developer a beer!\n")
+    cache.put(key, os.path.join(confdir, 'output.dat'), 'timer.dat')
+    cache.close()
+    shutil.rmtree(os.path.join(str(tmpdir), 'methane'))
+    monkeypatch.setenv(qm_cache.ENV_VAR, store)
+    confs_to_psi(insdf, 'mp2', 'def2-sv(p)', warm_start_dir=stage1)
+    assert os.listdir(confdir) == [qm_cache.KEY_FILE]
+
+
 # test manually without pytest
 if 0:
     test_confs_to_psi()
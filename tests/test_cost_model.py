@@ -0,0 +1,80 @@
+"""
+test_cost_model.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.cost_model import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from cost_model import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+
+def synthetic_runs(nmols=30, seed=0):
+    """
+    Runs of molecules whose runtime scales as nbf^3 with 10% noise.
+    """
+    rng = np.random.RandomState(seed)
+    runs = []
+    for i in range(nmols):
+        heavy = rng.randint(5, 30)
+        atomic_nums = [6] * heavy + [1] * (heavy + 2)
+        desc = descriptors(atomic_nums, 0, rng.randint(0, 8), 'def2-SV(P)')
+        for j in range(3):
+            run = {'title': 'mol%d' % i, 'method': 'mp2', 'basis': 'def2-SV(P)',
+                   'calctype': 'opt', 'steps': 10., 'source': 'set1-210.sdf',
+                   'runtime': 1e-4 * desc['nbf']**3 * rng.lognormal(0, 0.1)}
+            run.update(desc)
+            runs.append(run)
+    return runs
+
+
+def test_basis_functions():
+    # methane: C + 4 H
+    assert basis_functions([6, 1, 1, 1, 1], 'def2-SVP') == 14 + 4 * 5
+    assert basis_functions([6, 1, 1, 1, 1], 'def2-SV(P)') == 14 + 4 * 2
+    # unknown triple zeta basis estimated from its name
+    assert basis_functions([8], 'my-tzvp') == 30
+
+
+def test_fit_predict():
+    runs = synthetic_runs()
+    model = fit(runs)
+    assert model['n'] == len(runs)
+    assert model['sigma'] < 0.2
+    desc = descriptors([6] * 10 + [1] * 12, 0, 3, 'def2-SV(P)')
+    expected = 1e-4 * desc['nbf']**3
+    assert abs(predict(model, desc) / expected - 1) < 0.2
+    assert fit(runs[:MIN_RUNS - 1]) is None
+
+
+def test_history(tmpdir):
+    dbfile = os.path.join(str(tmpdir), 'history.sqlite')
+    db = open_history(dbfile)
+    runs = synthetic_runs()
+    assert add_records(db, runs) == len(runs)
+    # same runs from another file are not added again
+    assert add_records(db, runs) == 0
+    assert len(load_runs(db, 'MP2', 'def2-sv(p)', 'opt')) == len(runs)
+    assert load_runs(db, 'mp2', 'def2-SV(P)', 'spe') == []
+    # fall back to model of any basis set of the method
+    model = get_model(db, 'mp2', 'def2-TZVP', 'opt')
+    assert model['scope'] == 'mp2/any basis opt'
+    db.close()
+
+    results = accuracy_report(dbfile)
+    res = results[('mp2', 'def2-SV(P)', 'opt')]
+    assert res['n'] == len(runs)
+    assert res['median_ape'] < 20.
+    assert 0.8 < res['total_ratio'] < 1.2
+
+
+# test manually without pytest
+if 0:
+    test_history()
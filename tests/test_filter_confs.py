@@ -28,6 +28,86 @@ def test_identify_minima():
     assert mol.NumConfs() == 5
 
 
+def test_identify_minima_torsions():
+    mols = read_mol(os.path.join(mydir, 'data_tests', 'gbi.sdf'), True)
+    mol = next(mols)
+    stats = {}
+    assert identify_minima(mol, 'MM Szybki SD Energy', 5.E-4, 0.2, 90.,
+                           stats) is True
+    # same result as without prescreen but with fewer RMSD calculations
+    assert mol.NumConfs() == 5
+    assert stats['rmsd_avoided'] > 0
+    mols = read_mol(os.path.join(mydir, 'data_tests', 'gbi.sdf'), True)
+    mol = next(mols)
+    nostats = {}
+    identify_minima(mol, 'MM Szybki SD Energy', 5.E-4, 0.2, None, nostats)
+    assert nostats['rmsd_avoided'] == 0
+    assert nostats['rmsd'] == stats['rmsd'] + stats['rmsd_avoided']
+
+
+def test_identify_minima_torsions_same_confs():
+    # prescreen keeps exactly the conformers that RMSD alone keeps
+    kept = []
+    for thres in [90., None]:
+        mols = read_mol(os.path.join(mydir, 'data_tests', 'gbi.sdf'), True)
+        mol = next(mols)
+        identify_minima(mol, 'MM Szybki SD Energy', 5.E-4, 0.2, thres)
+        kept.append([(conf.GetIdx(), oechem.OEGetSDData(
+            conf, 'MM Szybki SD Energy')) for conf in mol.GetConfs()])
+    assert kept[0] == kept[1]
+
+
+def test_torsions_differ():
+    deg = math.pi / 180.
+    # periodic: 175 and -175 degrees differ by 10 degrees
+    assert not torsions_differ([175 * deg], [-175 * deg], 90 * deg)
+    assert torsions_differ([60 * deg, 0.], [-60 * deg, 0.], 90 * deg)
+    assert not torsions_differ([], [], 90 * deg)
+
+
+def test_condensed_row():
+    # four points on a line at 0, 1, 3, 6
+    x = [0., 1., 3., 6.]
+    dists = np.array([abs(x[i] - x[j]) for i in range(4)
+                      for j in range(i + 1, 4)])
+    assert list(condensed_row(dists, 4, 2)) == [3., 2., 0., 3.]
+    assert dists[condensed_index(4, 1, 3)] == 5.
+
+
+def test_butina():
+    x = [0., 0.1, 0.2, 5., 5.1]
+    dists = np.array([abs(x[i] - x[j]) for i in range(5)
+                      for j in range(i + 1, 5)])
+    clusters = butina(dists, 5, 0.5, [0., -1., 0., 0., 0.])
+    assert sorted(sorted(c) for c in clusters) == [[0, 1, 2], [3, 4]]
+
+
+def test_allocate_budget():
+    ranked = {'a': [(-1.0, 0), (-0.9, 3)], 'b': [(-2.0, 1), (-1.99, 2)]}
+    # lowest of each molecule first, then lower relative energy
+    assert allocate_budget(ranked, 3) == {'a': {0}, 'b': {1, 2}}
+    assert allocate_budget(ranked, None) == {'a': {0, 3}, 'b': {1, 2}}
+
+
+def test_cluster_minima():
+    mols = read_mol(os.path.join(mydir, 'data_tests', 'gbi.sdf'), True)
+    mol = next(mols)
+    reps = cluster_minima(mol, 'MM Szybki SD Energy', 0.5, maxconfs=3)
+    assert len(reps) == 3
+    assert [e for e, idx in reps] == sorted(e for e, idx in reps)
+
+
+def test_filter_confs_budget():
+    filter_confs(
+        os.path.join(mydir, 'data_tests', 'gbi.sdf'), 'MM Szybki SD Energy',
+        'output.sdf', maxconfs=4, budget=2)
+    mols = read_mol(os.path.join(os.getcwd(), 'output.sdf'), True)
+    mol = next(mols)
+    assert mol.NumConfs() == 2
+    os.remove(os.path.join(os.getcwd(), 'output.sdf'))
+    os.remove(os.path.join(os.getcwd(), 'numConfs.txt'))
+
+
 def test_filter_confs():
     filter_confs(
         os.path.join(mydir, 'data_tests', 'gbi.sdf'), 'MM Szybki SD Energy',
@@ -42,4 +122,8 @@ def test_filter_confs():
 # test manually without pytest
 if 0:
     test_identify_minima()
+    test_identify_minima_torsions()
+    test_torsions_differ()
+    test_cluster_minima()
+    test_filter_confs_budget()
     test_filter_confs()
@@ -90,6 +90,21 @@ def test_process_psi_out_opt():
     assert len(opt_dict['coords']) == 69
 
 
+def test_process_psi_out_compressed(tmpdir):
+    import gzip
+    import shutil
+    fname = os.path.join(str(tmpdir), 'output.dat')
+    with open(os.path.join(mydir, 'data_tests', 'output_opt.dat'), 'rb') as fin:
+        with gzip.open(fname + '.gz', 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+    # compressed file is read given the uncompressed name
+    opt_dict = process_psi_out(fname, {}, 'opt')
+    assert opt_dict['numSteps'] == '8'
+    assert opt_dict['finalEnergy'] == pytest.approx(-582.1568394053036,
+                                                    0.000000000001)
+    assert len(opt_dict['coords']) == 69
+
+
 def test_process_psi_out_two():
     # TODO what happens if passed in psi4 output with opt-->hess, or opt-->spe
     pass
@@ -163,6 +178,27 @@ def test_get_psi_results_hess():
     os.remove(hpickle)
 
 
+def test_get_psi_results_hess_cache(tmpdir, monkeypatch):
+    # finished Hessian calculations are added to the QM cache
+    import shutil
+    try:
+        import quanformer.qm_cache as qm_cache
+    except ModuleNotFoundError:
+        import qm_cache
+    for name in ['s1', 't1']:
+        shutil.copytree(os.path.join(mydir, 'data_tests', name),
+                        os.path.join(str(tmpdir), name))
+    infile = os.path.join(str(tmpdir), 'carbon-222.sdf')
+    shutil.copy(os.path.join(mydir, 'data_tests', 'carbon-222.sdf'), infile)
+    store = os.path.join(str(tmpdir), 'store')
+    monkeypatch.setenv(qm_cache.ENV_VAR, store)
+    monkeypatch.chdir(str(tmpdir))
+    get_psi_results(infile, 'carbon_hess-222.sdf', 'hess')
+    cache = qm_cache.QMCache(store)
+    assert cache.stats()['results'] == 2
+    cache.close()
+
+
 def test_get_psi_results_opt():
     infile = os.path.join(mydir, 'data_tests', 'gbi-200.sdf')
     outfile = os.path.join(mydir, 'data_tests', 'gbi-210.sdf')
@@ -0,0 +1,72 @@
+"""
+test_instrument.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.instrument import *
+    import quanformer.instrument as instrument
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from instrument import *
+    import instrument
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import pytest
+
+
+@timed('example')
+def example(fname, n):
+    for i in range(n):
+        count('items')
+    return n
+
+
+def test_disabled(tmpdir):
+    disable()
+    assert example('a.sdf', 3) == 3
+    assert report_file() is None
+
+
+def test_stage_records(tmpdir):
+    report = os.path.join(str(tmpdir), 'stages.jsonl')
+    enable(report)
+    try:
+        with stage('outer', tag='x'):
+            example('a.sdf', 3)
+            count('mols', 2)
+    finally:
+        disable()
+    records = read_report(report)
+    assert [r['stage'] for r in records] == ['example', 'outer']
+    inner, outer = records
+    assert inner['items'] == {'items': 3}
+    assert inner['input'] == 'a.sdf'
+    assert inner['parent'] == 'outer'
+    assert outer['items'] == {'mols': 2}
+    assert outer['tag'] == 'x'
+    assert outer['wall_sec'] >= inner['wall_sec']
+    for key in ['cpu_sec', 'peak_rss_mb', 'pid', 'start']:
+        assert key in outer
+
+
+def test_stage_failure(tmpdir):
+    report = os.path.join(str(tmpdir), 'stages.jsonl')
+    enable(report)
+    try:
+        with pytest.raises(ValueError):
+            with stage('bad'):
+                raise ValueError
+    finally:
+        disable()
+    assert read_report(report)[0]['ok'] is False
+
+
+# test manually without pytest
+if 0:
+    test_stage_records()
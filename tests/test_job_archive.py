@@ -0,0 +1,79 @@
+"""
+test_job_archive.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.job_archive import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from job_archive import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import shutil
+import pytest
+
+
+def make_campaign(tmpdir):
+    """
+    Copy the test opt output into two conformers of molecule 'done' and
+    one unfinished conformer of molecule 'running'.
+    """
+    maindir = os.path.join(str(tmpdir), 'campaign')
+    text = open(os.path.join(mydir, 'data_tests', 'output_opt.dat')).read()
+    for mol, conf, out in [('done', '1', text), ('done', '2', text),
+                           ('running', '1', text.split('Psi4 exiting')[0])]:
+        os.makedirs(os.path.join(maindir, mol, conf))
+        with open(os.path.join(maindir, mol, conf, 'output.dat'), 'w') as f:
+            f.write(out)
+        shutil.copyfile(os.path.join(mydir, 'data_tests', 'timer.dat'),
+                        os.path.join(maindir, mol, conf, 'timer.dat'))
+    return maindir, text
+
+
+@pytest.mark.parametrize('fmt', ['tar', 'zip'])
+def test_pack_read_unpack(tmpdir, fmt):
+    maindir, text = make_campaign(tmpdir)
+    output_io.compact(maindir, 'gz')
+    counts = pack(maindir, fmt)
+    assert (counts['mols'], counts['files'], counts['skipped']) == (1, 4, 1)
+    assert os.path.isfile(os.path.join(maindir, 'done.' + fmt))
+    assert not os.path.exists(os.path.join(maindir, 'done'))
+    assert os.path.isdir(os.path.join(maindir, 'running'))
+
+    # outputs are read from the archive by their usual names
+    outf = os.path.join(maindir, 'done', '2', 'output.dat')
+    stored = output_io.find_output(outf)
+    assert stored == os.path.join(maindir, 'done.' + fmt, 'done', '2',
+                                  'output.dat.gz')
+    assert output_io.find_output(stored) == stored
+    with output_io.open_output(outf) as f:
+        assert f.read() == text
+    assert output_io.find_output(
+        os.path.join(maindir, 'done', '3', 'output.dat')) is None
+
+    assert unpack(maindir) == 1
+    assert not os.path.exists(os.path.join(maindir, 'done.' + fmt))
+    assert output_io.find_output(outf) == outf + '.gz'
+
+
+def test_open_uncompressed_member(tmpdir):
+    maindir, text = make_campaign(tmpdir)
+    pack(maindir, 'tar', force=True)
+    outf = os.path.join(maindir, 'running', '1', 'output.dat')
+    with output_io.open_output(outf) as f:
+        assert 'Psi4 exiting' not in f.read()
+    with output_io.open_output(
+            os.path.join(maindir, 'done', '1', 'timer.dat'), 'rb') as f:
+        assert b'Wall Time' in f.read()
+    output_io.close_archive()
+
+
+# test manually without pytest
+if 0:
+    test_open_uncompressed_member()
@@ -0,0 +1,90 @@
+"""
+test_loadFromXYZ.py
+"""
+# tools are scripts, not part of the package
+import os
+import sys
+mydir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(mydir), 'tools'))
+from loadFromXYZ import *
+
+# -----------------------
+
+import pytest
+from helper import *
+
+METHANE = [('C', 0., 0., 0.), ('H', 0., 1.09, 0.), ('H', 1.03, -0.36, 0.),
+           ('H', -0.51, -0.36, 0.89), ('H', -0.51, -0.36, -0.89)]
+
+
+def write_xyz(tmpdir, name, frames, sep='', extra=''):
+    """
+    Write methane frames shifted by the frame number along x. sep is added
+    between frames and extra after the coordinates of each atom.
+    """
+    fname = os.path.join(str(tmpdir), name)
+    with open(fname, 'w') as f:
+        for k in range(frames):
+            f.write("%d\nframe %d\n" % (len(METHANE), k + 1))
+            for sym, x, y, z in METHANE:
+                f.write("%s %.4f %.4f %.4f%s\n" % (sym, x + k, y, z, extra))
+            f.write(sep)
+    return fname
+
+
+def test_read_xyz_frames(tmpdir):
+    fname = write_xyz(tmpdir, 'fixed.xyz', 3, extra=' 0.1 -0.2')
+    coords, comments, elements = read_xyz_frames(fname)
+    assert coords.shape == (3, 5, 3)
+    assert comments == ['frame 1', 'frame 2', 'frame 3']
+    assert elements == ['C', 'H', 'H', 'H', 'H']
+    assert coords[2, 1, 0] == pytest.approx(2.)
+    assert coords[2, 1, 1] == pytest.approx(1.09)
+
+    # blank lines between frames are read frame by frame, same result
+    fname = write_xyz(tmpdir, 'blank.xyz', 3, sep='\n')
+    coords2, comments2, elements2 = read_xyz_frames(fname)
+    assert np.allclose(coords2, coords)
+    assert (comments2, elements2) == (comments, elements)
+
+
+def test_read_xyz_frames_bad(tmpdir):
+    # second frame has other atoms
+    fname = os.path.join(str(tmpdir), 'bad.xyz')
+    with open(fname, 'w') as f:
+        f.write("2\none\nO 0 0 0\nH 0.96 0 0\n"
+                "2\ntwo\nO 0 0 0\nC 1.2 0 0\n")
+    with pytest.raises(ValueError, match='different atoms'):
+        read_xyz_frames(fname)
+    # missing coordinate
+    with open(fname, 'w') as f:
+        f.write("2\none\nO 0 0 0\nH 0.96 0\n")
+    with pytest.raises(ValueError, match='Bad atom line'):
+        read_xyz_frames(fname)
+
+
+def test_bulk_load(tmpdir):
+    template = os.path.join(mydir, 'data_tests', 'methane_c2p.sdf')
+    outfile = os.path.join(str(tmpdir), 'methane.sdf')
+    xyzfiles = [write_xyz(tmpdir, 'a.xyz', 2), write_xyz(tmpdir, 'b.xyz', 1)]
+    assert bulk_load(template, xyzfiles, outfile) == 3
+    mol = next(read_mol(outfile, True))
+    assert mol.GetTitle() == 'methane'
+    assert [oechem.OEGetSDData(conf, 'XYZ comment') for conf in
+            mol.GetConfs()] == ['frame 1', 'frame 2', 'frame 1']
+
+
+def test_bulk_load_none(tmpdir):
+    # nothing is written if all XYZ files are skipped
+    template = os.path.join(mydir, 'data_tests', 'methane_c2p.sdf')
+    outfile = os.path.join(str(tmpdir), 'methane.sdf')
+    fname = os.path.join(str(tmpdir), 'water.xyz')
+    with open(fname, 'w') as f:
+        f.write("3\nwater\nO 0 0 0\nH 0.96 0 0\nH -0.24 0.93 0\n")
+    assert bulk_load(template, [fname], outfile) == 0
+    assert not os.path.exists(outfile)
+
+
+# test manually without pytest
+if 0:
+    test_read_xyz_frames()
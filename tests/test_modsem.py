@@ -0,0 +1,144 @@
+"""
+test_modsem.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.modsem import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from modsem import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import pytest
+
+
+def read_water():
+    data = np.loadtxt(os.path.join(mydir, 'data_tests', 'water_hess.dat'))
+    coords = data[0].reshape(-1, 3)
+    hessian = data[1:]
+    return coords, hessian
+
+
+def test_topology():
+    top = Topology(4, [[0, 1], [0, 2], [0, 3]], [[1, 0, 2], [1, 0, 3],
+                                                 [2, 0, 3]])
+    assert top.arms.shape == (6, 2)
+    # each arm shares its bond with exactly one other arm
+    assert len(top.pair_i) == 6
+    for i, j in zip(top.pair_i, top.pair_j):
+        assert top.arms[i][0] == top.arms[j][0]
+
+
+def test_modsem_diatomic():
+    # pure bond stretch recovers half the harmonic force constant
+    coords = np.array([[0., 0., 0.], [1.1, 0., 0.]])
+    k = 0.4
+    uu = np.zeros((3, 3))
+    uu[0, 0] = 1.
+    hessian = np.block([[k * uu, -k * uu], [-k * uu, k * uu]])
+    res = modsem_conformer(coords, hessian, Topology(2, [[0, 1]], []))
+    assert res['bond_lengths'][0] == pytest.approx(1.1)
+    assert res['k_bonds'][0] == pytest.approx(hbb_to_kaa(k) / 2.)
+    assert len(res['k_angles']) == 0
+
+
+# harmonic valence model of water_hess.dat: E = 1/2 K_BOND sum (r - r0)^2
+# + 1/2 K_ANGLE (theta - theta0)^2 in Hartree, bohr, and radians
+K_BOND = 0.50
+K_ANGLE = 0.16
+R0 = 0.96  # Angstrom
+THETA0 = np.radians(104.5)
+BOHR = 0.529177
+
+
+def model_water_hessian(coords):
+    """
+    Hessian (Hartree/Bohr^2) of the harmonic model from the Wilson B vectors
+    of the two bonds and the angle, for water with O at the origin.
+    """
+    xyz = coords / BOHR
+    hess = np.zeros((9, 9))
+    grad_angle = np.zeros(9)
+    for h in [1, 2]:
+        r = np.linalg.norm(xyz[h])
+        u = xyz[h] / r
+        b = np.zeros(9)
+        b[3 * h:3 * h + 3] = u
+        b[0:3] = -u
+        hess += K_BOND * np.outer(b, b)
+        # d(theta)/d(x_h): in plane, perpendicular to bond h, away from
+        # the other hydrogen
+        other = xyz[3 - h] / np.linalg.norm(xyz[3 - h])
+        perp = other - np.dot(other, u) * u
+        grad_angle[3 * h:3 * h + 3] = -perp / np.linalg.norm(perp) / r
+    grad_angle[0:3] = -grad_angle[3:6] - grad_angle[6:9]
+    hess += K_ANGLE * np.outer(grad_angle, grad_angle)
+    return hess
+
+
+def test_water_fixture():
+    coords, hessian = read_water()
+    assert np.allclose(hessian, model_water_hessian(coords), atol=1.e-10)
+
+
+def test_modsem_water():
+    coords, hessian = read_water()
+    top = Topology(3, [[0, 1], [0, 2]], [[1, 0, 2]])
+    res = modsem_conformer(coords, hessian, top)
+    assert res['bond_lengths'] == pytest.approx([R0, R0])
+    assert res['angles'][0] == pytest.approx(104.5)
+
+    # For H1 on the x axis, the O-H1 sub-block of the model Hessian is
+    # upper triangular in the molecular plane:
+    #   [[-K_BOND, -s], [0, -c]]
+    # with c = K_ANGLE (1 - cos theta0) / r^2 and s = K_ANGLE sin theta0 / r^2
+    # from the angle term. Its eigenvectors are not along the bond, so the
+    # Seminario projections differ from the model constants:
+    #   k_AB = K_BOND + c s / d,  k_BA = K_BOND (K_BOND - c) / d
+    #   with d = sqrt(s^2 + (K_BOND - c)^2)
+    # and the H1-O sub-block projected on the in-plane perpendicular gives
+    #   k_perp = c + K_BOND s / d
+    r_bohr = R0 / BOHR
+    c = K_ANGLE * (1. - np.cos(THETA0)) / r_bohr**2
+    s = K_ANGLE * np.sin(THETA0) / r_bohr**2
+    d = np.sqrt(s**2 + (K_BOND - c)**2)
+    k_ab = K_BOND + c * s / d
+    k_ba = K_BOND * (K_BOND - c) / d
+
+    # bonds average both directions, halved for E = k (r - r0)^2:
+    # 562.2537 kcal/mol/A^2, vs. 560.22 of K_BOND alone
+    k_bond = hbb_to_kaa(0.5 * (k_ab + k_ba)) / 2.
+    assert k_bond == pytest.approx(562.253696, 1.e-8)
+    assert res['k_bonds'] == pytest.approx([k_bond, k_bond], 1.e-10)
+
+    # both arms are equal, so the series sum is r^2 k_perp / 2, halved:
+    # 58.8917 kcal/mol/rad^2
+    k_angle = hbb_to_kaa(c + K_BOND * s / d) * R0**2 / 4.
+    assert k_angle == pytest.approx(58.891723, 1.e-7)
+    assert res['k_angles'][0] == pytest.approx(k_angle, 1.e-10)
+
+
+def test_modsem_scaling():
+    coords, hessian = read_water()
+    top = Topology(3, [[0, 1], [0, 2]], [[1, 0, 2]])
+    res1 = modsem_conformer(coords, hessian, top)
+    res2 = modsem_conformer(coords, hessian, top, vib_scaling=0.957)
+    assert res2['k_bonds'] == pytest.approx(res1['k_bonds'] * 0.957**2)
+
+
+def test_modsem_bad_shape():
+    coords, hessian = read_water()
+    top = Topology(3, [[0, 1], [0, 2]], [[1, 0, 2]])
+    with pytest.raises(ValueError):
+        modsem_conformer(coords[:2], hessian, top)
+
+
+# test manually without pytest
+if 0:
+    test_modsem_water()
@@ -0,0 +1,97 @@
+"""
+test_output_io.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.output_io import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from output_io import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import shutil
+import pytest
+
+
+def make_campaign(tmpdir):
+    """
+    Copy the test opt output into two conformers, one of them unfinished.
+    """
+    maindir = os.path.join(str(tmpdir), 'campaign')
+    text = open(os.path.join(mydir, 'data_tests', 'output_opt.dat')).read()
+    for conf, out in [('1', text), ('2', text.split('Psi4 exiting')[0])]:
+        os.makedirs(os.path.join(maindir, 'mol', conf))
+        with open(os.path.join(maindir, 'mol', conf, 'output.dat'), 'w') as f:
+            f.write(out)
+        shutil.copyfile(os.path.join(mydir, 'data_tests', 'timer.dat'),
+                        os.path.join(maindir, 'mol', conf, 'timer.dat'))
+    return maindir, text
+
+
+@pytest.mark.parametrize('fmt', ['gz', 'xz'])
+def test_compress_file(tmpdir, fmt):
+    fname = os.path.join(str(tmpdir), 'output.dat')
+    with open(fname, 'w') as f:
+        f.write('line\n' * 1000)
+    before, after = compress_file(fname, fmt)
+    assert before == 5000 and after < before
+    assert not os.path.exists(fname)
+    assert find_output(fname) == fname + '.' + fmt
+    with open_output(fname) as f:
+        assert f.read() == 'line\n' * 1000
+    assert decompress_file(fname + '.' + fmt) == fname
+    assert find_output(fname) == fname
+
+
+def test_find_output_missing(tmpdir):
+    fname = os.path.join(str(tmpdir), 'output.dat')
+    assert find_output(fname) is None
+    with pytest.raises(FileNotFoundError):
+        open_output(fname)
+
+
+def test_compact(tmpdir):
+    maindir, text = make_campaign(tmpdir)
+    counts = compact(maindir, 'gz')
+    # output and timer of finished conformer only
+    assert counts['files'] == 2
+    assert counts['skipped'] == 1
+    assert counts['after'] < counts['before']
+    assert os.path.isfile(os.path.join(maindir, 'mol', '1', 'output.dat.gz'))
+    assert os.path.isfile(os.path.join(maindir, 'mol', '1', 'timer.dat.gz'))
+    assert os.path.isfile(os.path.join(maindir, 'mol', '2', 'output.dat'))
+    with open_output(os.path.join(maindir, 'mol', '1', 'output.dat')) as f:
+        assert f.read() == text
+    assert expand(maindir) == 2
+    assert os.path.isfile(os.path.join(maindir, 'mol', '1', 'output.dat'))
+
+
+
+def test_find_output_archive_compressed(tmpdir):
+    # names in archive form also match compressed members
+    try:
+        import quanformer.job_archive as job_archive
+    except ModuleNotFoundError:
+        import job_archive
+    maindir, text = make_campaign(tmpdir)
+    compact(maindir, 'gz')
+    job_archive.pack(maindir, 'tar', force=True)
+    archive = os.path.join(maindir, 'mol.tar')
+    assert find_output(archive + '/mol/1/timer.dat') == \
+        archive + '/mol/1/timer.dat.gz'
+    assert find_output(archive + '/mol/2/output.dat') == \
+        archive + '/mol/2/output.dat'
+    assert find_output(archive + '/mol/3/output.dat') is None
+    with open_output(archive + '/mol/1/output.dat') as f:
+        assert f.read() == text
+    close_archive()
+
+# test manually without pytest
+if 0:
+    test_compact()
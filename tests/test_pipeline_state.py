@@ -0,0 +1,84 @@
+"""
+test_pipeline_state.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.pipeline_state import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from pipeline_state import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+
+def make_source(tmpdir, text='mol1\nmol2\nmol3\n'):
+    source = os.path.join(str(tmpdir), 'set1-200.sdf')
+    with open(source, 'w') as f:
+        f.write(text)
+    return source
+
+
+def test_atomic_write(tmpdir):
+    fname = os.path.join(str(tmpdir), 'input.dat')
+    atomic_write(fname, 'energy\n', 'w')
+    assert open(fname).read() == 'energy\n'
+    assert not os.path.exists(fname + '.part')
+
+
+def test_resume(tmpdir):
+    source = make_source(tmpdir)
+    output = os.path.join(str(tmpdir), 'set1-210.sdf')
+
+    # first run is interrupted partway through the third molecule
+    ckpt = Checkpoint(output, 'get_psi_results', source)
+    assert not ckpt.complete()
+    assert ckpt.start() == {}
+    ckpt.add('mol1', b'one\n', {'n': 1})
+    ckpt.add('mol2', b'two\n', {'n': 2})
+    ckpt.f.write(b'thr')
+    ckpt.close()
+    assert not os.path.exists(output)
+    assert load_state(str(tmpdir))['outputs']['set1-210.sdf']['status'] == \
+        'running'
+
+    # second run continues after the last completed molecule
+    ckpt = Checkpoint(output, 'get_psi_results', source)
+    assert not ckpt.complete()
+    done = ckpt.start()
+    assert done == {'mol1': {'n': 1}, 'mol2': {'n': 2}}
+    ckpt.add('mol3', b'three\n')
+    ckpt.finish()
+
+    assert open(output, 'rb').read() == b'one\ntwo\nthree\n'
+    assert not os.path.exists(output + '.part')
+    assert not os.path.exists(output + '.ckpt')
+    record = load_state(str(tmpdir))['outputs']['set1-210.sdf']
+    assert record['status'] == 'done'
+    assert record['resumed'] == 2
+    assert Checkpoint(output, 'get_psi_results', source).complete()
+
+
+def test_source_changed(tmpdir):
+    source = make_source(tmpdir)
+    output = os.path.join(str(tmpdir), 'set1-220.sdf')
+    ckpt = Checkpoint(output, 'filter_confs', source)
+    ckpt.start()
+    ckpt.add('mol1', b'one\n')
+    ckpt.close()
+
+    make_source(tmpdir, 'mol4\n')
+    ckpt = Checkpoint(output, 'filter_confs', source)
+    assert ckpt.start() == {}
+    ckpt.add('mol4', b'four\n')
+    ckpt.finish()
+    assert open(output, 'rb').read() == b'four\n'
+
+
+# test manually without pytest
+if 0:
+    test_resume()
@@ -0,0 +1,78 @@
+"""
+test_profiling.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.profiling import *
+    import quanformer.profiling as profiling
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from profiling import *
+    import profiling
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import pstats
+
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+
+@profiled('inner')
+def inner(n):
+    return work(n)
+
+
+@profiled('outer')
+def outer(n):
+    return inner(n) + work(n)
+
+
+def test_disabled():
+    disable()
+    reset()
+    assert outer(10) == 2 * work(10)
+    assert write_reports() == []
+
+
+def test_write_reports(tmpdir):
+    reset()
+    enable(str(tmpdir))
+    try:
+        outer(20000)
+        outer(20000)
+        files = write_reports()
+    finally:
+        disable()
+        reset()
+    # inner is only called within outer so it has no separate profile
+    base = os.path.join(str(tmpdir), 'outer.%d' % os.getpid())
+    assert sorted(files) == [base + '.collapsed', base + '.prof', base + '.txt']
+    assert not [f for f in os.listdir(str(tmpdir)) if f.startswith('inner')]
+
+    stats = pstats.Stats(base + '.prof')
+    assert [f for f in stats.stats if f[2] == 'inner'][0]
+    with open(base + '.txt') as f:
+        text = f.read()
+    assert 'Sorted by cumulative time' in text
+    assert 'Sorted by own time' in text
+
+    with open(base + '.collapsed') as f:
+        stacks = [line.rsplit(' ', 1) for line in f]
+    assert stacks
+    for stack, usec in stacks:
+        assert stack.split(';')[0].startswith('outer')
+        assert int(usec) > 0
+    # inner stacks were found below outer
+    assert any(';inner' in stack for stack, usec in stacks)
+
+
+# test manually without pytest
+if 0:
+    test_write_reports()
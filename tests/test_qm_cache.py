@@ -0,0 +1,130 @@
+"""
+test_qm_cache.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.qm_cache import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from qm_cache import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import time
+
+INPUT = """memory 5.0 Gb
+molecule {} {{
+  0 1
+  C     {:.4f}    -0.0130      0.0100
+  H     -0.5270     0.9080     -0.2860
+  units angstrom
+}}
+
+set scf_type df
+set guess sad
+
+set basis def2-SV(P)
+set freeze_core True
+optimize('{}')
+
+"""
+
+
+def test_input_key():
+    key = input_key(INPUT.format('mol_1', 1.0020, 'mp2'))
+    # label, memory, and coordinates within tolerance do not change key
+    assert key == input_key(INPUT.format('other_3', 1.0022, 'mp2'))
+    assert key == input_key(
+        INPUT.format('mol_1', 1.0020, 'mp2').replace('5.0 Gb', '2.0 Gb'))
+    # geometry and method do
+    assert key != input_key(INPUT.format('mol_1', 1.0120, 'mp2'))
+    assert key != input_key(INPUT.format('mol_1', 1.0020, 'b3lyp'))
+
+
+def make_outputs(tmpdir, name, nbytes):
+    outf = os.path.join(str(tmpdir), name + '.out')
+    timef = os.path.join(str(tmpdir), name + '.time')
+    with open(outf, 'w') as f:
+        f.write('x' * nbytes)
+    with open(timef, 'w') as f:
+        f.write('Wall Time:  1.00 seconds\n')
+    return outf, timef
+
+
+def test_put_get(tmpdir):
+    cache = QMCache(os.path.join(str(tmpdir), 'store'))
+    key = cache.key(INPUT.format('mol_1', 1.0, 'mp2'))
+    assert not cache.has(key)
+    assert cache.get(key) == (None, None)
+    cache.put(key, *make_outputs(tmpdir, 'a', 100))
+    assert cache.has(key)
+    outf, timef = cache.get(key)
+    assert open(outf).read() == 'x' * 100
+    assert os.path.isfile(timef)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['added']) == (1, 1, 1)
+    cache.close()
+
+    # totals are kept in the store
+    cache = QMCache(os.path.join(str(tmpdir), 'store'))
+    stats = cache.stats()
+    assert (stats['total_hits'], stats['total_misses']) == (1, 1)
+    assert stats['results'] == 1
+    assert 'hit rate' in cache.report()
+
+
+def test_has_no_write(tmpdir):
+    # lookups do not write to the database, so they do not lock the store
+    store = os.path.join(str(tmpdir), 'store')
+    cache = QMCache(store)
+    for i in range(3):
+        assert not cache.has('%064d' % i)
+    assert not cache.db.in_transaction
+    assert cache.stats()['total_misses'] == 3
+    cache.close()
+    cache = QMCache(store)
+    assert cache.stats()['total_misses'] == 3
+    cache.close()
+
+
+def test_evict(tmpdir):
+    cache = QMCache(os.path.join(str(tmpdir), 'store'), max_bytes=2500)
+    keys = ['%064d' % i for i in range(3)]
+    cache.put(keys[0], *make_outputs(tmpdir, 'a', 1000))
+    cache.put(keys[1], *make_outputs(tmpdir, 'b', 1000))
+    time.sleep(0.01)
+    # use the first result so the second is least recently used
+    cache.get(keys[0])
+    cache.put(keys[2], *make_outputs(tmpdir, 'c', 1000))
+    assert cache.stats()['evicted'] == 1
+    assert cache.get(keys[1]) == (None, None)
+    assert cache.get(keys[0])[0] is not None
+    assert cache.total_bytes() <= 2500
+    assert parse_size('2K') == 2048
+
+
+def test_compact(tmpdir):
+    cache = QMCache(os.path.join(str(tmpdir), 'store'))
+    key = '%064d' % 0
+    cache.put(key, *make_outputs(tmpdir, 'a', 10000))
+    before = cache.total_bytes()
+    assert cache.compact('gz') == 1
+    assert cache.total_bytes() < before
+    outf, timef = cache.get(key)
+    assert not os.path.exists(outf)
+    assert os.path.isfile(outf + '.gz')
+
+    # compressed outputs are stored as they are
+    key2 = '%064d' % 1
+    cache.put(key2, outf + '.gz', timef + '.gz')
+    assert os.path.isfile(cache.get(key2)[0] + '.gz')
+
+
+# test manually without pytest
+if 0:
+    test_evict()
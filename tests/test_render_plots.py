@@ -0,0 +1,59 @@
+"""
+test_render_plots.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.render_plots import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from render_plots import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import pytest
+
+minimaE = [[0.0, 1.2, 3.4], [0.0, 1.5, 2.9]]
+thry = ['mp2/def2-SV(P)', 'b3lyp-d3mbj/def2-TZVP']
+
+
+def test_job_bad_kind():
+    with pytest.raises(ValueError):
+        job('pie', 'mol')
+
+
+def test_render_batch_serial(tmpdir):
+    jobs = [
+        job('minima', 'mol1', minimaE=minimaE, xticklabels=thry),
+        job('times', 'mol1', avgTimes=[10., 20.], sdTimes=[1., 2.],
+            xticklabels=thry),
+        job('heat', 'set1', rmsArray=[[0., 1.], [1., 0.]], ticklabels=thry),
+        job('scatter', 'set1', eneArray=[0., 1.], timeArray=[0., 0.3],
+            ticklabels=thry),
+    ]
+    fignames = render_batch(jobs, nprocs=1, fmt='svg', outdir=str(tmpdir))
+    assert [os.path.basename(f) for f in fignames] == [
+        'minimaE_mol1.svg', 'timebars_mol1.svg', 'rmse_set1.svg',
+        'scatter_set1.svg'
+    ]
+    for f in fignames:
+        assert os.path.getsize(f) > 0
+
+
+def test_render_batch_pool(tmpdir):
+    jobs = [
+        job('minima', 'mol%d' % i, minimaE=minimaE, xticklabels=thry)
+        for i in range(4)
+    ]
+    fignames = render_batch(jobs, nprocs=2, dpi=50, outdir=str(tmpdir))
+    assert len(fignames) == 4
+    assert os.path.isfile(os.path.join(str(tmpdir), 'minimaE_mol3.png'))
+
+
+# test manually without pytest
+if 0:
+    test_render_batch_serial()
@@ -0,0 +1,80 @@
+"""
+test_save_uniq_mols.py
+"""
+# tools are scripts, not part of the package
+import os
+import sys
+mydir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(mydir), 'tools'))
+from save_uniq_mols import *
+
+# -----------------------
+
+import pytest
+
+# ethanol three times (two titles, two SMILES), then two enantiomers
+SMILES = [('CCO', 'ethanol'), ('OCC', 'ethanol_2'), ('CCO', 'ethanol'),
+          ('C[C@H](O)F', 'fluoro_r'), ('C[C@@H](O)F', 'fluoro_s')]
+
+
+def write_smiles(tmpdir):
+    infile = os.path.join(str(tmpdir), 'mols.smi')
+    with open(infile, 'w') as f:
+        for smi, title in SMILES:
+            f.write("%s %s\n" % (smi, title))
+    return infile
+
+
+def read_titles(fname):
+    with open(fname) as f:
+        return [line.split()[1] for line in f if line.strip()]
+
+
+@pytest.mark.parametrize("key,titles", [
+    ('title', ['ethanol', 'ethanol_2', 'fluoro_r', 'fluoro_s']),
+    ('smiles', ['ethanol', 'fluoro_r', 'fluoro_s']),
+    ('inchikey', ['ethanol', 'fluoro_r', 'fluoro_s']),
+])
+def test_save_uniq_mols(tmpdir, key, titles):
+    infile = write_smiles(tmpdir)
+    outfile = os.path.join(str(tmpdir), 'uniq.smi')
+    nread, nsaved = save_uniq_mols(infile, outfile, key)
+    assert (nread, nsaved) == (5, len(titles))
+    assert read_titles(outfile) == titles
+
+
+def test_save_uniq_mols_ondisk(tmpdir):
+    infile = write_smiles(tmpdir)
+    outfile = os.path.join(str(tmpdir), 'uniq.smi')
+    dbfile = os.path.join(str(tmpdir), 'seen.db')
+    assert save_uniq_mols(infile, outfile, 'smiles', dbfile) == (5, 3)
+    assert read_titles(outfile) == ['ethanol', 'fluoro_r', 'fluoro_s']
+    assert os.path.isfile(dbfile)
+
+
+def test_save_uniq_mols_spill(tmpdir):
+    # digests move to a temporary SQLite file after the first unique mol
+    infile = write_smiles(tmpdir)
+    outfile = os.path.join(str(tmpdir), 'uniq.smi')
+    assert save_uniq_mols(infile, outfile, 'title', spill=1) == (5, 4)
+    assert read_titles(outfile) == ['ethanol', 'ethanol_2', 'fluoro_r',
+                                    'fluoro_s']
+    assert sorted(os.listdir(str(tmpdir))) == ['mols.smi', 'uniq.smi']
+
+
+def test_seen_sets(tmpdir):
+    digests = [key_digest(k) for k in ['a', 'b', 'a', 'c']]
+    disk = DiskSeen(os.path.join(str(tmpdir), 'seen.db'))
+    mem = MemorySeen()
+    assert [mem.add(d) for d in digests] == [True, True, False, True]
+    assert [disk.add(d) for d in digests] == [True, True, False, True]
+    disk.close()
+    moved = mem.to_disk(os.path.join(str(tmpdir), 'moved.db'))
+    assert not moved.add(digests[0])
+    assert moved.add(key_digest('d'))
+    moved.close()
+
+
+# test manually without pytest
+if 0:
+    test_save_uniq_mols_spill('.')
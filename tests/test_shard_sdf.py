@@ -0,0 +1,120 @@
+"""
+test_shard_sdf.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.shard_sdf import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from shard_sdf import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import pytest
+
+
+def make_input(tmpdir):
+    """
+    Combine two test files into one input of three molecules:
+    s1 (1 conf), t1 (1 conf), and GBI (5 confs), in that order.
+    """
+    infile = os.path.join(str(tmpdir), 'set1-200.sdf')
+    with open(infile, 'wb') as out:
+        for f in ['carbon-222.sdf', 'gbi-200.sdf']:
+            with open(os.path.join(mydir, 'data_tests', f), 'rb') as inp:
+                out.write(inp.read())
+    return infile
+
+
+def test_read_sdf_mols():
+    mols = read_sdf_mols(os.path.join(mydir, 'data_tests', 'gbi-200.sdf'))
+    assert len(mols) == 1
+    assert mols[0][0] == 'GBI'
+    assert len(mols[0][1]) == 5
+
+
+def test_iter_sdf_mols():
+    # offsets locate each molecule's records in the file
+    infile = os.path.join(mydir, 'data_tests', 'carbon-222.sdf')
+    with open(infile, 'rb') as f:
+        text = f.read()
+    mols = list(iter_sdf_mols(infile))
+    assert [t for t, offset, recs in mols] == ['s1', 't1']
+    for title, offset, recs in mols:
+        record = b''.join(recs)
+        assert text[offset:offset + len(record)] == record
+
+
+def test_balance():
+    assignment = balance([5., 1., 1., 3.], 2)
+    assert assignment == [[0], [1, 2, 3]]
+
+
+def test_shard_merge_roundtrip(tmpdir):
+    infile = make_input(tmpdir)
+    manifest_file = shard_sdf(infile, 2)
+    manifest, mdir = load_manifest(manifest_file)
+    assert manifest['order'] == ['s1', 't1', 'GBI']
+    assert [s['titles'] for s in manifest['shards']] == [['GBI'],
+                                                         ['s1', 't1']]
+    assert os.path.isfile(
+        os.path.join(str(tmpdir), 'set1_shards', 'set1_00', 'set1_00-200.sdf'))
+
+    outfile = merge_shards(manifest_file, '200',
+                           os.path.join(str(tmpdir), 'merged-200.sdf'))
+    with open(infile, 'rb') as f1, open(outfile, 'rb') as f2:
+        assert f1.read() == f2.read()
+
+
+def test_shard_hash(tmpdir):
+    # molecules are placed by title, so each lands in the same shard
+    # whatever the other molecules of the input
+    infile = make_input(tmpdir)
+    manifest_file = shard_sdf(infile, 2, weight='hash')
+    manifest, mdir = load_manifest(manifest_file)
+    for k, shard in enumerate(manifest['shards']):
+        assert all(hash_shard(t, 2) == k for t in shard['titles'])
+    assert sorted(t for s in manifest['shards'] for t in s['titles']) == \
+        ['GBI', 's1', 't1']
+    outfile = merge_shards(manifest_file, '200',
+                           os.path.join(str(tmpdir), 'merged-200.sdf'))
+    with open(infile, 'rb') as f1, open(outfile, 'rb') as f2:
+        assert f1.read() == f2.read()
+
+
+def test_merge_checksum(tmpdir):
+    infile = make_input(tmpdir)
+    manifest_file = shard_sdf(infile, 2)
+    manifest, mdir = load_manifest(manifest_file)
+    with open(shard_file(mdir, manifest['shards'][1], '200'), 'ab') as f:
+        f.write(b'\n')
+    with pytest.raises(ValueError, match='checksum mismatch'):
+        merge_shards(manifest_file, '200',
+                     os.path.join(str(tmpdir), 'merged-200.sdf'))
+    assert not os.path.exists(os.path.join(str(tmpdir), 'merged-200.sdf'))
+
+
+def test_merge_missing_results(tmpdir):
+    # results of only one shard: merge with nostrict keeps the rest in order
+    infile = make_input(tmpdir)
+    manifest_file = shard_sdf(infile, 2)
+    manifest, mdir = load_manifest(manifest_file)
+    shard = manifest['shards'][1]
+    with open(shard_file(mdir, shard, '200'), 'rb') as f:
+        text = f.read()
+    with open(shard_file(mdir, shard, '220'), 'wb') as f:
+        f.write(text)
+    outfile = merge_shards(manifest_file, '220',
+                           os.path.join(str(tmpdir), 'merged-220.sdf'),
+                           strict=False)
+    assert [t for t, recs in read_sdf_mols(outfile)] == ['s1', 't1']
+
+
+# test manually without pytest
+if 0:
+    test_balance()
@@ -0,0 +1,95 @@
+"""
+test_time_stats.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.time_stats import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from time_stats import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import pytest
+import numpy as np
+
+
+def test_running_stats():
+    values = [847., 2635., 'nan', 1020., 847., 1500.]
+    rs = RunningStats()
+    for v in values:
+        rs.add(v)
+    ref = np.array([847., 2635., 1020., 847., 1500.])
+    assert rs.n == 5
+    assert rs.mean == pytest.approx(np.mean(ref))
+    assert rs.sd == pytest.approx(np.std(ref))
+    assert rs.median == np.median(ref)
+    assert rs.mode == 847.
+
+
+def test_running_stats_merge():
+    a = RunningStats()
+    b = RunningStats()
+    for v in [8, 21, 13]:
+        a.add(v)
+    for v in [8, 5]:
+        b.add(v)
+    a.merge(b)
+    ref = np.array([8, 21, 13, 8, 5])
+    assert a.n == 5
+    assert a.mean == pytest.approx(np.mean(ref))
+    assert a.sd == pytest.approx(np.std(ref))
+    assert a.median == 8.
+    assert a.mode == 8.
+
+
+def test_running_stats_resolution():
+    # float runtimes are tallied to the second for median and mode
+    values = [100.2, 100.4, 99.9, 250.7, 250.6, 101.3]
+    rs = RunningStats()
+    for v in values:
+        rs.add(v)
+    assert len(rs.counts) == 3
+    assert rs.mean == pytest.approx(np.mean(values))
+    assert rs.sd == pytest.approx(np.std(values))
+    assert rs.median == 100.5
+    assert rs.mode == 100.
+    exact = RunningStats(resolution=None)
+    for v in values:
+        exact.add(v)
+    assert len(exact.counts) == 6
+    assert exact.median == pytest.approx(np.median(values))
+
+
+def test_running_stats_empty():
+    rs = RunningStats()
+    assert rs.n == 0
+    assert np.isnan(rs.mean)
+    assert np.isnan(rs.median)
+
+
+def test_conf_time_data():
+    pairs = [('QM Psi4 Opt. Runtime (sec) mp2/def2-SV(P)', '2635.0'),
+             ('QM Psi4 Final Opt. Energy (Har) mp2/def2-SV(P)', '-582.15'),
+             ('QM Psi4 Opt. Steps mp2/def2-SV(P)', '21')]
+    runtime, steps = conf_time_data(pairs, 'mp2', 'def2-SV(P)')
+    assert runtime == 2635.0
+    assert steps == 21
+
+
+def test_conf_time_data_notfinish():
+    pairs = [('QM Psi4 Opt. Runtime (sec) mp2/def2-SV(P)', '2635.0'),
+             ('Note on Opt. mp2/def2-SV(P)', 'JOB DID NOT FINISH')]
+    runtime, steps = conf_time_data(pairs, 'mp2', 'def2-SV(P)')
+    assert np.isnan(runtime)
+    assert np.isnan(steps)
+
+
+# test manually without pytest
+if 0:
+    test_running_stats()
@@ -0,0 +1,152 @@
+"""
+test_triage.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.triage import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from triage import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import time
+import shutil
+import pytest
+
+errdir = os.path.join(mydir, '..', 'examples', 'potential_errors')
+
+
+def partial_output(fname, message, nsteps=2):
+    """
+    Write the first nsteps optimization steps of the opt test output,
+    followed by an error message.
+    """
+    lines = []
+    with open(os.path.join(mydir, 'data_tests', 'output_opt.dat')) as f:
+        for line in f:
+            lines.append(line)
+            if "OPTKING Finished Execution" in line:
+                nsteps -= 1
+                if nsteps == 0:
+                    break
+    with open(fname, 'w') as f:
+        f.write(''.join(lines))
+        f.write(message)
+
+
+def make_campaign(tmpdir):
+    maindir = str(tmpdir.mkdir('campaign'))
+    shutil.copytree(os.path.join(mydir, 'data_tests', 'GBI'),
+                    os.path.join(maindir, 'GBI'))
+    partial_output(os.path.join(maindir, 'GBI', '2', 'output.dat'),
+        "\nRuntimeError: Could not converge SCF iterations in 100 "
+        "iterations.\nPsi4 encountered an error.\n")
+    partial_output(os.path.join(maindir, 'GBI', '4', 'output.dat'),
+        "\nConvergenceError: Could not converge geometry optimization in "
+        "50 iterations.\nPsi4 encountered an error.\n")
+    return maindir
+
+
+def test_classify_output(tmpdir):
+    assert classify_output(os.path.join(errdir, 'namingErr.dat')) == 'naming'
+    assert classify_output(
+        os.path.join(errdir, 'scratchDirErr.dat')) == 'scratch'
+    assert classify_output(
+        os.path.join(mydir, 'data_tests', 'output_opt.dat')) is None
+
+    # no message: running, or incomplete once stale
+    outf = str(tmpdir.join('output.dat'))
+    partial_output(outf, '')
+    assert classify_output(outf) is None
+    assert classify_output(outf, stale=1.) is None
+    assert classify_output(outf, stale=1.,
+                           now=os.path.getmtime(outf) + 7200) == 'incomplete'
+
+
+def test_classify_output_archive(tmpdir):
+    # unfinished output of a molecule packed with pack --force
+    maindir = str(tmpdir.mkdir('campaign'))
+    os.makedirs(os.path.join(maindir, 'mol', '1'))
+    partial_output(os.path.join(maindir, 'mol', '1', 'output.dat'), '')
+    try:
+        import quanformer.job_archive as job_archive
+    except ModuleNotFoundError:
+        import job_archive
+    job_archive.pack_molecule(maindir, 'mol')
+    outf = os.path.join(maindir, 'mol', '1', 'output.dat')
+    assert classify_output(outf) is None
+    assert classify_output(outf, stale=1., now=time.time() + 7200) is None
+
+
+def test_last_geometry(tmpdir):
+    outf = str(tmpdir.join('output.dat'))
+    partial_output(outf, '', nsteps=1)
+    geom = last_geometry(outf)
+    assert len(geom) == 23
+    assert geom[0] == ('C', -0.0481023481, 0.8924709097, -3.5407181910)
+    assert geom[-1][0] == 'H'
+
+
+def test_restart_input():
+    with open(os.path.join(mydir, 'data_tests', 'GBI', '1',
+                           'input.dat')) as f:
+        inputstring = f.read()
+    geom = [('C', 1., 2., 3.)] * 23
+
+    restart, changes = restart_input(inputstring, 'scf', geom)
+    assert changes == ['last geometry', 'maxiter 200',
+                       'damping_percentage 20', 'soscf true']
+    assert '  C     1.0000     2.0000      3.0000' in restart
+    assert "set soscf true\noptimize('mp2')" in restart
+    # options are replaced, not repeated, on another restart
+    restart, changes = restart_input(restart, 'scf', geom)
+    assert restart.count('set maxiter') == 1
+
+    # geometry of another molecule is not used
+    restart, changes = restart_input(inputstring, 'memory', geom[:5])
+    assert changes == ['memory 10 Gb']
+    assert restart.startswith('memory 10 Gb\nmolecule GBI_1 {')
+
+    restart, changes = restart_input(
+        inputstring.replace('GBI_1', '2GBI_1'), 'naming')
+    assert 'molecule mol2GBI_1 {' in restart
+
+
+def test_triage(tmpdir, capsys):
+    maindir = make_campaign(tmpdir)
+    failed = triage(maindir)
+    assert failed['scf'] == [os.path.join(maindir, 'GBI', '2')]
+    assert failed['opt_maxiter'] == [os.path.join(maindir, 'GBI', '4')]
+    assert sum(len(c) for c in failed.values()) == 2
+    assert os.path.isfile(os.path.join(maindir, 'GBI', '2', 'output.dat'))
+
+
+def test_triage_restart(tmpdir):
+    maindir = make_campaign(tmpdir)
+    triage(maindir, restart=True, classes=['opt_maxiter'])
+    confdir = os.path.join(maindir, 'GBI', '4')
+    assert os.path.isfile(os.path.join(confdir, 'input.dat.fail1'))
+    assert os.path.isfile(os.path.join(confdir, 'output.dat.fail1'))
+    assert os.path.isfile(os.path.join(confdir, 'timer.dat.fail1'))
+    assert not os.path.isfile(os.path.join(confdir, 'output.dat'))
+    with open(os.path.join(confdir, 'input.dat')) as f:
+        restart = f.read()
+    assert 'set geom_maxiter 200' in restart
+    with open(os.path.join(confdir, 'input.dat.fail1')) as f:
+        assert f.read() != restart
+
+    # scf failure not restarted
+    assert os.path.isfile(os.path.join(maindir, 'GBI', '2', 'output.dat'))
+    failed = triage(maindir)
+    assert failed['scf'] and not failed['opt_maxiter']
+
+
+# test manually without pytest
+if 0:
+    test_triage_restart()
@@ -0,0 +1,54 @@
+"""
+test_warm_start.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.warm_start import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from warm_start import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+
+def write_output(maindir, mol, conf, scf_per_step, nsteps):
+    """
+    Write a minimal Psi4 optimization output with SCF iteration lines.
+    """
+    confdir = os.path.join(maindir, mol, str(conf))
+    os.makedirs(confdir)
+    with open(os.path.join(confdir, 'output.dat'), 'w') as f:
+        for step in range(nsteps):
+            f.write("   @DF-RHF iter SAD:   -39.6 \n")
+            for i in range(scf_per_step):
+                f.write("   @DF-RHF iter %3d:   -40.1  -1.0e-05   1.0e-04 DIIS\n"
+                        % (i + 1))
+        f.write("  **** Optimization is complete! (in %d steps) ****\n" % nsteps)
+
+
+def test_count_output(tmpdir):
+    write_output(str(tmpdir), 'methane', 1, 10, 4)
+    outf = os.path.join(str(tmpdir), 'methane', '1', 'output.dat')
+    assert count_output(outf) == (40, 4, True)
+
+
+def test_warm_start_report(tmpdir):
+    cold = os.path.join(str(tmpdir), 'cold')
+    warm = os.path.join(str(tmpdir), 'warm')
+    write_output(cold, 'methane', 1, 12, 5)
+    write_output(cold, 'methane', 2, 12, 4)
+    write_output(warm, 'methane', 1, 6, 3)
+    totals = warm_start_report(cold, warm)
+    # only conformers in both campaigns are compared
+    assert totals == {'confs': 1, 'scf_cold': 60, 'scf_warm': 18,
+                      'steps_cold': 5, 'steps_warm': 3}
+
+
+# test manually without pytest
+if 0:
+    test_warm_start_report()
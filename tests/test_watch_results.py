@@ -0,0 +1,120 @@
+"""
+test_watch_results.py
+"""
+# local testing vs. travis testing
+try:
+    from quanformer.watch_results import *
+except ModuleNotFoundError:
+    import sys
+    sys.path.insert(0, '/home/limvt/Documents/off_psi4/quanformer')
+    from watch_results import *
+
+# define location of input files for testing
+import os
+mydir = os.path.dirname(os.path.abspath(__file__))
+
+# -----------------------
+
+import time
+import shutil
+from helper import *
+
+
+def test_watch_results(tmpdir):
+    # copy GBI calculations, with the last conformer still running
+    maindir = os.path.join(str(tmpdir), 'campaign')
+    shutil.copytree(os.path.join(mydir, 'data_tests', 'GBI'),
+                    os.path.join(maindir, 'GBI'))
+    infile = os.path.join(maindir, 'gbi-200.sdf')
+    shutil.copyfile(os.path.join(mydir, 'data_tests', 'gbi-200.sdf'), infile)
+    outf = os.path.join(maindir, 'GBI', '5', 'output.dat')
+    text = open(outf).read()
+    with open(outf, 'w') as f:
+        f.write(text.split('Optimization is complete')[0])
+    outfile = os.path.join(maindir, 'gbi-210.sdf')
+
+    # molecule is not harvested until all its conformers finish
+    m, b = watch_results(infile, outfile, 'opt', once=True)
+    assert (m, b) == (None, None)
+    assert not os.path.exists(outfile)
+    assert not os.path.exists(os.path.join(maindir, 'gbi-210.watch',
+                                           'shard_0001.sdf'))
+
+    with open(outf, 'w') as f:
+        f.write(text)
+    m, b = watch_results(infile, outfile, 'opt', interval=0.1)
+    assert m == 'mp2'
+    assert b == 'def2-SV(P)'
+    assert os.path.isfile(os.path.join(maindir, 'gbi-210.watch',
+                                       'shard_0001.sdf'))
+
+    # confs 2 and 4 failed opt so we should have data from confs 1 3 5
+    mol = read_mol(outfile, True)
+    confs = list(next(mol).GetConfs())
+    assert len(confs) == 3
+    assert oechem.OEGetSDData(
+        confs[1], 'QM Psi4 Final Opt. Energy (Har) mp2/def2-SV(P)'
+    ) == '-582.1570265488717'
+
+    # final output is not written again
+    assert watch_results(infile, outfile, 'opt') == (None, None)
+
+
+def copy_gbi(tmpdir):
+    maindir = os.path.join(str(tmpdir), 'campaign')
+    shutil.copytree(os.path.join(mydir, 'data_tests', 'GBI'),
+                    os.path.join(maindir, 'GBI'))
+    infile = os.path.join(maindir, 'gbi-200.sdf')
+    shutil.copyfile(os.path.join(mydir, 'data_tests', 'gbi-200.sdf'), infile)
+    return maindir, infile
+
+
+def test_watch_results_cached(tmpdir, monkeypatch):
+    # result of last conformer was found in the QM cache by confs_to_psi
+    maindir, infile = copy_gbi(tmpdir)
+    confdir = os.path.join(maindir, 'GBI', '5')
+    store = os.path.join(str(tmpdir), 'store')
+    cache = qm_cache.QMCache(store)
+    with open(os.path.join(confdir, 'input.dat')) as f:
+        key = cache.key(f.read())
+    cache.put(key, os.path.join(confdir, 'output.dat'),
+              os.path.join(confdir, 'timer.dat'))
+    cache.close()
+    for name in ['input.dat', 'output.dat', 'timer.dat']:
+        os.remove(os.path.join(confdir, name))
+    with open(os.path.join(confdir, qm_cache.KEY_FILE), 'w') as f:
+        f.write(key)
+    monkeypatch.setenv(qm_cache.ENV_VAR, store)
+
+    outfile = os.path.join(maindir, 'gbi-210.sdf')
+    watcher = ResultsWatcher(infile, outfile, 'opt')
+    assert watcher.conf_status(confdir) == 'done'
+    watcher.close()
+    m, b = watch_results(infile, outfile, 'opt', once=True)
+    assert m == 'mp2'
+    confs = list(next(read_mol(outfile, True)).GetConfs())
+    assert len(confs) == 3
+    assert oechem.OEGetSDData(
+        confs[1], 'QM Psi4 Final Opt. Energy (Har) mp2/def2-SV(P)'
+    ) == '-582.1570265488717'
+
+
+def test_conf_status_stale(tmpdir):
+    # job of last conformer died before writing its output
+    maindir, infile = copy_gbi(tmpdir)
+    confdir = os.path.join(maindir, 'GBI', '5')
+    os.remove(os.path.join(confdir, 'output.dat'))
+    outfile = os.path.join(maindir, 'gbi-210.sdf')
+    watcher = ResultsWatcher(infile, outfile, 'opt', stale=3600.)
+    assert watcher.conf_status(confdir) is None
+    old = time.time() - 7200.
+    os.utime(os.path.join(confdir, 'input.dat'), (old, old))
+    assert watcher.conf_status(confdir) == 'failed'
+    assert watcher.mol_resolved('GBI')
+    watcher.stale = None
+    assert watcher.conf_status(confdir) is None
+
+
+# test manually without pytest
+if 0:
+    test_watch_results()
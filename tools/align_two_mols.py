@@ -26,6 +26,12 @@ The hydrogen atoms are NOT rigorously assigned--their indices are reassigned
 based on their parent atoms but two hydrogens on the same *adjusted* parent atom
 may not have the same ordering as the two hydrogens on the *reference* parent atom.
 
+Batch mode: The MCS pattern is set up from the reference only once (per
+worker process), then all molecules/conformers of a multi-molecule fit file
+are aligned across a pool of worker processes. A report lists the alignment
+time and any reference atoms that could not be mapped for each molecule.
+  python align_two_mols.py ref.sdf fit.sdf out.sdf --batch --nprocs 8 --report align.dat
+
 Version:     Oct 5 2018
 Changes by:  Victoria T. Lim
 
@@ -51,6 +57,8 @@ Changes by:  Victoria T. Lim
 # Align two compounds based on the maximum common substructure
 #############################################################################
 import sys
+import time
+import multiprocessing
 from openeye import oechem
 
 
@@ -111,6 +119,195 @@ def MCSAlign(refmol, fitmol, ofs):
         oechem.OEWriteMolecule(ofs, fit2refmol)
 
 
+def setup_mcs(refmol):
+    """
+    Set up the MCS search against the reference molecule. This only needs to
+    be done once for any number of fit molecules.
+
+    Parameters
+    ----------
+    refmol : OEChem molecule of the reference, with hydrogens
+
+    Returns
+    -------
+    template : OEGraphMol, copy of refmol with all atoms, onto which fit
+        coordinates are placed
+    mcss : OEMCSSearch initialized with the heavy atoms of refmol
+
+    """
+    template = oechem.OEGraphMol(refmol)
+    pattern = oechem.OEGraphMol(refmol)
+    oechem.OESuppressHydrogens(pattern)
+
+    atomexpr = oechem.OEExprOpts_AtomicNumber | oechem.OEExprOpts_Aromaticity
+    bondexpr = 0
+    mcss = oechem.OEMCSSearch(oechem.OEMCSType_Exhaustive)
+    mcss.Init(pattern, atomexpr, bondexpr)
+    mcss.SetMCSFunc(oechem.OEMCSMaxBondsCompleteCycles())
+    mcss.SetMaxMatches(1)
+    return template, mcss
+
+
+def align_to_ref(template, mcss, fitmol):
+    """
+    Align one fit molecule onto the reference of an initialized MCS search
+    and renumber it by the reference atom ordering. Same procedure as
+    MCSAlign but without setting up the search again.
+
+    Parameters
+    ----------
+    template : OEGraphMol from setup_mcs
+    mcss : OEMCSSearch from setup_mcs
+    fitmol : OEGraphMol to align. Its coordinates are modified.
+
+    Returns
+    -------
+    fit2refmol : OEGraphMol with reference atom order and fit coordinates,
+        or None if no match or overlay failed
+    rms : float, RMSD of the overlay of matched heavy atoms
+    unmapped : list of reference atom indices that were not mapped, whose
+        coordinates remain those of the reference
+
+    """
+    fit2refmol = oechem.OEGraphMol(template)
+    fit2refmol.SetTitle(fitmol.GetTitle())
+    oechem.OECopySDData(fit2refmol, fitmol)
+
+    rmat = oechem.OEDoubleArray(9)
+    trans = oechem.OEDoubleArray(3)
+    mapped = set()
+    rms = float('nan')
+
+    for match in mcss.Match(fitmol, True):
+        rms = oechem.OERMSD(mcss.GetPattern(), fitmol, match, True, rmat, trans)
+        if rms < 0.0:
+            oechem.OEThrow.Warning("RMS overlay failure for %s" % fitmol.GetTitle())
+            return None, rms, [a.GetIdx() for a in fit2refmol.GetAtoms()]
+        oechem.OERotate(fitmol, rmat)
+        oechem.OETranslate(fitmol, trans)
+
+        for ma in match.GetAtoms():
+            f2r_atom = fit2refmol.GetAtom(oechem.OEHasAtomIdx(ma.pattern.GetIdx()))
+            tar_atom = fitmol.GetAtom(oechem.OEHasAtomIdx(ma.target.GetIdx()))
+            fit2refmol.SetCoords(f2r_atom, fitmol.GetCoords(tar_atom))
+            mapped.add(f2r_atom.GetIdx())
+            # reassign hydrogens
+            tar_hyds = list(tar_atom.GetAtoms(oechem.OEHasAtomicNum(oechem.OEElemNo_H)))
+            for i, nn_atom in enumerate(f2r_atom.GetAtoms(oechem.OEHasAtomicNum(oechem.OEElemNo_H))):
+                if i >= len(tar_hyds):
+                    break
+                fit2refmol.SetCoords(nn_atom, fitmol.GetCoords(tar_hyds[i]))
+                mapped.add(nn_atom.GetIdx())
+        break
+
+    unmapped = [a.GetIdx() for a in fit2refmol.GetAtoms() if a.GetIdx() not in mapped]
+    if not mapped:
+        return None, rms, unmapped
+    return fit2refmol, rms, unmapped
+
+
+# MCS search of each worker process, set up once by _init_worker
+_worker = {}
+
+
+def read_refmol(reffile):
+    reffs = oechem.oemolistream()
+    if not reffs.open(reffile):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % reffile)
+    refmol = oechem.OEGraphMol()
+    if not oechem.OEReadMolecule(reffs, refmol):
+        oechem.OEThrow.Fatal("Unable to read molecule in %s" % reffile)
+    reffs.close()
+    return refmol
+
+
+def _init_worker(reffile):
+    _worker['template'], _worker['mcss'] = setup_mcs(read_refmol(reffile))
+
+
+def _align_bytes(job):
+    """
+    Align one molecule passed between processes as SDF text.
+    Returns (count, title, SDF text or None, rms, unmapped, seconds).
+    """
+    count, molbytes = job
+    start = time.time()
+    fitmol = oechem.OEGraphMol()
+    oechem.OEReadMolFromBytes(fitmol, '.sdf', molbytes)
+    outmol, rms, unmapped = align_to_ref(_worker['template'], _worker['mcss'], fitmol)
+    outbytes = None
+    if outmol is not None:
+        outbytes = oechem.OEWriteMolToBytes('.sdf', outmol)
+    return count, fitmol.GetTitle(), outbytes, rms, unmapped, time.time() - start
+
+
+def batch_align(reffile, fitfile, outfile, nprocs=None, report=None):
+    """
+    Align all molecules and conformers of fitfile onto the reference
+    molecule, distributing the work across a pool of worker processes.
+
+    Parameters
+    ----------
+    reffile : string, name of file with the reference molecule
+    fitfile : string, name of multi-molecule file of geometries to align
+    outfile : string, name of output file of aligned and renumbered geometries
+    nprocs : int, number of worker processes. None uses all CPUs.
+    report : string, name of text file for per-molecule alignment time and
+        unmapped atoms. None prints the report to screen only.
+
+    Returns
+    -------
+    results : list of (title, rms, unmapped atom indices, seconds) for each
+        fit molecule in input order
+
+    """
+    fitfs = oechem.oemolistream()
+    if not fitfs.open(fitfile):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % fitfile)
+    ofs = oechem.oemolostream()
+    if not ofs.open(outfile):
+        oechem.OEThrow.Fatal("Unable to open %s for writing" % outfile)
+
+    def jobs():
+        for count, fitmol in enumerate(fitfs.GetOEGraphMols()):
+            if not fitmol.GetDimension() == 3:
+                oechem.OEThrow.Warning("%s doesn't have 3D coordinates" % fitmol.GetTitle())
+                continue
+            yield count, oechem.OEWriteMolToBytes('.sdf', fitmol)
+
+    if nprocs == 1:
+        _init_worker(reffile)
+        outputs = map(_align_bytes, jobs())
+        pool = None
+    else:
+        pool = multiprocessing.Pool(nprocs, _init_worker, (reffile, ))
+        outputs = pool.imap(_align_bytes, jobs(), chunksize=4)
+
+    results = []
+    lines = ["# count\ttitle\ttime(s)\trms\tunmapped reference atoms"]
+    for count, title, outbytes, rms, unmapped, secs in outputs:
+        if outbytes is not None:
+            outmol = oechem.OEGraphMol()
+            oechem.OEReadMolFromBytes(outmol, '.sdf', outbytes)
+            oechem.OEWriteMolecule(ofs, outmol)
+        else:
+            oechem.OEThrow.Warning("No alignment for %s" % title)
+        results.append((title, rms, unmapped, secs))
+        lines.append("%d\t%s\t%.4f\t%.4f\t%s" % (count, title, secs, rms,
+            ','.join(str(i) for i in unmapped) if unmapped else '-'))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    fitfs.close()
+    ofs.close()
+
+    print('\n'.join(lines))
+    if report is not None:
+        with open(report, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    return results
+
+
 def main(argv=[__name__]):
     if len(argv) != 4:
         oechem.OEThrow.Usage("%s <refmol> <fitmol> <outfile>" % argv[0])
@@ -148,4 +345,19 @@ def main(argv=[__name__]):
 
 
 if __name__ == "__main__":
-    sys.exit(main(sys.argv))
+    if '--batch' not in sys.argv:
+        sys.exit(main(sys.argv))
+
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("refmol", help="File with the reference molecule.")
+    parser.add_argument("fitmol", help="Multi-molecule file of geometries to align.")
+    parser.add_argument("outfile", help="Output file of aligned geometries.")
+    parser.add_argument("--batch", action="store_true", default=False,
+        help="Align all molecules in parallel with one MCS setup per worker.")
+    parser.add_argument("--nprocs", type=int, default=None,
+        help="Number of worker processes. Default uses all CPUs.")
+    parser.add_argument("--report", default=None,
+        help="Text file for per-molecule alignment time and unmapped atoms.")
+    args = parser.parse_args()
+    batch_align(args.refmol, args.fitmol, args.outfile, args.nprocs, args.report)
@@ -8,6 +8,10 @@
 # Examples:
 #  - python catMols2.py -i diverse-200-Div1.mol2 diverse-200-Div4.mol2 -o 41.mol2
 #  - python catMols2.py -i diverse-200.sdf diverse-200-Div4-selected.mol2 -list exclude.txt -o new.sdf
+#  - python catMols.py -i big1-200.sdf big2-200.sdf -list exclude.txt -db exclude.db -shards 8 -o all-200.sdf
+#    (also splits all-200.sdf into all_shards/all_00/all_00-200.sdf ... with manifest
+#     all_shards/all-200.shards.json as in shard_sdf.py, each molecule placed by a
+#     stable hash of its title, to run with executor.py --shards and merge_shards)
 #
 # By: Victoria T. Lim
 #
@@ -18,26 +22,78 @@
 # It can be useful for generating ROCS queries or reattach ligands to an
 # protein structure
 #############################################################################
+import os
 import sys
+import sqlite3
 from openeye.oechem import *
+try:
+    import quanformer.shard_sdf as shard_sdf
+except ModuleNotFoundError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..', 'quanformer'))
+    import shard_sdf
 
-def CatMols(infnames, outfname,nameset):
+
+class FileTitleSet(object):
+    """
+    Set of molecule titles kept in an SQLite file, for exclusion lists too
+    large to hold in memory. Lookups go through the primary key index.
+    """
+    def __init__(self, dbfile):
+        self.conn = sqlite3.connect(dbfile)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS titles "
+                          "(title TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    def update(self, titles):
+        self.conn.executemany("INSERT OR IGNORE INTO titles VALUES (?)",
+                              ((t, ) for t in titles))
+        self.conn.commit()
+
+    def __contains__(self, title):
+        return self.conn.execute("SELECT 1 FROM titles WHERE title=?",
+                                 (title, )).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def CatMols(infnames, outfname, nameset, nshards=1):
+    """
+    Stream molecules from infnames to outfname, skipping molecules of the
+    first (parent) file whose titles are in nameset. With nshards > 1, the
+    SDF output is then split by shard_sdf.py into that many shards by a
+    stable hash of the title. Returns the name of the shard manifest, or
+    None if not sharded.
+    """
+    if nshards > 1 and not outfname.endswith('.sdf'):
+        OEThrow.Fatal("Shards can only be written for SDF output")
     ofs = oemolostream()
     if not ofs.open(outfname):
         OEThrow.Fatal("Unable to open %s for writing" % outfname)
+    count = 0
 
     for i, fname in enumerate(infnames):
         print(fname, i)
         ifs = oemolistream()
         if ifs.open(fname):
             for imol in ifs.GetOEGraphMols():
-                if imol.GetTitle() in nameset and i==0:
+                if i==0 and imol.GetTitle() in nameset:
                     continue
-                else:
-                    OEWriteMolecule(ofs, imol)
+                OEWriteMolecule(ofs, imol)
+                count += 1
+            ifs.close()
         else:
             OEThrow.Fatal("Unable to open %s for reading" % fname)
 
+    ofs.close()
+    print("%d molecules written to %s" % (count, outfname))
+    if nshards > 1:
+        return shard_sdf.shard_sdf(outfname, nshards, weight='hash')
+    return None
+
 
 
 
@@ -67,6 +123,15 @@ Interface = """
   !TYPE string
   !BRIEF List file of mol titles to exclude from parent file
 !END
+!PARAMETER -db
+  !TYPE string
+  !BRIEF SQLite file to hold titles of -list for very long lists; reused if it exists
+!END
+!PARAMETER -shards
+  !TYPE int
+  !DEFAULT 1
+  !BRIEF Also split SDF output into this many shards by a stable hash of the title
+!END
 """
 
 
@@ -74,20 +139,25 @@ def main(argv=[__name__]):
     itf = OEInterface(Interface, argv)
 
     # collect names
-    nameset = set()
+    if itf.HasString("-db"):
+        nameset = FileTitleSet(itf.GetString("-db"))
+    else:
+        nameset = set()
     if itf.HasString("-list"):
         try:
             lfs = open(itf.GetString("-list"))
         except IOError:
             OEThrow.Fatal("Unable to open %s for reading" % itf.GetString("-list"))
-        for name in lfs.readlines():
-            name = name.strip()
-            nameset.add(name)
+        # stream the list file instead of reading all lines at once
+        nameset.update(name.strip() for name in lfs)
+        lfs.close()
     elif itf.HasString("-title"):
-        for t in itf.GetStringList("-title"):
-            nameset.add(t)
+        nameset.update(itf.GetStringList("-title"))
 
-    CatMols(itf.GetStringList("-i"), itf.GetString("-o"), nameset)
+    CatMols(itf.GetStringList("-i"), itf.GetString("-o"), nameset,
+            itf.GetInt("-shards"))
+    if itf.HasString("-db"):
+        nameset.close()
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
@@ -5,7 +5,6 @@
 import openeye.oechem as oechem
 import openeye.oedepict as oedepict
 import numpy as np
-from math import degrees
 
 
 def genHBIndexGuide(inpmol):
@@ -23,28 +22,22 @@ def genHBIndexGuide(inpmol):
 
 
 
-def findIntraHB(mol):
+def hbond_candidates(mol):
     """
-    WORDS
+    Get the atom indices of all possible intramolecular H-bonds of a molecule.
+    This depends only on the molecular graph, so it is done once per molecule
+    and reused for all of its conformers.
 
     Parameters
     ----------
-    mol
+    mol : OEChem molecule
 
     Returns
     -------
-    Hbond_list: 2D list. Each sublist is a unique possible intra HB pair.
-       Sublist is ordered by donor atom index, H atom index, acceptor index,
-       Hbond distance in Angstroms, Hbond angle in degrees (sublist length 5).
+    d_idx, h_idx, a_idx : 1D integer arrays of equal length, with the donor
+       atom index, H atom index, and acceptor atom index of each pair
 
     """
-    def getAtomCoords(mol,idx):
-        atom = mol.GetAtom(oechem.OEHasAtomIdx(idx))
-        xyz = oechem.OEFloatArray(3)
-        mol.GetCoords(atom, xyz)
-        return np.array([xyz[0],xyz[1],xyz[2]])
-
-    # .........!!!!!!!!!!!!!!!!!!!!
     # definitions of donor acceptor:
     # https://docs.eyesopen.com/toolkits/python/molproptk/molprops_sub.html
     # how to match to donor atom
@@ -53,41 +46,185 @@ def findIntraHB(mol):
     IsDonorAtom = oechem.OEMatchAtom("[!H0;#7,#8]")
     IsAcceptorAtom = oechem.OEMatchAtom("[#7,#8]")
 
-    # defaults from SetMaxHBondDistance and SetMaxDonorAngle
-    # https://docs.eyesopen.com/toolkits/python/oechemtk/OEBioClasses/OEPerceiveInteractionOptions.html
-    Hbond_angle_cutoff = 50.0
-    Hbond_dist_cutoff = 3.2
-
-    # Make list of H atoms, their donor atoms and possible Acceptor atoms
-    HD_atom_idx_list=[]; A_atom_idx_list=[]; HD_D_idx_dict={}   # HD means H atom bonded to Donor atom (D), A=acceptor
-
+    # HD means H atom bonded to Donor atom (D), A=acceptor
+    HD_D_pairs = []
+    A_atom_idx_list = []
     for atom in mol.GetAtoms():
-        idx=atom.GetIdx()
-        if atom.GetAtomicNum()==1:                 # hydrogen atoms
-            for nn_atom in atom.GetAtoms():        # nn_atom=nearest neighbour atom
+        idx = atom.GetIdx()
+        if atom.GetAtomicNum() == 1:             # hydrogen atoms
+            for nn_atom in atom.GetAtoms():      # nn_atom=nearest neighbour atom
                 if IsDonorAtom(nn_atom):
-                    HD_atom_idx_list.append(idx)        # list of H atoms bonded to D atoms
-                    HD_D_idx_dict[idx]=nn_atom.GetIdx() # dictionary of H atom idx and its D atom idx
+                    HD_D_pairs.append((idx, nn_atom.GetIdx()))
         if IsAcceptorAtom(atom):
-            A_atom_idx_list.append(idx)                 # list of A atoms
-
-    # Check distance and angle between HD and A atoms and make list of H bonds (atoms involved, angle and distance)
-    Hbond_list=[]
-    for HD_atom_idx in HD_atom_idx_list:
-        HD_atom=mol.GetAtom(oechem.OEHasAtomIdx(HD_atom_idx))
-        D_atom_idx=HD_D_idx_dict[HD_atom_idx]
-        D_atom = mol.GetAtom(oechem.OEHasAtomIdx(D_atom_idx))
-        HD_atom_coords=getAtomCoords(mol, D_atom_idx)
+            A_atom_idx_list.append(idx)
 
+    # don't consider the H atom's D atom as A atom
+    d_idx = []
+    h_idx = []
+    a_idx = []
+    for HD_atom_idx, D_atom_idx in HD_D_pairs:
         for A_atom_idx in A_atom_idx_list:
-            if A_atom_idx == D_atom_idx:        # don't consider the H atom's D atom as A atom
-                pass
-            else:
-                A_atom_coords=getAtomCoords(mol,A_atom_idx)
-                A_atom = mol.GetAtom(oechem.OEHasAtomIdx(A_atom_idx))
-                Hbond_angle=degrees(oechem.OEGetAngle(mol, D_atom, HD_atom, A_atom))
-                Hbond_dist=np.linalg.norm(HD_atom_coords-A_atom_coords)
-                if Hbond_angle > Hbond_angle_cutoff and Hbond_dist < Hbond_dist_cutoff:
-                    Hbond_list.append([D_atom_idx, HD_atom_idx, A_atom_idx, Hbond_dist, Hbond_angle])
+            if A_atom_idx != D_atom_idx:
+                d_idx.append(D_atom_idx)
+                h_idx.append(HD_atom_idx)
+                a_idx.append(A_atom_idx)
+
+    return (np.array(d_idx, dtype=int), np.array(h_idx, dtype=int),
+            np.array(a_idx, dtype=int))
+
+
+def conf_coords(mol):
+    """
+    Get coordinates of all conformers of a molecule as one array of shape
+    (number of conformers, max atom index, 3), indexed by atom index.
+    """
+    xyz = oechem.OEFloatArray(3 * mol.GetMaxAtomIdx())
+    coords = []
+    for conf in mol.GetConfs():
+        conf.GetCoords(xyz)
+        coords.append(np.array(xyz).reshape(-1, 3))
+    return np.array(coords)
+
+
+def hbond_geometry(coords, d_idx, h_idx, a_idx):
+    """
+    Evaluate H-bond distances and angles for all conformers and all
+    donor/H/acceptor triplets at once.
+
+    Parameters
+    ----------
+    coords : array of shape (nconfs, natoms, 3)
+    d_idx, h_idx, a_idx : 1D integer arrays from hbond_candidates
+
+    Returns
+    -------
+    dist : array of shape (nconfs, npairs), donor-acceptor distance in Angstroms
+    angle : array of shape (nconfs, npairs), D-H-A angle in degrees
+
+    """
+    d_xyz = coords[:, d_idx, :]
+    h_xyz = coords[:, h_idx, :]
+    a_xyz = coords[:, a_idx, :]
+    dist = np.linalg.norm(d_xyz - a_xyz, axis=2)
+
+    hd = d_xyz - h_xyz
+    ha = a_xyz - h_xyz
+    cos = np.sum(hd * ha, axis=2) / (
+        np.linalg.norm(hd, axis=2) * np.linalg.norm(ha, axis=2))
+    angle = np.degrees(np.arccos(np.clip(cos, -1., 1.)))
+    return dist, angle
+
+
+def findIntraHB(mol, Hbond_dist_cutoff=3.2, Hbond_angle_cutoff=50.0):
+    """
+    Find possible intramolecular H-bonds in the active conformer of mol.
+
+    Parameters
+    ----------
+    mol : OEChem molecule
+    Hbond_dist_cutoff : float, maximum donor-acceptor distance (Angstroms)
+    Hbond_angle_cutoff : float, minimum D-H-A angle (degrees)
+
+    Returns
+    -------
+    Hbond_list: 2D list. Each sublist is a unique possible intra HB pair.
+       Sublist is ordered by donor atom index, H atom index, acceptor index,
+       Hbond distance in Angstroms, Hbond angle in degrees (sublist length 5).
+
+    """
+    # defaults from SetMaxHBondDistance and SetMaxDonorAngle
+    # https://docs.eyesopen.com/toolkits/python/oechemtk/OEBioClasses/OEPerceiveInteractionOptions.html
+    d_idx, h_idx, a_idx = hbond_candidates(mol)
+    xyz = oechem.OEFloatArray(3 * mol.GetMaxAtomIdx())
+    mol.GetCoords(xyz)
+    coords = np.array(xyz).reshape(1, -1, 3)
+    dist, angle = hbond_geometry(coords, d_idx, h_idx, a_idx)
+
+    Hbond_list = []
+    found = (angle[0] > Hbond_angle_cutoff) & (dist[0] < Hbond_dist_cutoff)
+    for k in np.nonzero(found)[0]:
+        Hbond_list.append([d_idx[k], h_idx[k], a_idx[k], dist[0, k],
+                           angle[0, k]])
 
     return Hbond_list
+
+
+def findIntraHB_confs(mol, Hbond_dist_cutoff=3.2, Hbond_angle_cutoff=50.0):
+    """
+    Find possible intramolecular H-bonds in all conformers of mol. The
+    donor/H/acceptor indices are extracted once, then distances and angles of
+    all conformers are evaluated as array operations.
+
+    Parameters
+    ----------
+    mol : OEChem molecule with all of its conformers
+    Hbond_dist_cutoff : float, maximum donor-acceptor distance (Angstroms)
+    Hbond_angle_cutoff : float, minimum D-H-A angle (degrees)
+
+    Returns
+    -------
+    Hbond_table: 2D list with one sublist per H-bond found, ordered by
+       conformer number (1-based), donor atom index, H atom index, acceptor
+       index, Hbond distance in Angstroms, Hbond angle in degrees.
+
+    """
+    d_idx, h_idx, a_idx = hbond_candidates(mol)
+    if len(d_idx) == 0:
+        return []
+    dist, angle = hbond_geometry(conf_coords(mol), d_idx, h_idx, a_idx)
+
+    Hbond_table = []
+    found = (angle > Hbond_angle_cutoff) & (dist < Hbond_dist_cutoff)
+    for c, k in zip(*np.nonzero(found)):
+        Hbond_table.append([c + 1, d_idx[k], h_idx[k], a_idx[k], dist[c, k],
+                            angle[c, k]])
+    return Hbond_table
+
+
+def findIntraHB_file(infile, outfile, Hbond_dist_cutoff=3.2,
+                     Hbond_angle_cutoff=50.0):
+    """
+    Screen every conformer of every molecule in infile for intramolecular
+    H-bonds and write a per-conformer table to outfile.
+
+    Parameters
+    ----------
+    infile : string, name of multi-molecule, multi-conformer input file
+    outfile : string, name of output text table
+    Hbond_dist_cutoff : float, maximum donor-acceptor distance (Angstroms)
+    Hbond_angle_cutoff : float, minimum D-H-A angle (degrees)
+
+    """
+    ifs = oechem.oemolistream()
+    ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    if not ifs.open(infile):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % infile)
+
+    ofile = open(outfile, 'w')
+    ofile.write("# title\tconf\tdonor\thydrogen\tacceptor\tdist(A)\tangle(deg)\n")
+    for mol in ifs.GetOEMols():
+        for row in findIntraHB_confs(mol, Hbond_dist_cutoff,
+                                     Hbond_angle_cutoff):
+            ofile.write("%s\t%d\t%d\t%d\t%d\t%.4f\t%.2f\n" %
+                        tuple([mol.GetTitle()] + row))
+    ofile.close()
+    ifs.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Find possible intramolecular hydrogen bonds in all "
+        "conformers of all molecules of a file.")
+
+    parser.add_argument("-i", "--infile", required=True,
+        help="Input molecule file with all conformers of all molecules.")
+    parser.add_argument("-o", "--outfile", default="intraHB.dat",
+        help="Output table with one line per H-bond per conformer.")
+    parser.add_argument("-d", "--dist", type=float, default=3.2,
+        help="Maximum donor-acceptor distance in Angstroms. Default 3.2")
+    parser.add_argument("-a", "--angle", type=float, default=50.0,
+        help="Minimum D-H-A angle in degrees. Default 50.0")
+
+    args = parser.parse_args()
+    findIntraHB_file(args.infile, args.outfile, args.dist, args.angle)
@@ -7,15 +7,184 @@
 
 ## Usage: python loadFromXYZ.py -m initial.mol2 -x final.xyz -o final.mol2
 
+## Bulk mode: load every frame of many XYZ files (each may be a
+## concatenated multi-frame XYZ) as conformers of the template molecule,
+## and write all of them to one multi-conformer output file. Conformers
+## keep the title of the template molecule, and the comment line of each
+## frame is stored in the "XYZ comment" SD tag of its conformer.
+## Usage: python loadFromXYZ.py --bulk -m initial.mol2 -x *.xyz -o final.sdf
+
 import os, sys
+import numpy as np
 import openeye.oechem as oechem
 import argparse
 
 
 ### ------------------- Script -------------------
 
+def read_xyz_frames(fname):
+    """
+    Read all frames of a (multi-frame) XYZ file. Files whose frames all
+    have the same number of atoms and no blank lines in between are parsed
+    with numpy in one pass; other files are read frame by frame.
+
+    Parameters
+    ----------
+    fname : string, name of XYZ file
+
+    Returns
+    -------
+    coords : numpy array of shape (number of frames, number of atoms, 3)
+    comments : list of the comment line of each frame
+    elements : list of element symbols (or atomic numbers) of the atoms,
+        which must be the same in all frames
+
+    """
+    with open(fname) as f:
+        lines = f.read().splitlines()
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if not lines:
+        raise ValueError("No frames in %s" % fname)
+
+    try:
+        natoms = int(lines[0])
+    except ValueError:
+        raise ValueError("Bad number of atoms in frame 1 of %s" % fname)
+    size = natoms + 2
+    if len(lines) % size != 0 or \
+            any(line.strip() != str(natoms) for line in lines[::size]):
+        return read_xyz_frames_by_line(lines, fname)
+
+    # fixed number of atoms: table of frames by lines of each frame
+    table = np.array(lines, dtype=object).reshape(-1, size)
+    comments = [line.strip() for line in table[:, 1]]
+    atoms = table[:, 2:].ravel()
+    # only the first four fields; some programs add more columns
+    try:
+        coords = np.loadtxt(atoms, usecols=(1, 2, 3), ndmin=2)
+        labels = np.loadtxt(atoms, dtype=str, usecols=0, ndmin=1)
+    except ValueError as e:
+        raise ValueError("Bad atom line in %s: %s" % (fname, e))
+    labels = labels.reshape(-1, natoms)
+    if not (labels == labels[0]).all():
+        raise ValueError("Frames of %s have different atoms" % fname)
+    return coords.reshape(-1, natoms, 3), comments, [str(e) for e in labels[0]]
+
+
+def read_xyz_frames_by_line(lines, fname):
+    """
+    Read frames of an XYZ file from its lines one frame at a time, for files
+    with blank lines between frames. See read_xyz_frames.
+    """
+    frames = []
+    comments = []
+    elements = []
+    i = 0
+    while i < len(lines):
+        if not lines[i].strip():
+            i += 1
+            continue
+        natoms = int(lines[i])
+        comments.append(lines[i + 1].strip() if i + 1 < len(lines) else '')
+        block = lines[i + 2:i + 2 + natoms]
+        if len(block) != natoms:
+            raise ValueError("Incomplete frame %d in %s" % (len(frames) + 1, fname))
+        # only the first four fields; some programs add more columns
+        table = [line.split()[:4] for line in block]
+        if any(len(fields) != 4 for fields in table):
+            raise ValueError("Bad atom line in frame %d of %s" %
+                             (len(frames) + 1, fname))
+        frame_elements = [fields[0] for fields in table]
+        if not elements:
+            elements = frame_elements
+        elif frame_elements != elements:
+            raise ValueError("Frames of %s have different atoms" % fname)
+        frames.append(np.array([fields[1:] for fields in table], dtype=float))
+        i += 2 + natoms
+
+    if len(set(len(f) for f in frames)) > 1:
+        raise ValueError("Frames of %s have different numbers of atoms" % fname)
+    return np.array(frames), comments, elements
+
+
+def element_symbol(element):
+    """
+    Get the element symbol of an XYZ atom label such as 'C', 'cl', or '6'.
+    """
+    if element.isdigit():
+        return oechem.OEGetAtomicSymbol(int(element))
+    return element.capitalize()
+
+
+def bulk_load(fmol, xyzfiles, outfn):
+    """
+    Load every frame of the XYZ files as conformers of the template molecule
+    and write one multi-conformer output file.
+
+    Parameters
+    ----------
+    fmol : string, name of template molecule file (e.g., mol2). Atom order
+        of the XYZ files must match; files with other elements in any
+        position are skipped.
+    xyzfiles : list of XYZ file names
+    outfn : string, name of output file
+
+    Returns
+    -------
+    nconfs : int, number of conformers written. Nothing is written if no
+        frames could be loaded.
+
+    """
+    mifs = oechem.oemolistream()
+    if not mifs.open(fmol):
+        oechem.OEThrow.Fatal("Unable to open %s for reading" % fmol)
+    mmol = oechem.OEMol(next(mifs.GetOEMols()))
+    mifs.close()
+    mmol.DeleteConfs()
+    natoms = mmol.GetMaxAtomIdx()
+    symbols = [oechem.OEGetAtomicSymbol(atom.GetAtomicNum()) for atom in
+               sorted(mmol.GetAtoms(), key=lambda atom: atom.GetIdx())]
+
+    for fxyz in xyzfiles:
+        coords, comments, elements = read_xyz_frames(fxyz)
+        if coords.shape[1] != natoms:
+            oechem.OEThrow.Warning("Skipping %s: %d atoms vs. %d in %s" %
+                (fxyz, coords.shape[1], natoms, fmol))
+            continue
+        mismatch = [k for k, (e, sym) in enumerate(zip(elements, symbols))
+                    if element_symbol(e) != sym]
+        if mismatch:
+            k = mismatch[0]
+            oechem.OEThrow.Warning("Skipping %s: atom %d is %s vs. %s in %s" %
+                (fxyz, k + 1, elements[k], symbols[k], fmol))
+            continue
+        for j, frame in enumerate(coords):
+            conf = mmol.NewConf(oechem.OEFloatArray(frame.ravel()))
+            # same title for all conformers so they are read back as one
+            # molecule; keep the frame's comment in an SD tag instead
+            comment = comments[j] if comments[j] else "%s_%d" % (
+                os.path.splitext(os.path.basename(fxyz))[0], j + 1)
+            oechem.OESetSDData(conf, "XYZ comment", comment)
+
+    if mmol.NumConfs() == 0:
+        oechem.OEThrow.Warning("No conformers loaded from the XYZ files; "
+                               "%s not written" % outfn)
+        return 0
+
+    ofs = oechem.oemolostream()
+    if not ofs.open(outfn):
+        oechem.OEThrow.Fatal("Unable to open %s for writing" % outfn)
+    oechem.OEWriteConstMolecule(ofs, mmol)
+    ofs.close()
+    print("Wrote %d conformers to %s" % (mmol.NumConfs(), outfn))
+    return mmol.NumConfs()
+
+
 def main(**kwargs):
+    opt = kwargs
     outfn = opt['fout']
+    fxyz = opt['fxyz'] if isinstance(opt['fxyz'], str) else opt['fxyz'][0]
 
     # Open input files.
     mifs = oechem.oemolistream()
@@ -23,8 +192,8 @@ def main(**kwargs):
         oechem.OEThrow.Warning("Unable to open %s for reading" % opt['fmol2'])
         return
     xifs = oechem.oemolistream()
-    if not xifs.open(opt['fxyz']):
-        oechem.OEThrow.Warning("Unable to open %s for reading" % opt['fxyz'])
+    if not xifs.open(fxyz):
+        oechem.OEThrow.Warning("Unable to open %s for reading" % fxyz)
         return
     mmol = next(mifs.GetOEMols())
     xmol = next(xifs.GetOEMols())
@@ -44,13 +213,21 @@ if __name__ == "__main__":
 
     parser.add_argument("-m", "--fmol2",
         help="Reference mol2 file which new coordinates will be loaded into.")
-    parser.add_argument("-x", "--fxyz",
-        help="XYZ file with new coordinates to load into mol2 file.")
+    parser.add_argument("-x", "--fxyz", nargs='+',
+        help="XYZ file with new coordinates to load into mol2 file. "
+             "In bulk mode, any number of (multi-frame) XYZ files.")
     parser.add_argument("-o", "--fout",
             help="Name of the output mol2 file.")
+    parser.add_argument("--bulk", action="store_true", default=False,
+        help="Load all frames of all XYZ files as conformers of the "
+             "reference molecule and write one multi-conformer file.")
 
     args = parser.parse_args()
     opt = vars(args)
 
-    main(**opt)
-
+    if opt['bulk']:
+        bulk_load(opt['fmol2'], opt['fxyz'], opt['fout'])
+    else:
+        if len(opt['fxyz']) > 1:
+            parser.error("Only one XYZ file can be used without --bulk.")
+        main(**opt)
@@ -5,14 +5,147 @@ Purpose:    Take just the first instance of a duplicated molecule in multi-mol f
 By:         Victoria T. Lim
 Version:    Dec 20 2018
 Example:    python save_uniq_mols.py -i MiniDrugBank_filter04_extras.sdf -o MiniDrugBank_filter04.sdf
+            python save_uniq_mols.py -i big.sdf -o big_uniq.sdf -k smiles --ondisk seen.db
 Note:       All of the first mol's conformers are also saved. Comment the SetConfTest line if you want just first confs.
+            Molecules are streamed one at a time and only a fixed-size digest
+            of each key is remembered. In memory, a digest takes about 85
+            bytes in a Python set, so memory grows with the number of unique
+            molecules. It is bounded only when digests are kept on disk in
+            SQLite: with --ondisk, or automatically in a temporary file once
+            more than --spill unique molecules (default 5 million) are seen.
 
 """
 
+import os
+import time
+import sqlite3
+import hashlib
 import openeye.oechem as oechem
 
-def save_uniq_mols(infile, outfile):
 
+def mol_key(mol, key='title'):
+    """
+    Get the string by which duplicate molecules are identified.
+
+    Parameters
+    ----------
+    mol : OEChem molecule
+    key : string, one of 'title', 'smiles' (canonical isomeric SMILES), or
+        'inchikey'
+
+    Returns
+    -------
+    string key of the molecule
+
+    """
+    if key == 'title':
+        return mol.GetTitle()
+    if key == 'smiles':
+        return oechem.OECreateIsoSmiString(mol)
+    if key == 'inchikey':
+        return oechem.OECreateInChIKey(mol)
+    raise ValueError("Unknown key '{}'. Use title, smiles, or inchikey.".format(key))
+
+
+def key_digest(keystr):
+    """
+    Reduce a key of any length to a 16-byte digest for set membership.
+    """
+    return hashlib.blake2b(keystr.encode('utf-8'), digest_size=16).digest()
+
+
+class MemorySeen(object):
+    """
+    In-memory set of key digests.
+    """
+    def __init__(self):
+        self.seen = set()
+
+    def add(self, digest):
+        """
+        Add digest and return True if it was not already present.
+        """
+        if digest in self.seen:
+            return False
+        self.seen.add(digest)
+        return True
+
+    def __len__(self):
+        return len(self.seen)
+
+    def to_disk(self, dbfile):
+        """
+        Move the digests to a new DiskSeen and return it.
+        """
+        disk = DiskSeen(dbfile)
+        disk.conn.executemany("INSERT OR IGNORE INTO seen VALUES (?)",
+                              ((digest, ) for digest in self.seen))
+        disk.conn.commit()
+        self.seen = set()
+        return disk
+
+    def close(self):
+        pass
+
+
+class DiskSeen(object):
+    """
+    SQLite-backed set of key digests for libraries larger than RAM.
+    """
+    def __init__(self, dbfile):
+        self.conn = sqlite3.connect(dbfile)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen "
+                          "(digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.pending = 0
+
+    def add(self, digest):
+        """
+        Add digest and return True if it was not already present.
+        """
+        cur = self.conn.execute("INSERT OR IGNORE INTO seen VALUES (?)",
+                                (digest, ))
+        self.pending += 1
+        if self.pending >= 10000:
+            self.conn.commit()
+            self.pending = 0
+        return cur.rowcount == 1
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def save_uniq_mols(infile,
+                   outfile,
+                   key='title',
+                   ondisk=None,
+                   report=100000,
+                   spill=5000000):
+    """
+    Stream molecules from infile and write the first instance of each
+    unique molecule to outfile.
+
+    Parameters
+    ----------
+    infile : string, name of input molecules file
+    outfile : string, name of output molecules file
+    key : string, how to identify duplicates: 'title', 'smiles', or 'inchikey'
+    ondisk : string, name of SQLite file to keep seen digests on disk.
+        Default of None keeps them in memory, up to spill digests.
+    report : int, print throughput every this many molecules. 0 for no
+        intermediate reports.
+    spill : int, number of unique molecules after which digests kept in
+        memory are moved to a temporary SQLite file next to outfile, which
+        is removed at the end. 0 to always keep them in memory.
+
+    Returns
+    -------
+    nread : int, number of molecules read
+    nsaved : int, number of unique molecules written
+
+    """
     ### Read in molecules
     ifs = oechem.oemolistream()
     ifs.SetConfTest( oechem.OEAbsoluteConfTest() )
@@ -26,14 +159,38 @@ def save_uniq_mols(infile, outfile):
         oechem.OEThrow.Fatal("Unable to open %s for writing" % outfile)
 
     ### Go through all molecules
-    already_saved = []
+    already_saved = DiskSeen(ondisk) if ondisk else MemorySeen()
+    spillfile = None
+    nread = 0
+    nsaved = 0
+    start = time.time()
     for mol in ifs.GetOEMols():
-        if mol.GetTitle() not in already_saved:
+        nread += 1
+        if already_saved.add(key_digest(mol_key(mol, key))):
             oechem.OEWriteConstMolecule(ofs, mol)
-            already_saved.append(mol.GetTitle())
+            nsaved += 1
+            if spill and spillfile is None and not ondisk and \
+                    nsaved > spill:
+                spillfile = "%s.seen%d.db" % (outfile, os.getpid())
+                print("More than {} unique molecules; keeping seen "
+                      "molecules in {}".format(spill, spillfile))
+                already_saved = already_saved.to_disk(spillfile)
+        if report and nread % report == 0:
+            print("{} molecules read, {} saved, {:.1f} mols/sec".format(
+                nread, nsaved, nread / (time.time() - start)))
+    already_saved.close()
+    if spillfile is not None:
+        os.remove(spillfile)
     ifs.close()
     ofs.close()
 
+    elapsed = time.time() - start
+    print("Read {} molecules and saved {} unique by {} in {:.2f} sec "
+          "({:.1f} mols/sec)".format(nread, nsaved, key, elapsed,
+                                     nread / elapsed if elapsed else 0.))
+    return nread, nsaved
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
@@ -42,7 +199,27 @@ if __name__ == "__main__":
         help="Name of input molecules file.")
     parser.add_argument("-o", "--outfile", required=True,
         help="Name of output molecules file.")
+    parser.add_argument("-k", "--key", default="title",
+        choices=["title", "smiles", "inchikey"],
+        help="Identify duplicates by title, canonical isomeric SMILES, "
+             "or InChIKey. Default is title.")
+    parser.add_argument("--ondisk", default=None,
+        help="SQLite file for keeping seen molecules on disk, for "
+             "libraries too large for memory. Removed at the end unless "
+             "--keepdb is given.")
+    parser.add_argument("--keepdb", action="store_true", default=False,
+        help="Keep the --ondisk database after finishing.")
+    parser.add_argument("--report", type=int, default=100000,
+        help="Print throughput every this many molecules. 0 to turn off.")
+    parser.add_argument("--spill", type=int, default=5000000,
+        help="Move seen molecules from memory to a temporary SQLite file "
+             "after this many unique molecules. 0 to turn off. "
+             "Default is 5000000.")
 
     args = parser.parse_args()
-    save_uniq_mols(args.infile, args.outfile)
-
+    if args.ondisk and os.path.exists(args.ondisk):
+        parser.error("On-disk database %s already exists." % args.ondisk)
+    save_uniq_mols(args.infile, args.outfile, args.key, args.ondisk,
+                   args.report, args.spill)
+    if args.ondisk and not args.keepdb:
+        os.remove(args.ondisk)
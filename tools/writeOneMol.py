@@ -8,11 +8,18 @@ isolate specific conformers that lead to a high RMSD energy value for a particul
 
 Usage: python writeOneMol.py -f inputfile.sdf -t molName -s sdtag -v tagvalue -x filesuffix
 
+For SDF input, a sidecar index (inputfile.sdf.idx.json) of the byte offsets
+of each molecule is built on first use, and of each conformer's SD tag values
+whenever a new tag is searched. The index is reused while the size and
+modification time of the SDF file are unchanged, so that extraction is a seek
+and the parse of just the matching records.
+
 By: Victoria T. Lim
 
 """
 
 import os, sys
+import json
 import openeye.oechem as oechem
 import argparse
 
@@ -38,10 +45,212 @@ def write_conf_mol(outfn, mol):
     oechem.OEWriteConstMolecule(ofs, mol)
     ofs.close()
 
+def index_name(infn):
+    return infn + '.idx.json'
+
+
+def scan_sdf_records(infn, tags=()):
+    """
+    Read through an SDF file as text and get the byte offsets of each record.
+
+    Parameters
+    ----------
+    infn : str
+        Name of SDF file
+    tags : iterable of str
+        SD tags for which to also record the value of each record
+
+    Returns
+    -------
+    records : list of tuples
+        (title, start, end, {tag: value}) for each record in the file
+
+    """
+    tags = set(tags)
+    records = []
+    with open(infn, 'rb') as f:
+        start = f.tell()
+        title = None
+        values = {}
+        tag = None
+        for line in iter(f.readline, b''):
+            text = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if title is None:
+                title = text
+            elif text.startswith('$$$$'):
+                end = f.tell()
+                records.append((title, start, end, values))
+                start = end
+                title = None
+                values = {}
+                tag = None
+            elif text.startswith('>') and '<' in text and '>' in text[1:]:
+                name = text[text.index('<') + 1:text.rindex('>')]
+                tag = name if name in tags else None
+            elif tag is not None:
+                if text == '':
+                    tag = None
+                elif tag in values:
+                    values[tag] += '\n' + text
+                else:
+                    values[tag] = text
+    return records
+
+
+def build_index(infn, tags=()):
+    """
+    Build the sidecar index of an SDF file and save it next to the file.
+
+    Parameters
+    ----------
+    infn : str
+        Name of SDF file
+    tags : iterable of str
+        SD tags to index by value, in addition to molecule titles
+
+    Returns
+    -------
+    index : dict
+        Dictionary with file 'size' and 'mtime', 'titles' mapping each title
+        to a list of [start, end] byte spans of consecutive records of that
+        molecule, and 'tags' mapping each indexed tag to a dictionary of
+        tag value to title to list of [start, end] spans of conformers.
+
+    """
+    stat = os.stat(infn)
+    records = scan_sdf_records(infn, tags)
+    titles = {}
+    index_tags = {t: {} for t in tags}
+    prev = None
+    for title, start, end, values in records:
+        # consecutive records with the same title are confs of one molecule
+        if title == prev:
+            titles[title][-1][1] = end
+        else:
+            titles.setdefault(title, []).append([start, end])
+        prev = title
+        for t, v in values.items():
+            index_tags[t].setdefault(v, {}).setdefault(title, []).append(
+                [start, end])
+    index = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'titles': titles,
+        'tags': index_tags
+    }
+    with open(index_name(infn), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def load_index(infn, sdtag=""):
+    """
+    Load the sidecar index of an SDF file if it is still valid for the file,
+    otherwise (re)build it. If sdtag is not yet indexed, the index is rebuilt
+    to also include it, keeping any previously indexed tags.
+
+    Parameters
+    ----------
+    infn : str
+        Name of SDF file
+    sdtag : str
+        SD tag that needs to be indexed. Empty string for titles only.
+
+    Returns
+    -------
+    index : dict
+        See build_index
+
+    """
+    tags = [sdtag] if sdtag else []
+    idxfn = index_name(infn)
+    if os.path.exists(idxfn):
+        stat = os.stat(infn)
+        try:
+            with open(idxfn) as f:
+                index = json.load(f)
+        except ValueError:
+            index = None
+        if index is not None and index['size'] == stat.st_size and \
+                index['mtime'] == stat.st_mtime:
+            if not sdtag or sdtag in index['tags']:
+                return index
+            tags = list(index['tags']) + tags
+    print("Indexing %s" % infn)
+    return build_index(infn, tags)
+
+
+def read_span(infn, start, end, conftest=True):
+    """
+    Parse one molecule from the given byte span of an SDF file.
+
+    Parameters
+    ----------
+    infn : str
+        Name of SDF file
+    start : int
+        Byte offset of the first record
+    end : int
+        Byte offset after the last record
+    conftest : Boolean
+        Combine consecutive records of the same molecule as conformers
+
+    Returns
+    -------
+    mol : OpenEye OEMol, or None if the span could not be parsed
+
+    """
+    with open(infn, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start)
+    ifs = oechem.oemolistream()
+    ifs.SetFormat(oechem.OEFormat_SDF)
+    if conftest:
+        ifs.SetConfTest(oechem.OEAbsoluteConfTest())
+    if not ifs.openstring(text):
+        return None
+    mol = oechem.OEMol()
+    if not oechem.OEReadMolecule(ifs, mol):
+        mol = None
+    ifs.close()
+    return mol
+
+
+def main_indexed(opt, outfn):
+    """
+    Extract the molecule or conformer using the sidecar index of an SDF file.
+    Returns True if something matching was written out.
+    """
+    index = load_index(opt['infn'], opt['sdtag'])
+
+    # write out all confs in the first mol of this title if no SD tag
+    if opt['sdtag'] == "":
+        spans = index['titles'].get(opt['title'], [])
+        if not spans:
+            return False
+        write_conf_mol(outfn, read_span(opt['infn'], *spans[0]))
+        return True
+
+    # look for the conformers of this mol with specific SD tag value
+    spans = index['tags'][opt['sdtag']].get(opt['value'], {}).get(
+        opt['title'], [])
+    for start, end in spans:
+        write_conf_mol(outfn, read_span(opt['infn'], start, end, False))
+    return len(spans) > 0
+
+
 def main(**kwargs):
+    opt = kwargs
     outfn = os.path.splitext(opt['infn'])[0]+'_'+opt['suffix']+'.mol2'
     success = False
 
+    ### Use the sidecar index for SDF files
+    if os.path.splitext(opt['infn'])[1].lower() == '.sdf' and \
+            not opt.get('noindex', False):
+        if not main_indexed(opt, outfn):
+            print("\n** Found no confs matching your criteria. **")
+        return
+
     ### Read in .sdf file and distinguish each molecule's conformers
     ifs = oechem.oemolistream()
     ifs.SetConfTest( oechem.OEAbsoluteConfTest() )
@@ -78,6 +287,8 @@ if __name__ == "__main__":
         help="Value of the SD tag to write out that conformer.")
     parser.add_argument("-x", "--suffix",
         help="Suffix appened to input fn when writing out this conf.")
+    parser.add_argument("--noindex", action="store_true", default=False,
+        help="Scan the whole file instead of using the sidecar index.")
 
     args = parser.parse_args()
     opt = vars(args)